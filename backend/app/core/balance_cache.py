@@ -0,0 +1,166 @@
+"""
+Кэш балансов пользователей для GET /me/balances.
+
+Балансы меняются только в путях записи (депозит, вывод, корректировка, маржа/расчёт фьючерсов),
+а читаются при каждом обновлении экрана Mini App. Снимок балансов пользователя держим в памяти
+процесса API; любой коммит, затронувший строки balances, сбрасывает снимок этого пользователя
+в момент коммита (события сессии SQLAlchemy), следующий запрос перечитывает его из БД.
+
+Записывать в кэш сами значения из пути записи не стали: коммиты разных потоков могут завершиться
+не в том порядке, в каком их видит кэш, и тогда в памяти остался бы устаревший баланс.
+
+События сессии видят только коммиты этого процесса. Балансы меняют и отдельные воркеры
+(withdrawal_worker.py, offer_sweeper.py, netting_worker.py); их записи сопровождаются событиями
+outbox, и диспетчер outbox процесса API сбрасывает снимки получателей (subscribe_invalidation).
+Страховка на пути записи без события — снимок живёт не дольше BALANCE_CACHE_TTL_SECONDS.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.money import format_amount
+from app.core.settings import settings
+from app.db.database import SessionLocal
+from app.db.models import Balance
+
+
+# Валюты, которые всегда отдаём в ответе (даже при отсутствии строки в balances)
+CURRENCIES = ("TON", "USDT")
+
+_PENDING_KEY = "balance_cache_pending"
+
+
+@dataclass(frozen=True)
+class BalanceSnapshot:
+    user_id: int
+    balances: tuple[dict, ...]
+    etag: str
+
+    def as_dict(self) -> dict:
+        return {"user_id": self.user_id, "balances": [dict(b) for b in self.balances]}
+
+
+def build_snapshot(user_id: int, rows: Iterable[Balance]) -> BalanceSnapshot:
+    by_currency = {r.currency: r for r in rows}
+    balances = []
+    for currency in CURRENCIES:
+        row = by_currency.get(currency)
+        balances.append({
+            "currency": currency,
+            "available": format_amount(row.available if row is not None else None),
+            "reserved": format_amount(row.reserved if row is not None else None),
+        })
+    raw = "|".join(f"{b['currency']}:{b['available']}:{b['reserved']}" for b in balances)
+    etag = '"' + hashlib.sha1(f"{user_id}|{raw}".encode("utf-8")).hexdigest()[:20] + '"'
+    return BalanceSnapshot(user_id=user_id, balances=tuple(balances), etag=etag)
+
+
+class BalanceCache:
+    """
+    Снимки балансов по user_id со сроком жизни ttl_seconds (0 — без срока).
+    Поколение защищает от записи снимка, прочитанного до чужого коммита.
+    """
+
+    def __init__(self, ttl_seconds: float = 0) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._clock = time.monotonic
+        self._lock = threading.Lock()
+        self._entries: dict[int, tuple[BalanceSnapshot, float]] = {}
+        self._generation: dict[int, int] = {}
+
+    def get(self, user_id: int) -> BalanceSnapshot | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        snapshot, stored_at = entry
+        if self.ttl_seconds and self._clock() - stored_at >= self.ttl_seconds:
+            return None
+        return snapshot
+
+    def generation(self, user_id: int) -> int:
+        return self._generation.get(user_id, 0)
+
+    def put(self, snapshot: BalanceSnapshot, generation: int) -> None:
+        with self._lock:
+            if self._generation.get(snapshot.user_id, 0) == generation:
+                self._entries[snapshot.user_id] = (snapshot, self._clock())
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+                self._generation[user_id] = self._generation.get(user_id, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation.clear()
+
+
+balance_cache = BalanceCache(ttl_seconds=settings.balance_cache_ttl_seconds)
+
+
+def get_balances(db: Session, user_id: int) -> BalanceSnapshot:
+    """Снимок балансов из кэша; при промахе — один запрос в БД и сохранение в кэш."""
+    snapshot = balance_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+    generation = balance_cache.generation(user_id)
+    rows = db.query(Balance).filter(Balance.user_id == user_id).all()
+    snapshot = build_snapshot(user_id, rows)
+    balance_cache.put(snapshot, generation)
+    return snapshot
+
+
+# --- Сброс по событиям outbox (записи других процессов) ---
+
+# События, после которых меняются балансы пользователей из payload["recipients"]
+BALANCE_EVENT_TYPES = (
+    "deposit_credited", "withdrawal_failed", "offer_taken", "contract_settled",
+    "orders_executed", "offers_cancelled", "contracts_netted",
+)
+
+
+def invalidate_from_event(event: dict) -> None:
+    balance_cache.invalidate(event["payload"].get("recipients", []))
+
+
+def subscribe_invalidation(dispatcher) -> None:
+    """Подписать сброс кэша на события балансов (OutboxDispatcher процесса API)."""
+    for event_type in BALANCE_EVENT_TYPES:
+        dispatcher.subscribe(event_type, invalidate_from_event)
+
+
+# --- Сброс по коммиту (все сессии из SessionLocal) ---
+
+
+def invalidate_on_commit(session: Session, user_ids: Iterable[int]) -> None:
+    """Для пакетных UPDATE balances мимо ORM: их after_flush не видит, пользователей отмечаем явно."""
+    session.info.setdefault(_PENDING_KEY, set()).update(user_ids)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_touched_balances(session: Session, flush_context) -> None:
+    touched = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Balance) and obj.user_id is not None:
+            touched.add(obj.user_id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_on_commit(session: Session) -> None:
+    touched = session.info.pop(_PENDING_KEY, None)
+    if touched:
+        balance_cache.invalidate(touched)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _drop_pending_on_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
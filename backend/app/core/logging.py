@@ -1,15 +1,53 @@
-"""Structured JSON logging for API (vision: логгирование, мониторинг)."""
+"""
+Structured JSON logging for API (vision: логгирование, мониторинг).
+
+Поток запроса только кладёт запись в ограниченную очередь (QueueHandler), сериализация и запись
+в stdout идут в отдельном потоке QueueListener — всплеск логов не добавляет задержку сделке.
+При переполнении очереди запись отбрасывается (счётчик dropped), а не блокирует запрос.
+
+Шумные события ограничиваются до постановки в очередь:
+- LOG_RATE_LIMITS="ton_webhook_rejected=20,auth_failed=20" — не больше N записей события в секунду;
+- LOG_SAMPLING="request_end=0.1" — доля записей события, которая попадает в лог.
+Число подавленных записей события приходит полем "suppressed" в следующей записи этого события.
+
+Копия модуля живёт в bot/app/logging.py (бот разворачивается отдельно); расхождение общих частей
+ловит bot/tests/test_logging.py.
+"""
 from __future__ import annotations
 
+import atexit
 import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
+import threading
 import time
 from uuid import uuid4
 
+try:  # orjson заметно быстрее json.dumps; необязателен
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 
 SERVICE = "api"
 
+DEFAULT_RATE_LIMITS = "ton_webhook_rejected=20,auth_failed=20,admin_auth_failed=20"
+
+# Атрибуты самой LogRecord (и поля, которые формируем явно) — всё остальное считаем extra
+RESERVED_ATTRS = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | frozenset({
+    "message", "asctime", "taskName", "event", "request_id", "telegram_user_id", "tx_hash",
+})
+
+
+def _dumps(log: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(log, default=str).decode("utf-8")
+    return json.dumps(log, ensure_ascii=False, default=str)
+
 
 class JsonFormatter(logging.Formatter):
     """One JSON object per line: timestamp, level, service, event, message + extras."""
@@ -30,27 +68,119 @@ class JsonFormatter(logging.Formatter):
             log["tx_hash"] = record.tx_hash
         if record.exc_info:
             log["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log["exception"] = record.exc_text
         # any extra passed via logger.info(..., extra={...})
         for k, v in record.__dict__.items():
-            if k not in (
-                "name", "msg", "args", "created", "filename", "funcName", "levelname",
-                "levelno", "lineno", "module", "msecs", "pathname", "process",
-                "processName", "relativeCreated", "stack_info", "exc_info", "message",
-                "taskName", "event", "request_id", "telegram_user_id", "tx_hash",
-            ):
-                if v is not None:
-                    log[k] = v
-        return json.dumps(log, ensure_ascii=False)
+            if k not in RESERVED_ATTRS and v is not None:
+                log[k] = v
+        return _dumps(log)
+
+
+def _parse_event_map(raw: str, cast) -> dict:
+    """"a=1,b=0.5" → {"a": cast("1"), "b": cast("0.5")}; некорректные элементы пропускаем."""
+    result = {}
+    for part in raw.split(","):
+        name, sep, value = part.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            result[name.strip()] = cast(value.strip())
+        except ValueError:
+            continue
+    return result
+
+
+class EventSamplingFilter(logging.Filter):
+    """Сэмплирование и лимит записей в секунду по полю event. Записи без event не трогаем."""
+
+    def __init__(self, rate_limits: dict[str, float] | None = None, sampling: dict[str, float] | None = None) -> None:
+        super().__init__()
+        self.rate_limits = dict(rate_limits or {})
+        self.sampling = dict(sampling or {})
+        self._lock = threading.Lock()
+        # event → [токены, время последнего пополнения]
+        self._buckets: dict[str, list[float]] = {}
+        self._suppressed: dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or (event not in self.rate_limits and event not in self.sampling):
+            return True
+        ratio = self.sampling.get(event)
+        allowed = ratio is None or random.random() < ratio
+        limit = self.rate_limits.get(event)
+        with self._lock:
+            if allowed and limit is not None:
+                now = time.monotonic()
+                bucket = self._buckets.setdefault(event, [limit, now])
+                bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit)
+                bucket[1] = now
+                if bucket[0] >= 1:
+                    bucket[0] -= 1
+                else:
+                    allowed = False
+            if not allowed:
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return False
+            suppressed = self._suppressed.pop(event, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в потоке запроса и без блокировки при полной очереди."""
+
+    def __init__(self, q: queue.Queue) -> None:
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Подставляем args сейчас (объекты могут измениться), JSON собирает поток-слушатель
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: logging.handlers.QueueListener | None = None
 
 
 def setup_logging(level: str = "INFO") -> None:
-    """Configure root logger for app: JSON to stdout."""
+    """Configure root logger for app: JSON to stdout через очередь и поток-слушатель."""
+    global _listener
     root = logging.getLogger()
     root.setLevel(level)
-    if not root.handlers:
-        h = logging.StreamHandler(sys.stdout)
-        h.setFormatter(JsonFormatter())
-        root.addHandler(h)
+    if root.handlers:
+        return
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    handler.addFilter(EventSamplingFilter(
+        rate_limits=_parse_event_map(os.getenv("LOG_RATE_LIMITS", DEFAULT_RATE_LIMITS), float),
+        sampling=_parse_event_map(os.getenv("LOG_SAMPLING", ""), float),
+    ))
+    root.addHandler(handler)
+    _listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+
+
+def _stop_listener() -> None:
+    """Дописать очередь в stdout при завершении процесса."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
 def get_logger(name: str) -> logging.Logger:
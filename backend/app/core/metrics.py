@@ -0,0 +1,223 @@
+"""
+Метрики процесса API в текстовом формате Prometheus (GET /metrics).
+
+Горячий путь (inc/observe) не берёт общих блокировок: каждый поток пишет в свой шард
+(threading.local), блокировка нужна только при первом обращении потока к метрике и при сборе.
+Сбор суммирует шарды; значения монотонны, поэтому гонка со скрейпом даёт лишь отставание на одно событие.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Callable, Iterable
+
+
+# Границы бакетов латентности HTTP, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Sharded:
+    """Шард на поток: dict labels → значение. Список всех шардов — для сбора."""
+
+    def __init__(self, factory: Callable[[], dict]) -> None:
+        self._factory = factory
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._lock = threading.Lock()
+
+    def shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._factory()
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def shards(self) -> list[dict]:
+        with self._lock:
+            return list(self._shards)
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._data = _Sharded(dict)
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        shard = self._data.shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return sum(s.get(label_values, 0) for s in self._data.shards())
+
+    def collect(self) -> list[str]:
+        totals: dict[tuple, float] = {}
+        for shard in self._data.shards():
+            for key, v in list(shard.items()):
+                totals[key] = totals.get(key, 0) + v
+        if not self.labels:
+            totals.setdefault((), 0)
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for key, v in sorted(totals.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Gauge:
+    """Gauge с inc/dec (in-flight) или функцией-источником значения (пул БД)."""
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), func: Callable[[], dict] | None = None) -> None:
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._func = func
+        self._data = _Sharded(dict)
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        shard = self._data.shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def collect(self) -> list[str]:
+        if self._func is not None:
+            totals = dict(self._func())
+        else:
+            totals = {}
+            for shard in self._data.shards():
+                for key, v in list(shard.items()):
+                    totals[key] = totals.get(key, 0) + v
+            if not self.labels:
+                totals.setdefault((), 0)
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        for key, v in sorted(totals.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._data = _Sharded(dict)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        shard = self._data.shard()
+        series = shard.get(label_values)
+        if series is None:
+            # [счётчики бакетов (последний — +Inf)…, сумма]
+            series = shard[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self) -> list[str]:
+        totals: dict[tuple, list] = {}
+        for shard in self._data.shards():
+            for key, series in list(shard.items()):
+                acc = totals.setdefault(key, [0] * len(series))
+                for i, v in enumerate(list(series)):
+                    acc[i] += v
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                le_label = 'le="' + le + '"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_value(series[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- HTTP ---
+
+http_requests_total = registry.register(
+    Counter("http_requests_total", "HTTP requests by route template, method and status.", ("route", "method", "status"))
+)
+http_request_duration_seconds = registry.register(
+    Histogram("http_request_duration_seconds", "HTTP request latency by route template.", ("route", "method"))
+)
+http_requests_in_flight = registry.register(
+    Gauge("http_requests_in_flight", "HTTP requests currently being processed.")
+)
+
+
+def _db_pool_stats() -> dict:
+    from app.db.database import engine
+
+    pool = engine.pool
+    stats = {}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            try:
+                stats[(name,)] = fn()
+            except Exception:
+                pass
+    return stats
+
+
+db_pool_connections = registry.register(
+    Gauge("db_pool_connections", "SQLAlchemy connection pool state.", ("state",), func=_db_pool_stats)
+)
+
+# --- Бизнес-счётчики ---
+
+offers_created_total = registry.register(Counter("futures_offers_created_total", "Futures offers created."))
+offers_taken_total = registry.register(Counter("futures_offers_taken_total", "Futures offers taken."))
+contracts_settled_total = registry.register(Counter("futures_contracts_settled_total", "Futures contracts settled."))
+deposits_credited_total = registry.register(
+    Counter("deposits_credited_total", "Deposits credited via TON webhook.", ("currency",))
+)
+price_alerts_fired_total = registry.register(Counter("price_alerts_fired_total", "Price alerts fired by price pushes."))
+offers_cancelled_total = registry.register(
+    Counter("futures_offers_cancelled_total", "Open futures offers cancelled with margin released.", ("reason",))
+)
+contracts_netted_total = registry.register(
+    Counter("futures_contracts_netted_total", "Taken futures contracts collapsed into net contracts.")
+)
+conditional_orders_executed_total = registry.register(
+    Counter("conditional_orders_executed_total", "Conditional orders triggered by price pushes.", ("kind", "status"))
+)
+rate_limited_total = registry.register(
+    Counter("rate_limited_total", "Trading requests rejected by admission control.", ("route_class", "reason"))
+)
@@ -0,0 +1,134 @@
+"""
+Денежные величины в целых нанотонах (1 TON = 10**9 nanoton) для горячих путей торговли.
+
+В БД деньги хранятся как Numeric(36, 18) ↔ Decimal (conventions: Decimal, не float). Внутри расчётов
+(маржа, PnL, пакетный расчёт/переоценка/сверка) работаем с int: это точно, быстро и ложится в
+NumPy-массивы int64. Количество (qty) хранится в той же шкале 10**9, поэтому произведение
+«цена × количество» — одна операция mul_nano.
+
+Граница API: to_nano() принимает строку/Decimal и не теряет точность молча — значение с более чем
+9 знаками после запятой отклоняется (exact=True) или округляется банковским округлением (exact=False,
+для старых строк БД). from_nano() и format_amount() — обратное преобразование для ответов API.
+Thermos отдаёт floor в нанотонах, так что цены оракула переводятся без округления.
+"""
+from __future__ import annotations
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+
+try:  # NumPy нужен только для пакетных расчётов
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+NANO_DECIMALS = 9
+NANO = 10**NANO_DECIMALS
+
+_NANO_QUANT = Decimal(1).scaleb(-NANO_DECIMALS)
+# Граница int64 с запасом: выше — пакетные функции переходят на Python int (dtype=object)
+_INT64_SAFE = 2**62
+
+
+def to_nano(value: Decimal | str | int, *, exact: bool = True) -> int:
+    """Decimal/строка в TON (или штуках для qty) → целые нано-единицы. ValueError при неверном формате."""
+    try:
+        d = value if isinstance(value, Decimal) else Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not d.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    scaled = d.scaleb(NANO_DECIMALS)
+    integral = scaled.to_integral_value(rounding=ROUND_HALF_EVEN)
+    if exact and integral != scaled:
+        raise ValueError(f"Amount has more than {NANO_DECIMALS} decimal places: {value!r}")
+    return int(integral)
+
+
+def from_nano(value: int) -> Decimal:
+    """Нано-единицы → Decimal (для записи в Numeric-колонки)."""
+    return Decimal(int(value)).scaleb(-NANO_DECIMALS).quantize(_NANO_QUANT)
+
+
+def format_amount(value: Decimal | int | None) -> str:
+    """Decimal (или нано-int) → строка для API без экспоненты и хвостовых нулей: "10.500…0" → "10.5"."""
+    if value is None:
+        return "0"
+    if isinstance(value, int):
+        value = from_nano(value)
+    s = format(value.normalize(), "f")
+    return "0" if s in ("-0", "") else s
+
+
+def _round_div_nano(numerator: int) -> int:
+    """round(numerator / NANO) с банковским округлением для неотрицательного numerator."""
+    q, r = divmod(numerator, NANO)
+    if 2 * r > NANO or (2 * r == NANO and q & 1):
+        q += 1
+    return q
+
+
+def mul_nano(a: int, b: int) -> int:
+    """(a × b) в нано-шкале: например цена (nanoton) × qty (нано-штуки) → nanoton."""
+    prod = a * b
+    if prod >= 0:
+        return _round_div_nano(prod)
+    return -_round_div_nano(-prod)
+
+
+def settlement_pnl(entry: int, close: int, qty: int) -> tuple[int, int]:
+    """PnL (эмитент, покупатель) в nanoton: рост цены → эмитенту, падение → покупателю."""
+    if close > entry:
+        return mul_nano(close - entry, qty), 0
+    if close < entry:
+        return 0, mul_nano(entry - close, qty)
+    return 0, 0
+
+
+# --- Пакетные расчёты (NumPy) ---
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("numpy is required for batch money operations")
+
+
+def to_nano_array(values) -> "np.ndarray":
+    """Последовательность Decimal/строк → int64-массив нано-единиц (точно)."""
+    _require_numpy()
+    return np.array([to_nano(v) for v in values], dtype=np.int64)
+
+
+def from_nano_array(values: "np.ndarray") -> list[Decimal]:
+    _require_numpy()
+    return [from_nano(int(v)) for v in values]
+
+
+def mul_nano_array(a: "np.ndarray", b: "np.ndarray") -> "np.ndarray":
+    """
+    Поэлементное mul_nano для int64-массивов без переполнения промежуточного a × b.
+
+    a × b / N = a·b_hi + a_hi·b_lo + round(a_lo·b_lo / N), где x_hi = x // N, x_lo = x % N;
+    все слагаемые помещаются в int64, пока помещается сам результат. Иначе — dtype=object.
+    """
+    _require_numpy()
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    sign = np.sign(a) * np.sign(b)
+    a_abs = np.abs(a)
+    b_abs = np.abs(b)
+    if a_abs.size and (int(a_abs.max()) // NANO + 1) * int(b_abs.max()) >= _INT64_SAFE:
+        return np.array([mul_nano(int(x), int(y)) for x, y in zip(a, b)], dtype=object)
+    a_hi, a_lo = np.divmod(a_abs, NANO)
+    b_hi, b_lo = np.divmod(b_abs, NANO)
+    q, r = np.divmod(a_lo * b_lo, NANO)
+    q += (2 * r > NANO) | ((2 * r == NANO) & ((q & 1) == 1))
+    return sign * (a_abs * b_hi + a_hi * b_lo + q)
+
+
+def settlement_pnl_array(entry: "np.ndarray", close: "np.ndarray", qty: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    """Пакетный settlement_pnl: массивы PnL эмитента и покупателя в nanoton."""
+    _require_numpy()
+    move = np.asarray(close, dtype=np.int64) - np.asarray(entry, dtype=np.int64)
+    pnl = mul_nano_array(np.abs(move), qty)
+    zero = np.zeros_like(pnl)
+    return np.where(move > 0, pnl, zero), np.where(move < 0, pnl, zero)
@@ -0,0 +1,201 @@
+"""
+Ограничение частоты и допуск к пишущим эндпоинтам: класс "trade" — предложения (создание,
+принятие, отмена), settle, неттинг, ордера и алерты (создание и отмена); "withdraw" — вывод.
+
+Три проверки по порядку, все до открытия транзакции:
+1. Сброс нагрузки: если EWMA латентности записи в БД (app/db/profiling.py) выше
+   SHED_WRITE_LATENCY_MS — 503 + Retry-After, запрос не становится в очередь к единственному
+   писателю SQLite.
+2. Token bucket по (user_id, класс маршрута): RATE_LIMITS="trade=20:5,withdraw=5:0.2" —
+   ёмкость (всплеск) и пополнение в секунду. Исчерпан — 429 + Retry-After до следующего токена.
+3. Общий лимит одновременных торговых запросов (TRADING_MAX_CONCURRENCY): свободного места нет
+   ADMISSION_WAIT_SECONDS — 503 + Retry-After.
+
+Бакеты по умолчанию — в памяти процесса. При нескольких процессах API задайте
+RATE_LIMIT_REDIS_URL (нужен пакет redis): бакеты станут общими, атомарность — Lua-скриптом.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from typing import Callable
+
+from fastapi import Depends, HTTPException
+
+from app.core import metrics
+from app.core.auth_deps import require_user_id_dep
+from app.core.settings import settings
+from app.db.profiling import db_write_latency
+
+try:  # общий бакет между процессами — необязательно
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+
+logger = logging.getLogger("api")
+
+
+def parse_rate_limits(raw: str) -> dict[str, tuple[float, float]]:
+    """"trade=20:5,withdraw=5:0.2" → {"trade": (20.0, 5.0), ...}; некорректные элементы пропускаем."""
+    limits = {}
+    for part in raw.split(","):
+        name, sep, spec = part.partition("=")
+        burst, sep2, rate = spec.partition(":")
+        if not sep or not sep2 or not name.strip():
+            continue
+        try:
+            limits[name.strip()] = (float(burst), float(rate))
+        except ValueError:
+            continue
+    return limits
+
+
+class MemoryBucketStore:
+    """Token bucket в памяти процесса. take() → 0, если токен взят, иначе секунды до следующего."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # key → [токены, время последнего пополнения]
+        self._buckets: dict[tuple, list[float]] = {}
+
+    def take(self, key: tuple, burst: float, rate: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate if rate > 0 else 60.0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+# KEYS[1] — ключ бакета; ARGV: burst, rate, now (секунды). Ответ: 0 или миллисекунды до токена.
+_REDIS_TAKE = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local wait_ms = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+elseif rate > 0 then
+  wait_ms = math.ceil((1 - tokens) / rate * 1000)
+else
+  wait_ms = 60000
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / math.max(rate, 0.001)) + 1)
+return wait_ms
+"""
+
+
+class RedisBucketStore:
+    """Тот же token bucket в Redis — общий для всех процессов API."""
+
+    def __init__(self, url: str) -> None:
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the redis package is not installed")
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_REDIS_TAKE)
+
+    def take(self, key: tuple, burst: float, rate: float) -> float:
+        name = "ratelimit:" + ":".join(str(k) for k in key)
+        return int(self._take(keys=[name], args=[burst, rate, time.time()])) / 1000
+
+    def reset(self) -> None:
+        pass
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float]],
+        store,
+        *,
+        max_concurrency: int,
+        wait_seconds: float,
+        shed_write_latency_ms: float,
+    ) -> None:
+        self.limits = limits
+        self.store = store
+        self.wait_seconds = wait_seconds
+        self.shed_write_latency_ms = shed_write_latency_ms
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+
+    def check_load(self, route_class: str) -> None:
+        if self.shed_write_latency_ms <= 0:
+            return
+        latency = db_write_latency.value()
+        if latency > self.shed_write_latency_ms:
+            metrics.rate_limited_total.inc(route_class, "db_latency")
+            logger.warning(
+                "Load shedding: DB write latency above threshold",
+                extra={"event": "admission_shed", "route_class": route_class, "db_write_ms": round(latency, 1)},
+            )
+            raise HTTPException(status_code=503, detail="Service busy, retry later", headers={"Retry-After": "1"})
+
+    def check_rate(self, route_class: str, user_id: int) -> None:
+        limit = self.limits.get(route_class)
+        if limit is None:
+            return
+        burst, rate = limit
+        wait = self.store.take((route_class, user_id), burst, rate)
+        if wait > 0:
+            metrics.rate_limited_total.inc(route_class, "rate_limit")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+    def acquire_slot(self, route_class: str) -> bool:
+        if self._slots is None:
+            return False
+        if not self._slots.acquire(timeout=self.wait_seconds):
+            metrics.rate_limited_total.inc(route_class, "concurrency")
+            raise HTTPException(status_code=503, detail="Service busy, retry later", headers={"Retry-After": "1"})
+        return True
+
+    def release_slot(self) -> None:
+        self._slots.release()
+
+    def reset(self) -> None:
+        self.store.reset()
+
+
+admission = AdmissionController(
+    parse_rate_limits(settings.rate_limits),
+    RedisBucketStore(settings.rate_limit_redis_url) if settings.rate_limit_redis_url else MemoryBucketStore(),
+    max_concurrency=settings.trading_max_concurrency,
+    wait_seconds=settings.admission_wait_seconds,
+    shed_write_latency_ms=settings.shed_write_latency_ms,
+)
+
+
+def admit(route_class: str) -> Callable:
+    """Dependency для торгового эндпоинта: сброс нагрузки, лимит частоты, слот общего лимита."""
+
+    def dependency(user_id: int = Depends(require_user_id_dep)):
+        admission.check_load(route_class)
+        admission.check_rate(route_class, user_id)
+        held = admission.acquire_slot(route_class)
+        try:
+            yield
+        finally:
+            if held:
+                admission.release_slot()
+
+    return dependency
@@ -17,6 +17,55 @@ class Settings(BaseModel):
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./app.db")
     admin_token: str = os.getenv("ADMIN_TOKEN", "")
 
+    # Профилирование SQL: заголовок X-DB-Queries в ответах (только для отладки) и порог N+1
+    db_profile_header: bool = os.getenv("DB_PROFILE_HEADER", "").lower() in ("1", "true", "yes")
+    db_n_plus_one_threshold: int = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "10"))
+
+    # Запись трафика в NDJSON для bench/replay.py (пусто — выключено)
+    record_traffic_path: str = os.getenv("RECORD_TRAFFIC_PATH", "")
+
+    # Допуск к торговым эндпоинтам (app/core/rate_limit.py): бакеты "класс=всплеск:в_секунду",
+    # общий лимит одновременных запросов и порог сброса нагрузки по латентности записи (0 — выключено)
+    rate_limits: str = os.getenv("RATE_LIMITS", "trade=20:5,withdraw=5:0.2")
+    rate_limit_redis_url: str = os.getenv("RATE_LIMIT_REDIS_URL", "")
+    trading_max_concurrency: int = int(os.getenv("TRADING_MAX_CONCURRENCY", "8"))
+    admission_wait_seconds: float = float(os.getenv("ADMISSION_WAIT_SECONDS", "0.5"))
+    shed_write_latency_ms: float = float(os.getenv("SHED_WRITE_LATENCY_MS", "250"))
+
+    # Кэш балансов /me/balances: срок жизни снимка (с) — предел устаревания после записи воркера
+    balance_cache_ttl_seconds: float = float(os.getenv("BALANCE_CACHE_TTL_SECONDS", "5"))
+
+    # Outbox доменных событий: пачка и интервал опроса внутреннего диспетчера
+    outbox_batch_size: int = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+    outbox_poll_interval: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+    # Срок хранения событий (с; 0 — без удаления) и как часто диспетчер удаляет устаревшие (с)
+    outbox_retention_seconds: float = float(os.getenv("OUTBOX_RETENTION_SECONDS", "604800"))
+    outbox_prune_interval: float = float(os.getenv("OUTBOX_PRUNE_INTERVAL", "60"))
+
+    # Ценовые алерты: сколько активных алертов может держать один пользователь
+    alerts_max_per_user: int = int(os.getenv("ALERTS_MAX_PER_USER", "50"))
+    # Условные ордера (лимит/стоп-лосс/тейк-профит): активных ордеров на пользователя
+    orders_max_per_user: int = int(os.getenv("ORDERS_MAX_PER_USER", "50"))
+
+    # Срок жизни открытых предложений (с): по умолчанию и максимум для ttl_seconds; 0 — без срока.
+    # Снятие просроченных и предложений на выключенных рынках — offer_sweeper.py, пачками
+    offer_default_ttl_seconds: int = int(os.getenv("OFFER_DEFAULT_TTL_SECONDS", "604800"))
+    offer_max_ttl_seconds: int = int(os.getenv("OFFER_MAX_TTL_SECONDS", "2592000"))
+    offer_sweep_batch_size: int = int(os.getenv("OFFER_SWEEP_BATCH_SIZE", "500"))
+    offer_sweep_interval: float = float(os.getenv("OFFER_SWEEP_INTERVAL", "60"))
+    # Неттинг встречных контрактов (netting_worker.py): пар (рынок, контрагенты) на пачку и период
+    netting_batch_size: int = int(os.getenv("NETTING_BATCH_SIZE", "200"))
+    netting_interval: float = float(os.getenv("NETTING_INTERVAL", "300"))
+
+    # Воркер вывода (withdrawal_worker.py): транспорт (module:Class, без значения по умолчанию —
+    # воркер не запускается), размер пакета и захвата, повторы
+    withdraw_transport: str = os.getenv("WITHDRAW_TRANSPORT", "")
+    withdraw_batch_max_messages: int = int(os.getenv("WITHDRAW_BATCH_MAX_MESSAGES", "4"))
+    withdraw_claim_limit: int = int(os.getenv("WITHDRAW_CLAIM_LIMIT", "64"))
+    withdraw_max_attempts: int = int(os.getenv("WITHDRAW_MAX_ATTEMPTS", "3"))
+    withdraw_claim_ttl_seconds: float = float(os.getenv("WITHDRAW_CLAIM_TTL_SECONDS", "300"))
+    withdraw_poll_interval: float = float(os.getenv("WITHDRAW_POLL_INTERVAL", "5"))
+
     ton_webhook_secret: str = os.getenv("TON_WEBHOOK_SECRET", "")
     deposit_wallet_address: str = os.getenv("TON_PROJECT_WALLET_ADDRESS", "")
 
@@ -0,0 +1,245 @@
+"""
+Запись трафика API в NDJSON для воспроизведения торгового дня (bench/replay.py).
+
+Включается RECORD_TRAFFIC_PATH. Каждый запуск API пишет свой файл рядом с заданным путём:
+traffic.ndjson → traffic-20260101T120000Z-<pid>.ndjson (путь — в событии traffic_recording_started),
+так что запуски и процессы не смешиваются. Первая строка файла — снимок справочников и состояния
+на момент старта (пользователи, балансы, подарки, экспирации, рынки, незакрытые контракты), далее
+по строке на запрос: смещение от старта, метод, путь, статус, актор и очищенное тело.
+
+Что не попадает в запись: cookies и JWT (актор — только user_id из access-токена), заголовок
+Authorization (только признак admin), секрет webhook, подпись и профиль из initData (остаётся
+только telegram user id), адреса кошельков (заменяются на фиксированный адрес-заглушку).
+Для запросов, создающих сущности (вход, предложение, частичное принятие, ордер, алерт, неттинг),
+в запись попадает id из ответа — по нему replay сопоставляет старые и новые id.
+
+Запись идёт из фонового потока: запрос только кладёт строку в очередь.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.jwt import decode_jwt
+from app.core.money import format_amount
+from app.core.settings import settings
+from app.db.models import Balance, Expiry, FuturesContract, Gift, Market, User
+
+
+logger = logging.getLogger("api")
+
+# Не записываем служебные эндпоинты
+SKIP_PATHS = frozenset({"/healthz", "/metrics"})
+
+# Адрес-заглушка вместо реальных адресов кошельков (проходит проверку формата в /me)
+PLACEHOLDER_TON_ADDRESS = "EQ" + "A" * 46
+
+# (метод, шаблон пути) → (тип сущности, ключи до id в JSON-ответе); "*" — id всех элементов списка
+CAPTURE_IDS = (
+    ("POST", re.compile(r"^/auth/telegram$"), "user", ("user", "id")),
+    ("POST", re.compile(r"^/futures/offers$"), "contract", ("id",)),
+    # Частичное принятие создаёт дочерний контракт; при полном id совпадает с id предложения
+    ("POST", re.compile(r"^/futures/offers/\d+/take$"), "contract", ("id",)),
+    ("POST", re.compile(r"^/futures/net$"), "contract", ("contract_ids", "*")),
+    ("POST", re.compile(r"^/orders$"), "order", ("id",)),
+    ("POST", re.compile(r"^/alerts$"), "alert", ("id",)),
+)
+
+_ADDRESS_KEYS = ("address", "destination_address")
+
+
+def actor_from_cookies(cookie_header: str | None) -> int | None:
+    """user_id из ACCESS_TOKEN (токен в запись не попадает). Истёкший/битый токен → None."""
+    if not cookie_header:
+        return None
+    for part in cookie_header.split(";"):
+        name, _, value = part.strip().partition("=")
+        if name == "ACCESS_TOKEN" and value:
+            try:
+                return int(decode_jwt(value, secret=settings.jwt_secret)["sub"])
+            except Exception:
+                return None
+    return None
+
+
+def sanitize_body(path: str, raw: bytes) -> object:
+    """Тело запроса для записи: JSON без секретов. Не-JSON тела не записываем."""
+    if not raw:
+        return None
+    try:
+        body = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if path == "/auth/telegram" and isinstance(body, dict):
+        return {"telegram_user_id": _telegram_id_from_init_data(body.get("init_data") or "")}
+    if isinstance(body, dict):
+        for key in _ADDRESS_KEYS:
+            if body.get(key):
+                body[key] = PLACEHOLDER_TON_ADDRESS
+    return body
+
+
+def _telegram_id_from_init_data(init_data: str) -> str | None:
+    raw_user = dict(parse_qsl(init_data, keep_blank_values=True)).get("user")
+    if not raw_user:
+        return None
+    try:
+        user_id = json.loads(raw_user).get("id")
+    except (ValueError, AttributeError):
+        return None
+    return str(user_id) if user_id is not None else None
+
+
+def capture_for(method: str, path: str) -> tuple[str, tuple[str, ...]] | None:
+    """(тип сущности, ключи до id), если запрос создаёт сущность, id которой понадобится replay."""
+    for capture_method, pattern, kind, keys in CAPTURE_IDS:
+        if method == capture_method and pattern.match(path):
+            return kind, keys
+    return None
+
+
+def find_id(value: object, keys: tuple[str, ...]) -> int | list[int] | None:
+    """id по ключам в разобранном JSON-ответе; последний ключ "*" — список id."""
+    *path, last = keys
+    try:
+        for key in path:
+            value = value[key]
+        if last == "*":
+            return [int(item) for item in value]
+        return int(value[last])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def extract_id(response_body: bytes, keys: tuple[str, ...]) -> int | list[int] | None:
+    try:
+        value = json.loads(response_body)
+    except ValueError:
+        return None
+    return find_id(value, keys)
+
+
+def build_snapshot(db: Session) -> dict:
+    """Состояние на момент начала записи: replay восстанавливает его в чистой БД с теми же id."""
+    def rows(model, columns):
+        result = []
+        for row in db.execute(select(*[getattr(model, c) for c in columns]).order_by(model.id)):
+            result.append({c: _plain(v) for c, v in zip(columns, row)})
+        return result
+
+    return {
+        "type": "snapshot",
+        "users": rows(User, ("id", "telegram_user_id")),
+        "balances": rows(Balance, ("id", "user_id", "currency", "available", "reserved")),
+        "gifts": rows(Gift, ("id", "name", "is_active")),
+        "expiries": rows(Expiry, ("id", "days", "is_active")),
+        "markets": rows(Market, ("id", "gift_id", "expiry_id", "is_active", "price_ton", "price_usdt")),
+        "contracts": [
+            c for c in rows(FuturesContract, (
+                "id", "market_id", "emitter_id", "buyer_id", "side", "qty", "entry_price",
+                "status", "margin_emitter", "margin_buyer",
+            ))
+            if c["status"] in ("open", "taken")
+        ],
+    }
+
+
+def _plain(value):
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    return format_amount(value)
+
+
+def _open_run_file(base: str):
+    """Новый файл записи для этого запуска: <имя>-<UTC время>-<pid>[-N]<расширение>."""
+    base_path = Path(base)
+    stem = f"{base_path.stem}-{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{os.getpid()}"
+    for n in range(1000):
+        candidate = base_path.with_name(f"{stem}{f'-{n}' if n else ''}{base_path.suffix or '.ndjson'}")
+        try:
+            return open(candidate, "x", encoding="utf-8")
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"no free recording file name for {base}")
+
+
+def read_recording(path: str) -> tuple[dict | None, list[dict]]:
+    """Снимок и запросы одного запуска. В старых записях запуски дописывались в один файл —
+    каждый со своим снимком и смещениями от нуля; берём только первый запуск."""
+    snapshot = None
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("type") == "snapshot":
+                if snapshot is not None or entries:
+                    logger.warning(
+                        "Recording holds several runs, reading only the first",
+                        extra={"event": "traffic_recording_mixed", "path": path},
+                    )
+                    break
+                snapshot = item
+            else:
+                entries.append(item)
+    entries.sort(key=lambda e: e["t"])
+    return snapshot, entries
+
+
+class TrafficRecorder:
+    """Пишет строки NDJSON в собственный файл запуска из фонового потока; первая строка — снимок."""
+
+    def __init__(self, path: str) -> None:
+        self.started = time.monotonic()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._file = _open_run_file(path)
+        self.path = self._file.name
+        self._has_snapshot = False
+        self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def offset(self) -> float:
+        return round(time.monotonic() - self.started, 3)
+
+    def write_snapshot(self, snapshot: dict) -> None:
+        """Снимок состояния — один на файл, до первого запроса."""
+        if self._has_snapshot:
+            raise RuntimeError(f"recording {self.path} already has a snapshot")
+        self._has_snapshot = True
+        self.write(snapshot)
+        logger.info("Traffic recording started", extra={"event": "traffic_recording_started", "path": self.path})
+
+    def write(self, entry: dict) -> None:
+        self._queue.put(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+
+    def _run(self) -> None:
+        while True:
+            line = self._queue.get()
+            if line is None:
+                break
+            try:
+                self._file.write(line + "\n")
+                self._file.flush()
+            except OSError:
+                logger.exception("Traffic recorder write failed", extra={"event": "traffic_record_failed"})
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        if not self._file.closed:
+            self._file.close()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from decimal import Decimal
-from sqlalchemy import String, DateTime, Integer, Boolean, Numeric, UniqueConstraint, ForeignKey
+from sqlalchemy import String, DateTime, Integer, Boolean, Numeric, Text, UniqueConstraint, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.database import Base
@@ -112,9 +112,33 @@ class Withdrawal(Base):
     currency: Mapped[str] = mapped_column(String(CURRENCY_LEN), nullable=False)
     amount: Mapped[Decimal] = mapped_column(Numeric(36, 18), nullable=False)
     destination_address: Mapped[str] = mapped_column(String(68), nullable=False)
-    status: Mapped[str] = mapped_column(String(16), nullable=False)  # pending | completed | failed
+    status: Mapped[str] = mapped_column(String(16), nullable=False)  # pending | processing | submitted | completed | failed
     tx_hash: Mapped[str | None] = mapped_column(String(128), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    # Обработка воркером (app/services/withdrawals.py): чей захват и в какой пакет попала заявка
+    claim_token: Mapped[str | None] = mapped_column(String(36), nullable=True)
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    batch_id: Mapped[int | None] = mapped_column(ForeignKey("withdrawal_batches.id"), nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    __table_args__ = (Index("ix_withdrawals_status_id", "status", "id"),)
+
+
+class WithdrawalBatch(Base):
+    """Одна транзакция кошелька проекта: несколько исходящих сообщений (по одному на заявку)."""
+
+    __tablename__ = "withdrawal_batches"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    currency: Mapped[str] = mapped_column(String(CURRENCY_LEN), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)  # submitting | submitted | confirmed | failed
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    external_ref: Mapped[str | None] = mapped_column(String(128), nullable=True)  # hash внешнего сообщения
+    tx_hash: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    error: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    submitted_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    confirmed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
 
 # --- Торговля (пока без конкретной торговой модели) ---
@@ -159,13 +183,108 @@ class FuturesContract(Base):
     side: Mapped[str] = mapped_column(String(8), nullable=False)  # long | short
     qty: Mapped[Decimal] = mapped_column(Numeric(36, 18), nullable=False)  # количество базового актива (подарков)
     entry_price: Mapped[Decimal] = mapped_column(Numeric(36, 18), nullable=False)  # цена при входе (из price_ton)
-    status: Mapped[str] = mapped_column(String(16), nullable=False, default="open")  # open | taken | closed | liquidated
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="open")  # open | taken | closed | liquidated | cancelled | netted
     margin_emitter: Mapped[Decimal] = mapped_column(Numeric(36, 18), nullable=False, default=Decimal("0"))
     margin_buyer: Mapped[Decimal] = mapped_column(Numeric(36, 18), nullable=False, default=Decimal("0"))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     closed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     close_price: Mapped[Decimal | None] = mapped_column(Numeric(36, 18), nullable=True)
     liquidation_reason: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # Срок жизни открытого предложения; снятие — app/services/offers.py
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    cancel_reason: Mapped[str | None] = mapped_column(String(32), nullable=True)  # user | ttl | market_inactive | expiry_passed
+    # Частичное принятие: принятая часть — отдельный контракт с parent_id предложения,
+    # fill_count — версия предложения для условного UPDATE (app/services/futures.py: fill_offer)
+    parent_id: Mapped[int | None] = mapped_column(ForeignKey("futures_contracts.id"), nullable=True, index=True)
+    fill_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Неттинг (app/services/netting.py): в какой нетто-контракт свёрнут; NULL — позиции взаимно погасились
+    netted_into: Mapped[int | None] = mapped_column(ForeignKey("futures_contracts.id"), nullable=True)
 
     market: Mapped["Market"] = relationship("Market", foreign_keys=[market_id])
 
+    __table_args__ = (Index("ix_futures_contracts_status_expires", "status", "expires_at"),)
+
+
+class ContractFill(Base):
+    """Принятие предложения (целиком или части): история для GET /futures/offers/{id}/fills."""
+
+    __tablename__ = "contract_fills"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    offer_id: Mapped[int] = mapped_column(ForeignKey("futures_contracts.id"), nullable=False, index=True)
+    contract_id: Mapped[int] = mapped_column(ForeignKey("futures_contracts.id"), nullable=False)  # контракт покупателя
+    buyer_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    qty: Mapped[Decimal] = mapped_column(Numeric(36, 18), nullable=False)
+    margin: Mapped[Decimal] = mapped_column(Numeric(36, 18), nullable=False)  # маржа покупателя
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ConditionalOrder(Base):
+    """
+    Условный ордер (app/services/orders.py): исполняется на пуше цены, пересёкшем trigger_price.
+
+    limit_entry — разместить предложение (side, qty) по цене оракула; stop_loss / take_profit —
+    рассчитать принятый контракт contract_id. direction (above | below) выводится при создании.
+    """
+
+    __tablename__ = "conditional_orders"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    market_id: Mapped[int] = mapped_column(ForeignKey("markets.id"), nullable=False)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)  # limit_entry | stop_loss | take_profit
+    side: Mapped[str | None] = mapped_column(String(8), nullable=True)  # long | short (limit_entry)
+    qty: Mapped[Decimal | None] = mapped_column(Numeric(36, 18), nullable=True)  # limit_entry
+    contract_id: Mapped[int | None] = mapped_column(ForeignKey("futures_contracts.id"), nullable=True)  # stop_loss | take_profit
+    trigger_price: Mapped[Decimal] = mapped_column(Numeric(36, 18), nullable=False)
+    direction: Mapped[str] = mapped_column(String(8), nullable=False)  # above | below
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="active")  # active | executed | failed | cancelled
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    executed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    executed_price: Mapped[Decimal | None] = mapped_column(Numeric(36, 18), nullable=True)
+    result_contract_id: Mapped[int | None] = mapped_column(ForeignKey("futures_contracts.id"), nullable=True)  # limit_entry
+    error: Mapped[str | None] = mapped_column(String(128), nullable=True)
+
+    __table_args__ = (
+        Index("ix_conditional_orders_status_id", "status", "id"),
+        Index("ix_conditional_orders_user_status", "user_id", "status"),
+        Index("ix_conditional_orders_contract_status", "contract_id", "status"),
+    )
+
+
+# --- Ценовые алерты (app/services/alerts.py) ---
+
+
+class PriceAlert(Base):
+    """Алерт срабатывает один раз: цена рынка поднялась до threshold (above) или опустилась до него (below)."""
+
+    __tablename__ = "price_alerts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    market_id: Mapped[int] = mapped_column(ForeignKey("markets.id"), nullable=False)
+    direction: Mapped[str] = mapped_column(String(8), nullable=False)  # above | below
+    threshold: Mapped[Decimal] = mapped_column(Numeric(36, 18), nullable=False)  # цена TON
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="active")  # active | fired | cancelled
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    fired_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    fired_price: Mapped[Decimal | None] = mapped_column(Numeric(36, 18), nullable=True)
+
+    __table_args__ = (
+        Index("ix_price_alerts_status_id", "status", "id"),
+        Index("ix_price_alerts_user_status", "user_id", "status"),
+    )
+
+
+# --- Outbox доменных событий (app/services/outbox.py) ---
+
+
+class OutboxEvent(Base):
+    """Событие пишется в той же транзакции, что и бизнес-изменение; потребители читают по возрастанию id."""
+
+    __tablename__ = "outbox_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    type: Mapped[str] = mapped_column(String(64), nullable=False)  # deposit_credited, offer_taken, ...
+    payload: Mapped[str] = mapped_column(Text, nullable=False)  # JSON
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
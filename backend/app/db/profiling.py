@@ -0,0 +1,134 @@
+"""
+Профилирование SQL по запросам API: число запросов, суммарное время БД, самый медленный запрос,
+подозрения на N+1 (один и тот же SQL много раз за HTTP-запрос).
+
+Слушатели before/after_cursor_execute висят на engine; статистика копится в объекте из ContextVar,
+который middleware создаёт на каждый HTTP-запрос (виден и в потоке, где выполняется sync-эндпоинт).
+Вне HTTP-запроса (скрипты, фикстуры тестов) статистика запроса не записывается.
+
+Латентность записей (INSERT/UPDATE/DELETE) пишется всегда — в db_write_latency (EWMA): у SQLite
+один писатель, ожидание блокировки попадает во время первого пишущего запроса транзакции.
+По ней app/core/rate_limit.py сбрасывает нагрузку.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from sqlalchemy import event
+
+from app.core.settings import settings
+from app.db.database import engine
+
+
+# Порог повторов одного SQL за запрос, после которого логируем подозрение на N+1
+N_PLUS_ONE_THRESHOLD = settings.db_n_plus_one_threshold
+
+_SLOWEST_SQL_MAX_LEN = 300
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    total_ms: float = 0.0
+    slowest_ms: float = 0.0
+    slowest_sql: str | None = None
+    statements: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.statements[statement] += 1
+        if elapsed_ms >= self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest_sql = statement
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+        """SQL, выполненные не меньше threshold раз (кандидаты в N+1)."""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+    def header_value(self) -> str:
+        return f"count={self.count}; time_ms={self.total_ms:.2f}; slowest_ms={self.slowest_ms:.2f}"
+
+    def log_fields(self) -> dict:
+        fields = {
+            "db_queries": self.count,
+            "db_time_ms": round(self.total_ms, 2),
+            "db_slowest_ms": round(self.slowest_ms, 2),
+        }
+        if self.slowest_sql:
+            fields["db_slowest_sql"] = " ".join(self.slowest_sql.split())[:_SLOWEST_SQL_MAX_LEN]
+        return fields
+
+
+class WriteLatency:
+    """EWMA латентности записи, мс. Без новых замеров значение затухает (половина за half_life секунд)."""
+
+    def __init__(self, alpha: float = 0.2, half_life: float = 5.0) -> None:
+        self.alpha = alpha
+        self.half_life = half_life
+        self._value = 0.0
+        self._at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def value(self, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        return self._value * 0.5 ** (max(0.0, now - self._at) / self.half_life)
+
+    def observe(self, elapsed_ms: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            current = self.value(now)
+            self._value = current + self.alpha * (elapsed_ms - current)
+            self._at = now
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = 0.0
+            self._at = time.monotonic()
+
+
+db_write_latency = WriteLatency()
+
+_current: ContextVar[QueryStats | None] = ContextVar("db_query_stats", default=None)
+
+
+@contextmanager
+def profile_queries() -> Iterator[QueryStats]:
+    """Собрать статистику SQL, выполненных в текущем контексте (HTTP-запрос, скрипт, тест)."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.get("query_started_at")
+    if not started:
+        return
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        db_write_latency.observe(elapsed_ms)
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+
+
+@event.listens_for(engine, "handle_error")
+def _handle_error(exception_context) -> None:
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started_at"):
+        conn.info["query_started_at"].pop()
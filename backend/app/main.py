@@ -4,15 +4,27 @@ vision.md, conventions.md.
 """
 from __future__ import annotations
 
+import logging
+import time
+import zlib
+from contextlib import asynccontextmanager
+from uuid import uuid4
+
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from sqlalchemy import text
 
+from app.core import metrics
+from app.core.balance_cache import subscribe_invalidation
+from app.core.logging import setup_logging
 from app.core.settings import settings
-from app.db.database import Base, engine
+from app.core.traffic import SKIP_PATHS, TrafficRecorder, actor_from_cookies, build_snapshot, capture_for, extract_id, sanitize_body
+from app.db.database import Base, SessionLocal, engine
 from app.db import models  # noqa: F401 — регистрация таблиц в Base.metadata
+from app.db.profiling import profile_queries
+from app.services.outbox import dispatcher
 from app.routes.health import router as health_router
 from app.routes.auth import router as auth_router
 from app.routes.me import router as me_router
@@ -20,6 +32,14 @@ from app.routes.markets import router as markets_router
 from app.routes.ton_webhook import router as ton_webhook_router
 from app.routes.admin import router as admin_router
 from app.routes.futures import router as futures_router
+from app.routes.alerts import router as alerts_router
+from app.routes.orders import router as orders_router
+from app.routes.metrics import router as metrics_router
+from app.routes.bootstrap import router as bootstrap_router
+
+
+setup_logging()
+logger = logging.getLogger("api")
 
 
 class KeepAliveMiddleware(BaseHTTPMiddleware):
@@ -30,10 +50,197 @@ class KeepAliveMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Счётчик запросов, гистограмма латентности по шаблону маршрута и число запросов в обработке."""
+
+    async def dispatch(self, request: Request, call_next):
+        metrics.http_requests_in_flight.inc()
+        started = time.perf_counter()
+        status = "500"
+        try:
+            response = await call_next(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.http_requests_in_flight.dec()
+            # Шаблон пути (/futures/offers/{offer_id}/take), а не сам путь — иначе метки без границ
+            route = request.scope.get("route")
+            route_path = getattr(route, "path", None) or "<unmatched>"
+            metrics.http_requests_total.inc(route_path, request.method, status)
+            metrics.http_request_duration_seconds.observe(elapsed, route_path, request.method)
+
+
+class RequestLogMiddleware(BaseHTTPMiddleware):
+    """request_end в лог (vision: формат логов) со статистикой SQL за запрос; N+1 — отдельным предупреждением."""
+
+    async def dispatch(self, request: Request, call_next):
+        request_id = request.headers.get("x-request-id") or uuid4().hex
+        started = time.perf_counter()
+        with profile_queries() as stats:
+            response = await call_next(request)
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        if settings.db_profile_header:
+            response.headers["X-DB-Queries"] = stats.header_value()
+        logger.info(
+            f"{request.method} {request.url.path}",
+            extra={
+                "event": "request_end",
+                "request_id": request_id,
+                "status_code": response.status_code,
+                "duration_ms": duration_ms,
+                **stats.log_fields(),
+            },
+        )
+        for sql, times in stats.repeated():
+            logger.warning(
+                "Same SQL statement repeated within one request (possible N+1)",
+                extra={
+                    "event": "db_n_plus_one_suspected",
+                    "request_id": request_id,
+                    "path": request.url.path,
+                    "times": times,
+                    "sql": " ".join(sql.split())[:300],
+                },
+            )
+        return response
+
+
+class TrafficRecordMiddleware:
+    """Запись запросов в NDJSON для replay (RECORD_TRAFFIC_PATH, см. app/core/traffic.py)."""
+
+    def __init__(self, app, recorder: TrafficRecorder) -> None:
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        offset = self.recorder.offset()
+        method, path = scope["method"], scope["path"]
+        capture = capture_for(method, path)
+        request_body = bytearray()
+        response_body = bytearray()
+        status = 500
+
+        async def receive_tee():
+            message = await receive()
+            if message["type"] == "http.request":
+                request_body.extend(message.get("body", b""))
+            return message
+
+        async def send_tee(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and capture:
+                response_body.extend(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_tee, send_tee)
+        finally:
+            headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+            query = scope.get("query_string", b"").decode("latin-1")
+            entry = {
+                "t": offset,
+                "method": method,
+                "path": f"{path}?{query}" if query else path,
+                "status": status,
+                "user": actor_from_cookies(headers.get("cookie")),
+                "admin": "authorization" in headers,
+                "body": sanitize_body(path, bytes(request_body)),
+            }
+            if capture and status == 200:
+                kind, keys = capture
+                entry["created"] = {kind: extract_id(bytes(response_body), keys)}
+            self.recorder.write(entry)
+
+
+# Предел распакованного тела запроса (защита от gzip-бомбы)
+MAX_DECOMPRESSED_BODY_BYTES = 10 * 1024 * 1024
+
+
+class GzipRequestMiddleware:
+    """Распаковка тел запросов с Content-Encoding: gzip (оракул шлёт пакеты цен сжатыми)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"content-encoding", b"").strip().lower() != b"gzip":
+            await self.app(scope, receive, send)
+            return
+
+        compressed = bytearray()
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            compressed += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(bytes(compressed), MAX_DECOMPRESSED_BODY_BYTES)
+            too_large = bool(decompressor.unconsumed_tail)
+        except zlib.error:
+            await Response("Invalid gzip body", status_code=400)(scope, receive, send)
+            return
+        if too_large:
+            await Response("Request body too large", status_code=413)(scope, receive, send)
+            return
+
+        scope = dict(scope)
+        scope["headers"] = [
+            (k, str(len(body)).encode("latin-1") if k == b"content-length" else v)
+            for k, v in scope["headers"]
+            if k != b"content-encoding"
+        ]
+        sent = False
+
+        async def receive_decompressed():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, receive_decompressed, send)
+
+
+# Записи балансов воркерами доходят до кэша /me/balances через события outbox
+subscribe_invalidation(dispatcher)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    dispatcher.start()
+    try:
+        yield
+    finally:
+        dispatcher.stop()
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="Gifts Futures API")
+    app = FastAPI(title="Gifts Futures API", lifespan=lifespan)
 
     app.add_middleware(KeepAliveMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(RequestLogMiddleware)
+    # Запись трафика — внутри распаковки gzip, чтобы в файл попадали тела в виде JSON
+    recorder = TrafficRecorder(settings.record_traffic_path) if settings.record_traffic_path else None
+    if recorder is not None:
+        app.add_middleware(TrafficRecordMiddleware, recorder=recorder)
+    app.add_middleware(GzipRequestMiddleware)
 
     # CORS: позволяем Mini App (локально и по домену) ходить в API
     app.add_middleware(
@@ -78,18 +285,57 @@ def create_app() -> FastAPI:
             idx_names = [row[1] for row in r4.fetchall()]
             if "uq_gifts_name" not in idx_names:
                 conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_gifts_name ON gifts(name)"))
+            # withdrawals: поля воркера вывода (claim/batch)
+            r5 = conn.execute(text("PRAGMA table_info(withdrawals)"))
+            w_columns = [row[1] for row in r5.fetchall()]
+            if "claim_token" not in w_columns:
+                conn.execute(text("ALTER TABLE withdrawals ADD COLUMN claim_token VARCHAR(36) NULL"))
+            if "claimed_at" not in w_columns:
+                conn.execute(text("ALTER TABLE withdrawals ADD COLUMN claimed_at DATETIME NULL"))
+            if "batch_id" not in w_columns:
+                conn.execute(text("ALTER TABLE withdrawals ADD COLUMN batch_id INTEGER NULL REFERENCES withdrawal_batches(id)"))
+            if "attempts" not in w_columns:
+                conn.execute(text("ALTER TABLE withdrawals ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_withdrawals_status_id ON withdrawals(status, id)"))
+            # futures_contracts: срок жизни предложения и причина снятия
+            r6 = conn.execute(text("PRAGMA table_info(futures_contracts)"))
+            f_columns = [row[1] for row in r6.fetchall()]
+            if "expires_at" not in f_columns:
+                conn.execute(text("ALTER TABLE futures_contracts ADD COLUMN expires_at DATETIME NULL"))
+            if "cancel_reason" not in f_columns:
+                conn.execute(text("ALTER TABLE futures_contracts ADD COLUMN cancel_reason VARCHAR(32) NULL"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_futures_contracts_status_expires ON futures_contracts(status, expires_at)"))
+            # futures_contracts: частичное принятие предложений
+            if "parent_id" not in f_columns:
+                conn.execute(text("ALTER TABLE futures_contracts ADD COLUMN parent_id INTEGER NULL REFERENCES futures_contracts(id)"))
+            if "fill_count" not in f_columns:
+                conn.execute(text("ALTER TABLE futures_contracts ADD COLUMN fill_count INTEGER NOT NULL DEFAULT 0"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_futures_contracts_parent_id ON futures_contracts(parent_id)"))
+            if "netted_into" not in f_columns:
+                conn.execute(text("ALTER TABLE futures_contracts ADD COLUMN netted_into INTEGER NULL REFERENCES futures_contracts(id)"))
             conn.commit()
 
+    if recorder is not None:
+        with SessionLocal() as db:
+            recorder.write_snapshot(build_snapshot(db))
+
     app.include_router(health_router)
+    app.include_router(metrics_router)
     # Онбординг Mini App: auth + /me + markets
     app.include_router(auth_router)
     app.include_router(me_router)
     app.include_router(markets_router)
+    # Первый экран Mini App одним запросом
+    app.include_router(bootstrap_router)
     app.include_router(ton_webhook_router)
     # Админ-панель: управление справочниками и корректировка балансов
     app.include_router(admin_router)
     # Фьючерсы на подарки: предложения, принятие и расчёт
     app.include_router(futures_router)
+    # Ценовые алерты (срабатывают на пушах цен оракула)
+    app.include_router(alerts_router)
+    # Условные ордера (исполняются на пушах цен оракула)
+    app.include_router(orders_router)
     return app
 
 
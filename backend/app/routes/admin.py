@@ -1,16 +1,26 @@
 from __future__ import annotations
 
 import logging
+from datetime import datetime
 from decimal import Decimal
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
+from app.core import metrics
 from app.core.admin_auth import require_admin_token
+from app.core.money import format_amount, from_nano, to_nano
 from app.core.settings import settings
 from app.db.database import get_db
-from app.db.models import Balance, Expiry, Gift, LedgerEntry, Market
+from app.db.models import Balance, Expiry, FuturesContract, Gift, LedgerEntry, Market
+from app.services.alerts import fire_alerts
+from app.services.markets import provision_markets
+from app.services.netting import net_contracts
+from app.services.offers import cancel_offers, stale_offers, sweep
+from app.services.orders import close_contract, execute_orders
+from app.services.outbox import emit, event_out, fetch_after, with_recipients
 
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -96,6 +106,11 @@ def toggle_market(
     
     old_value = market.is_active
     market.is_active = body.is_active
+    cancelled = []
+    if old_value and not body.is_active:
+        # Открытые предложения выключенного рынка снимаются сразу (первая пачка; остаток — sweeper), маржа возвращается эмитентам
+        db.flush()
+        cancelled = cancel_offers(db, stale_offers(db, datetime.utcnow(), settings.offer_sweep_batch_size, market_id=market.id))
     db.commit()
     
     logger.info(
@@ -107,11 +122,43 @@ def toggle_market(
             "expiry_id": market.expiry_id,
             "old_value": old_value,
             "new_value": body.is_active,
+            "offers_cancelled": len(cancelled),
         },
     )
     return {"id": market.id, "gift_id": market.gift_id, "expiry_id": market.expiry_id, "is_active": market.is_active}
 
 
+class ProvisionMarketsIn(BaseModel):
+    expiry_days: list[int]
+
+
+@router.post("/markets/provision")
+def provision_markets_endpoint(
+    body: ProvisionMarketsIn,
+    _: None = Depends(require_admin_token),
+    db: Session = Depends(get_db),
+):
+    """
+    Создать недостающие рынки для всех активных подарков по набору сроков (дней).
+    Недостающие сроки создаются в expiries; рынки вставляются одним INSERT … SELECT.
+    """
+    if not body.expiry_days or any(d <= 0 for d in body.expiry_days):
+        raise HTTPException(status_code=400, detail="expiry_days must be a non-empty list of positive integers")
+
+    result = provision_markets(db, body.expiry_days)
+    db.commit()
+
+    logger.info(
+        "Markets provisioned",
+        extra={
+            "event": "admin_markets_provisioned",
+            "markets_created": result["created"],
+            "expiry_days": [e["days"] for e in result["expiries"]],
+        },
+    )
+    return result
+
+
 # --- Корректировка баланса ---
 
 
@@ -241,44 +288,81 @@ def bulk_update_market_prices(
     if not items:
         raise HTTPException(status_code=400, detail="Empty payload")
 
-    updated = 0
+    # Парсим Decimal
+    parsed: list[tuple[MarketPriceItem, Decimal | None, Decimal | None]] = []
     for item in items:
         if item.price_ton is None and item.price_usdt is None:
             continue
-
-        # Парсим Decimal
         price_ton_dec: Decimal | None = None
         price_usdt_dec: Decimal | None = None
         try:
             if item.price_ton is not None:
-                price_ton_dec = Decimal(item.price_ton)
+                # Цена TON участвует в расчётах маржи/PnL в нанотонах — принимаем не более 9 знаков
+                price_ton_dec = from_nano(to_nano(item.price_ton))
             if item.price_usdt is not None:
                 price_usdt_dec = Decimal(item.price_usdt)
         except Exception:
             raise HTTPException(status_code=400, detail=f"Invalid price format for item {item}")
+        if item.market_id is None and not item.gift_name:
+            continue
+        parsed.append((item, price_ton_dec, price_usdt_dec))
+
+    # Все затронутые рынки — одним запросом (а не запрос на каждый элемент пакета)
+    market_ids = {item.market_id for item, _, _ in parsed if item.market_id is not None}
+    gift_names = {item.gift_name for item, _, _ in parsed if item.market_id is None}
+    by_id: dict[int, Market] = {}
+    by_gift_name: dict[str, list[Market]] = {}
+    if market_ids or gift_names:
+        conditions = []
+        if market_ids:
+            conditions.append(Market.id.in_(market_ids))
+        if gift_names:
+            conditions.append(Gift.name.in_(gift_names))
+        rows = (
+            db.query(Market, Gift.name)
+            .join(Gift, Gift.id == Market.gift_id)
+            .filter(or_(*conditions))
+            .all()
+        )
+        for market, gift_name in rows:
+            by_id[market.id] = market
+            by_gift_name.setdefault(gift_name, []).append(market)
 
-        q = db.query(Market)
+    updated = 0
+    changed: dict[int, Market] = {}
+    for item, price_ton_dec, price_usdt_dec in parsed:
         if item.market_id is not None:
-            q = q.filter(Market.id == item.market_id)
-        elif item.gift_name:
-            q = q.join(Gift, Gift.id == Market.gift_id).filter(Gift.name == item.gift_name)
+            markets = [by_id[item.market_id]] if item.market_id in by_id else []
         else:
-            continue
-
-        markets = q.all()
-        if not markets:
-            continue
+            markets = by_gift_name.get(item.gift_name, [])
 
         for m in markets:
             if price_ton_dec is not None:
                 m.price_ton = price_ton_dec
             if price_usdt_dec is not None:
                 m.price_usdt = price_usdt_dec
+            changed[m.id] = m
             updated += 1
 
     if updated == 0:
         return {"updated": 0}
 
+    # Одно событие на пуш оракула: итоговые цены всех затронутых рынков
+    emit(db, "market_prices_updated", {
+        "markets": [
+            {
+                "market_id": m.id,
+                "price_ton": format_amount(m.price_ton) if m.price_ton is not None else None,
+                "price_usdt": format_amount(m.price_usdt) if m.price_usdt is not None else None,
+            }
+            for m in changed.values()
+        ],
+    })
+    # Алерты по новым ценам TON: только пересёкшие порог (книга триггеров, app/services/alerts.py)
+    prices_nano = {m.id: to_nano(m.price_ton, exact=False) for m in changed.values() if m.price_ton is not None}
+    fired = fire_alerts(db, prices_nano)
+    # Условные ордера, пересёкшие порог, — одним пакетом в той же транзакции (app/services/orders.py)
+    executed = execute_orders(db, prices_nano)
     db.commit()
     logger.info(
         "Markets prices bulk updated",
@@ -286,6 +370,95 @@ def bulk_update_market_prices(
             "event": "admin_markets_price_bulk_updated",
             "updated": updated,
             "items_count": len(items),
+            "alerts_fired": len(fired),
+            "orders_executed": len(executed),
         },
     )
     return {"updated": updated}
+
+
+# --- Снятие просроченных предложений и неттинг контрактов ---
+
+
+@router.post("/offers/sweep")
+def sweep_offers(
+    _: None = Depends(require_admin_token),
+    db: Session = Depends(get_db),
+):
+    """Один проход sweeper'а (как offer_sweeper.py --once): просроченные предложения и предложения на выключенных рынках."""
+    summary = sweep(db, batch_size=settings.offer_sweep_batch_size)
+    logger.info("Offers swept", extra={"event": "admin_offers_swept", **summary})
+    return summary
+
+
+@router.post("/futures/net")
+def net_futures(
+    market_id: int | None = None,
+    _: None = Depends(require_admin_token),
+    db: Session = Depends(get_db),
+):
+    """Неттинг встречных контрактов (как netting_worker.py --once); market_id — только по рынку."""
+    summary = net_contracts(db, batch_size=settings.netting_batch_size, market_id=market_id)
+    logger.info("Contracts netted", extra={"event": "admin_contracts_netted", "market_id": market_id, **summary})
+    return summary
+
+
+class SettleIn(BaseModel):
+    close_price: str | None = None
+
+
+@router.post("/futures/{contract_id}/settle")
+def settle_future(
+    contract_id: int,
+    body: SettleIn,
+    _: None = Depends(require_admin_token),
+    db: Session = Depends(get_db),
+):
+    """Рассчитать любой контракт по заданной цене (по умолчанию — по текущей цене рынка)."""
+    contract = db.get(FuturesContract, contract_id)
+    if contract is None or contract.status not in ("taken", "open"):
+        raise HTTPException(status_code=404, detail="Contract not found or not settleable")
+
+    if body.close_price is not None:
+        try:
+            close_nano = to_nano(body.close_price)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid close_price")
+    else:
+        market = db.get(Market, contract.market_id)
+        if market is None or market.price_ton is None:
+            raise HTTPException(status_code=400, detail="Market has no TON price for settlement")
+        close_nano = to_nano(market.price_ton, exact=False)
+    pnl = close_contract(db, contract, close_nano)
+    db.commit()
+    metrics.contracts_settled_total.inc()
+    logger.info("Contract settled", extra={"event": "admin_contract_settled", "contract_id": contract_id})
+    return {
+        "contract_id": contract.id,
+        "status": contract.status,
+        "close_price": format_amount(from_nano(close_nano)),
+        "pnl_emitter": format_amount(from_nano(pnl["pnl_emitter"])),
+        "pnl_buyer": format_amount(from_nano(pnl["pnl_buyer"])) if contract.buyer_id is not None else None,
+    }
+
+
+# --- Лента доменных событий (outbox) для внешних потребителей ---
+
+
+@router.get("/events")
+def list_events(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    types: str | None = None,
+    _: None = Depends(require_admin_token),
+    db: Session = Depends(get_db),
+):
+    """
+    События outbox с id > after_id по возрастанию id (курсор — у потребителя).
+
+    types — фильтр через запятую: "deposit_credited,contract_settled".
+    next_after_id — курсор для следующего запроса (не меняется, если событий нет).
+    """
+    wanted = {t.strip() for t in types.split(",") if t.strip()} if types else None
+    events = with_recipients(db, [event_out(e) for e in fetch_after(db, after_id, limit, wanted)])
+    return {"events": events, "next_after_id": events[-1]["id"] if events else after_id}
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.auth_deps import require_user_id_dep
+from app.core.money import format_amount, from_nano, to_nano
+from app.core.rate_limit import admit
+from app.core.settings import settings
+from app.db.database import get_db
+from app.db.models import Market, PriceAlert
+from app.services.alerts import discard_on_commit
+
+
+router = APIRouter(prefix="/alerts", tags=["alerts"])
+
+
+class AlertCreateIn(BaseModel):
+    market_id: int
+    direction: str = Field(pattern="^(above|below)$")
+    price: str = Field(..., description="Порог цены TON в виде строки Decimal")
+
+
+def _alert_out(alert: PriceAlert) -> dict:
+    return {
+        "id": alert.id,
+        "market_id": alert.market_id,
+        "direction": alert.direction,
+        "price": format_amount(alert.threshold),
+        "status": alert.status,
+        "created_at": alert.created_at.isoformat() if alert.created_at else None,
+        "fired_at": alert.fired_at.isoformat() if alert.fired_at else None,
+        "fired_price": format_amount(alert.fired_price) if alert.fired_price is not None else None,
+    }
+
+
+@router.post("", dependencies=[Depends(admit("trade"))])
+def create_alert(
+    body: AlertCreateIn,
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+):
+    """Алерт на цену рынка: сработает один раз на пуше цены, пересёкшем порог; уведомление — через бота."""
+    market = db.get(Market, body.market_id)
+    if market is None or not market.is_active:
+        raise HTTPException(status_code=400, detail="Market is not active or not found")
+    try:
+        threshold_nano = to_nano(body.price)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid price")
+    if threshold_nano <= 0:
+        raise HTTPException(status_code=400, detail="Price must be positive")
+    # Условие уже выполнено — алерт сработал бы на первом же пуше, без пересечения порога
+    if market.price_ton is not None:
+        current_nano = to_nano(market.price_ton, exact=False)
+        if (body.direction == "above" and current_nano >= threshold_nano) or (
+            body.direction == "below" and current_nano <= threshold_nano
+        ):
+            raise HTTPException(status_code=400, detail="Price is already on the alert side of the threshold")
+
+    active = db.scalar(
+        select(func.count()).select_from(PriceAlert).where(PriceAlert.user_id == user_id, PriceAlert.status == "active")
+    )
+    if active >= settings.alerts_max_per_user:
+        raise HTTPException(status_code=400, detail="Too many active alerts")
+
+    alert = PriceAlert(
+        user_id=user_id,
+        market_id=market.id,
+        direction=body.direction,
+        threshold=from_nano(threshold_nano),
+        status="active",
+    )
+    db.add(alert)
+    db.commit()
+    db.refresh(alert)
+    return _alert_out(alert)
+
+
+@router.get("")
+def list_alerts(
+    include_fired: bool = False,
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+):
+    """Алерты пользователя: активные, с include_fired — и сработавшие."""
+    statuses = ("active", "fired") if include_fired else ("active",)
+    rows = db.scalars(
+        select(PriceAlert)
+        .where(PriceAlert.user_id == user_id, PriceAlert.status.in_(statuses))
+        .order_by(PriceAlert.id.desc())
+    ).all()
+    return {"alerts": [_alert_out(a) for a in rows]}
+
+
+@router.delete("/{alert_id}", dependencies=[Depends(admit("trade"))])
+def cancel_alert(
+    alert_id: int,
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+):
+    """Отменить активный алерт."""
+    alert = db.get(PriceAlert, alert_id)
+    if alert is None or alert.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    if alert.status != "active":
+        raise HTTPException(status_code=400, detail="Alert is not active")
+    alert.status = "cancelled"
+    discard_on_commit(db, [alert.id])
+    db.commit()
+    return {"ok": True}
@@ -0,0 +1,48 @@
+"""
+GET /bootstrap — всё для первого экрана Mini App одним запросом.
+
+Вместо отдельных запросов (/me, /me/balances, /markets, /me/withdrawals, /futures/my, /futures/offers)
+по медленной мобильной сети — одна проверка авторизации, одна сессия БД и один ответ.
+Отдельные эндпоинты остаются для точечных обновлений после первого экрана.
+"""
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+
+from app.core.auth_deps import require_user_id_dep
+from app.core.balance_cache import get_balances
+from app.db.database import get_db
+from app.db.models import User
+from app.routes.futures import open_offers, user_contracts
+from app.routes.markets import active_markets
+from app.routes.me import MeOut, user_withdrawals
+
+
+router = APIRouter(tags=["bootstrap"])
+
+
+@router.get("/bootstrap")
+def bootstrap(
+    request: Request,
+    response: Response,
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+):
+    """Профиль, балансы, рынки, заявки на вывод, контракты и открытые предложения (как в отдельных эндпоинтах)."""
+    user = db.get(User, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    response.headers["Cache-Control"] = "no-store"
+    return {
+        "me": MeOut(
+            id=user.id,
+            telegram_user_id=user.telegram_user_id,
+            connected_ton_address=user.connected_ton_address,
+        ),
+        "balances": get_balances(db, user_id).as_dict(),
+        "markets": active_markets(db),
+        "withdrawals": user_withdrawals(db, user_id),
+        "contracts": user_contracts(db, user_id),
+        "offers": open_offers(db),
+    }
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
-from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
+from sqlalchemy import or_, select
 from sqlalchemy.orm import Session, joinedload
 
+from app.core import metrics
 from app.core.auth_deps import require_user_id_dep
+from app.core.money import format_amount, from_nano, to_nano
+from app.core.rate_limit import admit
+from app.core.settings import settings
 from app.db.database import get_db
-from app.db.models import Balance, FuturesContract, LedgerEntry, Market, Gift, Expiry
+from app.db.models import ContractFill, FuturesContract, Market, Gift, Expiry
+from app.services.futures import TradeError, fill_offer, get_ton_balance, open_offer
+from app.services.netting import net_contracts
+from app.services.offers import cancel_offers
+from app.services.orders import close_contract
 
 
 router = APIRouter(prefix="/futures", tags=["futures"])
@@ -19,6 +27,7 @@ class OfferCreateIn(BaseModel):
     market_id: int
     side: str = Field(pattern="^(long|short)$")
     qty: str = Field(..., description="Количество базового актива (подарков) в виде строки Decimal")
+    ttl_seconds: int | None = Field(default=None, ge=1, description="Срок жизни предложения в секундах (по умолчанию OFFER_DEFAULT_TTL_SECONDS)")
 
 
 class OfferOut(BaseModel):
@@ -28,14 +37,31 @@ class OfferOut(BaseModel):
     qty: str
     entry_price: str
     status: str
+    expires_at: str | None = None
+    parent_id: int | None = None
 
 
 class TakeOfferIn(BaseModel):
-    pass
+    qty: str | None = Field(default=None, description="Сколько принять (строка Decimal); по умолчанию — весь остаток")
 
 
-class SettleIn(BaseModel):
-    close_price: str | None = None
+class FillOut(BaseModel):
+    contract_id: int
+    buyer_id: int
+    qty: str
+    margin: str
+    created_at: str
+
+
+class OfferFillsOut(BaseModel):
+    offer_id: int
+    status: str
+    entry_price: str
+    total_qty: str
+    filled_qty: str
+    remaining_qty: str
+    fills_count: int
+    fills: list[FillOut]
 
 
 class MyContractOut(BaseModel):
@@ -50,16 +76,20 @@ class MyContractOut(BaseModel):
     expiry_days: int | None = None
 
 
-def _get_ton_balance(db: Session, user_id: int) -> Balance:
-    bal = db.query(Balance).filter(Balance.user_id == user_id, Balance.currency == "TON").first()
-    if bal is None:
-        bal = Balance(user_id=user_id, currency="TON", available=Decimal("0"), reserved=Decimal("0"))
-        db.add(bal)
-        db.flush()
-    return bal
+def _offer_out(contract: FuturesContract) -> OfferOut:
+    return OfferOut(
+        id=contract.id,
+        market_id=contract.market_id,
+        side=contract.side,
+        qty=format_amount(contract.qty),
+        entry_price=format_amount(contract.entry_price),
+        status=contract.status,
+        expires_at=contract.expires_at.isoformat() if contract.expires_at else None,
+        parent_id=contract.parent_id,
+    )
 
 
-@router.post("/offers", response_model=OfferOut)
+@router.post("/offers", response_model=OfferOut, dependencies=[Depends(admit("trade"))])
 def create_offer(
     body: OfferCreateIn,
     user_id: int = Depends(require_user_id_dep),
@@ -67,7 +97,7 @@ def create_offer(
 ) -> OfferOut:
     """Создать предложение по фьючерсу (эмитент размещает контракт).
 
-    MVP: маржа считается как qty * price_ton в TON.
+    MVP: маржа считается как qty * price_ton в TON (целые нанотоны, см. app.core.money).
     """
     market = db.get(Market, body.market_id)
     if market is None or not market.is_active:
@@ -76,53 +106,32 @@ def create_offer(
         raise HTTPException(status_code=400, detail="Market has no TON price configured")
 
     try:
-        qty = Decimal(body.qty)
-    except Exception:
+        qty_nano = to_nano(body.qty)
+    except ValueError:
         raise HTTPException(status_code=400, detail="Invalid qty")
-    if qty <= 0:
+    if qty_nano <= 0:
         raise HTTPException(status_code=400, detail="Qty must be positive")
+    ttl = settings.offer_default_ttl_seconds if body.ttl_seconds is None else body.ttl_seconds
+    if settings.offer_max_ttl_seconds and ttl > settings.offer_max_ttl_seconds:
+        raise HTTPException(status_code=400, detail=f"ttl_seconds must not exceed {settings.offer_max_ttl_seconds}")
 
-    entry_price: Decimal = market.price_ton
-    notional = qty * entry_price  # сколько TON замораживаем у эмитента
-
-    bal = _get_ton_balance(db, user_id)
-    if bal.available < notional:
-        raise HTTPException(status_code=400, detail="Недостаточно средств для маржи эмитента")
-
-    bal.available -= notional
-    db.add(
-        LedgerEntry(
-            user_id=user_id,
-            currency="TON",
-            delta=-notional,
-            reason="futures_margin",
-            ref_type="futures_offer",
-            ref_id=None,
+    try:
+        contract = open_offer(
+            db,
+            get_ton_balance(db, user_id),
+            market_id=market.id,
+            side=body.side,
+            qty_nano=qty_nano,
+            entry_nano=to_nano(market.price_ton, exact=False),
         )
-    )
-
-    contract = FuturesContract(
-        market_id=market.id,
-        emitter_id=user_id,
-        side=body.side,
-        qty=qty,
-        entry_price=entry_price,
-        status="open",
-        margin_emitter=notional,
-        margin_buyer=Decimal("0"),
-    )
-    db.add(contract)
+    except TradeError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    contract.expires_at = datetime.utcnow() + timedelta(seconds=ttl) if ttl else None
     db.commit()
     db.refresh(contract)
+    metrics.offers_created_total.inc()
 
-    return OfferOut(
-        id=contract.id,
-        market_id=contract.market_id,
-        side=contract.side,
-        qty=str(contract.qty),
-        entry_price=str(contract.entry_price),
-        status=contract.status,
-    )
+    return _offer_out(contract)
 
 
 @router.get("/offers", response_model=list[OfferOut])
@@ -130,161 +139,148 @@ def list_offers(
     db: Session = Depends(get_db),
 ) -> list[OfferOut]:
     """Список открытых предложений (status=open, без buyer_id)."""
+    return open_offers(db)
+
+
+def open_offers(db: Session) -> list[OfferOut]:
+    # Просроченные, но ещё не снятые sweeper'ом предложения не показываем
+    now = datetime.utcnow()
     rows = (
         db.query(FuturesContract)
-        .filter(FuturesContract.status == "open")
+        .filter(
+            FuturesContract.status == "open",
+            or_(FuturesContract.expires_at.is_(None), FuturesContract.expires_at > now),
+        )
         .all()
     )
-    return [
-        OfferOut(
-            id=c.id,
-            market_id=c.market_id,
-            side=c.side,
-            qty=str(c.qty),
-            entry_price=str(c.entry_price),
-            status=c.status,
-        )
-        for c in rows
-    ]
+    return [_offer_out(c) for c in rows]
 
 
-@router.post("/offers/{offer_id}/take", response_model=OfferOut)
+@router.post("/offers/{offer_id}/take", response_model=OfferOut, dependencies=[Depends(admit("trade"))])
 def take_offer(
     offer_id: int,
-    _: TakeOfferIn,
+    body: TakeOfferIn,
     user_id: int = Depends(require_user_id_dep),
     db: Session = Depends(get_db),
 ) -> OfferOut:
-    """Принять (купить) существующее предложение.
+    """Принять (купить) существующее предложение — целиком или часть qty.
 
-    Покупатель также замораживает notional TON как маржу.
+    Покупатель также замораживает notional TON как маржу. Возвращает контракт покупателя:
+    при частичном принятии — новый контракт (parent_id = offer_id), остаток предложения открыт.
     """
-    contract = db.get(FuturesContract, offer_id)
-    if contract is None or contract.status != "open":
-        raise HTTPException(status_code=404, detail="Offer not found or not open")
-    if contract.emitter_id == user_id:
-        raise HTTPException(status_code=400, detail="Emitter cannot take own offer")
-
-    notional = contract.qty * contract.entry_price
-    bal = _get_ton_balance(db, user_id)
-    if bal.available < notional:
-        raise HTTPException(status_code=400, detail="Недостаточно средств для маржи покупателя")
-
-    bal.available -= notional
-    db.add(
-        LedgerEntry(
-            user_id=user_id,
-            currency="TON",
-            delta=-notional,
-            reason="futures_margin",
-            ref_type="futures_take",
-            ref_id=contract.id,
-        )
-    )
+    qty_nano = None
+    if body.qty is not None:
+        try:
+            qty_nano = to_nano(body.qty)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid qty")
+        if qty_nano <= 0:
+            raise HTTPException(status_code=400, detail="Qty must be positive")
 
-    contract.buyer_id = user_id
-    contract.margin_buyer = notional
-    contract.status = "taken"
+    try:
+        contract = fill_offer(db, offer_id, get_ton_balance(db, user_id), qty_nano)
+    except TradeError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     db.commit()
     db.refresh(contract)
+    metrics.offers_taken_total.inc()
 
-    return OfferOut(
-        id=contract.id,
-        market_id=contract.market_id,
-        side=contract.side,
-        qty=str(contract.qty),
-        entry_price=str(contract.entry_price),
-        status=contract.status,
+    return _offer_out(contract)
+
+
+@router.get("/offers/{offer_id}/fills", response_model=OfferFillsOut)
+def offer_fills(
+    offer_id: int,
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+) -> OfferFillsOut:
+    """История принятий своего предложения и сводка: сколько принято, сколько осталось."""
+    offer = db.get(FuturesContract, offer_id)
+    if offer is None or offer.emitter_id != user_id or offer.parent_id is not None:
+        raise HTTPException(status_code=404, detail="Offer not found")
+    fills = db.scalars(select(ContractFill).where(ContractFill.offer_id == offer.id).order_by(ContractFill.id)).all()
+    filled_nano = sum(to_nano(f.qty, exact=False) for f in fills)
+    # Пока у строки предложения нет покупателя, её qty — непринятый остаток (открыт или снят)
+    unfilled_nano = to_nano(offer.qty, exact=False) if offer.buyer_id is None else 0
+    total_nano = filled_nano + unfilled_nano
+    remaining_nano = unfilled_nano if offer.status == "open" else 0
+    return OfferFillsOut(
+        offer_id=offer.id,
+        status=offer.status,
+        entry_price=format_amount(offer.entry_price),
+        total_qty=format_amount(from_nano(total_nano)),
+        filled_qty=format_amount(from_nano(filled_nano)),
+        remaining_qty=format_amount(from_nano(remaining_nano)),
+        fills_count=len(fills),
+        fills=[
+            FillOut(
+                contract_id=f.contract_id,
+                buyer_id=f.buyer_id,
+                qty=format_amount(f.qty),
+                margin=format_amount(f.margin),
+                created_at=f.created_at.isoformat(),
+            )
+            for f in fills
+        ],
     )
 
 
-@router.post("/{contract_id}/settle", response_model=OfferOut)
-def settle_contract(
+@router.post("/offers/{offer_id}/cancel", response_model=OfferOut, dependencies=[Depends(admit("trade"))])
+def cancel_offer(
+    offer_id: int,
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+) -> OfferOut:
+    """Снять своё открытое предложение: маржа эмитента возвращается на available."""
+    contract = db.get(FuturesContract, offer_id)
+    if contract is None or contract.emitter_id != user_id:
+        raise HTTPException(status_code=404, detail="Offer not found")
+    # Условный UPDATE внутри: параллельно принятое предложение не снимется
+    if not cancel_offers(db, {"user": [contract.id]}):
+        raise HTTPException(status_code=400, detail="Offer is not open")
+    db.commit()
+    db.refresh(contract)
+    return _offer_out(contract)
+
+
+@router.post("/{contract_id}/settle", response_model=OfferOut, dependencies=[Depends(admit("trade"))])
+def settle(
     contract_id: int,
-    body: SettleIn,
+    user_id: int = Depends(require_user_id_dep),
     db: Session = Depends(get_db),
 ) -> OfferOut:
-    """Закрыть/рассчитать контракт по текущей или заданной цене.
+    """Закрыть свой контракт по текущей цене рынка — только эмитент или покупатель.
 
-    MVP: PnL считается по простой формуле, разница распределяется на счета эмитента/покупателя.
+    Расчёт по заданной цене — только админ: POST /admin/futures/{id}/settle.
     """
     contract = db.get(FuturesContract, contract_id)
-    if contract is None or contract.status not in ("taken", "open"):
+    if (
+        contract is None
+        or contract.status not in ("taken", "open")
+        or user_id not in (contract.emitter_id, contract.buyer_id)
+    ):
         raise HTTPException(status_code=404, detail="Contract not found or not settleable")
 
     market = db.get(Market, contract.market_id)
     if market is None:
         raise HTTPException(status_code=400, detail="Market not found")
-
-    if body.close_price is not None:
-        try:
-            close_price = Decimal(body.close_price)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid close_price")
-    else:
-        if market.price_ton is None:
-            raise HTTPException(status_code=400, detail="Market has no TON price for settlement")
-        close_price = market.price_ton
-
-    entry = contract.entry_price
-    qty = contract.qty
-    move = (close_price - entry) / entry if entry != 0 else Decimal("0")
-
-    emitter_bal = _get_ton_balance(db, contract.emitter_id)
-    buyer_bal = _get_ton_balance(db, contract.buyer_id) if contract.buyer_id is not None else None
-
-    pnl_emitter = Decimal("0")
-    pnl_buyer = Decimal("0")
-
-    if close_price > entry:
-        # Цена выросла → разница идёт эмитенту
-        pnl = (close_price - entry) * qty
-        pnl_emitter = pnl
-    elif close_price < entry:
-        # Цена упала → разница идёт покупателю
-        pnl = (entry - close_price) * qty
-        pnl_buyer = pnl
-
-    # Разморозка маржи и зачисление PnL
-    emitter_bal.available += contract.margin_emitter + pnl_emitter
-    db.add(
-        LedgerEntry(
-            user_id=contract.emitter_id,
-            currency="TON",
-            delta=contract.margin_emitter + pnl_emitter,
-            reason="futures_settle",
-            ref_type="futures_contract",
-            ref_id=contract.id,
-        )
-    )
-
-    if contract.buyer_id is not None and buyer_bal is not None:
-        buyer_bal.available += contract.margin_buyer + pnl_buyer
-        db.add(
-            LedgerEntry(
-                user_id=contract.buyer_id,
-                currency="TON",
-                delta=contract.margin_buyer + pnl_buyer,
-                reason="futures_settle",
-                ref_type="futures_contract",
-                ref_id=contract.id,
-            )
-        )
-
-    contract.status = "closed"
-    contract.close_price = close_price
-    contract.closed_at = datetime.utcnow()
+    if market.price_ton is None:
+        raise HTTPException(status_code=400, detail="Market has no TON price for settlement")
+    close_contract(db, contract, to_nano(market.price_ton, exact=False))
     db.commit()
     db.refresh(contract)
+    metrics.contracts_settled_total.inc()
 
-    return OfferOut(
-        id=contract.id,
-        market_id=contract.market_id,
-        side=contract.side,
-        qty=str(contract.qty),
-        entry_price=str(contract.entry_price),
-        status=contract.status,
-    )
+    return _offer_out(contract)
+
+
+@router.post("/net", dependencies=[Depends(admit("trade"))])
+def net_my_contracts(
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+):
+    """Свернуть свои встречные контракты с каждым контрагентом по каждому рынку в нетто-контракты."""
+    return net_contracts(db, batch_size=settings.netting_batch_size, user_id=user_id, with_ids=True)
 
 
 @router.get("/my", response_model=list[MyContractOut])
@@ -293,6 +289,10 @@ def my_contracts(
     db: Session = Depends(get_db),
 ) -> list[MyContractOut]:
     """Список контрактов текущего пользователя (как эмитента, так и покупателя)."""
+    return user_contracts(db, user_id)
+
+
+def user_contracts(db: Session, user_id: int) -> list[MyContractOut]:
     rows = (
         db.query(FuturesContract)
         .options(joinedload(FuturesContract.market).joinedload(Market.gift), joinedload(FuturesContract.market).joinedload(Market.expiry))
@@ -313,8 +313,8 @@ def my_contracts(
                 id=c.id,
                 market_id=c.market_id,
                 side=c.side,
-                qty=str(c.qty),
-                entry_price=str(c.entry_price),
+                qty=format_amount(c.qty),
+                entry_price=format_amount(c.entry_price),
                 status=c.status,
                 role=role,
                 gift=gift_name,
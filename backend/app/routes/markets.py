@@ -13,6 +13,11 @@ router = APIRouter(prefix="/markets", tags=["markets"])
 @router.get("")
 def list_markets(db: Session = Depends(get_db)):
     """Список активных рынков из справочников gifts, expiries, markets (vision)."""
+    return {"markets": active_markets(db)}
+
+
+def active_markets(db: Session) -> list[dict]:
+    """Активные рынки (активны рынок, подарок и экспирация) — один запрос с joinedload."""
     rows = (
         db.query(Market)
         .options(
@@ -42,5 +47,5 @@ def list_markets(db: Session = Depends(get_db)):
                 "image_url": gift.image_url,
                 "active": True,
             })
-    return {"markets": markets}
+    return markets
 
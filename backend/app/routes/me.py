@@ -1,12 +1,15 @@
 from __future__ import annotations
 
-from decimal import Decimal
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.core.auth_deps import require_user_id_dep
+from app.core.balance_cache import get_balances
+from app.core.money import format_amount, from_nano, to_nano
+from app.core.rate_limit import admit
+from app.core.settings import settings
 from app.db.database import get_db
 from app.db.models import Balance, LedgerEntry, User, Withdrawal
 
@@ -46,14 +49,13 @@ def my_balances(
     user_id: int = Depends(require_user_id_dep),
     db: Session = Depends(get_db),
 ):
-    """Балансы пользователя из БД (обновляются при зачислении депозитов через TON webhook)."""
-    rows = db.query(Balance).filter(Balance.user_id == user_id).all()
-    by_currency = {r.currency: str(r.available) for r in rows}
-    balances = [
-        {"currency": "TON", "available": by_currency.get("TON", "0")},
-        {"currency": "USDT", "available": by_currency.get("USDT", "0")},
-    ]
-    return {"user_id": user_id, "balances": balances}
+    """Балансы пользователя (available и reserved) из кэша балансов; ETag / If-None-Match → 304."""
+    snapshot = get_balances(db, user_id)
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers={"ETag": snapshot.etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = snapshot.etag
+    response.headers["Cache-Control"] = "no-cache"
+    return snapshot.as_dict()
 
 
 class DepositInstructionOut(BaseModel):
@@ -131,7 +133,7 @@ class WithdrawIn(BaseModel):
     destination_address: str
 
 
-@router.post("/withdraw")
+@router.post("/withdraw", dependencies=[Depends(admit("withdraw"))])
 def create_withdraw(
     body: WithdrawIn,
     request: Request,
@@ -139,12 +141,12 @@ def create_withdraw(
     user_id: int = Depends(require_user_id_dep),
     db: Session = Depends(get_db),
 ):
-    """Создать заявку на вывод. Проверка баланса, списание, запись в withdrawals и ledger. On-chain — заглушка (status pending)."""
+    """Создать заявку на вывод. Проверка баланса, списание, запись в withdrawals и ledger. On-chain — воркер вывода (withdrawal_worker.py)."""
     if not _is_ton_address(body.destination_address):
         raise HTTPException(status_code=400, detail="Некорректный адрес")
     try:
-        amount = Decimal(body.amount)
-    except Exception:
+        amount = from_nano(to_nano(body.amount))
+    except ValueError:
         raise HTTPException(status_code=400, detail="Некорректная сумма")
     if amount <= 0:
         raise HTTPException(status_code=400, detail="Сумма должна быть больше 0")
@@ -182,7 +184,7 @@ def create_withdraw(
     return {
         "id": withdrawal.id,
         "status": withdrawal.status,
-        "amount": str(withdrawal.amount),
+        "amount": format_amount(withdrawal.amount),
         "currency": withdrawal.currency,
         "destination_address": withdrawal.destination_address,
         "created_at": withdrawal.created_at.isoformat() if withdrawal.created_at else None,
@@ -197,19 +199,21 @@ def list_withdrawals(
     db: Session = Depends(get_db),
 ):
     """Список заявок на вывод пользователя."""
+    return {"withdrawals": user_withdrawals(db, user_id)}
+
+
+def user_withdrawals(db: Session, user_id: int) -> list[dict]:
     rows = db.query(Withdrawal).filter(Withdrawal.user_id == user_id).order_by(Withdrawal.created_at.desc()).all()
-    return {
-        "withdrawals": [
-            {
-                "id": w.id,
-                "status": w.status,
-                "amount": str(w.amount),
-                "currency": w.currency,
-                "destination_address": (w.destination_address[:8] + "…" + w.destination_address[-6:]) if len(w.destination_address) > 16 else w.destination_address,
-                "tx_hash": w.tx_hash,
-                "created_at": w.created_at.isoformat() if w.created_at else None,
-            }
-            for w in rows
-        ],
-    }
+    return [
+        {
+            "id": w.id,
+            "status": w.status,
+            "amount": format_amount(w.amount),
+            "currency": w.currency,
+            "destination_address": (w.destination_address[:8] + "…" + w.destination_address[-6:]) if len(w.destination_address) > 16 else w.destination_address,
+            "tx_hash": w.tx_hash,
+            "created_at": w.created_at.isoformat() if w.created_at else None,
+        }
+        for w in rows
+    ]
 
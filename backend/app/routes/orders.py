@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.auth_deps import require_user_id_dep
+from app.core.money import format_amount, from_nano, to_nano
+from app.core.rate_limit import admit
+from app.core.settings import settings
+from app.db.database import get_db
+from app.db.models import ConditionalOrder, FuturesContract, Market
+from app.services.orders import cancel_on_commit, order_direction
+
+
+router = APIRouter(prefix="/orders", tags=["orders"])
+
+
+class OrderCreateIn(BaseModel):
+    kind: str = Field(pattern="^(limit_entry|stop_loss|take_profit)$")
+    trigger_price: str = Field(..., description="Цена срабатывания (TON) в виде строки Decimal")
+    # limit_entry
+    market_id: int | None = None
+    side: str | None = Field(default=None, pattern="^(long|short)$")
+    qty: str | None = None
+    # stop_loss | take_profit
+    contract_id: int | None = None
+
+
+def _order_out(order: ConditionalOrder) -> dict:
+    return {
+        "id": order.id,
+        "kind": order.kind,
+        "market_id": order.market_id,
+        "side": order.side,
+        "qty": format_amount(order.qty) if order.qty is not None else None,
+        "contract_id": order.contract_id,
+        "trigger_price": format_amount(order.trigger_price),
+        "direction": order.direction,
+        "status": order.status,
+        "created_at": order.created_at.isoformat() if order.created_at else None,
+        "executed_at": order.executed_at.isoformat() if order.executed_at else None,
+        "executed_price": format_amount(order.executed_price) if order.executed_price is not None else None,
+        "result_contract_id": order.result_contract_id,
+        "error": order.error,
+    }
+
+
+@router.post("", dependencies=[Depends(admit("trade"))])
+def create_order(
+    body: OrderCreateIn,
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+):
+    """
+    Условный ордер: исполняется на первом пуше цены оракула, пересёкшем trigger_price.
+
+    limit_entry (market_id, side, qty) — разместить предложение по цене пуша;
+    stop_loss / take_profit (contract_id) — рассчитать свой принятый контракт по цене пуша.
+    """
+    try:
+        trigger_nano = to_nano(body.trigger_price)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid trigger_price")
+    if trigger_nano <= 0:
+        raise HTTPException(status_code=400, detail="Trigger price must be positive")
+
+    qty = None
+    if body.kind == "limit_entry":
+        if body.market_id is None or body.side is None or body.qty is None:
+            raise HTTPException(status_code=400, detail="limit_entry requires market_id, side and qty")
+        market = db.get(Market, body.market_id)
+        if market is None or not market.is_active:
+            raise HTTPException(status_code=400, detail="Market is not active or not found")
+        try:
+            qty_nano = to_nano(body.qty)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid qty")
+        if qty_nano <= 0:
+            raise HTTPException(status_code=400, detail="Qty must be positive")
+        qty = from_nano(qty_nano)
+        direction = order_direction(body.kind, side=body.side)
+    else:
+        if body.contract_id is None:
+            raise HTTPException(status_code=400, detail=f"{body.kind} requires contract_id")
+        contract = db.get(FuturesContract, body.contract_id)
+        if contract is None or user_id not in (contract.emitter_id, contract.buyer_id):
+            raise HTTPException(status_code=404, detail="Contract not found")
+        if contract.status != "taken":
+            raise HTTPException(status_code=400, detail="Contract is not taken")
+        market = db.get(Market, contract.market_id)
+        direction = order_direction(body.kind, is_emitter=contract.emitter_id == user_id)
+
+    # Условие уже выполнено — ордер исполнился бы на первом же пуше, без пересечения цены
+    if market is not None and market.price_ton is not None:
+        current_nano = to_nano(market.price_ton, exact=False)
+        if (direction == "above" and current_nano >= trigger_nano) or (direction == "below" and current_nano <= trigger_nano):
+            raise HTTPException(status_code=400, detail="Price is already on the trigger side")
+
+    active = db.scalar(
+        select(func.count()).select_from(ConditionalOrder)
+        .where(ConditionalOrder.user_id == user_id, ConditionalOrder.status == "active")
+    )
+    if active >= settings.orders_max_per_user:
+        raise HTTPException(status_code=400, detail="Too many active orders")
+
+    order = ConditionalOrder(
+        user_id=user_id,
+        market_id=market.id,
+        kind=body.kind,
+        side=body.side if body.kind == "limit_entry" else None,
+        qty=qty,
+        contract_id=body.contract_id if body.kind != "limit_entry" else None,
+        trigger_price=from_nano(trigger_nano),
+        direction=direction,
+        status="active",
+    )
+    db.add(order)
+    db.commit()
+    db.refresh(order)
+    return _order_out(order)
+
+
+@router.get("")
+def list_orders(
+    include_closed: bool = False,
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+):
+    """Условные ордера пользователя: активные, с include_closed — все."""
+    query = select(ConditionalOrder).where(ConditionalOrder.user_id == user_id)
+    if not include_closed:
+        query = query.where(ConditionalOrder.status == "active")
+    rows = db.scalars(query.order_by(ConditionalOrder.id.desc())).all()
+    return {"orders": [_order_out(o) for o in rows]}
+
+
+@router.delete("/{order_id}", dependencies=[Depends(admit("trade"))])
+def cancel_order(
+    order_id: int,
+    user_id: int = Depends(require_user_id_dep),
+    db: Session = Depends(get_db),
+):
+    """Отменить активный ордер."""
+    order = db.get(ConditionalOrder, order_id)
+    if order is None or order.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if order.status != "active":
+        raise HTTPException(status_code=400, detail="Order is not active")
+    order.status = "cancelled"
+    cancel_on_commit(db, [order.id])
+    db.commit()
+    return {"ok": True}
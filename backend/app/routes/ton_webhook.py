@@ -10,9 +10,12 @@ from decimal import Decimal
 from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from sqlalchemy.orm import Session
 
+from app.core import metrics
+from app.core.money import format_amount
 from app.core.settings import settings
 from app.db.database import get_db
 from app.db.models import Balance, Deposit, LedgerEntry, User
+from app.services.outbox import emit
 
 router = APIRouter(prefix="/ton", tags=["ton"])
 logger = logging.getLogger("api")
@@ -120,7 +123,14 @@ async def ton_webhook(
     )
     db.add(entry)
     balance.available += amount
+    emit(db, "deposit_credited", {
+        "recipients": [user_id],
+        "deposit_id": deposit.id,
+        "amount": format_amount(amount),
+        "currency": currency,
+    })
     db.commit()
+    metrics.deposits_credited_total.inc(currency)
 
     logger.info(
         "ton_webhook_attributed",
@@ -0,0 +1,194 @@
+"""
+Ценовые алерты: «сообщить, когда цена рынка станет ≥ X (above) или ≤ X (below)».
+
+Книга триггеров (TriggerBook) держит активные алерты в памяти процесса API: по каждому рынку два
+отсортированных списка (порог в нанотонах, id алерта). На пуш цены p сработавшие алерты — это
+префикс списка above (порог ≤ p) и суффикс списка below (порог ≥ p): два bisect и k сработавших,
+O(log n + k), без просмотра остальных алертов рынка. Сработавшие помечаются одним условным UPDATE
+(status = 'active'), уведомление — одно событие outbox price_alerts_fired на пуш (бот доставит).
+
+БД — источник истины, книга — её кэш:
+- новые алерты (в том числе созданные другим процессом) книга подтягивает перед каждой проверкой
+  запросом «активные с id > последнего виденного» — при одном писателе id растут в порядке коммитов;
+- удаление из книги (сработал, отменён) — в момент коммита через события сессии, как в
+  balance_cache: откат транзакции оставляет книгу нетронутой;
+- алерт, отменённый другим процессом, остаётся в книге до ближайшего пересечения порога: условный
+  UPDATE его не заденет, и тогда он просто выбрасывается из книги.
+"""
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+from sqlalchemy import case, event, select, update
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.money import format_amount, from_nano, to_nano
+from app.db.database import SessionLocal
+from app.db.models import Expiry, Gift, Market, PriceAlert
+from app.services.outbox import emit
+
+
+_PENDING_KEY = "trigger_book_discard"
+# Больше любого id: bisect_right по (price, _MAX_ID) захватывает все пороги, равные price
+_MAX_ID = 2**63
+
+
+class _MarketTriggers:
+    __slots__ = ("above", "below")
+
+    def __init__(self) -> None:
+        # По возрастанию порога: above срабатывают префиксом, below — суффиксом
+        self.above: list[tuple[int, int]] = []
+        self.below: list[tuple[int, int]] = []
+
+    def side(self, direction: str) -> list[tuple[int, int]]:
+        return self.above if direction == "above" else self.below
+
+    def crossed(self, price_nano: int) -> list[int]:
+        up = self.above[:bisect_right(self.above, (price_nano, _MAX_ID))]
+        down = self.below[bisect_left(self.below, (price_nano, 0)):]
+        return [alert_id for _, alert_id in up] + [alert_id for _, alert_id in down]
+
+
+class TriggerBook:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._markets: dict[int, _MarketTriggers] = {}
+        # alert_id → (market_id, direction, threshold_nano): для удаления по id
+        self._alerts: dict[int, tuple[int, str, int]] = {}
+        self._max_id = 0
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def _add(self, alert_id: int, market_id: int, direction: str, threshold_nano: int) -> None:
+        if alert_id in self._alerts:
+            return
+        triggers = self._markets.get(market_id)
+        if triggers is None:
+            triggers = self._markets[market_id] = _MarketTriggers()
+        insort(triggers.side(direction), (threshold_nano, alert_id))
+        self._alerts[alert_id] = (market_id, direction, threshold_nano)
+
+    def sync(self, db: Session) -> int:
+        """Подтянуть активные алерты, появившиеся после последней синхронизации (id > max_id)."""
+        rows = db.execute(
+            select(PriceAlert.id, PriceAlert.market_id, PriceAlert.direction, PriceAlert.threshold)
+            .where(PriceAlert.status == "active", PriceAlert.id > self._max_id)
+            .order_by(PriceAlert.id)
+        ).all()
+        with self._lock:
+            for alert_id, market_id, direction, threshold in rows:
+                self._add(alert_id, market_id, direction, to_nano(threshold, exact=False))
+                self._max_id = max(self._max_id, alert_id)
+        return len(rows)
+
+    def crossed(self, market_id: int, price_nano: int) -> list[int]:
+        with self._lock:
+            triggers = self._markets.get(market_id)
+            return triggers.crossed(price_nano) if triggers is not None else []
+
+    def discard(self, alert_ids) -> None:
+        with self._lock:
+            for alert_id in alert_ids:
+                entry = self._alerts.pop(alert_id, None)
+                if entry is None:
+                    continue
+                market_id, direction, threshold_nano = entry
+                triggers = self._markets[market_id]
+                items = triggers.side(direction)
+                i = bisect_left(items, (threshold_nano, alert_id))
+                if i < len(items) and items[i] == (threshold_nano, alert_id):
+                    del items[i]
+                if not triggers.above and not triggers.below:
+                    del self._markets[market_id]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._markets.clear()
+            self._alerts.clear()
+            self._max_id = 0
+
+
+trigger_book = TriggerBook()
+
+
+def discard_on_commit(db: Session, alert_ids) -> None:
+    """Убрать алерты из книги, когда текущая транзакция закоммитится."""
+    db.info.setdefault(_PENDING_KEY, set()).update(alert_ids)
+
+
+def fire_alerts(db: Session, prices: dict[int, int]) -> list[dict]:
+    """
+    Проверить алерты по новым ценам {market_id: price_ton в нанотонах} и пометить сработавшие.
+
+    Вызывается в транзакции пуша цен; событие price_alerts_fired добавляется в ту же транзакцию,
+    коммит — на вызывающей стороне. Возвращает сработавшие алерты.
+    """
+    trigger_book.sync(db)
+    candidates: dict[int, int] = {}
+    for market_id, price_nano in prices.items():
+        for alert_id in trigger_book.crossed(market_id, price_nano):
+            candidates[alert_id] = market_id
+    if not candidates:
+        return []
+    discard_on_commit(db, candidates)
+
+    fired_price = case({m: from_nano(prices[m]) for m in set(candidates.values())}, value=PriceAlert.market_id)
+    rows = db.execute(
+        update(PriceAlert)
+        .where(PriceAlert.id.in_(list(candidates)), PriceAlert.status == "active")
+        .values(status="fired", fired_at=datetime.utcnow(), fired_price=fired_price)
+        .returning(PriceAlert.id, PriceAlert.user_id, PriceAlert.market_id, PriceAlert.direction, PriceAlert.threshold)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not rows:
+        return []
+
+    # Названия рынков для текста уведомления — одним запросом по сработавшим рынкам
+    labels = {
+        market_id: (gift, days)
+        for market_id, gift, days in db.execute(
+            select(Market.id, Gift.name, Expiry.days)
+            .join(Gift, Gift.id == Market.gift_id)
+            .join(Expiry, Expiry.id == Market.expiry_id)
+            .where(Market.id.in_({row.market_id for row in rows}))
+        )
+    }
+    fired = []
+    for alert_id, user_id, market_id, direction, threshold in sorted(rows):
+        gift, days = labels.get(market_id, (None, None))
+        fired.append({
+            "alert_id": alert_id,
+            "user_id": user_id,
+            "market_id": market_id,
+            "gift": gift,
+            "expiry_days": days,
+            "direction": direction,
+            "threshold": format_amount(threshold),
+            "price": format_amount(prices[market_id]),
+        })
+    emit(db, "price_alerts_fired", {
+        "recipients": sorted({a["user_id"] for a in fired}),
+        "alerts": fired,
+    })
+    metrics.price_alerts_fired_total.inc(amount=len(fired))
+    return fired
+
+
+# --- Синхронизация книги с коммитами (все сессии из SessionLocal) ---
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _discard_on_commit(session: Session) -> None:
+    alert_ids = session.info.pop(_PENDING_KEY, None)
+    if alert_ids:
+        trigger_book.discard(alert_ids)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _drop_pending_on_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,333 @@
+"""
+Торговые операции фьючерсов: размещение и принятие предложения, расчёт контракта.
+
+Используются эндпоинтами /futures и исполнением условных ордеров на пушах цен оракула
+(app/services/orders.py). Функции работают в транзакции вызывающей стороны (коммит — там же)
+и принимают уже загруженные строки балансов: пакетное исполнение грузит балансы всех участников
+одним запросом (ton_balances), а не запросом на каждую операцию.
+
+Принятие может быть частичным (fill_offer): принятая часть становится отдельным контрактом
+покупателя с parent_id предложения, а строка предложения остаётся открытой с уменьшенными qty
+и маржой эмитента. Изменение предложения — условный UPDATE по (status = 'open', fill_count):
+два параллельных покупателя не возьмут одну и ту же часть, проигравший перечитывает остаток.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core.balance_cache import invalidate_on_commit
+from app.core.money import format_amount, from_nano, mul_nano, settlement_pnl, to_nano
+from app.db.models import Balance, ContractFill, FuturesContract, LedgerEntry
+from app.services.outbox import emit
+
+
+class TradeError(Exception):
+    """Операция невозможна (нет средств, контракт уже закрыт); detail уходит клиенту как есть."""
+
+    def __init__(self, detail: str, status_code: int = 400) -> None:
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def notional_nano(qty: Decimal, price: Decimal) -> int:
+    """qty × price в nanoton (значения из БД; старые строки могут иметь >9 знаков — округляем)."""
+    return mul_nano(to_nano(qty, exact=False), to_nano(price, exact=False))
+
+
+def get_ton_balance(db: Session, user_id: int) -> Balance:
+    bal = db.query(Balance).filter(Balance.user_id == user_id, Balance.currency == "TON").first()
+    if bal is None:
+        bal = Balance(user_id=user_id, currency="TON", available=Decimal("0"), reserved=Decimal("0"))
+        db.add(bal)
+        db.flush()
+    return bal
+
+
+def ton_balances(db: Session, user_ids: Iterable[int]) -> dict[int, Balance]:
+    """TON-балансы пользователей одним запросом; недостающие строки создаются."""
+    wanted = set(user_ids)
+    if not wanted:
+        return {}
+    rows = db.scalars(select(Balance).where(Balance.user_id.in_(wanted), Balance.currency == "TON"))
+    balances = {b.user_id: b for b in rows}
+    for user_id in wanted - balances.keys():
+        balances[user_id] = Balance(user_id=user_id, currency="TON", available=Decimal("0"), reserved=Decimal("0"))
+        db.add(balances[user_id])
+    return balances
+
+
+_balances = Balance.__table__
+
+
+def credit_ton_batch(db: Session, entries: list[dict], now: datetime) -> None:
+    """
+    Зачислить TON пачкой без загрузки балансов: один executemany UPDATE (сумма по пользователю)
+    и один пакетный INSERT в ledger; недостающие строки балансов создаются.
+    entries — user_id, delta_nano, reason, ref_type, ref_id. Кэш балансов сбрасывается по коммиту.
+    """
+    totals: dict[int, int] = defaultdict(int)
+    for entry in entries:
+        totals[entry["user_id"]] += entry["delta_nano"]
+    if not totals:
+        return
+    existing = set(db.scalars(
+        select(_balances.c.user_id).where(_balances.c.user_id.in_(totals), _balances.c.currency == "TON")
+    ))
+    if len(existing) < len(totals):
+        db.execute(insert(_balances), [
+            {"user_id": user_id, "currency": "TON", "available": Decimal("0"), "reserved": Decimal("0")}
+            for user_id in totals.keys() - existing
+        ])
+    db.execute(
+        update(_balances)
+        .where(_balances.c.user_id == bindparam("b_user_id"), _balances.c.currency == "TON")
+        .values(available=_balances.c.available + bindparam("b_amount")),
+        [{"b_user_id": user_id, "b_amount": from_nano(amount)} for user_id, amount in totals.items()],
+    )
+    db.execute(
+        insert(LedgerEntry),
+        [
+            {
+                "user_id": entry["user_id"],
+                "currency": "TON",
+                "delta": from_nano(entry["delta_nano"]),
+                "reason": entry["reason"],
+                "ref_type": entry["ref_type"],
+                "ref_id": entry["ref_id"],
+                "created_at": now,
+            }
+            for entry in entries
+        ],
+    )
+    invalidate_on_commit(db, totals)
+
+
+def open_offer(
+    db: Session,
+    bal: Balance,
+    *,
+    market_id: int,
+    side: str,
+    qty_nano: int,
+    entry_nano: int,
+) -> FuturesContract:
+    """Разместить предложение: маржа эмитента qty × entry замораживается с его TON-баланса."""
+    qty = from_nano(qty_nano)
+    entry_price = from_nano(entry_nano)
+    notional = from_nano(mul_nano(qty_nano, entry_nano))  # сколько TON замораживаем у эмитента
+    if bal.available < notional:
+        raise TradeError("Недостаточно средств для маржи эмитента")
+
+    bal.available -= notional
+    db.add(
+        LedgerEntry(
+            user_id=bal.user_id,
+            currency="TON",
+            delta=-notional,
+            reason="futures_margin",
+            ref_type="futures_offer",
+            ref_id=None,
+        )
+    )
+    contract = FuturesContract(
+        market_id=market_id,
+        emitter_id=bal.user_id,
+        side=side,
+        qty=qty,
+        entry_price=entry_price,
+        status="open",
+        margin_emitter=notional,
+        margin_buyer=Decimal("0"),
+    )
+    db.add(contract)
+    return contract
+
+
+# Сколько раз перечитать предложение, если его параллельно изменил другой покупатель
+_FILL_ATTEMPTS = 3
+
+
+def fill_offer(db: Session, offer_id: int, bal: Balance, qty_nano: int | None = None) -> FuturesContract:
+    """
+    Принять предложение целиком (qty_nano=None или весь остаток) или частично.
+
+    bal — TON-баланс покупателя; его маржа qty × entry замораживается. Возвращает контракт
+    покупателя: при полном принятии — само предложение, при частичном — новый контракт.
+    """
+    for _ in range(_FILL_ATTEMPTS):
+        offer = db.get(FuturesContract, offer_id)
+        now = datetime.utcnow()
+        if offer is None or offer.status != "open" or (offer.expires_at is not None and offer.expires_at <= now):
+            raise TradeError("Offer not found or not open", status_code=404)
+        if offer.emitter_id == bal.user_id:
+            raise TradeError("Emitter cannot take own offer")
+
+        remaining_nano = to_nano(offer.qty, exact=False)
+        fill_nano = remaining_nano if qty_nano is None else qty_nano
+        if fill_nano > remaining_nano:
+            raise TradeError(f"Qty exceeds remaining offer qty {format_amount(offer.qty)}")
+        margin_nano = mul_nano(fill_nano, to_nano(offer.entry_price, exact=False))
+        if bal.available < from_nano(margin_nano):
+            raise TradeError("Недостаточно средств для маржи покупателя")
+
+        full = fill_nano == remaining_nano
+        if full:
+            values = {"status": "taken", "buyer_id": bal.user_id, "margin_buyer": from_nano(margin_nano)}
+            emitter_margin_nano = to_nano(offer.margin_emitter, exact=False)
+        else:
+            # Маржа эмитента делится вместе с qty; остаток целиком остаётся на предложении
+            emitter_margin_nano = min(margin_nano, to_nano(offer.margin_emitter, exact=False))
+            values = {
+                "qty": from_nano(remaining_nano - fill_nano),
+                "margin_emitter": from_nano(to_nano(offer.margin_emitter, exact=False) - emitter_margin_nano),
+            }
+        updated = db.execute(
+            update(FuturesContract)
+            .where(
+                FuturesContract.id == offer.id,
+                FuturesContract.status == "open",
+                FuturesContract.fill_count == offer.fill_count,
+            )
+            .values(fill_count=FuturesContract.fill_count + 1, **values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.expire(offer)
+        if updated:
+            break
+    else:
+        raise TradeError("Offer is being taken concurrently, retry", status_code=409)
+
+    if full:
+        contract = offer
+    else:
+        contract = FuturesContract(
+            market_id=offer.market_id,
+            emitter_id=offer.emitter_id,
+            buyer_id=bal.user_id,
+            side=offer.side,
+            qty=from_nano(fill_nano),
+            entry_price=offer.entry_price,
+            status="taken",
+            margin_emitter=from_nano(emitter_margin_nano),
+            margin_buyer=from_nano(margin_nano),
+            parent_id=offer.id,
+            created_at=now,
+        )
+        db.add(contract)
+        db.flush()
+
+    margin = from_nano(margin_nano)
+    bal.available -= margin
+    db.add(
+        LedgerEntry(
+            user_id=bal.user_id,
+            currency="TON",
+            delta=-margin,
+            reason="futures_margin",
+            ref_type="futures_take",
+            ref_id=contract.id,
+        )
+    )
+    db.add(
+        ContractFill(
+            offer_id=offer.id,
+            contract_id=contract.id,
+            buyer_id=bal.user_id,
+            qty=from_nano(fill_nano),
+            margin=margin,
+            created_at=now,
+        )
+    )
+    emit(db, "offer_taken", {
+        "recipients": [offer.emitter_id],
+        "contract_id": contract.id,
+        "offer_id": offer.id,
+        "market_id": offer.market_id,
+        "buyer_id": bal.user_id,
+        "side": offer.side,
+        "qty": format_amount(from_nano(fill_nano)),
+        "remaining_qty": format_amount(from_nano(remaining_nano - fill_nano)),
+        "entry_price": format_amount(offer.entry_price),
+    })
+    return contract
+
+
+def settle_contract(
+    db: Session,
+    contract: FuturesContract,
+    close_nano: int,
+    balances: dict[int, Balance],
+) -> dict:
+    """
+    Рассчитать контракт по close_nano: разморозка маржи, PnL, событие contract_settled.
+
+    Расчёт с нулевой суммой: выигрыш одной стороны оплачивается из маржи другой, убыток стороны
+    ограничен её маржой. Предложение без покупателя — только возврат маржи эмитенту.
+    balances — TON-балансы эмитента и покупателя (ton_balances). Возвращает PnL сторон в nanoton.
+    """
+    if contract.status not in ("taken", "open"):
+        raise TradeError("Contract not found or not settleable", status_code=404)
+    close_price = from_nano(close_nano)
+
+    transfer_nano = 0  # от покупателя к эмитенту (< 0 — наоборот)
+    if contract.buyer_id is not None:
+        # Цена выросла → разница идёт эмитенту, упала → покупателю
+        gain_emitter, gain_buyer = settlement_pnl(
+            to_nano(contract.entry_price, exact=False),
+            close_nano,
+            to_nano(contract.qty, exact=False),
+        )
+        transfer_nano = max(
+            -to_nano(contract.margin_emitter, exact=False),
+            min(gain_emitter - gain_buyer, to_nano(contract.margin_buyer, exact=False)),
+        )
+    pnl_emitter = from_nano(transfer_nano)
+    pnl_buyer = from_nano(-transfer_nano)
+
+    # Разморозка маржи и зачисление PnL
+    balances[contract.emitter_id].available += contract.margin_emitter + pnl_emitter
+    db.add(
+        LedgerEntry(
+            user_id=contract.emitter_id,
+            currency="TON",
+            delta=contract.margin_emitter + pnl_emitter,
+            reason="futures_settle",
+            ref_type="futures_contract",
+            ref_id=contract.id,
+        )
+    )
+
+    if contract.buyer_id is not None:
+        balances[contract.buyer_id].available += contract.margin_buyer + pnl_buyer
+        db.add(
+            LedgerEntry(
+                user_id=contract.buyer_id,
+                currency="TON",
+                delta=contract.margin_buyer + pnl_buyer,
+                reason="futures_settle",
+                ref_type="futures_contract",
+                ref_id=contract.id,
+            )
+        )
+
+    contract.status = "closed"
+    contract.close_price = close_price
+    contract.closed_at = datetime.utcnow()
+    emit(db, "contract_settled", {
+        "recipients": [contract.emitter_id] + ([contract.buyer_id] if contract.buyer_id is not None else []),
+        "contract_id": contract.id,
+        "market_id": contract.market_id,
+        "emitter_id": contract.emitter_id,
+        "buyer_id": contract.buyer_id,
+        "close_price": format_amount(close_price),
+        "pnl_emitter": format_amount(pnl_emitter),
+        "pnl_buyer": format_amount(pnl_buyer) if contract.buyer_id is not None else None,
+    })
+    return {"pnl_emitter": transfer_nano, "pnl_buyer": -transfer_nano}
@@ -0,0 +1,67 @@
+"""
+Провижининг рынков: рынок на каждую пару (активный gift × expiry) одним INSERT … SELECT.
+Используется seed_markets.py и POST /admin/markets/provision.
+"""
+from __future__ import annotations
+
+from sqlalchemy import and_, func, insert, select
+from sqlalchemy.orm import Session, aliased
+
+from app.db.models import Expiry, Gift, Market
+
+
+def ensure_expiries(db: Session, days: list[int]) -> list[Expiry]:
+    """Возвращает expiries для указанных сроков, создавая недостающие (один SELECT + один INSERT)."""
+    wanted = sorted({d for d in days if d > 0})
+    if not wanted:
+        return []
+    existing = {e.days: e for e in db.query(Expiry).filter(Expiry.days.in_(wanted)).all()}
+    missing = [{"days": d, "settlement_at": None, "is_active": True} for d in wanted if d not in existing]
+    if missing:
+        db.execute(insert(Expiry), missing)
+        existing = {e.days: e for e in db.query(Expiry).filter(Expiry.days.in_(wanted)).all()}
+    return [existing[d] for d in wanted]
+
+
+def provision_markets(db: Session, expiry_days: list[int]) -> dict:
+    """
+    Создаёт недостающие рынки для всех активных подарков по указанным срокам.
+
+    Декартово произведение gifts × expiries сравнивается с markets анти-join'ом внутри одного
+    INSERT … SELECT; стартовая цена нового рынка берётся с уже существующего рынка того же подарка
+    (если есть), иначе остаётся пустой до первого пуша оракула. Коммит — на вызывающей стороне.
+    """
+    expiries = ensure_expiries(db, expiry_days)
+    if not expiries:
+        return {"created": 0, "expiries": []}
+    expiry_ids = [e.id for e in expiries]
+
+    existing = aliased(Market)
+    sibling = aliased(Market)
+    inherited_price = (
+        select(func.max(sibling.price_ton))
+        .where(sibling.gift_id == Gift.id)
+        .scalar_subquery()
+    )
+    missing_pairs = (
+        select(
+            Gift.id,
+            Expiry.id,
+            True,
+            inherited_price,
+        )
+        .select_from(Gift)
+        .join(Expiry, Expiry.id.in_(expiry_ids))
+        .outerjoin(existing, and_(existing.gift_id == Gift.id, existing.expiry_id == Expiry.id))
+        .where(Gift.is_active.is_(True), existing.id.is_(None))
+    )
+    result = db.execute(
+        insert(Market).from_select(
+            ["gift_id", "expiry_id", "is_active", "price_ton"],
+            missing_pairs,
+        )
+    )
+    return {
+        "created": result.rowcount or 0,
+        "expiries": [{"id": e.id, "days": e.days} for e in expiries],
+    }
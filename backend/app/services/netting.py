@@ -0,0 +1,255 @@
+"""
+Неттинг встречных контрактов: принятые контракты одной пары контрагентов на одном рынке
+с одинаковыми условиями сворачиваются в один нетто-контракт.
+
+Выплата эмитенту контракта при цене c (settle_contract) — clamp(qty·(c − entry), −margin_emitter,
+margin_buyer): убыток стороны ограничен её маржой, поэтому выплата не линейна по цене (при марже
+qty·entry выигрыш эмитента перестаёт расти выше 2 × entry). Контракты с разной ценой входа или
+разной маржой на единицу qty сумму выплат одним контрактом не выражают: такой неттинг перенёс бы
+стоимость от одной стороны к другой, а запустить его может любая из них (POST /futures/net).
+
+Поэтому сворачиваются только контракты с одинаковыми условиями: ценой входа e и маржой на единицу
+qty с каждой стороны (rₑ = margin_emitter / qty, r_b = margin_buyer / qty). Для пары (u, v) выплата
+u — Σ sᵢ·qtyᵢ·f(c) = Q·f(c), где sᵢ = +1, если u — эмитент, иначе −1, Q = Σ sᵢ·qtyᵢ, а
+f(c) = clamp(c − e, −rₑ, r_b) общая у всех контрактов группы. Это выплата одного контракта на |Q|
+по e с маржой rₑ·|Q| и r_b·|Q| (эмитент — u при Q > 0, иначе v) при любой цене — с точностью до
+округления PnL до нанотона. При Q = 0 выплата равна нулю: вся маржа освобождается без перевода.
+Остаток прежней маржи сторон освобождается.
+
+Пакетная обработка (net_contracts):
+- пары-кандидаты — один GROUP BY по (market_id, min/max контрагента) с count ≥ 2, постранично
+  по ключу пары (пропущенная пара не выбирается повторно);
+- контракты всех пар пачки — одним SELECT; перевод в netted — условный UPDATE … WHERE
+  status = 'taken' RETURNING: контракт, параллельно рассчитанный или уже свёрнутый, группу отменяет;
+- нетто-контракты — одним flush, netted_into — один executemany UPDATE, стоп-лосс/тейк-профит
+  свёрнутых контрактов отменяются одним UPDATE;
+- освобождённая маржа и переводы — credit_ton_batch (один UPDATE балансов и один INSERT в ledger),
+  участникам — одно событие outbox contracts_netted на пачку.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from fractions import Fraction
+
+from sqlalchemy import bindparam, case, func, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.money import format_amount, from_nano, to_nano
+from app.db.models import ConditionalOrder, FuturesContract
+from app.services.futures import credit_ton_batch
+from app.services.orders import cancel_on_commit
+from app.services.outbox import emit
+
+
+_contracts = FuturesContract.__table__
+_LOW = case((FuturesContract.emitter_id < FuturesContract.buyer_id, FuturesContract.emitter_id), else_=FuturesContract.buyer_id)
+_HIGH = case((FuturesContract.emitter_id < FuturesContract.buyer_id, FuturesContract.buyer_id), else_=FuturesContract.emitter_id)
+
+
+def _terms(row) -> tuple:
+    """Условия контракта, при совпадении которых выплаты складываются: цена входа и маржа на единицу qty."""
+    qty = to_nano(row.qty, exact=False)
+    return (
+        to_nano(row.entry_price, exact=False),
+        Fraction(to_nano(row.margin_emitter, exact=False), qty),
+        Fraction(to_nano(row.margin_buyer, exact=False), qty),
+    )
+
+
+def _net(low: int, high: int, rows: list) -> dict:
+    """Нетто-позиция пары по контрактам с одинаковыми условиями (_terms)."""
+    qty = 0  # Q в нано-штуках, со стороны low
+    margin_emitter = 0  # Σ sᵢ·margin_emitterᵢ = rₑ·Q
+    margin_buyer = 0  # Σ sᵢ·margin_buyerᵢ = r_b·Q
+    margins = {low: 0, high: 0}
+    for row in rows:
+        sign = 1 if row.emitter_id == low else -1
+        qty += sign * to_nano(row.qty, exact=False)
+        margin_emitter += sign * to_nano(row.margin_emitter, exact=False)
+        margin_buyer += sign * to_nano(row.margin_buyer, exact=False)
+        margins[row.emitter_id] += to_nano(row.margin_emitter, exact=False)
+        margins[row.buyer_id] += to_nano(row.margin_buyer, exact=False)
+
+    if qty == 0:
+        # Позиции погасились: выплата не зависит от цены и равна нулю
+        return {"qty": 0, "emitter_id": None, "buyer_id": None, "entry": None,
+                "margin_emitter": 0, "margin_buyer": 0, "credits": dict(margins)}
+
+    emitter_id, buyer_id = (low, high) if qty > 0 else (high, low)
+    net_emitter, net_buyer = abs(margin_emitter), abs(margin_buyer)
+    return {"qty": abs(qty), "emitter_id": emitter_id, "buyer_id": buyer_id, "entry": _terms(rows[0])[0],
+            "margin_emitter": net_emitter, "margin_buyer": net_buyer,
+            "credits": {emitter_id: margins[emitter_id] - net_emitter, buyer_id: margins[buyer_id] - net_buyer}}
+
+
+def _pairs(db: Session, after: tuple | None, limit: int, market_id: int | None, user_id: int | None) -> list[tuple]:
+    """Ключи (market_id, low, high) пар с ≥ 2 принятыми контрактами, по возрастанию ключа."""
+    query = (
+        select(FuturesContract.market_id, _LOW, _HIGH)
+        .where(FuturesContract.status == "taken", FuturesContract.buyer_id.is_not(None))
+        .group_by(FuturesContract.market_id, _LOW, _HIGH)
+        .having(func.count() >= 2)
+        .order_by(FuturesContract.market_id, _LOW, _HIGH)
+        .limit(limit)
+    )
+    if market_id is not None:
+        query = query.where(FuturesContract.market_id == market_id)
+    if user_id is not None:
+        query = query.where(or_(FuturesContract.emitter_id == user_id, FuturesContract.buyer_id == user_id))
+    if after is not None:
+        query = query.having(tuple_(FuturesContract.market_id, _LOW, _HIGH) > tuple_(*after))
+    return [tuple(row) for row in db.execute(query)]
+
+
+def net_pairs(db: Session, pairs: list[tuple], now: datetime | None = None) -> list[dict]:
+    """Свернуть контракты перечисленных пар (коммит — на вызывающей стороне). Возвращает итоги по парам."""
+    now = now or datetime.utcnow()
+    keys = set(pairs)
+    query = (
+        select(
+            FuturesContract.id, FuturesContract.market_id, FuturesContract.emitter_id, FuturesContract.buyer_id,
+            FuturesContract.qty, FuturesContract.entry_price, FuturesContract.margin_emitter, FuturesContract.margin_buyer,
+            _LOW.label("low"), _HIGH.label("high"),
+        )
+        .where(
+            FuturesContract.status == "taken",
+            FuturesContract.buyer_id.is_not(None),
+            FuturesContract.market_id.in_({key[0] for key in keys}),
+        )
+        .order_by(FuturesContract.id)
+    )
+    if db.get_bind().dialect.name != "sqlite":
+        query = query.with_for_update()
+    # Внутри пары — группы с одинаковыми условиями: только их выплаты складываются в одну
+    groups: dict[tuple, list] = defaultdict(list)
+    for row in db.execute(query):
+        key = (row.market_id, row.low, row.high)
+        if key in keys:
+            groups[(*key, _terms(row))].append(row)
+
+    results: list[dict] = []
+    nets: list[tuple[dict, FuturesContract | None]] = []
+    credits: list[dict] = []
+    for (market_id, low, high, _), rows in groups.items():
+        if len(rows) < 2:
+            continue
+        net = _net(low, high, rows)
+        ids = [row.id for row in rows]
+        netted = db.scalars(
+            update(FuturesContract)
+            .where(FuturesContract.id.in_(ids), FuturesContract.status == "taken")
+            .values(status="netted", closed_at=now)
+            .returning(FuturesContract.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if len(netted) != len(ids):
+            # Часть контрактов уже рассчитана другой транзакцией — пару не трогаем
+            db.execute(
+                update(FuturesContract)
+                .where(FuturesContract.id.in_(netted))
+                .values(status="taken", closed_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            continue
+        contract = None
+        if net["qty"]:
+            contract = FuturesContract(
+                market_id=market_id,
+                emitter_id=net["emitter_id"],
+                buyer_id=net["buyer_id"],
+                side="long",  # эмитент выигрывает на росте цены
+                qty=from_nano(net["qty"]),
+                entry_price=from_nano(net["entry"]),
+                status="taken",
+                margin_emitter=from_nano(net["margin_emitter"]),
+                margin_buyer=from_nano(net["margin_buyer"]),
+                created_at=now,
+            )
+            db.add(contract)
+        nets.append(({"market_id": market_id, "users": [low, high], "ids": ids, **net}, contract))
+
+    if not nets:
+        return results
+    db.flush()  # id нетто-контрактов — одним flush на пачку
+
+    netted_into = []
+    for net, contract in nets:
+        net_id = contract.id if contract is not None else None
+        netted_into.extend({"c_id": contract_id, "c_net": net_id} for contract_id in net["ids"])
+        for user_id, amount in net["credits"].items():
+            if amount:
+                credits.append({
+                    "user_id": user_id,
+                    "delta_nano": amount,
+                    "reason": "futures_netting",
+                    "ref_type": "futures_contract",
+                    "ref_id": net_id,
+                })
+        results.append({
+            "market_id": net["market_id"],
+            "users": net["users"],
+            "netted": net["ids"],
+            "contract_id": net_id,
+            "emitter_id": net["emitter_id"],
+            "qty": format_amount(net["qty"]),
+            "entry_price": format_amount(net["entry"]) if net["entry"] is not None else None,
+            "released": {str(user_id): format_amount(amount) for user_id, amount in net["credits"].items()},
+        })
+    db.execute(
+        update(_contracts).where(_contracts.c.id == bindparam("c_id")).values(netted_into=bindparam("c_net")),
+        netted_into,
+    )
+    # Стоп-лосс/тейк-профит свёрнутых контрактов больше не к чему применять
+    cancelled = db.scalars(
+        update(ConditionalOrder)
+        .where(ConditionalOrder.contract_id.in_([row["c_id"] for row in netted_into]), ConditionalOrder.status == "active")
+        .values(status="cancelled", error="contract netted")
+        .returning(ConditionalOrder.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    cancel_on_commit(db, cancelled)
+    credit_ton_batch(db, credits, now)
+    metrics.contracts_netted_total.inc(amount=len(netted_into))
+    emit(db, "contracts_netted", {
+        "recipients": sorted({user_id for r in results for user_id in r["users"]}),
+        "pairs": results,
+    })
+    return results
+
+
+def net_contracts(
+    db: Session,
+    *,
+    batch_size: int,
+    market_id: int | None = None,
+    user_id: int | None = None,
+    now: datetime | None = None,
+    with_ids: bool = False,
+) -> dict:
+    """
+    Свернуть встречные контракты всех пар (или пар рынка / пользователя); коммит на каждую пачку.
+
+    with_ids — добавить в итог id созданных нетто-контрактов (contract_ids).
+    """
+    summary = {"pairs": 0, "contracts": 0, "net_contracts": 0, "batches": 0}
+    if with_ids:
+        summary["contract_ids"] = []
+    after = None
+    while True:
+        pairs = _pairs(db, after, batch_size, market_id, user_id)
+        if not pairs:
+            break
+        results = net_pairs(db, pairs, now)
+        db.commit()
+        summary["batches"] += 1
+        summary["pairs"] += len(results)
+        summary["contracts"] += sum(len(r["netted"]) for r in results)
+        summary["net_contracts"] += sum(1 for r in results if r["contract_id"] is not None)
+        if with_ids:
+            summary["contract_ids"].extend(r["contract_id"] for r in results if r["contract_id"] is not None)
+        if len(pairs) < batch_size:
+            break
+        after = pairs[-1]
+    return summary
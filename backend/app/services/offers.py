@@ -0,0 +1,137 @@
+"""
+Снятие открытых предложений с возвратом маржи эмитенту.
+
+Причины: user — эмитент отменил сам; ttl — истёк expires_at; market_inactive — выключен рынок,
+подарок или экспирация; expiry_passed — наступил settlement_at экспирации. Пока предложение
+открыто, его маржа заморожена (списана с available при create_offer), и брошенные предложения
+держали бы капитал и раздували /futures/offers бессрочно.
+
+Снятие — пачками, без загрузки объектов:
+- кандидаты одним SELECT по (status, expires_at) и флагам рынка;
+- условный UPDATE … WHERE status = 'open' RETURNING — возвращается маржа только тех предложений,
+  которые действительно перевели в cancelled (параллельный take_offer или другой sweeper не
+  приведут к двойному возврату);
+- возврат на балансы и записи ledger — credit_ton_batch (app/services/futures.py): один
+  executemany UPDATE и один пакетный INSERT на пачку, кэш балансов сбрасывается по коммиту;
+- эмитентам — одно событие outbox offers_cancelled на пачку.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import case, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.money import format_amount, to_nano
+from app.db.models import Expiry, FuturesContract, Gift, Market
+from app.services.futures import credit_ton_batch
+from app.services.outbox import emit
+
+
+REASONS = ("user", "ttl", "market_inactive", "expiry_passed")
+
+
+def cancel_offers(db: Session, ids_by_reason: dict[str, list[int]], now: datetime | None = None) -> list[dict]:
+    """
+    Перевести открытые предложения в cancelled и вернуть маржу эмитентам (коммит — на вызывающей стороне).
+
+    Предложения, уже не открытые к моменту UPDATE, пропускаются. Возвращает снятые предложения.
+    """
+    now = now or datetime.utcnow()
+    cancelled: list[dict] = []
+    for reason, ids in ids_by_reason.items():
+        if not ids:
+            continue
+        rows = db.execute(
+            update(FuturesContract)
+            .where(FuturesContract.id.in_(ids), FuturesContract.status == "open")
+            .values(status="cancelled", cancel_reason=reason, closed_at=now)
+            .returning(FuturesContract.id, FuturesContract.emitter_id, FuturesContract.market_id, FuturesContract.margin_emitter)
+            .execution_options(synchronize_session=False)
+        ).all()
+        for contract_id, emitter_id, market_id, margin in rows:
+            cancelled.append({
+                "contract_id": contract_id,
+                "user_id": emitter_id,
+                "market_id": market_id,
+                "reason": reason,
+                "margin_nano": to_nano(margin, exact=False),
+            })
+        metrics.offers_cancelled_total.inc(reason, amount=len(rows))
+    if not cancelled:
+        return []
+
+    credit_ton_batch(
+        db,
+        [
+            {
+                "user_id": offer["user_id"],
+                "delta_nano": offer["margin_nano"],
+                "reason": "futures_margin_release",
+                "ref_type": "futures_offer",
+                "ref_id": offer["contract_id"],
+            }
+            for offer in cancelled
+        ],
+        now,
+    )
+    emit(db, "offers_cancelled", {
+        "recipients": sorted({offer["user_id"] for offer in cancelled}),
+        "offers": [
+            {
+                "contract_id": offer["contract_id"],
+                "user_id": offer["user_id"],
+                "market_id": offer["market_id"],
+                "reason": offer["reason"],
+                "margin": format_amount(offer["margin_nano"]),
+            }
+            for offer in cancelled
+        ],
+    })
+    return cancelled
+
+
+def stale_offers(db: Session, now: datetime, limit: int, market_id: int | None = None) -> dict[str, list[int]]:
+    """Открытые предложения, которые пора снять, по причинам (не больше limit)."""
+    inactive = or_(Market.is_active.is_(False), Gift.is_active.is_(False), Expiry.is_active.is_(False))
+    passed = Expiry.settlement_at <= now
+    reason = case(
+        (inactive, "market_inactive"),
+        (passed, "expiry_passed"),
+        else_="ttl",
+    )
+    query = (
+        select(FuturesContract.id, reason)
+        .join(Market, Market.id == FuturesContract.market_id)
+        .join(Gift, Gift.id == Market.gift_id)
+        .join(Expiry, Expiry.id == Market.expiry_id)
+        .where(FuturesContract.status == "open", or_(FuturesContract.expires_at <= now, inactive, passed))
+        .order_by(FuturesContract.id)
+        .limit(limit)
+    )
+    if market_id is not None:
+        query = query.where(FuturesContract.market_id == market_id)
+    ids_by_reason: dict[str, list[int]] = defaultdict(list)
+    for contract_id, why in db.execute(query):
+        ids_by_reason[why].append(contract_id)
+    return dict(ids_by_reason)
+
+
+def sweep(db: Session, *, batch_size: int, now: datetime | None = None) -> dict:
+    """Снять все просроченные предложения и предложения на выключенных рынках; коммит на каждую пачку."""
+    now = now or datetime.utcnow()
+    summary = {reason: 0 for reason in REASONS if reason != "user"}
+    batches = 0
+    while True:
+        ids_by_reason = stale_offers(db, now, batch_size)
+        if not ids_by_reason:
+            break
+        for offer in cancel_offers(db, ids_by_reason, now):
+            summary[offer["reason"]] += 1
+        db.commit()
+        batches += 1
+        if sum(len(ids) for ids in ids_by_reason.values()) < batch_size:
+            break
+    return {"cancelled": sum(summary.values()), "batches": batches, **summary}
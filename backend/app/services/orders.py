@@ -0,0 +1,290 @@
+"""
+Условные ордера: исполнение на пушах цен оракула (POST /admin/markets/prices/bulk).
+
+- limit_entry — разместить предложение, когда цена дойдёт до лимита: long — цена ≤ лимита,
+  short — цена ≥ лимита; entry_price — цена пуша. Маржа при создании ордера не резервируется:
+  не хватает средств в момент исполнения — ордер failed.
+- stop_loss / take_profit — рассчитать принятый контракт по цене пуша. Эмитент выигрывает на росте
+  цены (take_profit — выше, stop_loss — ниже), покупатель — на падении (наоборот).
+
+Книга ордеров (OrderBook) в памяти процесса API: по каждому рынку две кучи — «above» (min-heap
+по порогу: цена ≥ вершины → сработал) и «below» (max-heap). На пуш цены сработавшие снимаются
+с вершины, O(k log n) на k сработавших, остальные ордера не просматриваются. Отмена — ленивая:
+id убирается из живых, запись в куче выбрасывается, когда дойдёт до вершины; когда мёртвых
+записей становится больше живых, кучи пересобираются.
+
+Все сработавшие за пуш ордера исполняются одним пакетом в транзакции пуша: ордера, контракты
+и балансы участников грузятся тремя запросами, итог — одно событие outbox orders_executed.
+
+Согласование с БД — как у алертов (app/services/alerts.py): новые ордера подтягиваются запросом
+«активные с id > последнего виденного», отмена применяется к книге в момент коммита, а снятые
+с вершины ордера при откате транзакции возвращаются в кучи. Ордер, отменённый другим процессом,
+отсеивается при исполнении: берутся только строки в статусе active.
+"""
+from __future__ import annotations
+
+import heapq
+import threading
+from datetime import datetime
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.money import format_amount, from_nano, to_nano
+from app.db.database import SessionLocal
+from app.db.models import ConditionalOrder, FuturesContract
+from app.services.futures import TradeError, open_offer, settle_contract, ton_balances
+from app.services.outbox import emit
+
+
+_CANCEL_KEY = "order_book_cancel"
+_POPPED_KEY = "order_book_popped"
+# Пересборка куч, когда мёртвых записей больше живых (и не меньше этого числа)
+_COMPACT_MIN_DEAD = 64
+
+
+class Trigger(NamedTuple):
+    order_id: int
+    market_id: int
+    direction: str
+    trigger_nano: int
+
+
+def order_direction(kind: str, *, side: str | None = None, is_emitter: bool | None = None) -> str:
+    """Направление срабатывания: above — цена ≥ порога, below — цена ≤ порога."""
+    if kind == "limit_entry":
+        return "below" if side == "long" else "above"
+    # Эмитент выигрывает на росте цены, покупатель — на падении
+    gains_above = bool(is_emitter)
+    if kind == "take_profit":
+        return "above" if gains_above else "below"
+    return "below" if gains_above else "above"
+
+
+class _MarketHeaps:
+    __slots__ = ("above", "below")
+
+    def __init__(self) -> None:
+        self.above: list[tuple[int, int]] = []  # (порог, id) — вершина с наименьшим порогом
+        self.below: list[tuple[int, int]] = []  # (-порог, id) — вершина с наибольшим порогом
+
+
+class OrderBook:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._markets: dict[int, _MarketHeaps] = {}
+        self._live: dict[int, Trigger] = {}
+        self._dead = 0
+        self._max_id = 0
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def _push(self, trigger: Trigger) -> None:
+        heaps = self._markets.get(trigger.market_id)
+        if heaps is None:
+            heaps = self._markets[trigger.market_id] = _MarketHeaps()
+        if trigger.direction == "above":
+            heapq.heappush(heaps.above, (trigger.trigger_nano, trigger.order_id))
+        else:
+            heapq.heappush(heaps.below, (-trigger.trigger_nano, trigger.order_id))
+        self._live[trigger.order_id] = trigger
+
+    def sync(self, db: Session) -> int:
+        """Подтянуть активные ордера, появившиеся после последней синхронизации (id > max_id)."""
+        rows = db.execute(
+            select(ConditionalOrder.id, ConditionalOrder.market_id, ConditionalOrder.direction, ConditionalOrder.trigger_price)
+            .where(ConditionalOrder.status == "active", ConditionalOrder.id > self._max_id)
+            .order_by(ConditionalOrder.id)
+        ).all()
+        with self._lock:
+            for order_id, market_id, direction, trigger_price in rows:
+                if order_id not in self._live:
+                    self._push(Trigger(order_id, market_id, direction, to_nano(trigger_price, exact=False)))
+                self._max_id = max(self._max_id, order_id)
+        return len(rows)
+
+    def pop_triggered(self, market_id: int, price_nano: int) -> list[Trigger]:
+        """Снять с куч рынка все ордера, которые цена price_nano пересекла."""
+        popped = []
+        with self._lock:
+            heaps = self._markets.get(market_id)
+            if heaps is None:
+                return popped
+            while heaps.above and heaps.above[0][0] <= price_nano:
+                _, order_id = heapq.heappop(heaps.above)
+                self._take(order_id, popped)
+            while heaps.below and -heaps.below[0][0] >= price_nano:
+                _, order_id = heapq.heappop(heaps.below)
+                self._take(order_id, popped)
+            if not heaps.above and not heaps.below:
+                del self._markets[market_id]
+        return popped
+
+    def _take(self, order_id: int, popped: list[Trigger]) -> None:
+        trigger = self._live.pop(order_id, None)
+        if trigger is None:
+            self._dead -= 1  # лениво удалённая запись
+        else:
+            popped.append(trigger)
+
+    def restore(self, triggers: Iterable[Trigger]) -> None:
+        with self._lock:
+            for trigger in triggers:
+                if trigger.order_id not in self._live:
+                    self._push(trigger)
+
+    def cancel(self, order_ids: Iterable[int]) -> None:
+        with self._lock:
+            for order_id in order_ids:
+                if self._live.pop(order_id, None) is not None:
+                    self._dead += 1
+            if self._dead >= _COMPACT_MIN_DEAD and self._dead > len(self._live):
+                self._compact()
+
+    def _compact(self) -> None:
+        live = list(self._live.values())
+        self._markets.clear()
+        self._live.clear()
+        self._dead = 0
+        for trigger in live:
+            self._push(trigger)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._markets.clear()
+            self._live.clear()
+            self._dead = 0
+            self._max_id = 0
+
+
+order_book = OrderBook()
+
+
+def cancel_on_commit(db: Session, order_ids: Iterable[int]) -> None:
+    """Убрать ордера из книги, когда текущая транзакция закоммитится."""
+    db.info.setdefault(_CANCEL_KEY, set()).update(order_ids)
+
+
+def cancel_contract_orders(db: Session, contract_id: int, *, except_id: int | None = None) -> None:
+    """Отменить активные стоп-лосс/тейк-профит закрываемого контракта."""
+    query = update(ConditionalOrder).where(ConditionalOrder.contract_id == contract_id, ConditionalOrder.status == "active")
+    if except_id is not None:
+        query = query.where(ConditionalOrder.id != except_id)
+    cancelled = db.scalars(
+        query.values(status="cancelled", error="contract closed")
+        .returning(ConditionalOrder.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    cancel_on_commit(db, cancelled)
+
+
+def close_contract(db: Session, contract: FuturesContract, close_nano: int) -> dict:
+    """Рассчитать контракт вне книги ордеров (ручное закрытие) и отменить его стоп-лосс/тейк-профит."""
+    user_ids = [uid for uid in (contract.emitter_id, contract.buyer_id) if uid is not None]
+    pnl = settle_contract(db, contract, close_nano, ton_balances(db, user_ids))
+    cancel_contract_orders(db, contract.id)
+    return pnl
+
+
+def execute_orders(db: Session, prices: dict[int, int]) -> list[dict]:
+    """
+    Исполнить ордера, сработавшие на новых ценах {market_id: price_ton в нанотонах}, одним пакетом.
+
+    Работает в транзакции пуша цен; коммит — на вызывающей стороне. Возвращает итоги по ордерам.
+    """
+    order_book.sync(db)
+    popped = [t for market_id, price_nano in prices.items() for t in order_book.pop_triggered(market_id, price_nano)]
+    if not popped:
+        return []
+    db.info.setdefault(_POPPED_KEY, []).extend(popped)
+
+    query = select(ConditionalOrder).where(
+        ConditionalOrder.id.in_([t.order_id for t in popped]), ConditionalOrder.status == "active"
+    ).order_by(ConditionalOrder.id)
+    if db.get_bind().dialect.name != "sqlite":
+        query = query.with_for_update(skip_locked=True)
+    orders = list(db.scalars(query))
+    if not orders:
+        return []
+
+    contract_ids = {o.contract_id for o in orders if o.contract_id is not None}
+    contracts = (
+        {c.id: c for c in db.scalars(select(FuturesContract).where(FuturesContract.id.in_(contract_ids)))}
+        if contract_ids else {}
+    )
+    user_ids = {o.user_id for o in orders}
+    for c in contracts.values():
+        user_ids.update(uid for uid in (c.emitter_id, c.buyer_id) if uid is not None)
+    balances = ton_balances(db, user_ids)
+
+    now = datetime.utcnow()
+    opened: list[tuple[ConditionalOrder, FuturesContract]] = []
+    for order in orders:
+        price_nano = prices[order.market_id]
+        order.executed_at = now
+        order.executed_price = from_nano(price_nano)
+        try:
+            if order.kind == "limit_entry":
+                contract = open_offer(
+                    db,
+                    balances[order.user_id],
+                    market_id=order.market_id,
+                    side=order.side,
+                    qty_nano=to_nano(order.qty, exact=False),
+                    entry_nano=price_nano,
+                )
+                opened.append((order, contract))
+            else:
+                contract = contracts.get(order.contract_id)
+                if contract is None or contract.status != "taken":
+                    raise TradeError("contract closed")
+                settle_contract(db, contract, price_nano, balances)
+                cancel_contract_orders(db, contract.id, except_id=order.id)
+            order.status = "executed"
+        except TradeError as e:
+            order.status = "failed"
+            order.error = e.detail[:128]
+        metrics.conditional_orders_executed_total.inc(order.kind, order.status)
+
+    if opened:
+        db.flush()  # id новых контрактов — одним flush на пакет
+        for order, contract in opened:
+            order.result_contract_id = contract.id
+
+    results = [
+        {
+            "order_id": o.id,
+            "user_id": o.user_id,
+            "kind": o.kind,
+            "market_id": o.market_id,
+            "status": o.status,
+            "price": format_amount(o.executed_price),
+            "contract_id": o.result_contract_id or o.contract_id,
+            "error": o.error,
+        }
+        for o in orders
+    ]
+    emit(db, "orders_executed", {"recipients": sorted({o.user_id for o in orders}), "orders": results})
+    return results
+
+
+# --- Синхронизация книги с коммитами (все сессии из SessionLocal) ---
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_on_commit(session: Session) -> None:
+    session.info.pop(_POPPED_KEY, None)
+    cancelled = session.info.pop(_CANCEL_KEY, None)
+    if cancelled:
+        order_book.cancel(cancelled)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _restore_on_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop(_CANCEL_KEY, None)
+    popped = session.info.pop(_POPPED_KEY, None)
+    if popped:
+        order_book.restore(popped)
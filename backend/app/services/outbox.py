@@ -0,0 +1,176 @@
+"""
+Transactional outbox: доменные события (депозит зачислен, предложение принято, контракт рассчитан,
+цены обновлены) пишутся в outbox_events в той же транзакции, что и само изменение, — событие
+появляется тогда и только тогда, когда закоммичено изменение. Путь записи только добавляет строку.
+
+Потребители читают ленту по возрастанию id:
+- внешние (бот) — GET /admin/events?after_id=N, курсор хранят у себя, ленту можно перечитать;
+- внутренние — подписчики OutboxDispatcher: фоновый поток API забирает события пачками по
+  OUTBOX_BATCH_SIZE после своего курсора и вызывает обработчики по порядку. Подписчик —
+  сброс кэша балансов (app/core/balance_cache.py): так до API доходят записи воркеров.
+
+Порядок id совпадает с порядком коммитов, пока писатель один (SQLite сериализует записи).
+
+Хранение: диспетчер раз в OUTBOX_PRUNE_INTERVAL удаляет события старше OUTBOX_RETENTION_SECONDS,
+уже разданные внутренним подписчикам (market_prices_updated пишется на каждый пуш оракула, и без
+чистки таблица растёт бесконечно). Курсоры внешних потребителей API не знает: потребитель,
+отставший больше чем на срок хранения, продолжит с самого старого оставшегося события.
+
+Соглашение о payload: JSON-объект, суммы — строки (format_amount), "recipients" — id пользователей,
+которых событие касается (лента отдаёт к ним telegram_user_id).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.core.settings import settings
+from app.db.database import SessionLocal
+from app.db.models import OutboxEvent, User
+
+
+logger = logging.getLogger("api")
+
+Handler = Callable[[dict], None]
+
+
+def emit(db: Session, event_type: str, payload: dict) -> OutboxEvent:
+    """Добавить событие в текущую транзакцию (коммит — на вызывающей стороне)."""
+    event = OutboxEvent(type=event_type, payload=json.dumps(payload, ensure_ascii=False, separators=(",", ":")))
+    db.add(event)
+    return event
+
+
+def fetch_after(db: Session, after_id: int, limit: int, types: set[str] | None = None) -> list[OutboxEvent]:
+    query = select(OutboxEvent).where(OutboxEvent.id > after_id)
+    if types:
+        query = query.where(OutboxEvent.type.in_(types))
+    return list(db.scalars(query.order_by(OutboxEvent.id).limit(limit)))
+
+
+def prune_events(db: Session, older_than: datetime, up_to_id: int) -> int:
+    """Удалить события, созданные раньше older_than, с id ≤ up_to_id; возвращает число удалённых."""
+    result = db.execute(
+        delete(OutboxEvent).where(OutboxEvent.created_at < older_than, OutboxEvent.id <= up_to_id)
+    )
+    return result.rowcount
+
+
+def event_out(event: OutboxEvent) -> dict:
+    return {
+        "id": event.id,
+        "type": event.type,
+        "payload": json.loads(event.payload),
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+    }
+
+
+def with_recipients(db: Session, events: list[dict]) -> list[dict]:
+    """Добавить к событиям получателей с telegram_user_id (все пользователи пачки — одним запросом)."""
+    user_ids = {uid for e in events for uid in e["payload"].get("recipients", [])}
+    telegram_ids: dict[int, str] = {}
+    if user_ids:
+        telegram_ids = {uid: tg for uid, tg in db.execute(select(User.id, User.telegram_user_id).where(User.id.in_(user_ids)))}
+    for e in events:
+        e["recipients"] = [
+            {"user_id": uid, "telegram_user_id": telegram_ids[uid]}
+            for uid in e["payload"].get("recipients", [])
+            if uid in telegram_ids
+        ]
+    return events
+
+
+class OutboxDispatcher:
+    """Фоновый поток: читает outbox пачками после курсора и раздаёт события подписчикам."""
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = 500,
+        poll_interval: float = 0.5,
+        retention_seconds: float = 0,
+        prune_interval: float = 60,
+    ) -> None:
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.prune_interval = prune_interval
+        self.cursor = 0
+        self._pruned_at = 0.0
+        self._subscribers: dict[str, list[Handler]] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def subscribe(self, event_type: str, handler: Handler) -> None:
+        """event_type "*" — все события."""
+        self._subscribers.setdefault(event_type, []).append(handler)
+
+    def dispatch_once(self) -> int:
+        """Одна пачка событий после курсора; возвращает число обработанных."""
+        with SessionLocal() as db:
+            events = [event_out(e) for e in fetch_after(db, self.cursor, self.batch_size)]
+        for event in events:
+            for handler in self._subscribers.get(event["type"], []) + self._subscribers.get("*", []):
+                try:
+                    handler(event)
+                except Exception:
+                    logger.exception(
+                        "Outbox subscriber failed",
+                        extra={"event": "outbox_subscriber_failed", "outbox_id": event["id"], "type": event["type"]},
+                    )
+            self.cursor = event["id"]
+        return len(events)
+
+    def prune(self, now: datetime | None = None) -> int:
+        """Удалить события старше срока хранения, уже разданные подписчикам; 0 — хранить всё."""
+        if self.retention_seconds <= 0:
+            return 0
+        older_than = (now or datetime.utcnow()) - timedelta(seconds=self.retention_seconds)
+        with SessionLocal() as db:
+            deleted = prune_events(db, older_than, self.cursor)
+            db.commit()
+        if deleted:
+            logger.info("Outbox pruned", extra={"event": "outbox_pruned", "deleted": deleted})
+        return deleted
+
+    def start(self) -> None:
+        """Внутренние подписчики реагируют на новые события: курсор — с текущего конца ленты."""
+        with SessionLocal() as db:
+            self.cursor = db.scalar(select(func.max(OutboxEvent.id))) or 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - self._pruned_at >= self.prune_interval:
+                    self._pruned_at = time.monotonic()
+                    self.prune()
+                # Полная пачка — сразу следующая, иначе ждём новых событий
+                if self.dispatch_once() >= self.batch_size:
+                    continue
+            except Exception:
+                logger.exception("Outbox dispatch failed", extra={"event": "outbox_dispatch_failed"})
+            self._stop.wait(self.poll_interval)
+
+
+dispatcher = OutboxDispatcher(
+    batch_size=settings.outbox_batch_size,
+    poll_interval=settings.outbox_poll_interval,
+    retention_seconds=settings.outbox_retention_seconds,
+    prune_interval=settings.outbox_prune_interval,
+)
@@ -0,0 +1,60 @@
+"""
+Транспорт выплат: отправка пакета исходящих сообщений кошелька проекта и проверка его включения в блокчейн.
+
+Кошелёк TON подписывает одно внешнее сообщение с несколькими исходящими (v3/v4 — до 4, v5 — до 255),
+поэтому транспорт принимает пакет целиком: submit() → ссылка на внешнее сообщение, status(ref) —
+его судьба. Реализация задаётся WITHDRAW_TRANSPORT="module:Class" — класс с этим интерфейсом
+(подпись и отправка через SDK кошелька); без неё withdrawal_worker.py не запускается.
+Транспорт без сети для тестов — bench/fakes.py: FakeTransport.
+
+Контракт submit(): исключение TransportError означает, что сообщение точно не принято сетью
+(повтор безопасен). Всё, что принято, должно быть однозначно отслеживаемо через status().
+"""
+from __future__ import annotations
+
+import importlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class TransferMessage:
+    withdrawal_id: int
+    destination: str
+    amount_nano: int
+    currency: str
+
+
+@dataclass(frozen=True)
+class TransferStatus:
+    state: str  # pending | confirmed | failed
+    tx_hash: str | None = None
+    error: str | None = None
+
+
+class TransportError(Exception):
+    """Пакет не отправлен (сеть/провайдер отказали до приёма сообщения)."""
+
+
+class PayoutTransport(ABC):
+    @abstractmethod
+    def submit(self, messages: list[TransferMessage]) -> str:
+        """Отправить пакет одним внешним сообщением кошелька; вернуть ссылку для status()."""
+
+    @abstractmethod
+    def status(self, ref: str) -> TransferStatus:
+        """Судьба внешнего сообщения: pending | confirmed | failed."""
+
+
+def load_transport(spec: str) -> PayoutTransport:
+    """
+    "package.module:ClassName" (класс создаётся без аргументов). Значения по умолчанию нет:
+    без настоящего транспорта заявки помечались бы выполненными, а выплаты не уходили бы.
+    """
+    module_name, _, class_name = spec.strip().partition(":")
+    if not module_name or not class_name:
+        raise ValueError(f"WITHDRAW_TRANSPORT must be 'module:Class' of a real payout transport, got {spec!r}")
+    transport = getattr(importlib.import_module(module_name), class_name)()
+    if not isinstance(transport, PayoutTransport) or getattr(transport, "fake", False):
+        raise ValueError(f"WITHDRAW_TRANSPORT {spec!r} is not a real PayoutTransport")
+    return transport
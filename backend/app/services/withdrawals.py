@@ -0,0 +1,239 @@
+"""
+Обработка заявок на вывод: захват пачки pending-заявок, отправка пакетами по несколько сообщений
+в одной транзакции кошелька проекта, отслеживание подтверждений и возврат средств при отказе.
+
+Жизненный цикл заявки: pending → processing (захвачена воркером) → submitted (в отправленном
+пакете) → completed | failed. Средства списаны с баланса ещё в POST /me/withdraw; при failed
+сумма возвращается на available с записью withdraw_refund в ledger.
+
+Захват безопасен для нескольких воркеров: на Postgres кандидаты выбираются с FOR UPDATE SKIP LOCKED,
+на SQLite (нет блокировок строк) — условным UPDATE … WHERE status = 'pending' с уникальным
+claim_token, после чего воркер забирает только строки со своим токеном. Заявка, зависшая в
+processing без пакета (воркер упал между захватом и отправкой), возвращается в pending через
+WITHDRAW_CLAIM_TTL_SECONDS.
+
+Пакет фиксируется в БД (submitting) до вызова транспорта: если процесс упадёт после отправки,
+заявки остаются привязаны к пакету и повторно не отправляются — такой пакет разбирается вручную.
+"""
+from __future__ import annotations
+
+import logging
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import groupby
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.core.money import format_amount, to_nano
+from app.db.models import Balance, LedgerEntry, Withdrawal, WithdrawalBatch
+from app.services.outbox import emit
+from app.services.payout_transport import PayoutTransport, TransferMessage, TransportError
+
+
+logger = logging.getLogger("api")
+
+
+def release_stale_claims(db: Session, ttl_seconds: float) -> int:
+    """Вернуть в pending заявки, захваченные давно и так и не попавшие в пакет."""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+    result = db.execute(
+        update(Withdrawal)
+        .where(Withdrawal.status == "processing", Withdrawal.batch_id.is_(None), Withdrawal.claimed_at < cutoff)
+        .values(status="pending", claim_token=None, claimed_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def claim_pending(db: Session, limit: int) -> list[Withdrawal]:
+    """Захватить до limit самых старых pending-заявок; другие воркеры их уже не получат."""
+    candidates = select(Withdrawal.id).where(Withdrawal.status == "pending").order_by(Withdrawal.id).limit(limit)
+    if db.get_bind().dialect.name != "sqlite":
+        candidates = candidates.with_for_update(skip_locked=True)
+    ids = list(db.scalars(candidates))
+    if not ids:
+        db.rollback()
+        return []
+    token = str(uuid.uuid4())
+    db.execute(
+        update(Withdrawal)
+        .where(Withdrawal.id.in_(ids), Withdrawal.status == "pending")
+        .values(status="processing", claim_token=token, claimed_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return list(db.scalars(select(Withdrawal).where(Withdrawal.claim_token == token).order_by(Withdrawal.id)))
+
+
+def submit_batches(
+    db: Session,
+    transport: PayoutTransport,
+    withdrawals: list[Withdrawal],
+    *,
+    max_messages: int,
+    max_attempts: int,
+) -> list[WithdrawalBatch]:
+    """Разбить захваченные заявки на пакеты (по валюте, до max_messages сообщений) и отправить."""
+    batches = []
+    ordered = sorted(withdrawals, key=lambda w: (w.currency, w.id))
+    for currency, group in groupby(ordered, key=lambda w: w.currency):
+        group = list(group)
+        for start in range(0, len(group), max_messages):
+            batches.append(_submit_batch(db, transport, currency, group[start:start + max_messages], max_attempts))
+    return batches
+
+
+def _submit_batch(
+    db: Session,
+    transport: PayoutTransport,
+    currency: str,
+    chunk: list[Withdrawal],
+    max_attempts: int,
+) -> WithdrawalBatch:
+    batch = WithdrawalBatch(currency=currency, status="submitting", message_count=len(chunk))
+    db.add(batch)
+    db.flush()
+    for w in chunk:
+        w.batch_id = batch.id
+    db.commit()
+
+    messages = [
+        TransferMessage(withdrawal_id=w.id, destination=w.destination_address, amount_nano=to_nano(w.amount, exact=False), currency=currency)
+        for w in chunk
+    ]
+    try:
+        ref = transport.submit(messages)
+    except TransportError as e:
+        batch.status = "failed"
+        batch.error = str(e)[:256]
+        retried, refunded = [], []
+        for w in chunk:
+            w.attempts += 1
+            if w.attempts >= max_attempts:
+                refunded.append(w)
+            else:
+                w.status, w.batch_id, w.claim_token, w.claimed_at = "pending", None, None, None
+                retried.append(w)
+        _fail_and_refund(db, refunded)
+        db.commit()
+        logger.warning(
+            "Withdrawal batch rejected by transport",
+            extra={
+                "event": "withdraw_batch_rejected",
+                "batch_id": batch.id,
+                "retried": len(retried),
+                "failed": len(refunded),
+                "error": batch.error,
+            },
+        )
+        return batch
+    except Exception:
+        # Неизвестно, принято ли сообщение: пакет остаётся submitting, заявки к нему привязаны
+        logger.exception(
+            "Withdrawal batch submit outcome unknown",
+            extra={"event": "withdraw_batch_unknown", "batch_id": batch.id},
+        )
+        raise
+
+    batch.status = "submitted"
+    batch.external_ref = ref
+    batch.submitted_at = datetime.utcnow()
+    for w in chunk:
+        w.status = "submitted"
+    db.commit()
+    logger.info(
+        "Withdrawal batch submitted",
+        extra={"event": "withdraw_batch_submitted", "batch_id": batch.id, "messages": len(chunk), "currency": currency},
+    )
+    return batch
+
+
+def poll_confirmations(db: Session, transport: PayoutTransport) -> dict:
+    """Проверить отправленные пакеты: подтверждённые → completed, отклонённые → failed с возвратом."""
+    batches = list(db.scalars(select(WithdrawalBatch).where(WithdrawalBatch.status == "submitted").order_by(WithdrawalBatch.id)))
+    summary = {"confirmed": 0, "failed": 0, "pending": 0}
+    if not batches:
+        db.rollback()
+        return summary
+    by_batch: dict[int, list[Withdrawal]] = {}
+    for w in db.scalars(select(Withdrawal).where(Withdrawal.batch_id.in_([b.id for b in batches]))):
+        by_batch.setdefault(w.batch_id, []).append(w)
+
+    now = datetime.utcnow()
+    failed: list[Withdrawal] = []
+    for batch in batches:
+        status = transport.status(batch.external_ref)
+        if status.state == "confirmed":
+            batch.status, batch.tx_hash, batch.confirmed_at = "confirmed", status.tx_hash, now
+            for w in by_batch.get(batch.id, []):
+                w.status, w.tx_hash = "completed", status.tx_hash
+                emit(db, "withdrawal_completed", _event_payload(w))
+        elif status.state == "failed":
+            batch.status, batch.error = "failed", (status.error or "")[:256]
+            failed.extend(by_batch.get(batch.id, []))
+            logger.warning(
+                "Withdrawal batch failed on-chain",
+                extra={"event": "withdraw_batch_failed", "batch_id": batch.id, "error": batch.error},
+            )
+        summary[status.state if status.state in summary else "pending"] += 1
+    _fail_and_refund(db, failed)
+    db.commit()
+    return summary
+
+
+def _fail_and_refund(db: Session, withdrawals: list[Withdrawal]) -> None:
+    """Пометить заявки failed и вернуть суммы на available (балансы — одним запросом)."""
+    if not withdrawals:
+        return
+    keys = {(w.user_id, w.currency) for w in withdrawals}
+    balances = {
+        (b.user_id, b.currency): b
+        for b in db.scalars(select(Balance).where(Balance.user_id.in_({k[0] for k in keys})))
+        if (b.user_id, b.currency) in keys
+    }
+    for w in withdrawals:
+        w.status = "failed"
+        balance = balances.get((w.user_id, w.currency))
+        if balance is None:
+            balance = balances[(w.user_id, w.currency)] = Balance(user_id=w.user_id, currency=w.currency, available=Decimal("0"), reserved=Decimal("0"))
+            db.add(balance)
+        balance.available += w.amount
+        emit(db, "withdrawal_failed", _event_payload(w))
+        db.add(LedgerEntry(
+            user_id=w.user_id,
+            currency=w.currency,
+            delta=w.amount,
+            reason="withdraw_refund",
+            ref_type="withdrawal",
+            ref_id=w.id,
+        ))
+
+
+def _event_payload(w: Withdrawal) -> dict:
+    return {
+        "recipients": [w.user_id],
+        "withdrawal_id": w.id,
+        "amount": format_amount(w.amount),
+        "currency": w.currency,
+        "tx_hash": w.tx_hash,
+    }
+
+
+def process_once(
+    db: Session,
+    transport: PayoutTransport,
+    *,
+    claim_limit: int,
+    max_messages: int,
+    max_attempts: int,
+    claim_ttl_seconds: float,
+) -> dict:
+    """Один проход воркера: вернуть зависшие, захватить и отправить, проверить подтверждения."""
+    released = release_stale_claims(db, claim_ttl_seconds)
+    claimed = claim_pending(db, claim_limit)
+    batches = submit_batches(db, transport, claimed, max_messages=max_messages, max_attempts=max_attempts) if claimed else []
+    confirmations = poll_confirmations(db, transport)
+    return {"released": released, "claimed": len(claimed), "batches": len(batches), **confirmations}
@@ -0,0 +1,369 @@
+"""
+Нагрузочный бенчмарк API: латентность (p50/p95/p99) и пропускная способность по сценариям.
+
+Сценарии:
+- markets       — GET /markets
+- balances      — GET /me/balances случайного пользователя (JWT в cookies, как у Mini App)
+- offer_flow    — POST /futures/offers → POST /futures/offers/{id}/take → POST /futures/{id}/settle
+                  (замеры по шагам: offer_create, offer_take, contract_settle)
+- bulk_prices   — цены из FakeThermos (как oracle_mrkt.py) → POST /admin/markets/prices/bulk
+- webhook       — депозиты от FakeTonProvider → POST /ton/webhook
+
+Каждый запуск создаёт свежую SQLite-БД во временном каталоге, заполняет её bench/datagen.py
+и поднимает API в отдельном процессе uvicorn (--mode inprocess — без сети, через TestClient).
+
+    cd backend
+    python -m bench.api_bench                                   # все сценарии, вывод таблицей
+    python -m bench.api_bench --save bench/baselines/api.json   # сохранить baseline
+    python -m bench.api_bench --compare bench/baselines/api.json
+
+Baseline сравнивается только с запусками на той же машине и с теми же параметрами.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Окружение API задаём до импорта app (engine создаётся при импорте app.db.database)
+_workdir = tempfile.mkdtemp(prefix="fogton-bench-")
+BENCH_ENV = {
+    "DATABASE_URL": f"sqlite:///{_workdir}/bench.db",
+    "JWT_SECRET": "bench-jwt-secret-0123456789abcdef0123",
+    "JWT_REFRESH_SECRET": "bench-refresh-secret-0123456789abcdef",
+    "ADMIN_TOKEN": "bench-admin-token",
+    "TON_WEBHOOK_SECRET": "bench-ton-secret",
+    "BOT_TOKEN": "123456:bench-bot-token",
+    # Логи запросов не нужны в замерах: пишем только предупреждения
+    "LOG_SAMPLING": "request_end=0",
+    # Замеряем пропускную способность самого API: лимиты частоты и сброс нагрузки выключены
+    "RATE_LIMITS": "",
+    "SHED_WRITE_LATENCY_MS": "0",
+}
+os.environ.update(BENCH_ENV)
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+
+from app.core.jwt import issue_access_token, issue_refresh_token  # noqa: E402
+from app.db.database import Base, SessionLocal, engine  # noqa: E402
+from bench.datagen import Dataset, generate  # noqa: E402
+from bench.fakes import FakeThermos, FakeTonProvider  # noqa: E402
+from oracle_mrkt import parse_collections  # noqa: E402
+
+
+SCENARIOS = ("markets", "balances", "offer_flow", "bulk_prices", "webhook")
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies_ms: list[float] = field(default_factory=list)
+    errors: int = 0
+    wall_seconds: float = 0.0
+
+    def record(self, started: float, ok: bool) -> None:
+        self.latencies_ms.append((time.perf_counter() - started) * 1000)
+        if not ok:
+            self.errors += 1
+
+    def summary(self) -> dict:
+        lat = sorted(self.latencies_ms)
+        return {
+            "requests": len(lat),
+            "errors": self.errors,
+            "p50_ms": round(percentile(lat, 50), 3),
+            "p95_ms": round(percentile(lat, 95), 3),
+            "p99_ms": round(percentile(lat, 99), 3),
+            "max_ms": round(lat[-1], 3) if lat else 0.0,
+            "throughput_rps": round(len(lat) / self.wall_seconds, 1) if self.wall_seconds else 0.0,
+        }
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Перцентиль по методу nearest-rank."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(-(-p * len(sorted_values) // 100)) - 1))
+    return sorted_values[k]
+
+
+# --- API: отдельный процесс или in-process ---
+
+
+def _free_port() -> int:
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ApiServer:
+    """uvicorn app.main:app в дочернем процессе с окружением бенчмарка."""
+
+    def __init__(self) -> None:
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._proc: subprocess.Popen | None = None
+
+    def start(self) -> None:
+        env = {**os.environ, **BENCH_ENV}
+        self._proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"{self.base_url}/healthz", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if self._proc.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            time.sleep(0.2)
+        raise RuntimeError("API did not become healthy in 30s")
+
+    def client(self) -> httpx.Client:
+        return httpx.Client(base_url=self.base_url, timeout=30)
+
+    def stop(self) -> None:
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.wait(timeout=10)
+
+
+class InProcessApi:
+    """Приложение в этом же процессе через TestClient: без сети, удобно там, где нет uvicorn."""
+
+    def __init__(self) -> None:
+        self._app = None
+
+    def start(self) -> None:
+        from app.main import create_app
+
+        self._app = create_app()
+
+    def client(self):
+        from fastapi.testclient import TestClient
+
+        return TestClient(self._app, base_url="http://testserver")
+
+    def stop(self) -> None:
+        pass
+
+
+# --- Сценарии ---
+
+
+class Bench:
+    def __init__(self, api, dataset: Dataset, thermos: FakeThermos, provider: FakeTonProvider, *, concurrency: int, seed: int) -> None:
+        self.api = api
+        self.dataset = dataset
+        self.thermos = thermos
+        self.provider = provider
+        self.concurrency = concurrency
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._local = threading.local()
+        self._cookies: dict[int, str] = {}
+        self.admin_headers = {"Authorization": f"Bearer {BENCH_ENV['ADMIN_TOKEN']}"}
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.api.client()
+        return client
+
+    def _user(self) -> int:
+        with self._rng_lock:
+            return self.dataset.user_ids[self._rng.randrange(len(self.dataset.user_ids))]
+
+    def _pair(self) -> tuple[int, int]:
+        with self._rng_lock:
+            a, b = self._rng.sample(self.dataset.user_ids, 2)
+        return a, b
+
+    def auth(self, user_id: int) -> dict:
+        cookie = self._cookies.get(user_id)
+        if cookie is None:
+            access = issue_access_token(subject=str(user_id), secret=BENCH_ENV["JWT_SECRET"], ttl_seconds=3600)
+            refresh = issue_refresh_token(subject=str(user_id), secret=BENCH_ENV["JWT_REFRESH_SECRET"], ttl_seconds=3600)
+            cookie = self._cookies[user_id] = f"ACCESS_TOKEN={access}; REFRESH_TOKEN={refresh}"
+        return {"Cookie": cookie}
+
+    def run(self, name: str, iterations: int) -> list[ScenarioResult]:
+        results: dict[str, ScenarioResult] = {}
+
+        def result(step: str) -> ScenarioResult:
+            return results.setdefault(step, ScenarioResult(step))
+
+        step_fn = getattr(self, f"_step_{name}")
+        lock = threading.Lock()
+
+        def worker(_: int) -> None:
+            for step, started, ok in step_fn():
+                with lock:
+                    result(step).record(started, ok)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(worker, range(iterations)))
+        wall = time.perf_counter() - started
+        for r in results.values():
+            r.wall_seconds = wall
+        return list(results.values())
+
+    def _step_markets(self):
+        started = time.perf_counter()
+        r = self._client().get("/markets")
+        yield "markets", started, r.status_code == 200
+
+    def _step_balances(self):
+        started = time.perf_counter()
+        r = self._client().get("/me/balances", headers=self.auth(self._user()))
+        yield "balances", started, r.status_code == 200
+
+    def _step_offer_flow(self):
+        client = self._client()
+        emitter, buyer = self._pair()
+        with self._rng_lock:
+            market_id = self._rng.choice(self.dataset.market_ids)
+            side = self._rng.choice(("long", "short"))
+        started = time.perf_counter()
+        r = client.post("/futures/offers", json={"market_id": market_id, "side": side, "qty": "1"}, headers=self.auth(emitter))
+        yield "offer_create", started, r.status_code == 200
+        if r.status_code != 200:
+            return
+        offer_id = r.json()["id"]
+        started = time.perf_counter()
+        r = client.post(f"/futures/offers/{offer_id}/take", json={}, headers=self.auth(buyer))
+        yield "offer_take", started, r.status_code == 200
+        started = time.perf_counter()
+        r = client.post(f"/futures/{offer_id}/settle", json={}, headers=self.auth(emitter))
+        yield "contract_settle", started, r.status_code == 200
+
+    def _step_bulk_prices(self):
+        client = self._client()
+        with self._rng_lock:
+            self.thermos.tick()
+        thermos = httpx.get(f"{self.thermos.base_url}/api/v1/collections", timeout=10).json()
+        payload = [{"gift_name": p.gift_name, "price_ton": str(p.price_ton)} for p in parse_collections(thermos)]
+        started = time.perf_counter()
+        r = client.post("/admin/markets/prices/bulk", json=payload, headers=self.admin_headers)
+        yield "bulk_prices", started, r.status_code == 200
+
+    def _step_webhook(self):
+        payload, headers = self.provider.next_webhook()
+        started = time.perf_counter()
+        r = self._client().post("/ton/webhook", json=payload, headers=headers)
+        yield "webhook", started, r.status_code == 200
+
+
+# --- Отчёт и baseline ---
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def print_report(report: dict, baseline: dict | None = None) -> None:
+    header = f"{'step':<16}{'req':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>9}"
+    if baseline:
+        header += f"{'Δp50':>9}{'Δp95':>9}{'Δrps':>9}"
+    print(header)
+    base_results = (baseline or {}).get("results", {})
+    for step, s in report["results"].items():
+        line = f"{step:<16}{s['requests']:>7}{s['errors']:>5}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['throughput_rps']:>9.1f}"
+        b = base_results.get(step)
+        if b:
+            line += "".join(f"{_delta(s[k], b[k]):>9}" for k in ("p50_ms", "p95_ms", "throughput_rps"))
+        print(line)
+
+
+def _delta(value: float, base: float) -> str:
+    if not base:
+        return "-"
+    return f"{(value - base) / base * 100:+.0f}%"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк API: p50/p95/p99 и throughput по сценариям")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="через запятую: " + ",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="итераций на сценарий")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--markets", type=int, default=50)
+    parser.add_argument("--contracts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=("subprocess", "inprocess"), default="subprocess")
+    parser.add_argument("--save", help="записать результат в JSON (baseline)")
+    parser.add_argument("--compare", help="сравнить с baseline JSON")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        dataset = generate(db, users=args.users, markets=args.markets, contracts=args.contracts, seed=args.seed)
+    finally:
+        db.close()
+
+    thermos = FakeThermos(dataset.gift_names, seed=args.seed)
+    thermos.start()
+    provider = FakeTonProvider(dataset.user_ids, secret=BENCH_ENV["TON_WEBHOOK_SECRET"], seed=args.seed)
+    api = ApiServer() if args.mode == "subprocess" else InProcessApi()
+    api.start()
+    try:
+        bench = Bench(api, dataset, thermos, provider, concurrency=args.concurrency, seed=args.seed)
+        results: dict[str, dict] = {}
+        for name in scenarios:
+            # Прогрев: соединения, кэши, JIT-компиляция запросов SQLAlchemy
+            bench.run(name, min(20, args.requests))
+            for r in bench.run(name, args.requests):
+                results[r.name] = r.summary()
+    finally:
+        api.stop()
+        thermos.stop()
+
+    report = {
+        "params": {k: getattr(args, k) for k in ("requests", "concurrency", "users", "markets", "contracts", "seed", "mode")},
+        "dataset": dataset.summary(),
+        "environment": environment(),
+        "results": results,
+    }
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    if baseline and baseline.get("params") != report["params"]:
+        print(f"warning: baseline params differ: {baseline.get('params')}")
+    print_report(report, baseline)
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"saved {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Генератор данных для бенчмарков: N пользователей с балансами, M рынков (подарок × экспирация),
+K фьючерсных контрактов (открытые предложения и принятые контракты).
+
+Детерминирован по seed, пишет пакетными INSERT (executemany) в БД из DATABASE_URL.
+Запуск отдельно (обычно вызывается из bench/api_bench.py):
+
+    cd backend
+    DATABASE_URL=sqlite:///./bench.db python -m bench.datagen --users 1000 --markets 50 --contracts 2000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app.core.money import from_nano, mul_nano, to_nano
+from app.db.database import Base, SessionLocal, engine
+from app.db.models import Balance, Expiry, FuturesContract, Gift, Market, User
+
+
+EXPIRY_DAYS = (7, 30)
+# Начальный баланс TON каждого пользователя — хватает на много сделок в сценариях
+START_BALANCE_TON = Decimal("100000")
+
+
+@dataclass
+class Dataset:
+    user_ids: list[int] = field(default_factory=list)
+    market_ids: list[int] = field(default_factory=list)
+    gift_names: list[str] = field(default_factory=list)
+    open_offer_ids: list[int] = field(default_factory=list)
+    taken_contract_ids: list[int] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        return {
+            "users": len(self.user_ids),
+            "markets": len(self.market_ids),
+            "gifts": len(self.gift_names),
+            "open_offers": len(self.open_offer_ids),
+            "taken_contracts": len(self.taken_contract_ids),
+        }
+
+
+def gift_name(i: int) -> str:
+    return f"Bench Gift {i:04d}"
+
+
+def generate(db: Session, *, users: int, markets: int, contracts: int, seed: int = 0) -> Dataset:
+    """Заполнить БД и вернуть id созданных сущностей. Ожидает пустые таблицы."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    db.execute(insert(User), [
+        {"telegram_user_id": str(900_000_000 + i), "created_at": now} for i in range(users)
+    ])
+    user_ids = list(db.scalars(select(User.id).order_by(User.id)))
+
+    db.execute(insert(Balance), [
+        {"user_id": uid, "currency": currency, "available": START_BALANCE_TON if currency == "TON" else Decimal("0"), "reserved": Decimal("0")}
+        for uid in user_ids
+        for currency in ("TON", "USDT")
+    ])
+
+    # Рынки: подарки × экспирации, сколько нужно до markets
+    n_gifts = max(1, -(-markets // len(EXPIRY_DAYS)))
+    names = [gift_name(i) for i in range(n_gifts)]
+    db.execute(insert(Gift), [{"name": name, "is_active": True} for name in names])
+    db.execute(insert(Expiry), [{"days": d, "is_active": True} for d in EXPIRY_DAYS])
+    gift_ids = list(db.scalars(select(Gift.id).order_by(Gift.id)))
+    expiry_ids = list(db.scalars(select(Expiry.id).order_by(Expiry.id)))
+    rows = []
+    for gift_id in gift_ids:
+        price = from_nano(rng.randrange(1, 200) * 10**8)  # 0.1 … 20 TON
+        for expiry_id in expiry_ids:
+            if len(rows) < markets:
+                rows.append({"gift_id": gift_id, "expiry_id": expiry_id, "is_active": True, "price_ton": price})
+    db.execute(insert(Market), rows)
+    market_rows = db.execute(select(Market.id, Market.price_ton).order_by(Market.id)).all()
+
+    # Контракты: половина — открытые предложения, половина — принятые
+    contract_rows = []
+    for i in range(contracts):
+        market_id, price_ton = market_rows[rng.randrange(len(market_rows))]
+        emitter_id = user_ids[rng.randrange(len(user_ids))]
+        buyer_id = None
+        if i % 2 and len(user_ids) > 1:
+            buyer_id = emitter_id
+            while buyer_id == emitter_id:
+                buyer_id = user_ids[rng.randrange(len(user_ids))]
+        qty_nano = rng.randrange(1, 10) * 10**9
+        entry_nano = to_nano(price_ton, exact=False)
+        notional = from_nano(mul_nano(qty_nano, entry_nano))
+        contract_rows.append({
+            "market_id": market_id,
+            "emitter_id": emitter_id,
+            "buyer_id": buyer_id,
+            "side": rng.choice(("long", "short")),
+            "qty": from_nano(qty_nano),
+            "entry_price": from_nano(entry_nano),
+            "status": "taken" if buyer_id is not None else "open",
+            "margin_emitter": notional,
+            "margin_buyer": notional if buyer_id is not None else Decimal("0"),
+            "created_at": now,
+        })
+    if contract_rows:
+        db.execute(insert(FuturesContract), contract_rows)
+    db.commit()
+
+    dataset = Dataset(user_ids=user_ids, market_ids=[r.id for r in market_rows], gift_names=names)
+    for cid, status in db.execute(select(FuturesContract.id, FuturesContract.status).order_by(FuturesContract.id)):
+        (dataset.taken_contract_ids if status == "taken" else dataset.open_offer_ids).append(cid)
+    return dataset
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Заполнить БД данными для бенчмарков")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--markets", type=int, default=50)
+    parser.add_argument("--contracts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        dataset = generate(db, users=args.users, markets=args.markets, contracts=args.contracts, seed=args.seed)
+    finally:
+        db.close()
+    print(dataset.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Локальные заменители внешних сервисов для бенчмарков (без сети):
+
+- FakeThermos — HTTP-сервер с /api/v1/collections в формате Thermos (floor в нанотонах,
+  ETag/If-None-Match), цены случайно блуждают при каждом tick(). Подходит и для oracle_mrkt.py
+  (THERMOS_PROXY_BASE_URL=<base_url>).
+- FakeTonProvider — генератор webhook-запросов провайдера TON API: депозиты на comment u{user_id},
+  подпись X-Ton-Webhook-Secret, доля повторов tx_hash (путь идемпотентности).
+- sign_init_data() — initData Telegram WebApp, подписанный токеном бота (вместо клиента Telegram).
+- FakeTransport — транспорт выплат для withdrawal-воркера в тестах: пакеты в памяти, подтверждение
+  вручную или сразу (auto_confirm). В WITHDRAW_TRANSPORT не принимается (load_transport).
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import threading
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from aiohttp import web
+
+from app.services.payout_transport import PayoutTransport, TransferMessage, TransferStatus, TransportError
+
+
+def sign_init_data(telegram_user_id: int | str, bot_token: str, *, auth_date: int = 1700000000) -> str:
+    """initData с полем user и hash по спецификации Telegram WebApp."""
+    fields = {
+        "auth_date": str(auth_date),
+        "query_id": "AAHdF6IQAAAAAN0XohDhrOrc",
+        "user": json.dumps({"id": int(telegram_user_id), "first_name": "Bench", "language_code": "ru"}),
+    }
+    check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode("utf-8"), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, check.encode("utf-8"), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+class FakeThermos:
+    def __init__(self, gift_names: list[str], *, seed: int = 0, drift: float = 0.02) -> None:
+        self._rng = random.Random(seed)
+        self.drift = drift
+        self.floors = {name: self._rng.randrange(1, 200) * 10**8 for name in gift_names}
+        self.version = 0
+        self.requests = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._runner: web.AppRunner | None = None
+        self._thread: threading.Thread | None = None
+        self.base_url = ""
+
+    def tick(self) -> None:
+        """Сдвинуть floor каждой коллекции на ±drift."""
+        for name, floor in self.floors.items():
+            move = 1 + self._rng.uniform(-self.drift, self.drift)
+            self.floors[name] = max(1, int(floor * move))
+        self.version += 1
+
+    def collections(self) -> list[dict]:
+        return [{"name": name, "stats": {"floor": str(floor)}} for name, floor in self.floors.items()]
+
+    def etag(self) -> str:
+        return '"' + hashlib.sha1(f"{self.version}".encode()).hexdigest()[:16] + '"'
+
+    async def _handle_collections(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        etag = self.etag()
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            body=json.dumps(self.collections()).encode("utf-8"),
+            content_type="application/json",
+            headers={"ETag": etag},
+        )
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запустить сервер в фоновом потоке; вернуть базовый URL."""
+        ready = threading.Event()
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            app = web.Application()
+            app.router.add_get("/api/v1/collections", self._handle_collections)
+            self._runner = web.AppRunner(app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, host, port)
+            self._loop.run_until_complete(site.start())
+            bound_port = site._server.sockets[0].getsockname()[1]
+            self.base_url = f"http://{host}:{bound_port}"
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-thermos", daemon=True)
+        self._thread.start()
+        ready.wait(timeout=10)
+        return self.base_url
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop = None
+
+
+class FakeTonProvider:
+    def __init__(self, user_ids: list[int], *, secret: str = "", seed: int = 0, duplicate_ratio: float = 0.05) -> None:
+        self._rng = random.Random(seed)
+        self.user_ids = user_ids
+        self.secret = secret
+        self.duplicate_ratio = duplicate_ratio
+        self._seq = 0
+        self._last: dict | None = None
+        self._lock = threading.Lock()
+
+    def next_webhook(self) -> tuple[dict, dict]:
+        """(payload, headers) очередного webhook: депозит TON случайному пользователю или повтор."""
+        with self._lock:
+            if self._last is not None and self._rng.random() < self.duplicate_ratio:
+                payload = dict(self._last)
+            else:
+                self._seq += 1
+                user_id = self.user_ids[self._rng.randrange(len(self.user_ids))]
+                amount = Decimal(self._rng.randrange(1, 1000)) / 10
+                payload = {
+                    "tx_hash": hashlib.sha256(f"bench-{self._seq}".encode()).hexdigest(),
+                    "amount": str(amount),
+                    "comment": f"u{user_id}",
+                    "currency": "TON",
+                }
+                self._last = payload
+        headers = {"X-Ton-Webhook-Secret": self.secret} if self.secret else {}
+        return payload, headers
+
+
+class FakeTransport(PayoutTransport):
+    """Транспорт без сети: пакеты копятся в памяти, подтверждение — вручную или сразу (auto_confirm)."""
+
+    # load_transport отказывается от фейковых транспортов: выплаты без сети не уходят
+    fake = True
+
+    def __init__(self, *, auto_confirm: bool = False) -> None:
+        self.auto_confirm = auto_confirm
+        self.submitted: dict[str, list[TransferMessage]] = {}
+        self.fail_next_submit = 0
+        self._states: dict[str, TransferStatus] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, messages: list[TransferMessage]) -> str:
+        with self._lock:
+            if self.fail_next_submit > 0:
+                self.fail_next_submit -= 1
+                raise TransportError("fake transport: submit rejected")
+            ref = hashlib.sha256(f"batch-{len(self.submitted)}-{messages}".encode()).hexdigest()
+            self.submitted[ref] = list(messages)
+            self._states[ref] = TransferStatus("pending")
+            if self.auto_confirm:
+                self._confirm(ref)
+            return ref
+
+    def status(self, ref: str) -> TransferStatus:
+        with self._lock:
+            return self._states.get(ref, TransferStatus("failed", error="unknown external message"))
+
+    def confirm(self, ref: str) -> None:
+        with self._lock:
+            self._confirm(ref)
+
+    def fail(self, ref: str, error: str = "bounced") -> None:
+        with self._lock:
+            self._states[ref] = TransferStatus("failed", error=error)
+
+    def _confirm(self, ref: str) -> None:
+        self._states[ref] = TransferStatus("confirmed", tx_hash=hashlib.sha256(ref.encode()).hexdigest())
@@ -0,0 +1,278 @@
+"""
+Микробенчмарки горячих чистых функций (выполняются на каждом запросе): время на вызов и память.
+
+Для каждого случая:
+- ns_per_call — минимум по нескольким повторам (число вызовов калибруется до ~20 мс на повтор);
+- ratio — ns_per_call в единицах эталонной нагрузки (чистый Python: json и арифметика Decimal),
+  замеренной в том же запуске;
+- peak_bytes — пиковый прирост памяти за один вызов (tracemalloc);
+- retained_per_call — сколько памяти в среднем остаётся занятым после вызова (утечки, растущие кэши).
+
+    cd backend
+    python -m bench.microbench                                 # таблица
+    python -m bench.microbench --save                          # записать baseline (bench/baselines/micro.json)
+    python -m bench.microbench --check                         # exit 1 при регрессии относительно baseline
+
+Порог регрессии: --time-threshold (доля, по умолчанию 0.25) и --mem-threshold (0.10).
+Время --check сравнивает по ratio, а не по абсолютным наносекундам: более быстрая или медленная
+машина ускоряет эталон и случаи одинаково, и baseline из репозитория остаётся применим. Разная
+версия Python или библиотек (PyJWT, orjson) меняет ratio — baseline тогда стоит перезаписать.
+Память от машины почти не зависит и сравнивается напрямую.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = BACKEND_DIR / "bench" / "baselines" / "micro.json"
+
+# Модули app читают окружение при импорте; БД в микробенчмарках не используется
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.core.jwt import decode_jwt, issue_access_token  # noqa: E402
+from app.core.logging import JsonFormatter  # noqa: E402
+from app.core.money import from_nano, settlement_pnl, to_nano  # noqa: E402
+from app.core.telegram_auth import verify_telegram_webapp_init_data  # noqa: E402
+from app.routes.ton_webhook import _user_id_from_comment  # noqa: E402
+from bench.fakes import sign_init_data  # noqa: E402
+
+
+CASES: dict[str, Callable[[], Callable[[], object]]] = {}
+
+# Допуски поверх относительного порога: выравнивание аллокатора и ограниченные кэши библиотек
+# (PyJWT/datetime держат несколько КБ, которые не растут с числом вызовов)
+PEAK_SLACK_BYTES = 256
+RETAINED_SLACK_PER_CALL = 16.0
+LEAK_CALLS = 5000
+TARGET_REPEAT_SECONDS = 0.02
+REPEATS = 15
+
+
+def case(name: str):
+    """Регистрация случая: фабрика готовит данные и возвращает функцию без аргументов."""
+    def decorator(factory: Callable[[], Callable[[], object]]):
+        CASES[name] = factory
+        return factory
+    return decorator
+
+
+# --- Случаи ---
+
+_BOT_TOKEN = "123456:bench-bot-token"
+_JWT_SECRET = "bench-jwt-secret-0123456789abcdef0123"
+
+
+@case("telegram_init_data_verify")
+def _case_init_data():
+    init_data = sign_init_data(279058397, _BOT_TOKEN)
+    return lambda: verify_telegram_webapp_init_data(init_data, _BOT_TOKEN)
+
+
+@case("jwt_issue_access")
+def _case_jwt_issue():
+    return lambda: issue_access_token(subject="42", secret=_JWT_SECRET, ttl_seconds=300)
+
+
+@case("jwt_decode")
+def _case_jwt_decode():
+    token = issue_access_token(subject="42", secret=_JWT_SECRET, ttl_seconds=3600)
+    return lambda: decode_jwt(token, secret=_JWT_SECRET)
+
+
+@case("user_id_from_comment")
+def _case_comment():
+    return lambda: _user_id_from_comment("u123456")
+
+
+@case("json_formatter_format")
+def _case_formatter():
+    formatter = JsonFormatter()
+    record = logging.LogRecord("api", logging.INFO, __file__, 1, "request_end", (), None)
+    record.event = "request_end"
+    record.request_id = "4f1c2b9e-8a7d-4c3b-9e21-0f5a6b7c8d9e"
+    record.method = "POST"
+    record.path = "/futures/offers"
+    record.status_code = 200
+    record.duration_ms = 12.5
+    return lambda: formatter.format(record)
+
+
+@case("settlement_pnl")
+def _case_settlement():
+    # Как в settle_contract: Decimal из БД → нано → PnL → Decimal для записи
+    entry, close, qty = Decimal("12.345678900000000000"), Decimal("13.1"), Decimal("3.000000000000000000")
+
+    def run():
+        emitter, buyer = settlement_pnl(to_nano(entry, exact=False), to_nano(close), to_nano(qty, exact=False))
+        return from_nano(emitter), from_nano(buyer)
+    return run
+
+
+# --- Эталон ---
+
+_REFERENCE_DOC = {"user_id": 42, "items": [{"qty": "1.5", "price": "12.3456789"}] * 8, "ok": True}
+
+
+def _reference() -> object:
+    """Нагрузка без кода приложения: по ней нормируется время случаев."""
+    doc = json.loads(json.dumps(_REFERENCE_DOC))
+    return sum(Decimal(i["qty"]) * Decimal(i["price"]) for i in doc["items"])
+
+
+def reference_ns() -> float:
+    return time_per_call(_reference)
+
+
+# --- Замеры ---
+
+
+def time_per_call(fn: Callable[[], object]) -> float:
+    """Наносекунды на вызов: калибровка числа вызовов, затем минимум по REPEATS повторам."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= TARGET_REPEAT_SECONDS / 5:
+            break
+        number *= 2
+    number = max(1, int(number * TARGET_REPEAT_SECONDS / max(elapsed, 1e-9)))
+    best = float("inf")
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            best = min(best, (time.perf_counter() - started) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best * 1e9
+
+
+def memory_per_call(fn: Callable[[], object], calls: int = LEAK_CALLS) -> tuple[int, float]:
+    """(пиковый прирост за один вызов в байтах, средний остаток памяти на вызов после calls вызовов)."""
+    fn()  # прогрев: ленивые импорты, кэши модулей
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        peak_bytes = peak - base
+        gc.collect()
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(calls):
+            fn()
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak_bytes), round(max(0, after - before) / calls, 2)
+
+
+def run_cases(names: list[str]) -> tuple[dict[str, dict], float]:
+    """(результаты, эталон в нс). Эталон мерится до и после случаев, берётся минимум."""
+    reference = reference_ns()
+    results = {}
+    for name in names:
+        fn = CASES[name]()
+        peak, retained = memory_per_call(fn)
+        results[name] = {
+            "ns_per_call": round(time_per_call(fn), 1),
+            "peak_bytes": peak,
+            "retained_per_call": retained,
+        }
+    reference = min(reference, reference_ns())
+    for r in results.values():
+        r["ratio"] = round(r["ns_per_call"] / reference, 3)
+    return results, reference
+
+
+def check(results: dict[str, dict], baseline: dict[str, dict], *, time_threshold: float, mem_threshold: float) -> list[str]:
+    """Список регрессий относительно baseline (пустой — всё в пределах порогов)."""
+    failures = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        if "ratio" in b and r["ratio"] > b["ratio"] * (1 + time_threshold):
+            failures.append(f"{name}: {r['ratio']:.3f}x reference > baseline {b['ratio']:.3f}x (+{time_threshold:.0%})")
+        for key, slack in (("peak_bytes", PEAK_SLACK_BYTES), ("retained_per_call", RETAINED_SLACK_PER_CALL)):
+            if r[key] > b[key] * (1 + mem_threshold) + slack:
+                failures.append(f"{name}: {key} {r[key]} > baseline {b[key]} (+{mem_threshold:.0%})")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций: время и память на вызов")
+    parser.add_argument("cases", nargs="*", help="имена случаев (по умолчанию все): " + ", ".join(CASES))
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save", action="store_true", help="записать результаты в baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1, если есть регрессия относительно baseline (время — в долях эталона)")
+    parser.add_argument("--time-threshold", type=float, default=0.25)
+    parser.add_argument("--mem-threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    names = args.cases or list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    results, reference = run_cases(names)
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")).get("cases", {}) if baseline_path.exists() else {}
+
+    print(f"reference: {reference:.0f} ns/call")
+    print(f"{'case':<28}{'ns/call':>12}{'x ref':>9}{'peak B':>10}{'kept B/call':>13}{'vs base':>10}")
+    for name, r in results.items():
+        b = baseline.get(name)
+        delta = f"{(r['ratio'] - b['ratio']) / b['ratio'] * 100:+.0f}%" if b and "ratio" in b else "-"
+        print(f"{name:<28}{r['ns_per_call']:>12.0f}{r['ratio']:>9.3f}{r['peak_bytes']:>10}{r['retained_per_call']:>13}{delta:>10}")
+
+    if args.save:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "environment": {"python": platform.python_version(), "platform": platform.platform()},
+            "reference_ns": round(reference, 1),
+            "cases": {**baseline, **results},
+        }
+        baseline_path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+        print(f"saved {baseline_path}")
+
+    if args.check:
+        if not baseline:
+            print(f"no baseline at {baseline_path}")
+            sys.exit(2)
+        # Медленный случай перемеряем вместе с эталоном: единичный выброс планировщика ОС
+        # не должен валить проверку
+        for _ in range(2):
+            for name, r in results.items():
+                b = baseline.get(name)
+                if b and "ratio" in b and r["ratio"] > b["ratio"] * (1 + args.time_threshold):
+                    ratio = time_per_call(CASES[name]()) / reference_ns()
+                    r["ratio"] = min(r["ratio"], round(ratio, 3))
+        failures = check(results, baseline, time_threshold=args.time_threshold, mem_threshold=args.mem_threshold)
+        for line in failures:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Воспроизведение записанного трафика (RECORD_TRAFFIC_PATH, app/core/traffic.py) на чистой БД.
+
+Снимок из первой строки записи восстанавливается с теми же id, затем запросы отправляются
+в записанном порядке с ускорением времени (--speed: 60 — минута записи за секунду, 0 — без пауз)
+и ограничением параллелизма (--concurrency). Запросы одного пользователя идут строго по порядку;
+запрос, ссылающийся на созданную в записи сущность (пользователь, контракт, ордер, алерт), ждёт её
+создания. Новые id сопоставляются со старыми по полю created записи. Запрос с id, которому нет
+сопоставления (сущность не создана при replay или её создание не попало в запись), не отправляется:
+такие запросы перечисляются в отчёте (unmapped), и replay завершается с ошибкой.
+
+Итог: пропускная способность, латентность по маршрутам, расхождения статусов с записью и
+каноническое состояние учёта (балансы, суммы проводок, контракты, депозиты, выводы — по
+telegram_user_id, без внутренних id) с его sha256. При --concurrency 1 состояние детерминировано,
+и его файл (--state-out) побайтно сравним между версиями кода; при параллелизме гонки между
+разными пользователями (например, за одно предложение) могут разрешаться по-разному.
+
+    cd backend
+    RECORD_TRAFFIC_PATH=traffic.ndjson uvicorn app.main:app      # запись: traffic-<время>-<pid>.ndjson
+    python -m bench.replay traffic-20260101T120000Z-4242.ndjson --speed 60 --concurrency 8 --state-out state.json
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from decimal import Decimal
+from pathlib import Path
+
+# api_bench задаёт окружение (временная БД, секреты) до импорта app
+from bench.api_bench import BENCH_ENV, ApiServer, InProcessApi, percentile
+
+from sqlalchemy import func, insert, select
+
+from app.core.jwt import issue_access_token, issue_refresh_token
+from app.core.money import format_amount
+from app.core.traffic import capture_for, find_id, read_recording
+from app.db.database import Base, SessionLocal, engine
+from app.db.models import Balance, Deposit, Expiry, FuturesContract, Gift, LedgerEntry, Market, User, Withdrawal
+from bench.fakes import sign_init_data
+
+
+# Пути с id сущности: /futures/offers/{id}/take, /futures/{id}/settle, /admin/futures/{id}/settle,
+# /orders/{id}, /alerts/{id}
+_ID_PATHS = (
+    (re.compile(r"^(/(?:admin/)?futures/(?:offers/)?)(\d+)(/.*)$"), "contract"),
+    (re.compile(r"^(/orders/)(\d+)()$"), "order"),
+    (re.compile(r"^(/alerts/)(\d+)()$"), "alert"),
+)
+_COMMENT_USER = re.compile(r"^u(\d+)$")
+
+
+class UnmappedId(Exception):
+    """В запросе id сущности, для которой при replay нет нового id."""
+
+
+def _path_id(path: str) -> tuple[re.Match, str] | None:
+    for pattern, kind in _ID_PATHS:
+        m = pattern.match(path)
+        if m:
+            return m, kind
+    return None
+
+
+def restore_snapshot(snapshot: dict | None) -> None:
+    """Справочники и состояние на момент начала записи — с теми же id."""
+    Base.metadata.create_all(bind=engine)
+    if not snapshot:
+        return
+
+    def decimals(rows, keys):
+        return [{k: (Decimal(v) if k in keys and v is not None else v) for k, v in row.items()} for row in rows]
+
+    with SessionLocal() as db:
+        for model, key, money in (
+            (User, "users", ()),
+            (Gift, "gifts", ()),
+            (Expiry, "expiries", ()),
+            (Market, "markets", ("price_ton", "price_usdt")),
+            (Balance, "balances", ("available", "reserved")),
+            (FuturesContract, "contracts", ("qty", "entry_price", "margin_emitter", "margin_buyer")),
+        ):
+            rows = decimals(snapshot.get(key) or [], money)
+            if rows:
+                db.execute(insert(model), rows)
+        db.commit()
+
+
+class Replayer:
+    def __init__(self, api, snapshot: dict | None, *, speed: float, concurrency: int) -> None:
+        self.api = api
+        self.speed = speed
+        self.concurrency = concurrency
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Старый id → новый; сущности из снимка сохраняют id
+        self.ids: dict[str, dict[int, int]] = {
+            "user": {u["id"]: u["id"] for u in (snapshot or {}).get("users", [])},
+            "contract": {c["id"]: c["id"] for c in (snapshot or {}).get("contracts", [])},
+            "order": {},
+            "alert": {},
+        }
+        self._creators: dict[tuple[str, int], Future] = {}
+        self._cookies: dict[int, str] = {}
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.status_mismatches: dict[str, int] = defaultdict(int)
+        self.unmapped: list[str] = []
+        self.errors = 0
+        self.sent = 0
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.api.client()
+        return client
+
+    # --- Зависимости ---
+
+    def _dependencies(self, entry: dict) -> list[tuple[str, int]]:
+        deps = []
+        if entry.get("user") is not None:
+            deps.append(("user", entry["user"]))
+        path_id = _path_id(entry["path"])
+        if path_id:
+            deps.append((path_id[1], int(path_id[0].group(2))))
+        body = entry.get("body")
+        if isinstance(body, dict):
+            if isinstance(body.get("contract_id"), int):
+                deps.append(("contract", body["contract_id"]))
+            comment = _COMMENT_USER.match(str(body.get("comment") or ""))
+            if comment:
+                deps.append(("user", int(comment.group(1))))
+            if isinstance(body.get("user_id"), int):
+                deps.append(("user", body["user_id"]))
+        return deps
+
+    def _map(self, kind: str, old_id: int) -> int:
+        with self._lock:
+            try:
+                return self.ids[kind][old_id]
+            except KeyError:
+                raise UnmappedId(f"{kind} {old_id}") from None
+
+    # --- Перевод записи в запрос ---
+
+    def _request(self, entry: dict) -> tuple[str, str, dict, object, str]:
+        method, path, body = entry["method"], entry["path"], entry.get("body")
+        route = path.split("?", 1)[0]
+        headers: dict[str, str] = {}
+
+        path_id = _path_id(path)
+        if path_id:
+            m, kind = path_id
+            path = f"{m.group(1)}{self._map(kind, int(m.group(2)))}{m.group(3)}"
+            route = f"{m.group(1)}{{id}}{m.group(3)}".split("?", 1)[0]
+
+        if route == "/auth/telegram" and isinstance(body, dict):
+            body = {"init_data": sign_init_data(body.get("telegram_user_id") or 0, BENCH_ENV["BOT_TOKEN"])}
+        elif isinstance(body, dict):
+            body = dict(body)
+            comment = _COMMENT_USER.match(str(body.get("comment") or ""))
+            if comment:
+                body["comment"] = f"u{self._map('user', int(comment.group(1)))}"
+            if isinstance(body.get("user_id"), int):
+                body["user_id"] = self._map("user", body["user_id"])
+            if isinstance(body.get("contract_id"), int):
+                body["contract_id"] = self._map("contract", body["contract_id"])
+
+        if entry.get("user") is not None:
+            headers["Cookie"] = self._cookie(self._map("user", entry["user"]))
+        if entry.get("admin"):
+            headers["Authorization"] = f"Bearer {BENCH_ENV['ADMIN_TOKEN']}"
+        if route == "/ton/webhook":
+            headers["X-Ton-Webhook-Secret"] = BENCH_ENV["TON_WEBHOOK_SECRET"]
+        return method, path, headers, body, f"{method} {route}"
+
+    def _cookie(self, user_id: int) -> str:
+        cookie = self._cookies.get(user_id)
+        if cookie is None:
+            access = issue_access_token(subject=str(user_id), secret=BENCH_ENV["JWT_SECRET"], ttl_seconds=86400)
+            refresh = issue_refresh_token(subject=str(user_id), secret=BENCH_ENV["JWT_REFRESH_SECRET"], ttl_seconds=86400)
+            cookie = self._cookies[user_id] = f"ACCESS_TOKEN={access}; REFRESH_TOKEN={refresh}"
+        return cookie
+
+    def _execute(self, entry: dict, waits: list[Future]) -> None:
+        # Ошибка зависимости не отменяет запрос: он получит тот же статус, что и без неё
+        wait(waits)
+        try:
+            method, path, headers, body, route = self._request(entry)
+        except UnmappedId as e:
+            with self._lock:
+                self.unmapped.append(f"{entry['method']} {entry['path']}: no replay id for {e}")
+            return
+        started = time.perf_counter()
+        try:
+            r = self._client().request(method, path, headers=headers, json=body)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            if r.status_code != entry.get("status"):
+                self.status_mismatches[route] += 1
+            created = entry.get("created") or {}
+            capture = capture_for(method, path.split("?", 1)[0])
+            if r.status_code == 200 and capture:
+                new_ids = find_id(r.json(), capture[1])
+                for kind, old_ids in created.items():
+                    # Неттинг создаёт список контрактов — сопоставляем по порядку
+                    if isinstance(old_ids, list) and isinstance(new_ids, list):
+                        self.ids[kind].update(zip(old_ids, new_ids))
+                    elif old_ids is not None and isinstance(new_ids, int):
+                        self.ids[kind][old_ids] = new_ids
+
+    def run(self, entries: list[dict]) -> float:
+        """Отправить все запросы; вернуть длительность в секундах."""
+        last_by_actor: dict[object, Future] = {}
+        futures = []
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for entry in entries:
+                if self.speed > 0:
+                    delay = entry["t"] / self.speed - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                waits = [self._creators[d] for d in self._dependencies(entry) if d in self._creators]
+                actor = ("user", entry["user"]) if entry.get("user") is not None else ("admin" if entry.get("admin") else None)
+                if actor is not None and actor in last_by_actor:
+                    waits.append(last_by_actor[actor])
+                if self.concurrency == 1 and futures:
+                    waits.append(futures[-1])
+                future = pool.submit(self._execute, entry, waits)
+                futures.append(future)
+                if actor is not None:
+                    last_by_actor[actor] = future
+                for kind, old_ids in (entry.get("created") or {}).items():
+                    for old_id in old_ids if isinstance(old_ids, list) else [old_ids]:
+                        if old_id is not None:
+                            self._creators[(kind, old_id)] = future
+                self.sent += 1
+            wait(futures)
+        return time.monotonic() - started
+
+
+# --- Каноническое состояние учёта ---
+
+
+def ledger_state() -> dict:
+    """Состояние без внутренних id (они зависят от порядка вставки): ключ — telegram_user_id."""
+    with SessionLocal() as db:
+        tg = dict(db.execute(select(User.id, User.telegram_user_id)).all())
+
+        balances: dict[str, dict] = defaultdict(dict)
+        for b in db.scalars(select(Balance)):
+            balances[tg.get(b.user_id, str(b.user_id))][b.currency] = {
+                "available": format_amount(b.available),
+                "reserved": format_amount(b.reserved),
+            }
+
+        ledger: dict[str, dict] = defaultdict(dict)
+        for user_id, currency, reason, total, count in db.execute(
+            select(LedgerEntry.user_id, LedgerEntry.currency, LedgerEntry.reason, func.sum(LedgerEntry.delta), func.count())
+            .group_by(LedgerEntry.user_id, LedgerEntry.currency, LedgerEntry.reason)
+        ):
+            ledger[tg.get(user_id, str(user_id))][f"{currency}:{reason}"] = {"sum": format_amount(total), "count": count}
+
+        contracts = sorted(
+            [
+                tg.get(c.emitter_id, str(c.emitter_id)),
+                tg.get(c.buyer_id) if c.buyer_id is not None else None,
+                c.market_id,
+                c.side,
+                format_amount(c.qty),
+                format_amount(c.entry_price),
+                c.status,
+                format_amount(c.close_price) if c.close_price is not None else None,
+            ]
+            for c in db.scalars(select(FuturesContract))
+        )
+
+        deposits = sorted(
+            [tg.get(d.user_id, str(d.user_id)), d.currency, format_amount(d.amount), d.tx_hash, d.status]
+            for d in db.scalars(select(Deposit))
+        )
+        withdrawals = sorted(
+            [tg.get(w.user_id, str(w.user_id)), w.currency, format_amount(w.amount), w.status]
+            for w in db.scalars(select(Withdrawal))
+        )
+        markets = sorted(
+            [m.id, format_amount(m.price_ton) if m.price_ton is not None else None, m.is_active]
+            for m in db.scalars(select(Market))
+        )
+
+    return {
+        "balances": dict(sorted(balances.items())),
+        "ledger": dict(sorted(ledger.items())),
+        "contracts": contracts,
+        "deposits": deposits,
+        "withdrawals": withdrawals,
+        "markets": markets,
+    }
+
+
+def canonical_json(state: dict) -> str:
+    return json.dumps(state, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay записанного трафика на чистой БД")
+    parser.add_argument("recording", help="NDJSON из RECORD_TRAFFIC_PATH")
+    parser.add_argument("--speed", type=float, default=60.0, help="ускорение времени; 0 — без пауз")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=("subprocess", "inprocess"), default="subprocess")
+    parser.add_argument("--state-out", help="записать каноническое состояние учёта (JSON)")
+    parser.add_argument("--report", help="записать отчёт (JSON)")
+    args = parser.parse_args()
+
+    snapshot, entries = read_recording(args.recording)
+    restore_snapshot(snapshot)
+
+    api = ApiServer() if args.mode == "subprocess" else InProcessApi()
+    api.start()
+    try:
+        replayer = Replayer(api, snapshot, speed=args.speed, concurrency=max(1, args.concurrency))
+        duration = replayer.run(entries)
+    finally:
+        api.stop()
+
+    state = canonical_json(ledger_state())
+    digest = hashlib.sha256(state.encode("utf-8")).hexdigest()
+    routes = {}
+    for route, lat in sorted(replayer.latencies.items()):
+        lat.sort()
+        routes[route] = {
+            "requests": len(lat),
+            "p50_ms": round(percentile(lat, 50), 3),
+            "p95_ms": round(percentile(lat, 95), 3),
+            "p99_ms": round(percentile(lat, 99), 3),
+            "status_mismatches": replayer.status_mismatches.get(route, 0),
+        }
+    recorded_span = entries[-1]["t"] if entries else 0.0
+    report = {
+        "requests": replayer.sent,
+        "errors": replayer.errors,
+        "recorded_seconds": recorded_span,
+        "replay_seconds": round(duration, 3),
+        "throughput_rps": round(replayer.sent / duration, 1) if duration else 0.0,
+        "routes": routes,
+        "unmapped": replayer.unmapped,
+        "ledger_sha256": digest,
+    }
+
+    print(f"{replayer.sent} requests in {duration:.2f}s ({report['throughput_rps']} rps), recorded span {recorded_span:.1f}s, errors {replayer.errors}")
+    for route, r in routes.items():
+        print(f"  {route:<40}{r['requests']:>7}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}  mismatches {r['status_mismatches']}")
+    print(f"ledger sha256 {digest}")
+    if args.state_out:
+        Path(args.state_out).write_text(state, encoding="utf-8")
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    if replayer.unmapped:
+        for line in replayer.unmapped:
+            print(f"  unmapped: {line}")
+        raise SystemExit(f"{len(replayer.unmapped)} requests not replayed: ids without a replay mapping")
+
+
+if __name__ == "__main__":
+    main()
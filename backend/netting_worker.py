@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+"""
+Воркер неттинга: раз в NETTING_INTERVAL секунд сворачивает встречные принятые контракты каждой
+пары контрагентов на каждом рынке в нетто-контракты и освобождает лишнюю маржу.
+Логика — в app/services/netting.py.
+
+Отдельный процесс, НЕ часть FastAPI. Можно запускать несколько экземпляров: контракты переводятся
+в netted условным UPDATE по status = 'taken', одна пара не будет свёрнута дважды.
+
+    cd backend
+    python netting_worker.py            # цикл
+    python netting_worker.py --once     # один проход (cron)
+"""
+
+import argparse
+import logging
+import time
+
+from app.core.logging import setup_logging
+from app.core.settings import settings
+from app.db.database import Base, SessionLocal, engine
+from app.services.netting import net_contracts
+
+
+logger = logging.getLogger("api")
+
+
+def run(once: bool = False) -> None:
+    Base.metadata.create_all(bind=engine)
+    while True:
+        started = time.monotonic()
+        try:
+            with SessionLocal() as db:
+                summary = net_contracts(db, batch_size=settings.netting_batch_size)
+            if summary["pairs"]:
+                logger.info("Netting worker pass", extra={"event": "netting_worker_pass", **summary})
+        except Exception:
+            logger.exception("Netting worker pass failed", extra={"event": "netting_worker_error"})
+        if once:
+            return
+        time.sleep(max(0.0, settings.netting_interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Неттинг встречных фьючерсных контрактов")
+    parser.add_argument("--once", action="store_true", help="один проход и выход")
+    args = parser.parse_args()
+    setup_logging()
+    run(once=args.once)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+"""
+Sweeper открытых предложений: раз в OFFER_SWEEP_INTERVAL секунд снимает предложения с истёкшим
+expires_at и предложения на выключенных рынках (экспирациях, подарках), возвращая маржу эмитентам.
+Логика — в app/services/offers.py.
+
+Отдельный процесс, НЕ часть FastAPI. Можно запускать несколько экземпляров: снятие — условным
+UPDATE по status = 'open', одно предложение не будет возвращено дважды.
+
+    cd backend
+    python offer_sweeper.py            # цикл
+    python offer_sweeper.py --once     # один проход (cron)
+"""
+
+import argparse
+import logging
+import time
+
+from app.core.logging import setup_logging
+from app.core.settings import settings
+from app.db.database import Base, SessionLocal, engine
+from app.services.offers import sweep
+
+
+logger = logging.getLogger("api")
+
+
+def run(once: bool = False) -> None:
+    Base.metadata.create_all(bind=engine)
+    while True:
+        started = time.monotonic()
+        try:
+            with SessionLocal() as db:
+                summary = sweep(db, batch_size=settings.offer_sweep_batch_size)
+            if summary["cancelled"]:
+                logger.info("Offer sweeper pass", extra={"event": "offer_sweeper_pass", **summary})
+        except Exception:
+            logger.exception("Offer sweeper pass failed", extra={"event": "offer_sweeper_error"})
+        if once:
+            return
+        time.sleep(max(0.0, settings.offer_sweep_interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Снятие просроченных открытых предложений")
+    parser.add_argument("--once", action="store_true", help="один проход и выход")
+    args = parser.parse_args()
+    setup_logging()
+    run(once=args.once)
@@ -1,25 +1,45 @@
 from __future__ import annotations
 
 """
-Простейший «оракул» цен подарков через Thermos Proxy API.
+«Оракул» цен подарков: агрегатор нескольких источников (маркетплейсов).
 
-- Берёт floor-прайсы подарков из Thermos Proxy:
-  GET https://proxy.thermos.gifts/api/v1/collections
-- Конвертирует floor (строка в nanoton) → Decimal TON.
-- Шлёт их в наш backend через POST /admin/markets/prices/bulk.
+- Источники (PriceSource) опрашиваются параллельно, каждый в своей задаче со своим таймаутом
+  и circuit breaker'ом: медленный или лежащий маркетплейс не задерживает остальные и пуш.
+  * thermos — Thermos Proxy API: GET https://proxy.thermos.gifts/api/v1/collections
+    (условный запрос: If-None-Match / If-Modified-Since; на 304 используем прошлый ответ),
+    floor (строка в nanoton) → Decimal TON;
+  * feed:<name> — произвольный JSON-фид адаптера маркетплейса (Portals, MRKT, Tonnel и т.п.),
+    см. ORACLE_EXTRA_FEEDS и JsonFeedSource.
+- Aggregator хранит последнюю котировку каждого источника по каждому подарку; обновление
+  котировки только помечает подарок. На тике пересчитываются помеченные подарки и подарки
+  с истёкшими котировками (куча сроков), каждый за O(k), k — число источников; полный обход
+  всех подарков — только в полном пуше раз в ORACLE_FULL_PUSH_INTERVAL.
+  Цена — взвешенная медиана (или усечённое среднее), вес котировки убывает с её возрастом,
+  котировки старше ORACLE_MAX_QUOTE_AGE не учитываются.
+- В наш backend через POST /admin/markets/prices/bulk уходят только изменившиеся цены
+  (таблица последних отправленных цен в памяти), тело сжато gzip.
+
+Асинхронный (asyncio + aiohttp, один пул соединений на процесс), поэтому тик можно держать
+в секундах: при неизменных ценах backend не получает ни одной записи.
 
 Это отдельный скрипт, НЕ часть FastAPI — его можно запускать по cron/systemd
 или просто в отдельном терминале во время разработки.
 """
 
+import asyncio
+import gzip
+import heapq
+import json
 import os
 import time
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from decimal import Decimal
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+import aiohttp
 from dotenv import load_dotenv
 load_dotenv()
-import requests
 
 
 # Thermos Proxy API (публичный)
@@ -31,7 +51,24 @@ BACKEND_BASE_RAW = os.getenv("BACKEND_BASE_URL", "https://api.fogton.ru") or ""
 BACKEND_BASE = BACKEND_BASE_RAW.strip().rstrip("/")
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
-POLL_INTERVAL_SECONDS = int(os.getenv("ORACLE_POLL_INTERVAL", "60"))
+POLL_INTERVAL_SECONDS = float(os.getenv("ORACLE_POLL_INTERVAL", "5"))
+# Раз в N секунд пушим все цены целиком (самовосстановление, если backend потерял состояние)
+FULL_PUSH_INTERVAL_SECONDS = float(os.getenv("ORACLE_FULL_PUSH_INTERVAL", "600"))
+
+# Источники: "thermos" + фиды вида "portals=https://...,mrkt=https://..."
+SOURCES = [s.strip() for s in os.getenv("ORACLE_SOURCES", "thermos").split(",") if s.strip()]
+EXTRA_FEEDS = os.getenv("ORACLE_EXTRA_FEEDS", "")
+SOURCE_TIMEOUT_SECONDS = float(os.getenv("ORACLE_SOURCE_TIMEOUT", "10"))
+BREAKER_FAILURES = int(os.getenv("ORACLE_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("ORACLE_BREAKER_COOLDOWN", "60"))
+
+# Агрегация: median | trimmed_mean; возраст котировок
+AGGREGATION = os.getenv("ORACLE_AGGREGATION", "median")
+MAX_QUOTE_AGE_SECONDS = float(os.getenv("ORACLE_MAX_QUOTE_AGE", "300"))
+QUOTE_HALF_LIFE_SECONDS = float(os.getenv("ORACLE_QUOTE_HALF_LIFE", "60"))
+
+# Цены TON в backend — не более 9 знаков (нанотоны, см. app/core/money.py)
+NANO_QUANT = Decimal("1e-9")
 
 
 @dataclass
@@ -40,16 +77,37 @@ class GiftPrice:
     price_ton: Decimal
 
 
-def collect_gift_prices() -> List[GiftPrice]:
-    """
-    Обходит коллекции в Thermos Proxy и собирает floor-прайсы
-    для подарков по имени коллекции.
-    """
-    url = f"{PROXY_BASE}/api/v1/collections"
-    resp = requests.get(url, timeout=15)
-    resp.raise_for_status()
-    data = resp.json()
+class ConditionalGet:
+    """GET с ETag/Last-Modified: на 304 возвращает закэшированное тело прошлого ответа."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self.body: Any = None
+        self.not_modified = False
+
+    async def fetch(self, session: aiohttp.ClientSession, timeout: float) -> Any:
+        headers = {}
+        if self.body is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+        async with session.get(self.url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status == 304 and self.body is not None:
+                self.not_modified = True
+                return self.body
+            resp.raise_for_status()
+            self.body = await resp.json(content_type=None)
+            self.etag = resp.headers.get("ETag")
+            self.last_modified = resp.headers.get("Last-Modified")
+            self.not_modified = False
+            return self.body
 
+
+def parse_collections(data: Any) -> List[GiftPrice]:
+    """Коллекции Thermos → floor-прайсы подарков по имени коллекции."""
     collections: List[Dict[str, Any]] = data or []
     result: List[GiftPrice] = []
 
@@ -71,52 +129,345 @@ def collect_gift_prices() -> List[GiftPrice]:
     return result
 
 
-def push_prices_to_backend(prices: List[GiftPrice]) -> None:
-    """Отправляет собранные цены в backend через /admin/markets/prices/bulk."""
-    if not prices:
-        print("[oracle] no prices to push")
-        return
-    if not ADMIN_TOKEN:
-        raise RuntimeError("ADMIN_TOKEN is not set")
-
-    url = f"{BACKEND_BASE}/admin/markets/prices/bulk"
-    payload = [
-        {"gift_name": p.gift_name, "price_ton": str(p.price_ton)}
-        for p in prices
-    ]
-    resp = requests.post(
-        url,
-        json=payload,
-        headers={"Authorization": f"Bearer {ADMIN_TOKEN}", "Content-Type": "application/json"},
-        timeout=10,
-    )
-    try:
-        data = resp.json()
-    except Exception:
-        data = resp.text
-    if resp.status_code != 200:
-        raise RuntimeError(f"Backend responded with {resp.status_code}: {data}")
-    print(f"[oracle] pushed {len(prices)} prices, backend response: {data}")
-
-
-def run_once() -> None:
-    prices = collect_gift_prices()
-    push_prices_to_backend(prices)
-
-
-def run_loop() -> None:
-    while True:
+# --- Источники ---
+
+
+class PriceSource(ABC):
+    """Источник цен. Подкласс реализует fetch(); интервал и таймаут — на источник."""
+
+    name = "source"
+
+    def __init__(self, timeout: float = SOURCE_TIMEOUT_SECONDS, interval: float = POLL_INTERVAL_SECONDS) -> None:
+        self.timeout = timeout
+        self.interval = interval
+
+    @abstractmethod
+    async def fetch(self, session: aiohttp.ClientSession) -> List[GiftPrice]:
+        """Текущие цены источника; исключение — неудача для circuit breaker'а."""
+
+
+class ThermosSource(PriceSource):
+    name = "thermos"
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.collections = ConditionalGet(f"{PROXY_BASE}/api/v1/collections")
+
+    async def fetch(self, session: aiohttp.ClientSession) -> List[GiftPrice]:
+        return parse_collections(await self.collections.fetch(session, timeout=self.timeout))
+
+
+class JsonFeedSource(PriceSource):
+    """
+    JSON-фид адаптера маркетплейса: список объектов
+    {"gift_name": "...", "price_ton": "1.23"} или {"gift_name": "...", "floor_nano": "1230000000"}.
+    """
+
+    def __init__(self, name: str, url: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.name = name
+        self.feed = ConditionalGet(url)
+
+    async def fetch(self, session: aiohttp.ClientSession) -> List[GiftPrice]:
+        data = await self.feed.fetch(session, timeout=self.timeout)
+        result: List[GiftPrice] = []
+        for item in data or []:
+            name = (item.get("gift_name") or item.get("name") or "").strip()
+            try:
+                if item.get("price_ton") is not None:
+                    price = Decimal(str(item["price_ton"]))
+                elif item.get("floor_nano") is not None:
+                    price = Decimal(str(item["floor_nano"])) / Decimal("1e9")
+                else:
+                    continue
+            except Exception:
+                continue
+            if name and price > 0:
+                result.append(GiftPrice(gift_name=name, price_ton=price))
+        return result
+
+
+# Реестр встроенных источников: имя из ORACLE_SOURCES → класс
+SOURCE_TYPES: Dict[str, type] = {"thermos": ThermosSource}
+
+
+def build_sources() -> List[PriceSource]:
+    sources: List[PriceSource] = [SOURCE_TYPES[name]() for name in SOURCES if name in SOURCE_TYPES]
+    for pair in EXTRA_FEEDS.split(","):
+        name, _, url = pair.partition("=")
+        if name.strip() and url.strip():
+            sources.append(JsonFeedSource(name.strip(), url.strip()))
+    return sources
+
+
+class CircuitBreaker:
+    """После N неудач подряд источник пропускается на cooldown; затем одна пробная попытка."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN_SECONDS) -> None:
+        self.failures_threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    def allow(self, now: float) -> bool:
+        return self.opened_at is None or now - self.opened_at >= self.cooldown
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self, now: float) -> None:
+        self.failures += 1
+        if self.failures >= self.failures_threshold:
+            self.opened_at = now
+
+
+# --- Агрегация ---
+
+
+@dataclass
+class Quote:
+    price: Decimal
+    at: float
+
+
+def weighted_median(quotes: List[Quote], now: float) -> Decimal | None:
+    """Медиана с весами по свежести: вес = 0.5 ** (возраст / half-life)."""
+    if not quotes:
+        return None
+    weighted = sorted((q.price, 0.5 ** (max(0.0, now - q.at) / QUOTE_HALF_LIFE_SECONDS)) for q in quotes)
+    half = sum(w for _, w in weighted) / 2
+    acc = 0.0
+    for i, (price, w) in enumerate(weighted):
+        acc += w
+        if acc > half:
+            return price
+        if acc == half and i + 1 < len(weighted):
+            return (price + weighted[i + 1][0]) / 2
+    return weighted[-1][0]
+
+
+def trimmed_mean(quotes: List[Quote], now: float) -> Decimal | None:
+    """Среднее без минимальной и максимальной котировки (при 3+ источниках)."""
+    if not quotes:
+        return None
+    prices = sorted(q.price for q in quotes)
+    if len(prices) >= 3:
+        prices = prices[1:-1]
+    return sum(prices) / len(prices)
+
+
+AGGREGATORS = {"median": weighted_median, "trimmed_mean": trimmed_mean}
+
+
+class Aggregator:
+    """
+    Котировки по подарку и источнику. Цена подарка пересчитывается лениво: update() помечает
+    подарок, dirty_prices()/prices() пересчитывают помеченные и те, у кого истекла котировка.
+
+    Относительные веса котировок от времени не зависят (у всех одинаковый half-life),
+    поэтому без новых котировок цена подарка меняется, только когда котировка устаревает.
+    """
+
+    def __init__(self, method: str = AGGREGATION, max_age: float = MAX_QUOTE_AGE_SECONDS) -> None:
+        self.method = AGGREGATORS.get(method, weighted_median)
+        self.max_age = max_age
+        self._quotes: Dict[str, Dict[str, Quote]] = {}
+        self._prices: Dict[str, Decimal] = {}
+        self._dirty: Set[str] = set()
+        # (срок, подарок): не позже срока у подарка устаревает самая старая котировка
+        self._deadlines: List[Tuple[float, str]] = []
+        self._scheduled: Set[str] = set()
+
+    def update(self, source: str, gift_name: str, price: Decimal, now: float) -> None:
+        quotes = self._quotes.setdefault(gift_name, {})
+        quotes[source] = Quote(price=price, at=now)
+        self._dirty.add(gift_name)
+        if gift_name not in self._scheduled:
+            self._schedule(gift_name, now + self.max_age)
+
+    def mark_dirty(self, gift_names: Iterable[str]) -> None:
+        """Вернуть подарки в следующий dirty_prices() (например, после неудачного пуша)."""
+        self._dirty.update(g for g in gift_names if g in self._quotes)
+
+    def _schedule(self, gift_name: str, deadline: float) -> None:
+        heapq.heappush(self._deadlines, (deadline, gift_name))
+        self._scheduled.add(gift_name)
+
+    def _recompute(self, gift_name: str, now: float) -> None:
+        quotes = self._quotes.get(gift_name) or {}
+        for source in [s for s, q in quotes.items() if now - q.at > self.max_age]:
+            del quotes[source]
+        price = self.method(list(quotes.values()), now)
+        if price is None:
+            self._quotes.pop(gift_name, None)
+            self._prices.pop(gift_name, None)
+        else:
+            self._prices[gift_name] = price.quantize(NANO_QUANT)
+
+    def _refresh(self, now: float) -> Set[str]:
+        """Пересчитать помеченные подарки и подарки с истёкшими сроками; вернуть их имена."""
+        while self._deadlines and self._deadlines[0][0] < now:
+            _, gift_name = heapq.heappop(self._deadlines)
+            self._scheduled.discard(gift_name)
+            self._dirty.add(gift_name)
+        refreshed, self._dirty = self._dirty, set()
+        for gift_name in refreshed:
+            self._recompute(gift_name, now)
+            quotes = self._quotes.get(gift_name)
+            if quotes and gift_name not in self._scheduled:
+                self._schedule(gift_name, min(q.at for q in quotes.values()) + self.max_age)
+        return refreshed
+
+    def dirty_prices(self, now: float) -> List[GiftPrice]:
+        """Цены подарков, пересчитанных с прошлого вызова; выпавшие подарки не возвращаются."""
+        return [
+            GiftPrice(gift_name=name, price_ton=self._prices[name])
+            for name in self._refresh(now)
+            if name in self._prices
+        ]
+
+    def prices(self, now: float) -> List[GiftPrice]:
+        """Все текущие агрегированные цены; подарки без свежих котировок выпадают."""
+        self._refresh(now)
+        return [GiftPrice(gift_name=name, price_ton=price) for name, price in self._prices.items()]
+
+
+class PushTable:
+    """Последние успешно отправленные цены: в backend уходят только изменения."""
+
+    def __init__(self) -> None:
+        self._pushed: Dict[str, Decimal] = {}
+        self._last_full_push = 0.0
+
+    def full_due(self, now: float) -> bool:
+        return now - self._last_full_push >= FULL_PUSH_INTERVAL_SECONDS
+
+    def changed(self, prices: List[GiftPrice], now: float) -> List[GiftPrice]:
+        if self.full_due(now):
+            return list(prices)
+        return [p for p in prices if self._pushed.get(p.gift_name) != p.price_ton]
+
+    def mark_pushed(self, prices: List[GiftPrice], now: float, *, full: bool) -> None:
+        for p in prices:
+            self._pushed[p.gift_name] = p.price_ton
+        if full:
+            self._last_full_push = now
+
+
+class Oracle:
+    def __init__(self, session: aiohttp.ClientSession, sources: List[PriceSource] | None = None) -> None:
+        self.session = session
+        self.sources = sources if sources is not None else build_sources()
+        self.breakers = {s.name: CircuitBreaker() for s in self.sources}
+        self.aggregator = Aggregator()
+        self.pushed = PushTable()
+
+    async def poll_source(self, source: PriceSource) -> None:
+        """Один опрос источника с таймаутом; результат сразу попадает в агрегатор."""
+        breaker = self.breakers[source.name]
+        if not breaker.allow(time.monotonic()):
+            return
         try:
-            run_once()
+            prices = await asyncio.wait_for(source.fetch(self.session), timeout=source.timeout)
         except Exception as e:
-            print(f"[oracle] error in run_once: {e}")
-        time.sleep(POLL_INTERVAL_SECONDS)
+            breaker.record_failure(time.monotonic())
+            print(f"[oracle] source {source.name} failed: {e!r}")
+            return
+        breaker.record_success()
+        now = time.monotonic()
+        for p in prices:
+            self.aggregator.update(source.name, p.gift_name, p.price_ton, now)
+
+    async def push_prices_to_backend(self, prices: List[GiftPrice]) -> None:
+        """Отправляет цены в backend через /admin/markets/prices/bulk (gzip)."""
+        if not ADMIN_TOKEN:
+            raise RuntimeError("ADMIN_TOKEN is not set")
+
+        url = f"{BACKEND_BASE}/admin/markets/prices/bulk"
+        payload = [
+            {"gift_name": p.gift_name, "price_ton": format(p.price_ton.normalize(), "f")}
+            for p in prices
+        ]
+        body = gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        async with self.session.post(
+            url,
+            data=body,
+            headers={
+                "Authorization": f"Bearer {ADMIN_TOKEN}",
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip",
+            },
+            timeout=aiohttp.ClientTimeout(total=10),
+        ) as resp:
+            try:
+                data = await resp.json(content_type=None)
+            except Exception:
+                data = await resp.text()
+            if resp.status != 200:
+                raise RuntimeError(f"Backend responded with {resp.status}: {data}")
+        print(f"[oracle] pushed {len(prices)} prices, backend response: {data}")
+
+    async def push_changed(self) -> None:
+        now = time.monotonic()
+        # Полный пуш обходит все подарки, обычный тик — только пересчитанные
+        full = self.pushed.full_due(now)
+        prices = self.aggregator.prices(now) if full else self.aggregator.dirty_prices(now)
+        changed = self.pushed.changed(prices, now)
+        if not changed:
+            return
+        try:
+            await self.push_prices_to_backend(changed)
+        except Exception:
+            self.aggregator.mark_dirty(p.gift_name for p in changed)
+            raise
+        self.pushed.mark_pushed(changed, now, full=full)
+
+    async def run_once(self) -> None:
+        await asyncio.gather(*(self.poll_source(s) for s in self.sources))
+        await self.push_changed()
+
+    async def _source_loop(self, source: PriceSource) -> None:
+        while True:
+            started = time.monotonic()
+            await self.poll_source(source)
+            await asyncio.sleep(max(0.0, source.interval - (time.monotonic() - started)))
+
+    async def run_loop(self) -> None:
+        # Каждый источник — своя задача: медленный маркетплейс не держит тик пуша
+        tasks = [asyncio.create_task(self._source_loop(s)) for s in self.sources]
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    await self.push_changed()
+                except Exception as e:
+                    print(f"[oracle] error in push: {e}")
+                # Тик фиксированной длины, независимо от времени обработки
+                await asyncio.sleep(max(0.0, POLL_INTERVAL_SECONDS - (time.monotonic() - started)))
+        finally:
+            for t in tasks:
+                t.cancel()
+
+
+def _session() -> aiohttp.ClientSession:
+    # Один пул соединений на процесс: keep-alive к источникам и к backend
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=75))
+
+
+async def run_once() -> None:
+    async with _session() as session:
+        await Oracle(session).run_once()
+
+
+async def run_loop() -> None:
+    async with _session() as session:
+        await Oracle(session).run_loop()
 
 
 if __name__ == "__main__":
     mode = os.getenv("ORACLE_MODE", "once")
     if mode == "loop":
-        run_loop()
+        asyncio.run(run_loop())
     else:
-        run_once()
-
+        asyncio.run(run_once())
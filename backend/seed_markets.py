@@ -1,20 +1,29 @@
 from __future__ import annotations
 
 """
-Одноразовый скрипт для создания рынков по всем подаркам из таблицы gifts.
+Создание рынков по всем активным подаркам из таблицы gifts для набора сроков экспирации.
 
-Использует текущую DATABASE_URL и модели SQLAlchemy.
+Использует текущую DATABASE_URL и модели SQLAlchemy. Недостающие пары gift × expiry
+вычисляются и вставляются одним запросом (app/services/markets.py). Сроки — аргументы
+командной строки или SEED_EXPIRY_DAYS (через запятую), по умолчанию 7.
 Запускать из корня проекта:
     python backend/seed_markets.py
+    python backend/seed_markets.py 7 30 90
 """
 
-from decimal import Decimal
+import os
+import sys
 
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from app.db.database import SessionLocal, Base, engine
-from app.db.models import Gift, Expiry, Market
+from app.services.markets import provision_markets
+
+
+def parse_expiry_days(argv: list[str]) -> list[int]:
+    raw = argv or os.getenv("SEED_EXPIRY_DAYS", "7").split(",")
+    return [int(x) for x in raw if str(x).strip()]
 
 
 def main() -> None:
@@ -33,41 +42,13 @@ def main() -> None:
 
     db: Session = SessionLocal()
     try:
-        # expiry 7 дней
-        expiry = db.query(Expiry).filter(Expiry.days == 7).first()
-        if expiry is None:
-            expiry = Expiry(days=7, settlement_at=None, is_active=True)
-            db.add(expiry)
-            db.flush()
-
-        # Берём все активные подарки и создаём по рынку на каждый (для expiry=7 дней)
-        gifts = db.query(Gift).filter(Gift.is_active == True).all()  # noqa: E712
-
-        for idx, gift in enumerate(gifts, start=1):
-
-            market = (
-                db.query(Market)
-                .filter(Market.gift_id == gift.id, Market.expiry_id == expiry.id)
-                .first()
-            )
-            if market is None:
-                # простые стартовые курсы в TON
-                base_price = Decimal("1.0") + Decimal(idx - 1) * Decimal("0.5")
-                market = Market(
-                    gift_id=gift.id,
-                    expiry_id=expiry.id,
-                    is_active=True,
-                    price_ton=base_price,
-                    price_usdt=None,
-                )
-                db.add(market)
-
+        result = provision_markets(db, parse_expiry_days(sys.argv[1:]))
         db.commit()
-        print("Seed completed successfully.")
+        days = ", ".join(str(e["days"]) for e in result["expiries"])
+        print(f"Seed completed successfully. created={result['created']}, expiries=[{days}]")
     finally:
         db.close()
 
 
 if __name__ == "__main__":
     main()
-
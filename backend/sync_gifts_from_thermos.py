@@ -8,6 +8,8 @@ from __future__ import annotations
   - name
   - image_url
   - total_count
+- Существующие подарки читаются одним запросом (name → строка), новые и изменённые
+  пишутся пакетными INSERT/UPDATE; в конце печатается diff (created/updated/missing).
 
 Запускать из корня проекта:
 
@@ -15,10 +17,13 @@ from __future__ import annotations
 """
 
 import os
-from decimal import Decimal
+import time
+from dataclasses import dataclass, field
+from typing import Any
 
 import requests
 from dotenv import load_dotenv
+from sqlalchemy import insert, select, update
 from sqlalchemy.orm import Session
 
 from app.db.database import Base, SessionLocal, engine
@@ -30,7 +35,78 @@ load_dotenv()
 PROXY_BASE = os.getenv("THERMOS_PROXY_BASE_URL", "https://proxy.thermos.gifts")
 
 
-def sync_gifts() -> None:
+@dataclass
+class SyncDiff:
+    created: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    unchanged: int = 0
+    # Есть в БД, но пропали из Thermos (не удаляем и не выключаем — только отчёт)
+    missing: list[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (
+            f"created={len(self.created)}, updated={len(self.updated)}, "
+            f"unchanged={self.unchanged}, missing={len(self.missing)}"
+        )
+
+
+def apply_collections(db: Session, data: list[dict[str, Any]]) -> SyncDiff:
+    """
+    Применяет список коллекций к gifts: один SELECT существующих подарков (name → строка),
+    затем один пакетный INSERT новых и один пакетный UPDATE изменившихся (executemany).
+    """
+    existing = {
+        row.name: row
+        for row in db.execute(select(Gift.id, Gift.name, Gift.image_url, Gift.total_count))
+    }
+    diff = SyncDiff()
+    inserts: list[dict[str, Any]] = []
+    updates: list[dict[str, Any]] = []
+    seen: set[str] = set()
+
+    for col in data:
+        name = (col.get("name") or "").strip()
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        image_url = col.get("image_url")
+        stats = col.get("stats") or {}
+        total_count = stats.get("count")
+
+        row = existing.get(name)
+        if row is None:
+            inserts.append({
+                "name": name,
+                "image_url": image_url,
+                "total_count": total_count if isinstance(total_count, int) else None,
+                "is_active": True,
+            })
+            diff.created.append(name)
+            continue
+
+        changes: dict[str, Any] = {}
+        if image_url and row.image_url != image_url:
+            changes["image_url"] = image_url
+        if isinstance(total_count, int) and row.total_count != total_count:
+            changes["total_count"] = total_count
+        if changes:
+            updates.append({"id": row.id, **changes})
+            diff.updated.append(name)
+        else:
+            diff.unchanged += 1
+
+    diff.missing = sorted(set(existing) - seen)
+
+    if inserts:
+        db.execute(insert(Gift), inserts)
+    # executemany по первичному ключу; строки с разным набором колонок группируются SQLAlchemy
+    if updates:
+        db.execute(update(Gift), updates)
+    db.commit()
+    return diff
+
+
+def sync_gifts() -> SyncDiff:
     # Убедимся, что таблицы созданы
     Base.metadata.create_all(bind=engine)
 
@@ -44,38 +120,20 @@ def sync_gifts() -> None:
 
     db: Session = SessionLocal()
     try:
-        updated = 0
-        created = 0
-        for col in data:
-            name = (col.get("name") or "").strip()
-            if not name:
-                continue
-            image_url = col.get("image_url")
-            stats = col.get("stats") or {}
-            total_count = stats.get("count")
-
-            gift = db.query(Gift).filter(Gift.name == name).one_or_none()
-            if gift is None:
-                gift = Gift(name=name, image_url=image_url, total_count=total_count, is_active=True)
-                db.add(gift)
-                created += 1
-            else:
-                changed = False
-                if image_url and gift.image_url != image_url:
-                    gift.image_url = image_url
-                    changed = True
-                if isinstance(total_count, int) and gift.total_count != total_count:
-                    gift.total_count = total_count
-                    changed = True
-                if changed:
-                    updated += 1
-
-        db.commit()
-        print(f"Sync completed. created={created}, updated={updated}")
+        started = time.perf_counter()
+        diff = apply_collections(db, data)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"Sync completed in {elapsed_ms:.0f} ms. {diff.summary()}")
+        for name in diff.created:
+            print(f"  + {name}")
+        for name in diff.updated:
+            print(f"  ~ {name}")
+        for name in diff.missing:
+            print(f"  ? {name} (нет в Thermos)")
+        return diff
     finally:
         db.close()
 
 
 if __name__ == "__main__":
     sync_gifts()
-
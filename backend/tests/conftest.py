@@ -17,24 +17,31 @@ os.environ.setdefault("JWT_SECRET", "test-jwt-secret")
 os.environ.setdefault("JWT_REFRESH_SECRET", "test-refresh-secret")
 os.environ.setdefault("ADMIN_TOKEN", "test-admin-token")
 os.environ.setdefault("BOT_TOKEN", "test-bot-token")
+os.environ.setdefault("DB_PROFILE_HEADER", "1")  # X-DB-Queries в ответах — для бюджетов запросов
 os.environ.setdefault("TON_WEBHOOK_SECRET", "")  # Пустой — в тестах webhook можно вызывать без заголовка
 
 # Добавляем backend в path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import pytest
+from fastapi import Request, Response
 from fastapi.testclient import TestClient
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from app.main import create_app
 from app.core.auth_deps import require_user_id_dep
+from app.core.balance_cache import balance_cache
+from app.core.rate_limit import admission
 from app.db.database import SessionLocal
+from app.db.profiling import db_write_latency
 from app.db.models import User, Gift, Expiry, Market, Balance
+from app.services.alerts import trigger_book
+from app.services.orders import order_book
 
 
 # Переопределение: в тестах «текущий пользователь» = user_id 1
-def _override_user_id(request, response):
+def _override_user_id(request: Request, response: Response):
     return 1
 
 
@@ -63,12 +70,18 @@ def db_session():
 @pytest.fixture(autouse=True)
 def _clean_tables_before(db_session: Session):
     """Очистка таблиц перед каждым тестом (порядок из-за FK)."""
-    for table in ("ledger_entries", "withdrawals", "deposits", "balances", "markets", "expiries", "gifts", "users"):
+    for table in ("outbox_events", "price_alerts", "conditional_orders", "contract_fills", "futures_contracts", "ledger_entries", "withdrawals", "withdrawal_batches", "deposits", "balances", "markets", "expiries", "gifts", "users"):
         try:
             db_session.execute(text(f"DELETE FROM {table}"))
             db_session.commit()
         except Exception:
             db_session.rollback()
+    # Таблицы чистятся сырым SQL — события сессии кэш не сбросят
+    balance_cache.clear()
+    admission.reset()
+    db_write_latency.reset()
+    trigger_book.reset()
+    order_book.reset()
     yield
     db_session.rollback()
 
@@ -113,3 +126,15 @@ def test_gift_expiry_market(db_session: Session, test_user: User):
 def admin_headers():
     """Заголовок Authorization для админ-эндпоинтов."""
     return {"Authorization": "Bearer test-admin-token"}
+
+
+@pytest.fixture
+def query_budget():
+    """Проверка бюджета SQL-запросов эндпоинта по заголовку X-DB-Queries (регрессии N+1 валят тесты)."""
+    def _check(response, max_queries: int) -> int:
+        header = response.headers.get("X-DB-Queries")
+        assert header, "X-DB-Queries header missing (DB_PROFILE_HEADER)"
+        count = int(header.split(";")[0].split("=")[1])
+        assert count <= max_queries, f"{response.request.method} {response.request.url.path}: {count} SQL queries > budget {max_queries}"
+        return count
+    return _check
@@ -2,6 +2,8 @@
 Итерация 7: Админ-панель.
 Тест: curl с ADMIN_TOKEN — переключить is_active рынка; корректировка баланса — проверить баланс и ledger.
 """
+import logging
+
 import pytest
 from decimal import Decimal
 from fastapi.testclient import TestClient
@@ -132,3 +134,51 @@ def test_admin_adjust_balance_no_reason_rejected(client: TestClient, user_for_ad
     )
     assert r.status_code == 400
     assert "Reason is required" in r.json()["detail"]
+
+
+def test_admin_bulk_prices_gzip_body(client: TestClient, test_gift_expiry_market: dict, admin_headers: dict, db_session: Session):
+    """POST /admin/markets/prices/bulk принимает тело, сжатое gzip (оракул)."""
+    import gzip
+    import json
+
+    body = gzip.compress(json.dumps([{"gift_name": "Test Gift", "price_ton": "1.25"}]).encode("utf-8"))
+    r = client.post(
+        "/admin/markets/prices/bulk",
+        content=body,
+        headers={**admin_headers, "Content-Type": "application/json", "Content-Encoding": "gzip"},
+    )
+    assert r.status_code == 200
+    assert r.json() == {"updated": 1}
+    market = test_gift_expiry_market["market"]
+    db_session.refresh(market)
+    assert market.price_ton == Decimal("1.25")
+
+
+def test_admin_provision_markets(client: TestClient, test_gift_expiry_market: dict, admin_headers: dict, db_session: Session, caplog):
+    """POST /admin/markets/provision создаёт недостающие рынки gift × expiry, повторный вызов ничего не создаёт."""
+    from app.db.models import Gift, Market
+
+    market = test_gift_expiry_market["market"]
+    market.price_ton = Decimal("3")
+    db_session.add(Gift(name="Second Gift", is_active=True))
+    db_session.add(Gift(name="Inactive Gift", is_active=False))
+    db_session.commit()
+
+    # На уровне INFO запись лога создаётся: поле extra не должно совпадать с атрибутами LogRecord
+    with caplog.at_level(logging.INFO, logger="api"):
+        r = client.post("/admin/markets/provision", json={"expiry_days": [7, 30]}, headers=admin_headers)
+    assert r.status_code == 200
+    assert any(getattr(rec, "event", None) == "admin_markets_provisioned" for rec in caplog.records)
+    data = r.json()
+    # 2 активных подарка × 2 срока = 4 рынка, 1 уже был (Test Gift, 7 дней)
+    assert data["created"] == 3
+    assert [e["days"] for e in data["expiries"]] == [7, 30]
+
+    db_session.expire_all()
+    markets = db_session.query(Market).all()
+    assert len(markets) == 4
+    test_gift_30 = next(m for m in markets if m.gift_id == market.gift_id and m.id != market.id)
+    assert test_gift_30.price_ton == Decimal("3")
+
+    r2 = client.post("/admin/markets/provision", json={"expiry_days": [7, 30]}, headers=admin_headers)
+    assert r2.json()["created"] == 0
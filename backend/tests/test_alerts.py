@@ -0,0 +1,123 @@
+"""
+Ценовые алерты: /alerts и срабатывание на пакетном обновлении цен (книга триггеров).
+"""
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.db.models import PriceAlert, User
+from app.services.alerts import TriggerBook, trigger_book
+
+
+def _push(client: TestClient, admin_headers: dict, market_id: int, price: str) -> None:
+    r = client.post("/admin/markets/prices/bulk", json=[{"market_id": market_id, "price_ton": price}], headers=admin_headers)
+    assert r.status_code == 200
+
+
+def _fired_events(client: TestClient, admin_headers: dict) -> list[dict]:
+    return client.get("/admin/events?types=price_alerts_fired", headers=admin_headers).json()["events"]
+
+
+def test_create_list_cancel(client: TestClient, test_gift_expiry_market: dict):
+    market = test_gift_expiry_market["market"]
+    r = client.post("/alerts", json={"market_id": market.id, "direction": "above", "price": "5.5"})
+    assert r.status_code == 200
+    alert = r.json()
+    assert alert["price"] == "5.5" and alert["status"] == "active"
+    assert [a["id"] for a in client.get("/alerts").json()["alerts"]] == [alert["id"]]
+
+    assert client.delete(f"/alerts/{alert['id']}").json() == {"ok": True}
+    assert client.get("/alerts").json()["alerts"] == []
+    assert client.delete(f"/alerts/{alert['id']}").status_code == 400
+
+
+def test_create_validation(client: TestClient, db_session: Session, test_gift_expiry_market: dict):
+    market = test_gift_expiry_market["market"]
+    market.price_ton = Decimal("3")
+    db_session.commit()
+    assert client.post("/alerts", json={"market_id": market.id, "direction": "above", "price": "2"}).status_code == 400
+    assert client.post("/alerts", json={"market_id": market.id, "direction": "below", "price": "1.0000000001"}).status_code == 400
+    assert client.post("/alerts", json={"market_id": market.id, "direction": "sideways", "price": "2"}).status_code == 422
+    assert client.post("/alerts", json={"market_id": 999999, "direction": "above", "price": "4"}).status_code == 400
+
+
+def test_alerts_fire_once_on_crossing(client: TestClient, db_session: Session, test_gift_expiry_market: dict, admin_headers: dict):
+    market = test_gift_expiry_market["market"]
+    _push(client, admin_headers, market.id, "3")
+    ids = {}
+    for direction, price in (("above", "4"), ("above", "5"), ("below", "2"), ("below", "1")):
+        ids[(direction, price)] = client.post(
+            "/alerts", json={"market_id": market.id, "direction": direction, "price": price}
+        ).json()["id"]
+
+    _push(client, admin_headers, market.id, "4.5")
+    events = _fired_events(client, admin_headers)
+    assert len(events) == 1
+    fired = events[0]["payload"]["alerts"]
+    assert [(a["alert_id"], a["price"], a["gift"]) for a in fired] == [(ids[("above", "4")], "4.5", "Test Gift")]
+    assert [r["user_id"] for r in events[0]["recipients"]] == [1]
+
+    # Повторный пуш выше порога не поднимает алерт снова; падение цены поднимает оба below
+    _push(client, admin_headers, market.id, "4.6")
+    _push(client, admin_headers, market.id, "1")
+    events = _fired_events(client, admin_headers)
+    assert len(events) == 2
+    assert sorted(a["alert_id"] for a in events[1]["payload"]["alerts"]) == sorted([ids[("below", "2")], ids[("below", "1")]])
+
+    statuses = {a.id: (a.status, a.fired_price) for a in db_session.query(PriceAlert).all()}
+    assert statuses[ids[("above", "5")]] == ("active", None)
+    assert statuses[ids[("below", "1")]] == ("fired", Decimal("1"))
+    assert len(trigger_book) == 1
+
+
+def test_cancelled_alert_does_not_fire(client: TestClient, test_gift_expiry_market: dict, admin_headers: dict):
+    market = test_gift_expiry_market["market"]
+    alert_id = client.post("/alerts", json={"market_id": market.id, "direction": "above", "price": "4"}).json()["id"]
+    _push(client, admin_headers, market.id, "1")  # книга подхватила алерт
+    client.delete(f"/alerts/{alert_id}")
+    assert len(trigger_book) == 0
+    _push(client, admin_headers, market.id, "10")
+    assert _fired_events(client, admin_headers) == []
+
+
+def test_alert_cancelled_elsewhere_is_skipped(client: TestClient, db_session: Session, test_gift_expiry_market: dict, admin_headers: dict):
+    """Отмена мимо книги (другой процесс API): условный UPDATE не трогает алерт, книга его выбрасывает."""
+    market = test_gift_expiry_market["market"]
+    alert_id = client.post("/alerts", json={"market_id": market.id, "direction": "below", "price": "2"}).json()["id"]
+    _push(client, admin_headers, market.id, "3")
+    db_session.get(PriceAlert, alert_id).status = "cancelled"
+    db_session.commit()
+    _push(client, admin_headers, market.id, "1")
+    assert _fired_events(client, admin_headers) == []
+    assert len(trigger_book) == 0
+
+
+def test_alert_limit_per_user(client: TestClient, db_session: Session, test_gift_expiry_market: dict, monkeypatch):
+    from app.core.settings import settings
+
+    monkeypatch.setattr(settings, "alerts_max_per_user", 2)
+    market = test_gift_expiry_market["market"]
+    for price in ("4", "5"):
+        assert client.post("/alerts", json={"market_id": market.id, "direction": "above", "price": price}).status_code == 200
+    assert client.post("/alerts", json={"market_id": market.id, "direction": "above", "price": "6"}).status_code == 400
+
+
+def test_trigger_book_crossed_boundaries(db_session: Session, test_gift_expiry_market: dict):
+    market = test_gift_expiry_market["market"]
+    other = User(telegram_user_id="777")
+    db_session.add(other)
+    db_session.flush()
+    for direction, price in (("above", "2"), ("above", "2"), ("above", "3"), ("below", "2"), ("below", "1")):
+        db_session.add(PriceAlert(user_id=other.id, market_id=market.id, direction=direction, threshold=Decimal(price), status="active"))
+    db_session.commit()
+
+    book = TriggerBook()
+    assert book.sync(db_session) == 5
+    assert book.sync(db_session) == 0
+    nano = 10**9
+    # Порог, равный цене, срабатывает; соседние — нет
+    assert len(book.crossed(market.id, 2 * nano)) == 3
+    assert len(book.crossed(market.id, 2 * nano - 1)) == 1
+    assert len(book.crossed(market.id, 2 * nano + 1)) == 2
+    assert book.crossed(market.id + 1, 2 * nano) == []
@@ -0,0 +1,104 @@
+"""
+GET /me/balances: кэш балансов, ETag/304, reserved в ответе, сброс кэша при зачислении депозита
+и по TTL после записи воркера.
+"""
+import pytest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.core.balance_cache import balance_cache
+from app.db.database import engine
+from app.db.models import User, Balance, FuturesContract
+from app.services.offers import sweep
+from app.services.outbox import dispatcher
+
+
+@pytest.fixture
+def user_with_reserved(db_session: Session) -> User:
+    u = User(telegram_user_id="balances-user")
+    db_session.add(u)
+    db_session.flush()
+    db_session.add(Balance(user_id=u.id, currency="TON", available=Decimal("7.25"), reserved=Decimal("1.5")))
+    db_session.commit()
+    db_session.refresh(u)
+    return u
+
+
+def test_balances_report_reserved(client: TestClient, user_with_reserved: User):
+    r = client.get("/me/balances")
+    assert r.status_code == 200
+    ton = next(b for b in r.json()["balances"] if b["currency"] == "TON")
+    usdt = next(b for b in r.json()["balances"] if b["currency"] == "USDT")
+    assert ton == {"currency": "TON", "available": "7.25", "reserved": "1.5"}
+    assert usdt == {"currency": "USDT", "available": "0", "reserved": "0"}
+
+
+def test_balances_etag_not_modified(client: TestClient, user_with_reserved: User):
+    r1 = client.get("/me/balances")
+    etag = r1.headers["ETag"]
+    r2 = client.get("/me/balances", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.headers["ETag"] == etag
+
+
+def test_balances_cache_invalidated_by_deposit(client: TestClient, user_with_reserved: User):
+    r1 = client.get("/me/balances")
+    etag = r1.headers["ETag"]
+
+    r = client.post(
+        "/ton/webhook",
+        json={"tx_hash": "cache-tx-1", "amount": "2.75", "comment": f"u{user_with_reserved.id}", "currency": "TON"},
+    )
+    assert r.json()["credited"] is True
+
+    r2 = client.get("/me/balances", headers={"If-None-Match": etag})
+    assert r2.status_code == 200
+    assert r2.headers["ETag"] != etag
+    ton = next(b for b in r2.json()["balances"] if b["currency"] == "TON")
+    assert ton["available"] == "10"
+
+
+def test_worker_write_visible_after_ttl(client: TestClient, db_session: Session, test_gift_expiry_market: dict, monkeypatch):
+    """Запись отдельного процесса (воркер) не проходит через события сессий API — снимок истекает по TTL."""
+    db_session.add(Balance(user_id=1, currency="TON", available=Decimal("5"), reserved=Decimal("0")))
+    db_session.add(FuturesContract(
+        market_id=test_gift_expiry_market["market"].id, emitter_id=1, side="long", qty=Decimal("1"),
+        entry_price=Decimal("2"), status="open", margin_emitter=Decimal("2"), margin_buyer=Decimal("0"),
+        expires_at=datetime.utcnow() - timedelta(seconds=1),
+    ))
+    db_session.commit()
+
+    def ton_available() -> str:
+        return next(b for b in client.get("/me/balances").json()["balances"] if b["currency"] == "TON")["available"]
+
+    assert ton_available() == "5"
+    # Сессия не из SessionLocal — как в другом процессе: кэш API об этой записи не узнаёт
+    with Session(engine) as worker_db:
+        assert sweep(worker_db, batch_size=10)["cancelled"] == 1
+    assert ton_available() == "5"
+
+    started = balance_cache._clock()
+    monkeypatch.setattr(balance_cache, "_clock", lambda: started + balance_cache.ttl_seconds)
+    assert ton_available() == "7"
+
+
+def test_worker_write_invalidated_by_outbox_event(client: TestClient, db_session: Session, test_gift_expiry_market: dict):
+    """Событие outbox воркера (offers_cancelled) сбрасывает снимок сразу, без ожидания TTL."""
+    db_session.add(Balance(user_id=1, currency="TON", available=Decimal("5"), reserved=Decimal("0")))
+    db_session.add(FuturesContract(
+        market_id=test_gift_expiry_market["market"].id, emitter_id=1, side="long", qty=Decimal("1"),
+        entry_price=Decimal("2"), status="open", margin_emitter=Decimal("2"), margin_buyer=Decimal("0"),
+        expires_at=datetime.utcnow() - timedelta(seconds=1),
+    ))
+    db_session.commit()
+    assert client.get("/me/balances").json()["balances"][0]["available"] == "5"
+
+    with Session(engine) as worker_db:
+        sweep(worker_db, batch_size=10)
+    # Диспетчер процесса API (подписки — в app.main); лента в тесте начинается с нуля
+    dispatcher.cursor = 0
+    while dispatcher.dispatch_once():
+        pass
+    assert client.get("/me/balances").json()["balances"][0]["available"] == "7"
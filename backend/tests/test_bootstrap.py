@@ -0,0 +1,43 @@
+"""
+GET /bootstrap: данные первого экрана Mini App одним запросом.
+"""
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.db.models import Balance, FuturesContract, User
+
+
+def test_bootstrap_combines_first_screen(client: TestClient, db_session: Session, test_gift_expiry_market: dict, query_budget):
+    market = test_gift_expiry_market["market"]
+    other = User(telegram_user_id="987654321")
+    db_session.add(other)
+    db_session.add(Balance(user_id=1, currency="TON", available=Decimal("12.5"), reserved=Decimal("0")))
+    db_session.flush()
+    db_session.add_all([
+        FuturesContract(market_id=market.id, emitter_id=1, side="long", qty=Decimal("1"), entry_price=Decimal("2"), status="open"),
+        FuturesContract(market_id=market.id, emitter_id=other.id, side="short", qty=Decimal("2"), entry_price=Decimal("2"), status="open"),
+    ])
+    db_session.commit()
+
+    r = client.get("/bootstrap")
+    assert r.status_code == 200
+    data = r.json()
+    assert data["me"]["telegram_user_id"] == "123456789"
+    ton = next(b for b in data["balances"]["balances"] if b["currency"] == "TON")
+    assert ton["available"] == "12.5"
+    assert [m["id"] for m in data["markets"]] == [market.id]
+    assert [c["role"] for c in data["contracts"]] == ["emitter"]
+    assert len(data["offers"]) == 2
+    # Ответы совпадают с отдельными эндпоинтами
+    assert data["markets"] == client.get("/markets").json()["markets"]
+    assert data["offers"] == client.get("/futures/offers").json()
+    assert data["contracts"] == client.get("/futures/my").json()
+    assert data["withdrawals"] == []
+    # me + balances + markets + withdrawals + my + offers, без N+1
+    query_budget(r, 6)
+
+
+def test_bootstrap_unknown_user(client: TestClient):
+    assert client.get("/bootstrap").status_code == 404
@@ -0,0 +1,178 @@
+"""
+Итерация 9: фьючерсы — предложение, принятие, расчёт.
+Тест: эмитент выставляет предложение, покупатель принимает, расчёт по цене выше входа → PnL эмитенту.
+"""
+import pytest
+from decimal import Decimal
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.core.auth_deps import require_user_id_dep
+from app.db.database import SessionLocal
+from app.db.models import Balance, FuturesContract, User
+from app.services.futures import fill_offer, get_ton_balance
+
+
+@pytest.fixture
+def two_traders(db_session: Session, test_gift_expiry_market: dict):
+    """user_id=1 (эмитент, из test_user) и второй пользователь-покупатель; у обоих по 100 TON."""
+    market = test_gift_expiry_market["market"]
+    market.price_ton = Decimal("2")
+    buyer = User(telegram_user_id="buyer")
+    db_session.add(buyer)
+    db_session.flush()
+    for uid in (1, buyer.id):
+        db_session.add(Balance(user_id=uid, currency="TON", available=Decimal("100"), reserved=Decimal("0")))
+    db_session.commit()
+    return {"market": market, "emitter_id": 1, "buyer_id": buyer.id}
+
+
+@pytest.fixture
+def as_user(app):
+    """Переключение «текущего пользователя» внутри теста."""
+    def _switch(user_id: int):
+        app.dependency_overrides[require_user_id_dep] = lambda: user_id
+    original = app.dependency_overrides[require_user_id_dep]
+    yield _switch
+    app.dependency_overrides[require_user_id_dep] = original
+
+
+def _ton(db_session: Session, user_id: int) -> Decimal:
+    db_session.expire_all()
+    return db_session.query(Balance).filter(Balance.user_id == user_id, Balance.currency == "TON").one().available
+
+
+def test_offer_take_settle(client: TestClient, two_traders: dict, as_user, db_session: Session, admin_headers: dict):
+    market = two_traders["market"]
+    r = client.post("/futures/offers", json={"market_id": market.id, "side": "long", "qty": "1.5"})
+    assert r.status_code == 200
+    offer = r.json()
+    assert offer["qty"] == "1.5"
+    assert offer["entry_price"] == "2"
+    assert _ton(db_session, 1) == Decimal("97")
+
+    as_user(two_traders["buyer_id"])
+    r = client.post(f"/futures/offers/{offer['id']}/take", json={})
+    assert r.status_code == 200
+    assert r.json()["status"] == "taken"
+    assert _ton(db_session, two_traders["buyer_id"]) == Decimal("97")
+
+    r = client.post(f"/admin/futures/{offer['id']}/settle", json={"close_price": "2.5"}, headers=admin_headers)
+    assert r.status_code == 200
+    assert r.json()["status"] == "closed"
+    # эмитент: маржа 3 + PnL (2.5 - 2) × 1.5 = 0.75; покупатель: маржа 3 − 0.75 (расчёт с нулевой суммой)
+    assert _ton(db_session, 1) == Decimal("100.75")
+    assert _ton(db_session, two_traders["buyer_id"]) == Decimal("99.25")
+
+
+def test_offer_qty_precision_rejected(client: TestClient, two_traders: dict):
+    r = client.post(
+        "/futures/offers",
+        json={"market_id": two_traders["market"].id, "side": "long", "qty": "0.0000000001"},
+    )
+    assert r.status_code == 400
+
+
+def test_partial_take_splits_offer(client: TestClient, two_traders: dict, as_user, db_session: Session, admin_headers: dict):
+    market = two_traders["market"]
+    offer = client.post("/futures/offers", json={"market_id": market.id, "side": "long", "qty": "5"}).json()
+
+    as_user(two_traders["buyer_id"])
+    r = client.post(f"/futures/offers/{offer['id']}/take", json={"qty": "2"})
+    assert r.status_code == 200
+    part = r.json()
+    assert (part["status"], part["qty"], part["parent_id"]) == ("taken", "2", offer["id"])
+    assert _ton(db_session, two_traders["buyer_id"]) == Decimal("96")
+    assert [(o["id"], o["qty"]) for o in client.get("/futures/offers").json()] == [(offer["id"], "3")]
+    assert client.post(f"/futures/offers/{offer['id']}/take", json={"qty": "3.5"}).status_code == 400
+
+    # Остаток целиком: строка предложения становится контрактом покупателя
+    r = client.post(f"/futures/offers/{offer['id']}/take", json={})
+    assert (r.json()["id"], r.json()["status"], r.json()["qty"]) == (offer["id"], "taken", "3")
+    assert client.get("/futures/offers").json() == []
+
+    # Маржа эмитента разделилась между контрактами без потерь: 4 + 6 = 10
+    assert _ton(db_session, 1) == Decimal("90")
+    as_user(1)
+    assert client.post(f"/admin/futures/{part['id']}/settle", json={"close_price": "2"}, headers=admin_headers).status_code == 200
+    assert client.post(f"/admin/futures/{offer['id']}/settle", json={"close_price": "2"}, headers=admin_headers).status_code == 200
+    assert _ton(db_session, 1) == Decimal("100")
+    assert _ton(db_session, two_traders["buyer_id"]) == Decimal("100")
+
+
+def test_offer_fills_history(client: TestClient, two_traders: dict, as_user, admin_headers: dict):
+    market = two_traders["market"]
+    offer = client.post("/futures/offers", json={"market_id": market.id, "side": "short", "qty": "4"}).json()
+    as_user(two_traders["buyer_id"])
+    for qty in ("1", "0.5"):
+        assert client.post(f"/futures/offers/{offer['id']}/take", json={"qty": qty}).status_code == 200
+    assert client.get(f"/futures/offers/{offer['id']}/fills").status_code == 404  # только эмитенту
+
+    as_user(1)
+    history = client.get(f"/futures/offers/{offer['id']}/fills").json()
+    assert (history["total_qty"], history["filled_qty"], history["remaining_qty"], history["fills_count"]) == ("4", "1.5", "2.5", 2)
+    assert [(f["qty"], f["margin"]) for f in history["fills"]] == [("1", "2"), ("0.5", "1")]
+
+    events = client.get("/admin/events?types=offer_taken", headers=admin_headers).json()["events"]
+    assert [e["payload"]["remaining_qty"] for e in events] == ["3", "2.5"]
+
+
+def test_take_retries_after_concurrent_fill(client: TestClient, two_traders: dict, as_user, db_session: Session):
+    market = two_traders["market"]
+    offer = client.post("/futures/offers", json={"market_id": market.id, "side": "long", "qty": "3"}).json()
+    third = User(telegram_user_id="third")
+    db_session.add(third)
+    db_session.flush()
+    db_session.add(Balance(user_id=third.id, currency="TON", available=Decimal("100"), reserved=Decimal("0")))
+    db_session.commit()
+
+    with SessionLocal() as db:
+        assert db.get(FuturesContract, offer["id"]).fill_count == 0  # снимок до чужого принятия
+        as_user(two_traders["buyer_id"])
+        assert client.post(f"/futures/offers/{offer['id']}/take", json={"qty": "2"}).status_code == 200
+        # Устаревший fill_count: условный UPDATE не проходит, предложение перечитывается
+        contract = fill_offer(db, offer["id"], get_ton_balance(db, third.id))
+        db.commit()
+        assert (contract.id, contract.status, contract.qty) == (offer["id"], "taken", Decimal("1"))
+
+
+def test_settle_loss_capped_by_margin(client: TestClient, two_traders: dict, as_user, db_session: Session, admin_headers: dict):
+    offer = client.post("/futures/offers", json={"market_id": two_traders["market"].id, "side": "long", "qty": "1"}).json()
+    as_user(two_traders["buyer_id"])
+    client.post(f"/futures/offers/{offer['id']}/take", json={})
+    # Цена выросла в 3 раза: убыток покупателя 4 > его маржи 2 — эмитент получает только маржу покупателя
+    assert client.post(f"/admin/futures/{offer['id']}/settle", json={"close_price": "6"}, headers=admin_headers).status_code == 200
+    assert _ton(db_session, 1) == Decimal("102")
+    assert _ton(db_session, two_traders["buyer_id"]) == Decimal("98")
+
+
+def test_settle_price_drop_debits_emitter(client: TestClient, two_traders: dict, as_user, db_session: Session, admin_headers: dict):
+    offer = client.post("/futures/offers", json={"market_id": two_traders["market"].id, "side": "long", "qty": "2"}).json()
+    as_user(two_traders["buyer_id"])
+    client.post(f"/futures/offers/{offer['id']}/take", json={})
+    # Падение на 0.5: покупатель получает 2 × 0.5 = 1 из маржи эмитента
+    assert client.post(f"/admin/futures/{offer['id']}/settle", json={"close_price": "1.5"}, headers=admin_headers).status_code == 200
+    assert _ton(db_session, 1) == Decimal("99")
+    assert _ton(db_session, two_traders["buyer_id"]) == Decimal("101")
+
+
+def test_settle_only_by_party_at_market_price(client: TestClient, two_traders: dict, as_user, db_session: Session, admin_headers: dict):
+    offer = client.post("/futures/offers", json={"market_id": two_traders["market"].id, "side": "long", "qty": "1"}).json()
+    as_user(two_traders["buyer_id"])
+    client.post(f"/futures/offers/{offer['id']}/take", json={})
+    outsider = User(telegram_user_id="outsider")
+    db_session.add(outsider)
+    two_traders["market"].price_ton = Decimal("3")
+    db_session.commit()
+
+    as_user(outsider.id)
+    assert client.post(f"/futures/{offer['id']}/settle", json={}).status_code == 404
+    assert client.post(f"/admin/futures/{offer['id']}/settle", json={"close_price": "6"}).status_code == 401
+
+    # Цена из тела игнорируется: сторона закрывает только по текущей цене рынка
+    as_user(two_traders["buyer_id"])
+    r = client.post(f"/futures/{offer['id']}/settle", json={"close_price": "0.1"})
+    assert (r.status_code, r.json()["status"]) == (200, "closed")
+    assert _ton(db_session, 1) == Decimal("101")
+    assert _ton(db_session, two_traders["buyer_id"]) == Decimal("99")
+    assert client.post(f"/admin/futures/{offer['id']}/settle", json={}, headers=admin_headers).status_code == 404
@@ -0,0 +1,61 @@
+"""
+JSON-логирование: форматтер, лимиты шумных событий, неблокирующая очередь.
+"""
+import json
+import logging
+import queue
+
+from app.core.logging import EventSamplingFilter, JsonFormatter, NonBlockingQueueHandler, _parse_event_map
+
+
+def _record(event: str | None = None, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("api", logging.WARNING, __file__, 1, "msg %s", ("x",), None)
+    if event is not None:
+        record.event = event
+    for k, v in extra.items():
+        setattr(record, k, v)
+    return record
+
+
+def test_formatter_outputs_extras_only():
+    line = JsonFormatter().format(_record("ton_webhook_rejected", reason="invalid_secret", tx_hash="abc"))
+    log = json.loads(line)
+    assert log["event"] == "ton_webhook_rejected"
+    assert log["message"] == "msg x"
+    assert log["reason"] == "invalid_secret"
+    assert log["tx_hash"] == "abc"
+    for attr in ("thread", "threadName", "lineno", "args", "msg"):
+        assert attr not in log
+
+
+def test_rate_limit_suppresses_and_reports():
+    f = EventSamplingFilter(rate_limits={"ton_webhook_rejected": 3})
+    passed = [f.filter(_record("ton_webhook_rejected")) for _ in range(10)]
+    assert passed.count(True) == 3
+    # другие события и записи без event не ограничиваются
+    assert all(f.filter(_record("auth_success")) for _ in range(10))
+    assert f.filter(_record())
+    # после пополнения бакета следующая запись несёт число подавленных
+    f._buckets["ton_webhook_rejected"][0] = 1
+    record = _record("ton_webhook_rejected")
+    assert f.filter(record)
+    assert record.suppressed == 7
+
+
+def test_sampling_ratio_zero_drops_all():
+    f = EventSamplingFilter(sampling={"request_end": 0.0})
+    assert not any(f.filter(_record("request_end")) for _ in range(5))
+
+
+def test_queue_handler_never_blocks():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+    for _ in range(5):
+        handler.handle(_record("request_end"))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    record = handler.queue.get_nowait()
+    assert record.msg == "msg x" and record.args is None
+
+
+def test_parse_event_map_skips_garbage():
+    assert _parse_event_map("a=1, b=0.5,bad,c=x,=2", float) == {"a": 1.0, "b": 0.5}
@@ -0,0 +1,21 @@
+"""GET /metrics: формат Prometheus, латентность по шаблону маршрута, бизнес-счётчики."""
+from fastapi.testclient import TestClient
+
+
+def test_metrics_route_template_and_business_counters(client: TestClient, test_user):
+    client.get("/healthz")
+    r = client.post("/ton/webhook", json={"tx_hash": "metrics-tx-1", "amount": "1", "comment": f"u{test_user.id}"})
+    assert r.json()["credited"] is True
+    client.patch("/admin/markets/999999", json={"is_active": True})
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    body = r.text
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_duration_seconds_bucket{route="/healthz",method="GET",le="+Inf"}' in body
+    # метка — шаблон маршрута, а не конкретный id
+    assert 'route="/admin/markets/{market_id}"' in body
+    assert 'deposits_credited_total{currency="TON"}' in body
+    assert "http_requests_in_flight" in body
+    assert 'db_pool_connections{state="checkedout"}' in body
@@ -0,0 +1,26 @@
+"""
+Проверка регрессий микробенчмарков: время — в долях эталона того же запуска, память — напрямую.
+"""
+from bench.microbench import check
+
+
+BASELINE = {"case": {"ns_per_call": 1000.0, "ratio": 0.5, "peak_bytes": 1000, "retained_per_call": 0.0}}
+
+
+def _result(ns: float, ratio: float, peak: int = 1000) -> dict:
+    return {"case": {"ns_per_call": ns, "ratio": ratio, "peak_bytes": peak, "retained_per_call": 0.0}}
+
+
+def test_slower_machine_is_not_a_regression():
+    # Вдвое медленнее и случай, и эталон: ratio тот же
+    assert check(_result(2000, 0.5), BASELINE, time_threshold=0.25, mem_threshold=0.1) == []
+
+
+def test_ratio_regression_reported():
+    failures = check(_result(900, 0.7), BASELINE, time_threshold=0.25, mem_threshold=0.1)
+    assert len(failures) == 1 and "reference" in failures[0]
+
+
+def test_memory_compared_directly():
+    failures = check(_result(1000, 0.5, peak=2000), BASELINE, time_threshold=0.25, mem_threshold=0.1)
+    assert len(failures) == 1 and "peak_bytes" in failures[0]
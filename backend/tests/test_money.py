@@ -0,0 +1,53 @@
+"""
+Нанотоны (app.core.money): точная конвертация на границе API и пакетные расчёты в int64.
+"""
+import pytest
+from decimal import Decimal
+
+np = pytest.importorskip("numpy")
+
+from app.core.money import (
+    format_amount,
+    from_nano,
+    mul_nano,
+    mul_nano_array,
+    settlement_pnl,
+    settlement_pnl_array,
+    to_nano,
+)
+
+
+def test_to_nano_exact_roundtrip():
+    assert to_nano("1.5") == 1_500_000_000
+    assert to_nano(Decimal("0.000000001")) == 1
+    assert from_nano(1_500_000_000) == Decimal("1.5")
+    assert format_amount(Decimal("10.500000000000000000")) == "10.5"
+    assert format_amount(Decimal("0E-18")) == "0"
+
+
+def test_to_nano_rejects_lost_precision():
+    with pytest.raises(ValueError):
+        to_nano("0.0000000001")
+    with pytest.raises(ValueError):
+        to_nano("abc")
+    assert to_nano("0.0000000015", exact=False) == 2
+
+
+def test_mul_nano_array_matches_scalar():
+    rng = np.random.default_rng(42)
+    prices = rng.integers(1, 10**14, size=5000, dtype=np.int64)  # до 100k TON
+    qty = rng.integers(1, 10**12, size=5000, dtype=np.int64)  # до 1000 штук
+    result = mul_nano_array(prices, qty)
+    assert result.dtype == np.int64
+    assert [int(x) for x in result] == [mul_nano(int(p), int(q)) for p, q in zip(prices, qty)]
+
+
+def test_settlement_pnl_array_matches_scalar():
+    entry = np.array([to_nano("2"), to_nano("2"), to_nano("3.5")], dtype=np.int64)
+    close = np.array([to_nano("2.5"), to_nano("1.25"), to_nano("3.5")], dtype=np.int64)
+    qty = np.array([to_nano("3"), to_nano("0.5"), to_nano("10")], dtype=np.int64)
+    emitter, buyer = settlement_pnl_array(entry, close, qty)
+    expected = [settlement_pnl(int(e), int(c), int(q)) for e, c, q in zip(entry, close, qty)]
+    assert list(zip(map(int, emitter), map(int, buyer))) == expected
+    assert expected[0] == (to_nano("1.5"), 0)
+    assert expected[1] == (0, to_nano("0.375"))
@@ -0,0 +1,153 @@
+"""
+Неттинг встречных контрактов по (рынок, пара контрагентов) и расчёт с нулевой суммой.
+"""
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.core.money import to_nano
+from app.db.models import Balance, ConditionalOrder, FuturesContract, LedgerEntry, Market, User
+from app.services.futures import settle_contract, ton_balances
+
+NANO = 10**9
+
+
+@pytest.fixture
+def pair(db_session: Session, test_gift_expiry_market: dict):
+    """user_id=1 и контрагент, у обоих по 100 TON свободных (маржа контрактов уже заморожена)."""
+    other = User(telegram_user_id="netting-peer")
+    db_session.add(other)
+    db_session.flush()
+    for uid in (1, other.id):
+        db_session.add(Balance(user_id=uid, currency="TON", available=Decimal("100"), reserved=Decimal("0")))
+    db_session.commit()
+    return {"market": test_gift_expiry_market["market"], "peer": other.id}
+
+
+def _contract(db_session: Session, market_id: int, emitter_id: int, buyer_id: int, qty: str, entry: str) -> FuturesContract:
+    margin = Decimal(qty) * Decimal(entry)
+    contract = FuturesContract(
+        market_id=market_id, emitter_id=emitter_id, buyer_id=buyer_id, side="long", qty=Decimal(qty),
+        entry_price=Decimal(entry), status="taken", margin_emitter=margin, margin_buyer=margin,
+    )
+    db_session.add(contract)
+    db_session.commit()
+    return contract
+
+
+def _settle_all(db_session: Session, market_id: int, close: str) -> None:
+    for contract in db_session.query(FuturesContract).filter(
+        FuturesContract.market_id == market_id, FuturesContract.status == "taken",
+    ):
+        settle_contract(db_session, contract, to_nano(close), ton_balances(db_session, [contract.emitter_id, contract.buyer_id]))
+    db_session.commit()
+
+
+def _ton(db_session: Session, user_id: int) -> int:
+    db_session.expire_all()
+    bal = db_session.query(Balance).filter(Balance.user_id == user_id, Balance.currency == "TON").one()
+    return to_nano(bal.available, exact=False)
+
+
+def test_offsetting_contracts_collapse_into_net(client: TestClient, db_session: Session, pair: dict, admin_headers: dict):
+    market, peer = pair["market"], pair["peer"]
+    c1 = _contract(db_session, market.id, 1, peer, "3", "2")
+    c2 = _contract(db_session, market.id, peer, 1, "1", "2")
+    c3 = _contract(db_session, market.id, 1, peer, "2", "2")
+    other = _contract(db_session, market.id, 1, peer, "1", "3")  # другая цена входа — не сворачивается
+    stop = ConditionalOrder(
+        user_id=1, market_id=market.id, kind="stop_loss", contract_id=c2.id,
+        trigger_price=Decimal("5"), direction="above", status="active",
+    )
+    db_session.add(stop)
+    db_session.commit()
+
+    r = client.post("/admin/futures/net", headers=admin_headers)
+    assert r.json() == {"pairs": 1, "contracts": 3, "net_contracts": 1, "batches": 1}
+
+    # user 1: +3 − 1 + 2 = 4 по 2; маржа 12 → 8 с каждой стороны
+    net = db_session.query(FuturesContract).filter(FuturesContract.netted_into.is_(None), FuturesContract.id != other.id).one()
+    assert (net.status, net.emitter_id, net.buyer_id) == ("taken", 1, peer)
+    assert (to_nano(net.qty, exact=False), to_nano(net.entry_price, exact=False)) == (4 * NANO, 2 * NANO)
+    assert (to_nano(net.margin_emitter, exact=False), to_nano(net.margin_buyer, exact=False)) == (8 * NANO, 8 * NANO)
+    assert {c.id: (c.status, c.netted_into) for c in db_session.query(FuturesContract).filter(FuturesContract.id != net.id)} == {
+        c1.id: ("netted", net.id), c2.id: ("netted", net.id), c3.id: ("netted", net.id), other.id: ("taken", None),
+    }
+    assert (_ton(db_session, 1), _ton(db_session, peer)) == (104 * NANO, 104 * NANO)
+    assert db_session.query(LedgerEntry).filter(LedgerEntry.reason == "futures_netting").count() == 2
+    assert db_session.get(ConditionalOrder, stop.id).status == "cancelled"
+
+    events = client.get("/admin/events?types=contracts_netted", headers=admin_headers).json()["events"]
+    assert events[0]["payload"]["pairs"][0]["released"] == {"1": "4", str(peer): "4"}
+
+
+def test_fully_offsetting_contracts_release_margin(client: TestClient, db_session: Session, pair: dict):
+    market, peer = pair["market"], pair["peer"]
+    _contract(db_session, market.id, 1, peer, "2", "2")
+    _contract(db_session, market.id, peer, 1, "2", "2")
+
+    assert client.post("/futures/net").json()["net_contracts"] == 0
+    # Выплата user 1 при любой цене: 2·f(c) − 2·f(c) = 0 — вся маржа (по 8) освобождается без перевода
+    assert (_ton(db_session, 1), _ton(db_session, peer)) == (108 * NANO, 108 * NANO)
+    assert {c.status for c in db_session.query(FuturesContract)} == {"netted"}
+
+
+def test_different_entries_are_not_netted(client: TestClient, db_session: Session, pair: dict):
+    market, peer = pair["market"], pair["peer"]
+    # user 1 — покупатель 1 @ 1 и эмитент 1 @ 2: при c ≥ 4 выплаты 1 и 2 ограничены маржой, сумма ≠ 1 @ 1.5
+    _contract(db_session, market.id, peer, 1, "1", "1")
+    _contract(db_session, market.id, 1, peer, "1", "2")
+
+    assert client.post("/futures/net").json() == {"pairs": 0, "contracts": 0, "net_contracts": 0, "batches": 1, "contract_ids": []}
+    assert db_session.query(FuturesContract).filter(FuturesContract.status == "taken").count() == 2
+    assert (_ton(db_session, 1), _ton(db_session, peer)) == (100 * NANO, 100 * NANO)
+
+
+@pytest.mark.parametrize("close", ["0.5", "2", "3.7", "5", "10"])
+def test_netting_preserves_payoffs(client: TestClient, db_session: Session, pair: dict, admin_headers: dict, close: str):
+    """Одни и те же контракты на двух рынках: свёрнутые и нет дают одинаковые итоговые балансы, в т. ч. выше 2 × entry."""
+    market, peer = pair["market"], pair["peer"]
+    a, b = User(telegram_user_id="netting-a"), User(telegram_user_id="netting-b")
+    unnetted = Market(gift_id=market.gift_id, expiry_id=market.expiry_id, is_active=True)
+    db_session.add_all([a, b, unnetted])
+    db_session.flush()
+    for uid in (a.id, b.id):
+        db_session.add(Balance(user_id=uid, currency="TON", available=Decimal("100"), reserved=Decimal("0")))
+    db_session.commit()
+    for market_id, u, v in ((market.id, 1, peer), (unnetted.id, a.id, b.id)):
+        _contract(db_session, market_id, u, v, "3", "2")
+        _contract(db_session, market_id, v, u, "1", "2")
+        _contract(db_session, market_id, u, v, "2", "2")
+        _contract(db_session, market_id, v, u, "1", "1")
+        _contract(db_session, market_id, u, v, "1", "2.5")
+
+    r = client.post(f"/admin/futures/net?market_id={market.id}", headers=admin_headers)
+    assert r.json()["net_contracts"] == 1
+    _settle_all(db_session, market.id, close)
+    _settle_all(db_session, unnetted.id, close)
+
+    assert (_ton(db_session, 1), _ton(db_session, peer)) == (_ton(db_session, a.id), _ton(db_session, b.id))
+    # Расчёт с нулевой суммой: к 200 TON свободных вернулась вся маржа — по 15.5 с каждой стороны
+    assert _ton(db_session, 1) + _ton(db_session, peer) == 231 * NANO
+
+
+def test_netting_scope(client: TestClient, db_session: Session, pair: dict, admin_headers: dict):
+    market, peer = pair["market"], pair["peer"]
+    third = User(telegram_user_id="netting-third")
+    other_market = Market(gift_id=market.gift_id, expiry_id=market.expiry_id, is_active=True)
+    db_session.add_all([third, other_market])
+    db_session.commit()
+    _contract(db_session, market.id, 1, peer, "1", "2")
+    _contract(db_session, market.id, 1, third.id, "1", "2")  # другой контрагент
+    _contract(db_session, other_market.id, peer, 1, "1", "2")  # другой рынок
+    _contract(db_session, other_market.id, peer, third.id, "1", "2")
+    _contract(db_session, other_market.id, third.id, peer, "1", "2")
+
+    assert client.post("/futures/net").json()["pairs"] == 0  # у user 1 нет пары с ≥ 2 контрактами
+    r = client.post(f"/admin/futures/net?market_id={market.id}", headers=admin_headers)
+    assert r.json()["pairs"] == 0
+    r = client.post(f"/admin/futures/net?market_id={other_market.id}", headers=admin_headers)
+    assert r.json() == {"pairs": 1, "contracts": 2, "net_contracts": 0, "batches": 1}
+    assert db_session.query(FuturesContract).filter(FuturesContract.status == "taken").count() == 3
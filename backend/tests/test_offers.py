@@ -0,0 +1,152 @@
+"""
+Снятие открытых предложений: отмена эмитентом, TTL, выключение рынка, sweeper пачками.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.core.auth_deps import require_user_id_dep
+from app.core.money import to_nano
+from app.db.database import SessionLocal
+from app.db.models import Balance, FuturesContract, LedgerEntry, User
+from app.services.offers import sweep
+
+
+@pytest.fixture
+def funded(db_session: Session, test_gift_expiry_market: dict):
+    """user_id=1 с 100 TON, второй пользователь-покупатель с 100 TON, цена рынка 2."""
+    market = test_gift_expiry_market["market"]
+    market.price_ton = Decimal("2")
+    buyer = User(telegram_user_id="offers-buyer")
+    db_session.add(buyer)
+    db_session.flush()
+    for uid in (1, buyer.id):
+        db_session.add(Balance(user_id=uid, currency="TON", available=Decimal("100"), reserved=Decimal("0")))
+    db_session.commit()
+    return {"market": market, "buyer_id": buyer.id}
+
+
+@pytest.fixture
+def as_user(app):
+    """Переключение «текущего пользователя» внутри теста."""
+    def _switch(user_id: int):
+        app.dependency_overrides[require_user_id_dep] = lambda: user_id
+    original = app.dependency_overrides[require_user_id_dep]
+    yield _switch
+    app.dependency_overrides[require_user_id_dep] = original
+
+
+def _ton(db_session: Session, user_id: int) -> int:
+    db_session.expire_all()
+    bal = db_session.query(Balance).filter(Balance.user_id == user_id, Balance.currency == "TON").one()
+    return to_nano(bal.available, exact=False)
+
+
+def _offer(client: TestClient, market_id: int, qty: str = "1", **extra) -> dict:
+    r = client.post("/futures/offers", json={"market_id": market_id, "side": "long", "qty": qty, **extra})
+    assert r.status_code == 200
+    return r.json()
+
+
+def _expire(db_session: Session, *offer_ids: int) -> None:
+    past = datetime.utcnow() - timedelta(seconds=1)
+    for offer_id in offer_ids:
+        db_session.get(FuturesContract, offer_id).expires_at = past
+    db_session.commit()
+
+
+def test_emitter_cancels_offer(client: TestClient, db_session: Session, funded: dict, admin_headers: dict):
+    offer = _offer(client, funded["market"].id, "1.5")
+    assert offer["expires_at"] is not None
+    assert _ton(db_session, 1) == 97 * 10**9
+
+    r = client.post(f"/futures/offers/{offer['id']}/cancel")
+    assert r.status_code == 200
+    assert r.json()["status"] == "cancelled"
+    assert _ton(db_session, 1) == 100 * 10**9
+    release = db_session.query(LedgerEntry).filter(LedgerEntry.reason == "futures_margin_release").one()
+    assert (release.ref_id, to_nano(release.delta, exact=False)) == (offer["id"], 3 * 10**9)
+    assert db_session.get(FuturesContract, offer["id"]).cancel_reason == "user"
+
+    # Повторная отмена не возвращает маржу второй раз
+    assert client.post(f"/futures/offers/{offer['id']}/cancel").status_code == 400
+    assert _ton(db_session, 1) == 100 * 10**9
+    events = client.get("/admin/events?types=offers_cancelled", headers=admin_headers).json()["events"]
+    assert [o["reason"] for e in events for o in e["payload"]["offers"]] == ["user"]
+
+
+def test_cancel_taken_or_foreign_offer_rejected(client: TestClient, funded: dict, as_user):
+    offer = _offer(client, funded["market"].id)
+    as_user(funded["buyer_id"])
+    assert client.post(f"/futures/offers/{offer['id']}/cancel").status_code == 404
+    assert client.post(f"/futures/offers/{offer['id']}/take", json={}).status_code == 200
+    as_user(1)
+    assert client.post(f"/futures/offers/{offer['id']}/cancel").status_code == 400
+
+
+def test_ttl_validation(client: TestClient, funded: dict):
+    market_id = funded["market"].id
+    r = client.post("/futures/offers", json={"market_id": market_id, "side": "long", "qty": "1", "ttl_seconds": 10**9})
+    assert r.status_code == 400
+    offer = _offer(client, market_id, ttl_seconds=60)
+    expires_at = datetime.fromisoformat(offer["expires_at"])
+    assert timedelta(seconds=50) < expires_at - datetime.utcnow() <= timedelta(seconds=60)
+
+
+def test_expired_offer_hidden_and_not_takeable(client: TestClient, db_session: Session, funded: dict, as_user):
+    offer = _offer(client, funded["market"].id)
+    _expire(db_session, offer["id"])
+    assert client.get("/futures/offers").json() == []
+    as_user(funded["buyer_id"])
+    assert client.post(f"/futures/offers/{offer['id']}/take", json={}).status_code == 404
+
+
+def test_sweep_releases_margin_in_batches(client: TestClient, db_session: Session, funded: dict):
+    market_id = funded["market"].id
+    offers = [_offer(client, market_id) for _ in range(5)]
+    keep = _offer(client, market_id)
+    _expire(db_session, *[o["id"] for o in offers])
+    client.get("/me/balances")  # кэш балансов заполнен до снятия
+
+    with SessionLocal() as db:
+        summary = sweep(db, batch_size=2)
+    assert summary == {"cancelled": 5, "batches": 3, "ttl": 5, "market_inactive": 0, "expiry_passed": 0}
+    assert _ton(db_session, 1) == 98 * 10**9  # 100 − 2 (маржа keep)
+    ton = next(b for b in client.get("/me/balances").json()["balances"] if b["currency"] == "TON")
+    assert Decimal(ton["available"]) == Decimal("98")
+    assert db_session.query(LedgerEntry).filter(LedgerEntry.reason == "futures_margin_release").count() == 5
+    assert [o["id"] for o in client.get("/futures/offers").json()] == [keep["id"]]
+
+    with SessionLocal() as db:
+        assert sweep(db, batch_size=2)["cancelled"] == 0
+
+
+def test_market_toggle_cancels_offers(
+    client: TestClient, db_session: Session, funded: dict, test_gift_expiry_market: dict, admin_headers: dict
+):
+    market_id = funded["market"].id
+    for _ in range(3):
+        _offer(client, market_id)
+    r = client.patch(f"/admin/markets/{market_id}", json={"is_active": False}, headers=admin_headers)
+    assert r.status_code == 200
+    assert _ton(db_session, 1) == 100 * 10**9
+    reasons = {c.cancel_reason for c in db_session.query(FuturesContract).all()}
+    assert reasons == {"market_inactive"}
+
+
+def test_admin_sweep_expiry_passed(
+    client: TestClient, db_session: Session, funded: dict, test_gift_expiry_market: dict, admin_headers: dict
+):
+    offer = _offer(client, funded["market"].id)
+    expiry = db_session.merge(test_gift_expiry_market["expiry"])
+    expiry.settlement_at = datetime.utcnow() - timedelta(minutes=1)
+    db_session.commit()
+
+    r = client.post("/admin/offers/sweep", headers=admin_headers)
+    assert r.status_code == 200
+    assert r.json()["expiry_passed"] == 1
+    assert db_session.get(FuturesContract, offer["id"]).status == "cancelled"
+    assert _ton(db_session, 1) == 100 * 10**9
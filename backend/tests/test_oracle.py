@@ -0,0 +1,215 @@
+"""
+Оракул цен (oracle_mrkt.py): пуш изменений, условный GET, circuit breaker, агрегация котировок.
+"""
+import asyncio
+import time
+from decimal import Decimal
+
+import aiohttp
+import pytest
+
+import oracle_mrkt
+from bench.fakes import FakeThermos
+from oracle_mrkt import (
+    Aggregator,
+    CircuitBreaker,
+    ConditionalGet,
+    GiftPrice,
+    Oracle,
+    PriceSource,
+    PushTable,
+    Quote,
+    trimmed_mean,
+    weighted_median,
+)
+
+
+def _prices(**kw: str) -> list[GiftPrice]:
+    return [GiftPrice(gift_name=name, price_ton=Decimal(price)) for name, price in kw.items()]
+
+
+def test_push_table_full_then_delta(monkeypatch):
+    monkeypatch.setattr(oracle_mrkt, "FULL_PUSH_INTERVAL_SECONDS", 600)
+    table = PushTable()
+    first = _prices(a="1", b="2")
+    # Первый пуш — всегда полный
+    assert table.changed(first, now=1000) == first
+    table.mark_pushed(first, now=1000, full=True)
+
+    # Дальше — только изменившиеся цены, пока не истёк интервал полного пуша
+    assert table.changed(_prices(a="1", b="2"), now=1001) == []
+    assert table.changed(_prices(a="1", b="3", c="4"), now=1001) == _prices(b="3", c="4")
+    table.mark_pushed(_prices(b="3"), now=1001, full=False)
+    assert table.changed(_prices(a="1", b="3"), now=1599) == []
+
+    # Интервал истёк — снова всё целиком, даже без изменений
+    assert table.changed(_prices(a="1", b="3"), now=1600) == _prices(a="1", b="3")
+
+
+def test_push_changed_marks_full_push(monkeypatch):
+    pushed: list[list[GiftPrice]] = []
+    oracle = Oracle(session=None, sources=[])
+
+    async def push(prices):
+        pushed.append(prices)
+
+    oracle.push_prices_to_backend = push
+    oracle.aggregator.update("s", "a", Decimal("1"), now=time.monotonic())
+    monkeypatch.setattr(oracle_mrkt, "FULL_PUSH_INTERVAL_SECONDS", 0)
+    asyncio.run(oracle.push_changed())
+    monkeypatch.setattr(oracle_mrkt, "FULL_PUSH_INTERVAL_SECONDS", 600)
+    oracle.aggregator.update("s", "b", Decimal("2"), now=time.monotonic())
+    asyncio.run(oracle.push_changed())
+    asyncio.run(oracle.push_changed())
+    assert pushed == [_prices(a="1"), _prices(b="2")]
+
+
+def test_conditional_get_uses_etag():
+    thermos = FakeThermos(["Plush Pepe"])
+    base_url = thermos.start()
+    try:
+        get = ConditionalGet(f"{base_url}/api/v1/collections")
+
+        async def fetch_twice():
+            async with aiohttp.ClientSession() as session:
+                first = await get.fetch(session, timeout=5)
+                assert get.not_modified is False and get.etag == thermos.etag()
+                second = await get.fetch(session, timeout=5)
+                assert get.not_modified is True
+                assert second is first
+                thermos.tick()
+                third = await get.fetch(session, timeout=5)
+                assert get.not_modified is False and get.etag == thermos.etag()
+                return first, third
+
+        first, third = asyncio.run(fetch_twice())
+        assert third == thermos.collections() != first
+        assert thermos.requests == 3
+    finally:
+        thermos.stop()
+
+
+def test_breaker_opens_and_closes():
+    breaker = CircuitBreaker(failures=2, cooldown=60)
+    breaker.record_failure(now=0)
+    assert breaker.allow(now=1)
+    breaker.record_failure(now=1)
+    assert not breaker.allow(now=60)
+    # После cooldown — пробная попытка; неудача снова открывает breaker
+    assert breaker.allow(now=61)
+    breaker.record_failure(now=61)
+    assert not breaker.allow(now=62)
+    assert breaker.allow(now=121)
+    breaker.record_success()
+    assert breaker.allow(now=122) and breaker.failures == 0
+
+
+def test_oracle_skips_source_with_open_breaker():
+    class Failing(PriceSource):
+        name = "failing"
+        calls = 0
+
+        async def fetch(self, session):
+            Failing.calls += 1
+            raise RuntimeError("down")
+
+    oracle = Oracle(session=None, sources=[Failing()])
+    oracle.breakers["failing"] = CircuitBreaker(failures=2, cooldown=60)
+    for _ in range(4):
+        asyncio.run(oracle.poll_source(oracle.sources[0]))
+    assert Failing.calls == 2
+
+
+def test_price_source_is_abstract():
+    with pytest.raises(TypeError):
+        PriceSource()
+
+
+def test_weighted_median_ignores_outlier():
+    quotes = [Quote(Decimal("10"), 0), Quote(Decimal("11"), 0), Quote(Decimal("1000"), 0)]
+    assert weighted_median(quotes, now=0) == Decimal("11")
+    # Чётное число равных весов — середина между центральными
+    assert weighted_median(quotes[:2], now=0) == Decimal("10.5")
+
+
+def test_weighted_median_prefers_fresh_quotes(monkeypatch):
+    monkeypatch.setattr(oracle_mrkt, "QUOTE_HALF_LIFE_SECONDS", 60)
+    quotes = [Quote(Decimal("5"), 0), Quote(Decimal("6"), 0), Quote(Decimal("20"), 300)]
+    assert weighted_median(quotes, now=300) == Decimal("20")
+
+
+def test_trimmed_mean_drops_extremes():
+    quotes = [Quote(Decimal(p), 0) for p in ("1", "10", "12", "500")]
+    assert trimmed_mean(quotes, now=0) == Decimal("11")
+    # Двух котировок мало для усечения
+    assert trimmed_mean(quotes[:2], now=0) == Decimal("5.5")
+
+
+@pytest.mark.parametrize("method", [weighted_median, trimmed_mean])
+def test_single_source(method):
+    assert method([Quote(Decimal("7.25"), 0)], now=100) == Decimal("7.25")
+    assert method([], now=0) is None
+
+
+def test_aggregator_drops_stale_quotes():
+    agg = Aggregator(method="trimmed_mean", max_age=300)
+    agg.update("a", "gift", Decimal("1"), now=0)
+    agg.update("b", "gift", Decimal("3"), now=100)
+    assert agg.prices(now=200) == _prices(gift="2")
+    assert agg.prices(now=301) == _prices(gift="3")
+    assert agg.prices(now=401) == []
+
+
+def test_aggregator_recomputes_only_dirty_gifts(monkeypatch):
+    calls: list[int] = []
+
+    def counting(quotes, now):
+        calls.append(len(quotes))
+        return trimmed_mean(quotes, now)
+
+    monkeypatch.setitem(oracle_mrkt.AGGREGATORS, "counting", counting)
+    agg = Aggregator(method="counting", max_age=300)
+    for i in range(100):
+        agg.update("a", f"gift{i}", Decimal(i + 1), now=0)
+    assert len(agg.dirty_prices(now=1)) == 100
+    calls.clear()
+
+    agg.update("b", "gift7", Decimal("10"), now=5)
+    assert agg.dirty_prices(now=6) == _prices(gift7="9")
+    assert calls == [2]
+    assert agg.dirty_prices(now=7) == []
+    # Полный список отдаётся из кэша цен, без пересчёта
+    assert len(agg.prices(now=8)) == 100 and calls == [2]
+
+
+def test_aggregator_dirty_on_expiry():
+    agg = Aggregator(method="trimmed_mean", max_age=300)
+    agg.update("a", "gift", Decimal("1"), now=0)
+    agg.update("b", "gift", Decimal("3"), now=100)
+    agg.update("a", "other", Decimal("5"), now=250)
+    assert len(agg.dirty_prices(now=200)) == 2
+    assert agg.dirty_prices(now=300) == []
+    assert agg.dirty_prices(now=301) == _prices(gift="3")
+    # Котировка b устарела — подарок выпал и в пуш не попадает
+    assert agg.dirty_prices(now=401) == []
+    assert agg.prices(now=401) == _prices(other="5")
+
+
+def test_failed_push_retries_dirty_gifts(monkeypatch):
+    monkeypatch.setattr(oracle_mrkt, "FULL_PUSH_INTERVAL_SECONDS", 10**9)
+    oracle = Oracle(session=None, sources=[])
+    oracle.pushed._last_full_push = time.monotonic()
+    attempts: list[list[GiftPrice]] = []
+
+    async def push(prices):
+        attempts.append(prices)
+        if len(attempts) == 1:
+            raise RuntimeError("backend down")
+
+    oracle.push_prices_to_backend = push
+    oracle.aggregator.update("s", "a", Decimal("1"), now=time.monotonic())
+    with pytest.raises(RuntimeError):
+        asyncio.run(oracle.push_changed())
+    asyncio.run(oracle.push_changed())
+    asyncio.run(oracle.push_changed())
+    assert attempts == [_prices(a="1"), _prices(a="1")]
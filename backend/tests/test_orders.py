@@ -0,0 +1,158 @@
+"""
+Условные ордера: /orders и пакетное исполнение на пуше цен оракула (книга ордеров на кучах).
+"""
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.core.money import to_nano
+from app.db.database import SessionLocal
+from app.db.models import Balance, ConditionalOrder, FuturesContract, User
+from app.services.orders import OrderBook, Trigger, execute_orders, order_book
+
+NANO = 10**9
+
+
+def _push(client: TestClient, admin_headers: dict, market_id: int, price: str) -> None:
+    r = client.post("/admin/markets/prices/bulk", json=[{"market_id": market_id, "price_ton": price}], headers=admin_headers)
+    assert r.status_code == 200
+
+
+def _ton(db_session: Session, user_id: int) -> Decimal:
+    db_session.expire_all()
+    return db_session.query(Balance).filter(Balance.user_id == user_id, Balance.currency == "TON").one().available
+
+
+def _fund(db_session: Session, user_id: int, amount: str) -> None:
+    db_session.add(Balance(user_id=user_id, currency="TON", available=Decimal(amount), reserved=Decimal("0")))
+    db_session.commit()
+
+
+def test_limit_entry_executes_at_push_price(client: TestClient, db_session: Session, test_gift_expiry_market: dict, admin_headers: dict):
+    market = test_gift_expiry_market["market"]
+    _fund(db_session, 1, "10")
+    _push(client, admin_headers, market.id, "3")
+    r = client.post("/orders", json={"kind": "limit_entry", "market_id": market.id, "side": "long", "qty": "2", "trigger_price": "2.5"})
+    assert r.status_code == 200
+    order = r.json()
+    assert order["direction"] == "below"
+
+    _push(client, admin_headers, market.id, "2.8")
+    assert client.get("/orders").json()["orders"][0]["status"] == "active"
+
+    _push(client, admin_headers, market.id, "2.4")
+    done = client.get("/orders?include_closed=true").json()["orders"][0]
+    assert done["status"] == "executed"
+    contract = db_session.get(FuturesContract, done["result_contract_id"])
+    # SQLite хранит Numeric как REAL — сравниваем в нанотонах
+    assert contract.status == "open"
+    assert (to_nano(contract.entry_price, exact=False), to_nano(contract.margin_emitter, exact=False)) == (2_400_000_000, 4_800_000_000)
+    assert to_nano(_ton(db_session, 1), exact=False) == 5_200_000_000
+
+    events = client.get("/admin/events?types=orders_executed", headers=admin_headers).json()["events"]
+    assert [(o["order_id"], o["price"]) for o in events[0]["payload"]["orders"]] == [(order["id"], "2.4")]
+    assert len(order_book) == 0
+
+
+def test_limit_entry_fails_without_funds(client: TestClient, test_gift_expiry_market: dict, admin_headers: dict):
+    market = test_gift_expiry_market["market"]
+    client.post("/orders", json={"kind": "limit_entry", "market_id": market.id, "side": "short", "qty": "1", "trigger_price": "5"})
+    _push(client, admin_headers, market.id, "5")
+    order = client.get("/orders?include_closed=true").json()["orders"][0]
+    assert order["status"] == "failed"
+    assert order["result_contract_id"] is None
+
+
+def test_take_profit_settles_and_cancels_stop_loss(client: TestClient, db_session: Session, test_gift_expiry_market: dict, admin_headers: dict):
+    market = test_gift_expiry_market["market"]
+    emitter = User(telegram_user_id="555")
+    db_session.add(emitter)
+    db_session.flush()
+    contract = FuturesContract(
+        market_id=market.id, emitter_id=emitter.id, buyer_id=1, side="long", qty=Decimal("1"), entry_price=Decimal("2"),
+        status="taken", margin_emitter=Decimal("2"), margin_buyer=Decimal("2"),
+    )
+    db_session.add(contract)
+    db_session.commit()
+    _fund(db_session, 1, "0")
+    _push(client, admin_headers, market.id, "2")
+
+    # Покупатель выигрывает на падении: take_profit ниже цены, stop_loss выше
+    tp = client.post("/orders", json={"kind": "take_profit", "contract_id": contract.id, "trigger_price": "1.5"}).json()
+    sl = client.post("/orders", json={"kind": "stop_loss", "contract_id": contract.id, "trigger_price": "3"}).json()
+    assert (tp["direction"], sl["direction"]) == ("below", "above")
+    assert client.post("/orders", json={"kind": "stop_loss", "contract_id": contract.id, "trigger_price": "1"}).status_code == 400
+
+    _push(client, admin_headers, market.id, "1.4")
+    db_session.expire_all()
+    assert (contract.status, to_nano(contract.close_price, exact=False)) == ("closed", 1_400_000_000)
+    assert to_nano(_ton(db_session, 1), exact=False) == 2_600_000_000  # маржа 2 + PnL 0.6
+    statuses = {o.id: o.status for o in db_session.query(ConditionalOrder).all()}
+    assert statuses == {tp["id"]: "executed", sl["id"]: "cancelled"}
+    assert len(order_book) == 0
+
+
+def test_stop_order_requires_own_taken_contract(client: TestClient, db_session: Session, test_gift_expiry_market: dict):
+    market = test_gift_expiry_market["market"]
+    other = User(telegram_user_id="556")
+    db_session.add(other)
+    db_session.flush()
+    contract = FuturesContract(
+        market_id=market.id, emitter_id=other.id, side="long", qty=Decimal("1"), entry_price=Decimal("2"), status="open",
+    )
+    db_session.add(contract)
+    db_session.commit()
+    body = {"kind": "stop_loss", "contract_id": contract.id, "trigger_price": "1"}
+    assert client.post("/orders", json=body).status_code == 404
+    assert client.post("/orders", json={"kind": "limit_entry", "trigger_price": "1"}).status_code == 400
+
+
+def test_cancelled_order_not_executed(client: TestClient, db_session: Session, test_gift_expiry_market: dict, admin_headers: dict):
+    market = test_gift_expiry_market["market"]
+    _fund(db_session, 1, "10")
+    order_id = client.post(
+        "/orders", json={"kind": "limit_entry", "market_id": market.id, "side": "short", "qty": "1", "trigger_price": "4"}
+    ).json()["id"]
+    _push(client, admin_headers, market.id, "3")  # книга подхватила ордер
+    assert client.delete(f"/orders/{order_id}").json() == {"ok": True}
+    _push(client, admin_headers, market.id, "4.5")
+    assert db_session.query(FuturesContract).count() == 0
+    assert client.get("/admin/events?types=orders_executed", headers=admin_headers).json()["events"] == []
+
+
+def test_popped_orders_restored_on_rollback(db_session: Session, test_gift_expiry_market: dict):
+    market = test_gift_expiry_market["market"]
+    _fund(db_session, 1, "10")
+    db_session.add(ConditionalOrder(
+        user_id=1, market_id=market.id, kind="limit_entry", side="long", qty=Decimal("1"),
+        trigger_price=Decimal("2"), direction="below", status="active",
+    ))
+    db_session.commit()
+
+    with SessionLocal() as db:
+        assert len(execute_orders(db, {market.id: 2 * NANO})) == 1
+        db.rollback()
+    assert len(order_book) == 1
+    assert db_session.query(ConditionalOrder).one().status == "active"
+
+
+def test_order_book_heaps_lazy_cancel():
+    book = OrderBook()
+    book.restore([
+        Trigger(1, 7, "above", 5 * NANO),
+        Trigger(2, 7, "above", 3 * NANO),
+        Trigger(3, 7, "below", 2 * NANO),
+        Trigger(4, 7, "below", 1 * NANO),
+    ])
+    book.cancel([2])
+    assert book.pop_triggered(7, 4 * NANO) == []  # отменённый 2 выброшен с вершины, 1 ещё не пересечён
+    assert [t.order_id for t in book.pop_triggered(7, 2 * NANO)] == [3]
+    assert [t.order_id for t in book.pop_triggered(7, 5 * NANO)] == [1]
+    assert len(book) == 1
+
+    # Много отмен — кучи пересобираются без мёртвых записей
+    book.restore([Trigger(i, 8, "above", i * NANO) for i in range(100, 300)])
+    book.cancel(range(100, 290))
+    assert book._dead == 0
+    assert [t.order_id for t in book.pop_triggered(8, 10**12)] == list(range(290, 300))
@@ -0,0 +1,119 @@
+"""
+Outbox доменных событий: запись в той же транзакции, лента /admin/events, диспетчер подписчиков.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.db.models import Balance, FuturesContract, OutboxEvent, User
+from app.services.outbox import OutboxDispatcher
+
+
+def _offer_from_other_user(db_session: Session, market) -> tuple[User, FuturesContract]:
+    emitter = User(telegram_user_id="555")
+    db_session.add(emitter)
+    db_session.flush()
+    contract = FuturesContract(
+        market_id=market.id, emitter_id=emitter.id, side="long", qty=Decimal("1"), entry_price=Decimal("2"),
+        status="open", margin_emitter=Decimal("2"),
+    )
+    db_session.add(contract)
+    db_session.commit()
+    return emitter, contract
+
+
+def test_deposit_event_in_feed(client: TestClient, test_user: User, admin_headers: dict):
+    r = client.post("/ton/webhook", json={"tx_hash": "outbox-1", "amount": "7.5", "comment": f"u{test_user.id}"})
+    assert r.json()["credited"] is True
+    # Повтор webhook не зачисляет и не создаёт событие
+    client.post("/ton/webhook", json={"tx_hash": "outbox-1", "amount": "7.5", "comment": f"u{test_user.id}"})
+
+    feed = client.get("/admin/events", headers=admin_headers).json()
+    assert [e["type"] for e in feed["events"]] == ["deposit_credited"]
+    event = feed["events"][0]
+    assert event["payload"]["amount"] == "7.5"
+    assert event["recipients"] == [{"user_id": test_user.id, "telegram_user_id": "123456789"}]
+    assert feed["next_after_id"] == event["id"]
+    assert client.get(f"/admin/events?after_id={event['id']}", headers=admin_headers).json() == {
+        "events": [], "next_after_id": event["id"],
+    }
+
+
+def test_take_and_settle_events(client: TestClient, db_session: Session, test_gift_expiry_market: dict, admin_headers: dict):
+    market = test_gift_expiry_market["market"]
+    emitter, contract = _offer_from_other_user(db_session, market)
+    db_session.add(Balance(user_id=1, currency="TON", available=Decimal("10"), reserved=Decimal("0")))
+    db_session.commit()
+
+    assert client.post(f"/futures/offers/{contract.id}/take", json={}).status_code == 200
+    assert client.post(f"/admin/futures/{contract.id}/settle", json={"close_price": "3"}, headers=admin_headers).status_code == 200
+
+    events = client.get("/admin/events?types=offer_taken,contract_settled", headers=admin_headers).json()["events"]
+    assert [e["type"] for e in events] == ["offer_taken", "contract_settled"]
+    assert [r["user_id"] for r in events[0]["recipients"]] == [emitter.id]
+    settled = events[1]
+    assert [r["user_id"] for r in settled["recipients"]] == [emitter.id, 1]
+    assert settled["payload"]["close_price"] == "3"
+
+
+def test_no_event_when_request_fails(client: TestClient, db_session: Session, test_gift_expiry_market: dict):
+    _, contract = _offer_from_other_user(db_session, test_gift_expiry_market["market"])
+    # У user 1 нет средств на маржу — транзакция не коммитится, события нет
+    assert client.post(f"/futures/offers/{contract.id}/take", json={}).status_code == 400
+    assert db_session.query(OutboxEvent).count() == 0
+
+
+def test_bulk_prices_single_event(client: TestClient, test_gift_expiry_market: dict, admin_headers: dict):
+    market = test_gift_expiry_market["market"]
+    r = client.post("/admin/markets/prices/bulk", json=[{"gift_name": "Test Gift", "price_ton": "4.2"}], headers=admin_headers)
+    assert r.json()["updated"] == 1
+    events = client.get("/admin/events", headers=admin_headers).json()["events"]
+    assert len(events) == 1
+    assert events[0]["payload"]["markets"] == [{"market_id": market.id, "price_ton": "4.2", "price_usdt": None}]
+
+
+def test_events_feed_requires_admin(client: TestClient):
+    assert client.get("/admin/events").status_code in (401, 403)
+
+
+def test_dispatcher_delivers_in_order(client: TestClient, test_user: User):
+    for i in range(5):
+        client.post("/ton/webhook", json={"tx_hash": f"disp-{i}", "amount": "1", "comment": f"u{test_user.id}"})
+
+    seen, all_events = [], []
+    dispatcher = OutboxDispatcher(batch_size=2)
+
+    def broken(event):
+        raise RuntimeError("subscriber bug")
+
+    dispatcher.subscribe("deposit_credited", broken)
+    dispatcher.subscribe("deposit_credited", lambda e: seen.append(e["id"]))
+    dispatcher.subscribe("*", lambda e: all_events.append(e["type"]))
+    while dispatcher.dispatch_once():
+        pass
+    assert len(seen) == 5 and seen == sorted(seen)
+    assert all_events == ["deposit_credited"] * 5
+    assert dispatcher.cursor == seen[-1]
+
+
+def test_dispatcher_prunes_dispatched_events(client: TestClient, test_user: User, db_session: Session):
+    for i in range(3):
+        client.post("/ton/webhook", json={"tx_hash": f"prune-{i}", "amount": "1", "comment": f"u{test_user.id}"})
+    events = db_session.query(OutboxEvent).order_by(OutboxEvent.id).all()
+    events[0].created_at = events[1].created_at = datetime.utcnow() - timedelta(days=8)
+    db_session.commit()
+    ids = [e.id for e in events]
+
+    dispatcher = OutboxDispatcher(batch_size=1, retention_seconds=7 * 86400)
+    dispatcher.dispatch_once()
+    # Старое, но ещё не разданное подписчикам событие не удаляется
+    assert dispatcher.prune() == 1
+    while dispatcher.dispatch_once():
+        pass
+    assert dispatcher.prune() == 1
+    db_session.expire_all()
+    assert [e.id for e in db_session.query(OutboxEvent)] == ids[2:]
+
+    assert OutboxDispatcher(retention_seconds=0).prune(datetime.utcnow() + timedelta(days=365)) == 0
@@ -0,0 +1,44 @@
+"""
+Бюджеты SQL-запросов на эндпоинт: число запросов не должно расти с размером данных (N+1).
+"""
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.db.models import Expiry, Gift, Market
+
+
+def _many_markets(db_session: Session, n: int) -> None:
+    expiry = Expiry(days=7, is_active=True)
+    db_session.add(expiry)
+    db_session.flush()
+    for i in range(n):
+        gift = Gift(name=f"Budget Gift {i}", is_active=True)
+        db_session.add(gift)
+        db_session.flush()
+        db_session.add(Market(gift_id=gift.id, expiry_id=expiry.id, is_active=True, price_ton=Decimal("1")))
+    db_session.commit()
+
+
+def test_markets_list_budget(client: TestClient, db_session: Session, query_budget):
+    _many_markets(db_session, 30)
+    r = client.get("/markets")
+    assert len(r.json()["markets"]) == 30
+    query_budget(r, 1)
+
+
+def test_balances_budget(client: TestClient, test_user, query_budget):
+    query_budget(client.get("/me/balances"), 1)
+    # повторное чтение — из кэша балансов
+    assert query_budget(client.get("/me/balances"), 0) == 0
+
+
+def test_bulk_prices_budget(client: TestClient, db_session: Session, admin_headers: dict, query_budget):
+    _many_markets(db_session, 30)
+    payload = [{"gift_name": f"Budget Gift {i}", "price_ton": "2.5"} for i in range(30)]
+    r = client.post("/admin/markets/prices/bulk", json=payload, headers=admin_headers)
+    assert r.json() == {"updated": 30}
+    # SELECT рынков + пакетный UPDATE + синхронизация книг алертов и ордеров (+ служебные запросы сессии),
+    # независимо от размера пакета
+    query_budget(r, 5)
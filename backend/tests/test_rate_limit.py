@@ -0,0 +1,82 @@
+"""
+Допуск к торговым эндпоинтам: token bucket на пользователя, сброс нагрузки, общий лимит.
+"""
+import pytest
+from fastapi import HTTPException, Request, Response
+from fastapi.testclient import TestClient
+
+from app.core.auth_deps import require_user_id_dep
+from app.core.rate_limit import AdmissionController, MemoryBucketStore, parse_rate_limits
+from app.db.profiling import db_write_latency
+from app.db.models import User
+
+
+BAD_WITHDRAW = {"amount": "1", "currency": "TON", "destination_address": "not-an-address"}
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("trade=20:5, withdraw=5:0.2,broken,x=1") == {"trade": (20.0, 5.0), "withdraw": (5.0, 0.2)}
+
+
+def test_withdraw_limited_after_burst(client: TestClient, test_user: User):
+    # withdraw=5:0.2 — пять запросов проходят до проверки тела, шестой получает 429
+    for _ in range(5):
+        assert client.post("/me/withdraw", json=BAD_WITHDRAW).status_code == 400
+    r = client.post("/me/withdraw", json=BAD_WITHDRAW)
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+
+
+def test_buckets_are_per_user(app, client: TestClient, test_user: User):
+    for _ in range(6):
+        client.post("/me/withdraw", json=BAD_WITHDRAW)
+    assert client.post("/me/withdraw", json=BAD_WITHDRAW).status_code == 429
+
+    def other_user(request: Request, response: Response):
+        return 2
+
+    previous = app.dependency_overrides[require_user_id_dep]
+    app.dependency_overrides[require_user_id_dep] = other_user
+    try:
+        assert client.post("/me/withdraw", json=BAD_WITHDRAW).status_code == 400
+    finally:
+        app.dependency_overrides[require_user_id_dep] = previous
+
+
+def test_sheds_load_on_slow_db_writes(client: TestClient, test_gift_expiry_market: dict):
+    market = test_gift_expiry_market["market"]
+    for _ in range(20):
+        db_write_latency.observe(1000)
+    r = client.post("/futures/offers", json={"market_id": market.id, "side": "long", "qty": "1"})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+    # Чтения не затрагиваются
+    assert client.get("/markets").status_code == 200
+
+
+def test_concurrency_cap():
+    controller = AdmissionController({}, MemoryBucketStore(), max_concurrency=1, wait_seconds=0, shed_write_latency_ms=0)
+    assert controller.acquire_slot("trade")
+    with pytest.raises(HTTPException) as exc:
+        controller.acquire_slot("trade")
+    assert exc.value.status_code == 503
+    controller.release_slot()
+    assert controller.acquire_slot("trade")
+
+
+@pytest.mark.parametrize(
+    "method,path",
+    [
+        ("post", "/futures/offers/1/cancel"),
+        ("post", "/futures/1/settle"),
+        ("post", "/alerts"),
+        ("delete", "/alerts/1"),
+        ("delete", "/orders/1"),
+    ],
+)
+def test_write_paths_admitted(client: TestClient, method: str, path: str):
+    # Сброс нагрузки срабатывает до разбора тела и поиска объекта
+    for _ in range(20):
+        db_write_latency.observe(1000)
+    r = client.request(method.upper(), path, json={})
+    assert r.status_code == 503
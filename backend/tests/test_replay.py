@@ -0,0 +1,98 @@
+"""
+Replay записанного трафика: сопоставление id, созданных при записи и при воспроизведении.
+"""
+import importlib
+import os
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def replay():
+    # bench.api_bench при импорте подменяет окружение (временная БД, секреты) — возвращаем его
+    with mock.patch.dict(os.environ):
+        return importlib.import_module("bench.replay")
+
+
+class _Response:
+    def __init__(self, status_code: int, payload: dict) -> None:
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self) -> dict:
+        return self._payload
+
+
+class FakeApi:
+    """Ответы replay-сервера по (метод, путь); запросы запоминаются."""
+
+    def __init__(self, responses: dict) -> None:
+        self.responses = responses
+        self.requests: list[tuple[str, str, dict | None]] = []
+
+    def client(self):
+        return self
+
+    def request(self, method, path, headers=None, json=None):
+        self.requests.append((method, path, json))
+        return _Response(200, self.responses.get((method, path), {}))
+
+
+def _entry(t: float, method: str, path: str, *, user: int = 1, body=None, created=None) -> dict:
+    entry = {"t": t, "method": method, "path": path, "status": 200, "user": user, "admin": False, "body": body}
+    if created is not None:
+        entry["created"] = created
+    return entry
+
+
+def test_partial_take_then_settle(replay):
+    snapshot = {"users": [{"id": 1}, {"id": 2}], "contracts": []}
+    api = FakeApi({
+        ("POST", "/futures/offers"): {"id": 20},
+        ("POST", "/futures/offers/20/take"): {"id": 21, "parent_id": 20},
+        ("POST", "/orders"): {"id": 5},
+        ("POST", "/futures/net"): {"net_contracts": 1, "contract_ids": [30]},
+    })
+    entries = [
+        _entry(0.0, "POST", "/futures/offers", body={"market_id": 1, "side": "long", "qty": "5"}, created={"contract": 10}),
+        # Частичное принятие: в записи дочерний контракт 11, при replay — 21
+        _entry(0.1, "POST", "/futures/offers/10/take", user=2, body={"qty": "2"}, created={"contract": 11}),
+        _entry(0.2, "POST", "/orders", user=2, body={"kind": "stop_loss", "trigger_price": "1", "contract_id": 11}, created={"order": 3}),
+        _entry(0.3, "DELETE", "/orders/3", user=2),
+        _entry(0.4, "POST", "/futures/11/settle", user=2, body={}),
+        _entry(0.5, "POST", "/futures/net", created={"contract": [12]}),
+        _entry(0.6, "POST", "/futures/12/settle", body={}),
+    ]
+    replayer = replay.Replayer(api, snapshot, speed=0, concurrency=1)
+    replayer.run(entries)
+
+    assert [(m, p) for m, p, _ in api.requests] == [
+        ("POST", "/futures/offers"),
+        ("POST", "/futures/offers/20/take"),
+        ("POST", "/orders"),
+        ("DELETE", "/orders/5"),
+        ("POST", "/futures/21/settle"),
+        ("POST", "/futures/net"),
+        ("POST", "/futures/30/settle"),
+    ]
+    assert api.requests[2][2]["contract_id"] == 21
+    assert replayer.unmapped == []
+
+
+def test_unmapped_id_is_not_sent(replay):
+    api = FakeApi({})
+    entries = [
+        # Создание контракта 10 при replay не вернуло id — settle нельзя отправить на чужой id
+        _entry(0.0, "POST", "/futures/offers", body={"market_id": 1}, created={"contract": 10}),
+        _entry(0.1, "POST", "/futures/10/settle", body={}),
+        _entry(0.2, "DELETE", "/alerts/7"),
+    ]
+    replayer = replay.Replayer(api, {"users": [{"id": 1}]}, speed=0, concurrency=1)
+    replayer.run(entries)
+
+    assert [p for _, p, _ in api.requests] == ["/futures/offers"]
+    assert replayer.unmapped == [
+        "POST /futures/10/settle: no replay id for contract 10",
+        "DELETE /alerts/7: no replay id for alert 7",
+    ]
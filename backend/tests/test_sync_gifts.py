@@ -0,0 +1,54 @@
+"""
+Синхронизация gifts из Thermos: пакетный upsert и отчёт diff.
+"""
+from sqlalchemy.orm import Session
+
+from app.db.models import Gift
+from app.db.profiling import profile_queries
+from sync_gifts_from_thermos import apply_collections
+
+
+def test_apply_collections_diff(db_session: Session):
+    db_session.add_all([
+        Gift(name="Old Same", image_url="same.png", total_count=5),
+        Gift(name="Old Changed", image_url="old.png", total_count=1),
+        Gift(name="Gone", image_url=None, total_count=None),
+    ])
+    db_session.commit()
+
+    diff = apply_collections(db_session, [
+        {"name": "Old Same", "image_url": "same.png", "stats": {"count": 5}},
+        {"name": "Old Changed", "image_url": "new.png", "stats": {"count": 2}},
+        {"name": "New One", "image_url": "n.png", "stats": {"count": 7}},
+        {"name": "New One", "image_url": "dup.png"},
+        {"name": "  "},
+    ])
+
+    assert diff.created == ["New One"]
+    assert diff.updated == ["Old Changed"]
+    assert diff.unchanged == 1
+    assert diff.missing == ["Gone"]
+
+    db_session.expire_all()
+    gifts = {g.name: g for g in db_session.query(Gift).all()}
+    assert gifts["Old Changed"].image_url == "new.png"
+    assert gifts["Old Changed"].total_count == 2
+    assert gifts["New One"].total_count == 7
+    assert gifts["New One"].is_active is True
+
+
+def test_apply_collections_thousands_batched(db_session: Session):
+    # Число SQL не зависит от числа подарков: SELECT существующих + один пакетный INSERT / UPDATE.
+    # Время не проверяем — замеры в bench/
+    data = [{"name": f"Gift {i}", "image_url": f"{i}.png", "stats": {"count": i}} for i in range(3000)]
+    with profile_queries() as created_stats:
+        diff = apply_collections(db_session, data)
+    assert len(diff.created) == 3000
+    assert created_stats.count == 2
+
+    data[0]["stats"]["count"] = 99999
+    with profile_queries() as updated_stats:
+        diff2 = apply_collections(db_session, data)
+    assert diff2.updated == ["Gift 0"]
+    assert diff2.unchanged == 2999
+    assert updated_stats.count == 2
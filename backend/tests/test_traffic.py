@@ -0,0 +1,117 @@
+"""
+Запись трафика для replay: очистка тел и актора, строки NDJSON из middleware.
+"""
+import json
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.jwt import issue_access_token
+from app.core.settings import settings
+from app.core.traffic import PLACEHOLDER_TON_ADDRESS, TrafficRecorder, actor_from_cookies, read_recording, sanitize_body
+from app.main import TrafficRecordMiddleware
+
+
+def test_sanitize_auth_keeps_only_telegram_id():
+    init_data = 'auth_date=1&user=%7B%22id%22%3A%20555%2C%20%22first_name%22%3A%20%22A%22%7D&hash=deadbeef'
+    body = sanitize_body("/auth/telegram", json.dumps({"init_data": init_data}).encode())
+    assert body == {"telegram_user_id": "555"}
+
+
+def test_sanitize_replaces_wallet_addresses():
+    raw = json.dumps({"amount": "1", "destination_address": "EQreal"}).encode()
+    assert sanitize_body("/me/withdraw", raw) == {"amount": "1", "destination_address": PLACEHOLDER_TON_ADDRESS}
+    assert sanitize_body("/me/withdraw", b"not json") is None
+
+
+def test_actor_from_cookies():
+    token = issue_access_token(subject="42", secret=settings.jwt_secret, ttl_seconds=60)
+    assert actor_from_cookies(f"REFRESH_TOKEN=x; ACCESS_TOKEN={token}") == 42
+    assert actor_from_cookies("ACCESS_TOKEN=garbage") is None
+    assert actor_from_cookies(None) is None
+
+
+def test_middleware_records_requests(tmp_path):
+    inner = FastAPI()
+
+    @inner.post("/futures/offers")
+    def _create(body: dict):
+        return {"id": 7}
+
+    @inner.get("/healthz")
+    def _health():
+        return {"status": "ok"}
+
+    path = tmp_path / "traffic.ndjson"
+    recorder = TrafficRecorder(str(path))
+    client = TestClient(TrafficRecordMiddleware(inner, recorder=recorder))
+    token = issue_access_token(subject="3", secret=settings.jwt_secret, ttl_seconds=60)
+    client.post("/futures/offers", json={"market_id": 1}, headers={"Cookie": f"ACCESS_TOKEN={token}", "Authorization": "Bearer x"})
+    client.get("/healthz")
+    recorder.close()
+
+    path = Path(recorder.path)
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert len(lines) == 1
+    entry = lines[0]
+    assert entry["method"] == "POST" and entry["path"] == "/futures/offers" and entry["status"] == 200
+    assert entry["user"] == 3 and entry["admin"] is True
+    assert entry["body"] == {"market_id": 1}
+    assert entry["created"] == {"contract": 7}
+    assert token not in path.read_text(encoding="utf-8")
+
+
+def test_middleware_captures_created_ids(tmp_path):
+    inner = FastAPI()
+
+    @inner.post("/futures/offers/{offer_id}/take")
+    def _take(offer_id: int):
+        return {"id": 11, "parent_id": offer_id}
+
+    @inner.post("/futures/net")
+    def _net():
+        return {"net_contracts": 2, "contract_ids": [12, 13]}
+
+    @inner.post("/alerts")
+    def _alert():
+        return {"id": 4}
+
+    recorder = TrafficRecorder(str(tmp_path / "traffic.ndjson"))
+    client = TestClient(TrafficRecordMiddleware(inner, recorder=recorder))
+    for path in ("/futures/offers/10/take", "/futures/net", "/alerts"):
+        client.post(path, json={})
+    recorder.close()
+
+    _, entries = read_recording(recorder.path)
+    assert [e["created"] for e in entries] == [{"contract": 11}, {"contract": [12, 13]}, {"alert": 4}]
+
+
+def test_each_run_gets_own_file_with_one_snapshot(tmp_path):
+    base = str(tmp_path / "traffic.ndjson")
+    first, second = TrafficRecorder(base), TrafficRecorder(base)
+    for n, recorder in enumerate((first, second)):
+        recorder.write_snapshot({"type": "snapshot", "run": n})
+        recorder.write({"t": 0.1, "method": "GET", "path": "/markets", "run": n})
+        with pytest.raises(RuntimeError):
+            recorder.write_snapshot({"type": "snapshot"})
+        recorder.close()
+
+    assert first.path != second.path
+    assert not (tmp_path / "traffic.ndjson").exists()
+    for n, recorder in enumerate((first, second)):
+        snapshot, entries = read_recording(recorder.path)
+        assert snapshot == {"type": "snapshot", "run": n}
+        assert [e["run"] for e in entries] == [n]
+
+
+def test_replay_reads_only_first_run_of_legacy_file(tmp_path):
+    path = tmp_path / "legacy.ndjson"
+    rows = [
+        {"type": "snapshot", "run": 0}, {"t": 5.0, "run": 0},
+        {"type": "snapshot", "run": 1}, {"t": 0.5, "run": 1},
+    ]
+    path.write_text("\n".join(json.dumps(r) for r in rows) + "\n", encoding="utf-8")
+    snapshot, entries = read_recording(str(path))
+    assert snapshot["run"] == 0 and entries == [{"t": 5.0, "run": 0}]
@@ -0,0 +1,115 @@
+"""
+Воркер вывода: атомарный захват, пакеты по несколько сообщений, подтверждение и возврат при отказе.
+"""
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.orm import Session
+
+import withdrawal_worker
+from app.db.database import SessionLocal
+from app.db.models import Balance, LedgerEntry, User, Withdrawal, WithdrawalBatch
+from app.services.payout_transport import load_transport
+from app.services.withdrawals import claim_pending, poll_confirmations, process_once, submit_batches
+from bench.fakes import FakeTransport
+
+
+ADDRESS = "EQtest1234567890123456789012345678901234567890abc"
+
+
+def _pending(db_session: Session, count: int, amount: str = "1") -> User:
+    """Пользователь с count pending-заявками; суммы уже списаны с баланса, как в POST /me/withdraw."""
+    user = User(telegram_user_id="worker")
+    db_session.add(user)
+    db_session.flush()
+    db_session.add(Balance(user_id=user.id, currency="TON", available=Decimal("0"), reserved=Decimal("0")))
+    db_session.add_all([
+        Withdrawal(user_id=user.id, currency="TON", amount=Decimal(amount), destination_address=ADDRESS, status="pending")
+        for _ in range(count)
+    ])
+    db_session.commit()
+    return user
+
+
+def _run(transport: FakeTransport, **overrides) -> dict:
+    options = {"claim_limit": 64, "max_messages": 4, "max_attempts": 3, "claim_ttl_seconds": 300}
+    options.update(overrides)
+    with SessionLocal() as db:
+        return process_once(db, transport, **options)
+
+
+def test_claim_is_exclusive(db_session: Session):
+    _pending(db_session, 5)
+    with SessionLocal() as first, SessionLocal() as second:
+        claimed = claim_pending(first, 3)
+        rest = claim_pending(second, 10)
+    assert len(claimed) == 3
+    assert len(rest) == 2
+    assert not {w.id for w in claimed} & {w.id for w in rest}
+
+
+def test_batches_group_messages_and_confirm(db_session: Session):
+    _pending(db_session, 10)
+    transport = FakeTransport()
+    summary = _run(transport)
+    assert summary["claimed"] == 10
+    assert summary["batches"] == 3
+    assert sorted(len(m) for m in transport.submitted.values()) == [2, 4, 4]
+    assert {w.status for w in db_session.query(Withdrawal)} == {"submitted"}
+
+    for ref in transport.submitted:
+        transport.confirm(ref)
+    assert _run(transport)["confirmed"] == 3
+    db_session.expire_all()
+    rows = db_session.query(Withdrawal).all()
+    assert {w.status for w in rows} == {"completed"}
+    assert all(w.tx_hash for w in rows)
+    assert {b.status for b in db_session.query(WithdrawalBatch)} == {"confirmed"}
+
+
+def test_failed_batch_refunds(db_session: Session):
+    user = _pending(db_session, 2, amount="2.5")
+    transport = FakeTransport()
+    with SessionLocal() as db:
+        submit_batches(db, transport, claim_pending(db, 10), max_messages=4, max_attempts=3)
+        transport.fail(next(iter(transport.submitted)))
+        assert poll_confirmations(db, transport)["failed"] == 1
+
+    db_session.expire_all()
+    assert {w.status for w in db_session.query(Withdrawal)} == {"failed"}
+    balance = db_session.query(Balance).filter(Balance.user_id == user.id).one()
+    assert balance.available == Decimal("5")
+    refunds = db_session.query(LedgerEntry).filter(LedgerEntry.reason == "withdraw_refund").all()
+    assert sorted(e.delta for e in refunds) == [Decimal("2.5"), Decimal("2.5")]
+
+
+def test_rejected_submit_retries_then_fails(db_session: Session):
+    user = _pending(db_session, 1, amount="3")
+    transport = FakeTransport()
+    transport.fail_next_submit = 2
+
+    _run(transport, max_attempts=2)
+    db_session.expire_all()
+    w = db_session.query(Withdrawal).one()
+    assert (w.status, w.attempts, w.batch_id) == ("pending", 1, None)
+
+    _run(transport, max_attempts=2)
+    db_session.expire_all()
+    w = db_session.query(Withdrawal).one()
+    assert (w.status, w.attempts) == ("failed", 2)
+    assert db_session.query(Balance).filter(Balance.user_id == user.id).one().available == Decimal("3")
+    assert transport.submitted == {}
+
+
+@pytest.mark.parametrize("spec", ["", "fake", "bench.fakes:FakeTransport", "app.db.models:User"])
+def test_no_real_transport_refused(spec: str):
+    with pytest.raises(ValueError):
+        load_transport(spec)
+
+
+def test_worker_refuses_to_start_without_transport(monkeypatch, db_session: Session):
+    _pending(db_session, 1)
+    monkeypatch.setattr(withdrawal_worker.settings, "withdraw_transport", "")
+    with pytest.raises(SystemExit):
+        withdrawal_worker.run(once=True)
+    assert db_session.query(Withdrawal).one().status == "pending"
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+"""
+Воркер вывода средств: раз в WITHDRAW_POLL_INTERVAL секунд захватывает pending-заявки,
+отправляет их пакетами через транспорт выплат (WITHDRAW_TRANSPORT, обязателен) и отслеживает подтверждения.
+Логика — в app/services/withdrawals.py.
+
+Отдельный процесс, НЕ часть FastAPI. Можно запускать несколько экземпляров: захват заявок
+атомарный, одна заявка попадает только в один пакет.
+
+    cd backend
+    python withdrawal_worker.py            # цикл
+    python withdrawal_worker.py --once     # один проход (cron)
+"""
+
+import argparse
+import logging
+import time
+
+from app.core.logging import setup_logging
+from app.core.settings import settings
+from app.db.database import Base, SessionLocal, engine
+from app.services.payout_transport import load_transport
+from app.services.withdrawals import process_once
+
+
+logger = logging.getLogger("api")
+
+
+def run(once: bool = False) -> None:
+    try:
+        transport = load_transport(settings.withdraw_transport)
+    except (ValueError, ImportError, AttributeError) as e:
+        # Без настоящего транспорта заявки нельзя ни отправить, ни честно подтвердить
+        logger.error("Payout transport is not configured", extra={"event": "withdraw_worker_no_transport", "error": str(e)})
+        raise SystemExit(2)
+    Base.metadata.create_all(bind=engine)
+    while True:
+        started = time.monotonic()
+        try:
+            with SessionLocal() as db:
+                summary = process_once(
+                    db,
+                    transport,
+                    claim_limit=settings.withdraw_claim_limit,
+                    max_messages=settings.withdraw_batch_max_messages,
+                    max_attempts=settings.withdraw_max_attempts,
+                    claim_ttl_seconds=settings.withdraw_claim_ttl_seconds,
+                )
+            if summary["claimed"] or summary["confirmed"] or summary["failed"] or summary["released"]:
+                logger.info("Withdrawal worker pass", extra={"event": "withdraw_worker_pass", **summary})
+        except Exception:
+            logger.exception("Withdrawal worker pass failed", extra={"event": "withdraw_worker_error"})
+        if once:
+            return
+        time.sleep(max(0.0, settings.withdraw_poll_interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обработка заявок на вывод пакетами")
+    parser.add_argument("--once", action="store_true", help="один проход и выход")
+    args = parser.parse_args()
+    setup_logging()
+    run(once=args.once)
@@ -0,0 +1,143 @@
+"""
+Асинхронное наблюдение за изменениями одного файла (.webhook_url от скриптов туннеля).
+
+- Linux: inotify через ctypes на каталог файла (скрипты пишут и напрямую, и через rename) —
+  без опроса, в простое ни одного системного вызова.
+- Остальные ОС или inotify недоступен: stat() раз в poll_interval, сравнение (mtime, size, inode);
+  содержимое файла не читается, пока stat не изменился.
+
+Серия быстрых перезаписей схлопывается: изменение отдаётся, когда файл не менялся debounce секунд.
+"""
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import AsyncIterator
+
+from .logging import get_logger
+
+
+logger = get_logger("bot.file_watcher")
+
+# linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1  # noqa: B018 — проверка наличия символа
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class _Inotify:
+    """inotify на каталоге; is_relevant() — есть ли среди прочитанных событий наш файл."""
+
+    def __init__(self, libc, directory: Path, name: str) -> None:
+        self.name = os.fsencode(name)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def is_relevant(self) -> bool:
+        relevant = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                start = offset + _EVENT_HEADER.size
+                if data[start:start + length].rstrip(b"\0") == self.name:
+                    relevant = True
+                offset = start + length
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _stat_key(path: Path) -> tuple | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+async def watch_file(path: str, *, debounce: float = 0.3, poll_interval: float = 1.0) -> AsyncIterator[None]:
+    """Асинхронный генератор: значение на каждое «успокоившееся» изменение файла (создание, запись, удаление)."""
+    target = Path(path).resolve()
+    dirty = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    inotify = None
+    libc = _load_libc()
+    if libc is not None and target.parent.is_dir():
+        try:
+            inotify = _Inotify(libc, target.parent, target.name)
+        except OSError as e:
+            logger.warning(
+                "inotify unavailable, falling back to stat polling",
+                extra={"event": "file_watch_fallback", "path": str(target), "reason": str(e)},
+            )
+
+    poll_task = None
+    if inotify is not None:
+        loop.add_reader(inotify.fd, lambda: inotify.is_relevant() and dirty.set())
+    else:
+        async def poll() -> None:
+            last = _stat_key(target)
+            while True:
+                await asyncio.sleep(poll_interval)
+                key = _stat_key(target)
+                if key != last:
+                    last = key
+                    dirty.set()
+
+        poll_task = asyncio.create_task(poll())
+
+    logger.info(
+        "Watching file",
+        extra={"event": "file_watch_started", "path": str(target), "mode": "inotify" if inotify else "stat"},
+    )
+    try:
+        while True:
+            await dirty.wait()
+            # Ждём тишины: каждая новая запись в окне debounce откладывает выдачу
+            while True:
+                dirty.clear()
+                try:
+                    await asyncio.wait_for(dirty.wait(), timeout=debounce)
+                except asyncio.TimeoutError:
+                    break
+            yield
+    finally:
+        if inotify is not None:
+            loop.remove_reader(inotify.fd)
+            inotify.close()
+        if poll_task is not None:
+            poll_task.cancel()
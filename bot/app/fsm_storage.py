@@ -0,0 +1,73 @@
+"""
+FSM-хранилище aiogram в SQLite — общее для нескольких процессов бота (webhook_cluster.py).
+
+MemoryStorage живёт в памяти одного процесса: при нескольких воркерах состояние диалога,
+записанное одним процессом, другой бы не увидел (например, после перезапуска воркера).
+Файл BOT_FSM_STORAGE_PATH открывается в режиме WAL, запросы идут в пуле потоков.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(
+        str(part) if part is not None else ""
+        for part in (key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny)
+    )
+
+
+class SqliteStorage(BaseStorage):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}')"
+            )
+            self._conn.commit()
+
+    def _execute(self, sql: str, params: tuple) -> list[tuple]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            self._conn.commit()
+            return rows
+
+    async def _run(self, sql: str, params: tuple) -> list[tuple]:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._run(
+            "INSERT INTO fsm (key, state) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (_key(key), value),
+        )
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        rows = await self._run("SELECT state FROM fsm WHERE key = ?", (_key(key),))
+        return rows[0][0] if rows else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Data must be a dict, got {type(data).__name__}")
+        await self._run(
+            "INSERT INTO fsm (key, data) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (_key(key), json.dumps(data, ensure_ascii=False)),
+        )
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        rows = await self._run("SELECT data FROM fsm WHERE key = ?", (_key(key),))
+        return json.loads(rows[0][0]) if rows else {}
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -10,12 +10,19 @@ from pathlib import Path
 
 from aiogram import Bot, Dispatcher
 from aiogram.filters import CommandStart
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import Message
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 from dotenv import load_dotenv
 
+from .file_watcher import watch_file
+from .fsm_storage import SqliteStorage
 from .logging import setup_logging, get_logger
+from .notifications import notifier_from_env
+from .polling import run_polling_executor
+from .webhook_cluster import WebhookCluster
 
 load_dotenv()
 setup_logging()
@@ -27,6 +34,13 @@ BOT_MODE = os.getenv("BOT_MODE", "").lower()
 WEBHOOK_BASE_URL_ENV = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
 WEBHOOK_SET_RETRY_SECONDS = int(os.getenv("WEBHOOK_SET_RETRY_SECONDS", "180"))
+# Слежение за .webhook_url: окно склейки перезаписей и интервал stat() там, где нет inotify
+WEBHOOK_WATCH_DEBOUNCE = float(os.getenv("WEBHOOK_WATCH_DEBOUNCE", "0.3"))
+WEBHOOK_WATCH_POLL_INTERVAL = float(os.getenv("WEBHOOK_WATCH_POLL_INTERVAL", "1"))
+# Процессов-обработчиков webhook (1 — один процесс, как раньше; >1 — webhook_cluster.py)
+BOT_WEBHOOK_WORKERS = int(os.getenv("BOT_WEBHOOK_WORKERS", "1"))
+# Одновременных HTTPS-соединений Telegram к webhook (1..100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
 
 # Путь к файлу с webhook URL (для динамического обновления через bore)
 WEBHOOK_URL_FILE = os.getenv("WEBHOOK_URL_FILE", "")
@@ -38,9 +52,15 @@ if not WEBHOOK_URL_FILE:
 WEBHOOK_PATH = "/telegram/webhook"
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+def create_storage() -> BaseStorage:
+    """FSM-хранилище: общий SQLite, если задан BOT_FSM_STORAGE_PATH (несколько процессов), иначе память."""
+    path = os.getenv("BOT_FSM_STORAGE_PATH", "")
+    return SqliteStorage(path) if path else MemoryStorage()
 
-# Текущий webhook URL для отслеживания изменений
+
+dp = Dispatcher(storage=create_storage())
+
+# Webhook URL, успешно установленный в Telegram
 _current_webhook_url: str | None = None
 
 logger = get_logger("bot.main")
@@ -53,10 +73,24 @@ async def cmd_start(message: Message) -> None:
     )
 
 
+def start_notifications() -> asyncio.Task | None:
+    """Фоновая отправка уведомлений о событиях backend (если настроены BACKEND_BASE_URL и ADMIN_TOKEN)."""
+    notifier = notifier_from_env(bot)
+    if notifier is None:
+        logger.info("Notifications disabled: BACKEND_BASE_URL/ADMIN_TOKEN not set", extra={"event": "notify_disabled"})
+        return None
+    return asyncio.create_task(notifier.run())
+
+
 async def run_polling() -> None:
     logger.info("Starting bot in polling mode", extra={"event": "polling_started"})
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    notify_task = start_notifications()
+    try:
+        await run_polling_executor(bot, dp)
+    finally:
+        if notify_task is not None:
+            notify_task.cancel()
 
 
 def normalize_url(url: str) -> str:
@@ -102,30 +136,20 @@ def normalize_url(url: str) -> str:
 
 
 def get_webhook_url() -> str:
-    """Получить webhook URL из переменной окружения или файла."""
-    global _current_webhook_url
-    
+    """Получить webhook URL из переменной окружения или файла (без побочных эффектов)."""
     # Сначала пробуем прочитать из файла (для динамического обновления)
     if os.path.exists(WEBHOOK_URL_FILE):
         try:
             with open(WEBHOOK_URL_FILE, "r", encoding="utf-8") as f:
                 url_from_file = f.read().strip()
             if url_from_file:
-                base_url = normalize_url(url_from_file)
-                webhook_url = f"{base_url}{WEBHOOK_PATH}"
-                
-                if webhook_url != _current_webhook_url:
-                    _current_webhook_url = webhook_url
-                return webhook_url
+                return f"{normalize_url(url_from_file)}{WEBHOOK_PATH}"
         except Exception as e:
             print(f"Warning: Could not read webhook URL from file: {e}")
     
     # Fallback на переменную окружения
     if WEBHOOK_BASE_URL_ENV:
-        base_url = normalize_url(WEBHOOK_BASE_URL_ENV)
-        webhook_url = f"{base_url}{WEBHOOK_PATH}"
-        _current_webhook_url = webhook_url
-        return webhook_url
+        return f"{normalize_url(WEBHOOK_BASE_URL_ENV)}{WEBHOOK_PATH}"
     
     return ""
 
@@ -165,6 +189,7 @@ async def update_webhook_if_changed() -> bool:
                 new_url,
                 secret_token=WEBHOOK_SECRET or None,
                 drop_pending_updates=False,  # Не сбрасывать апдейты при обновлении
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
             )
             logger.info(
                 "Webhook URL updated",
@@ -183,14 +208,28 @@ async def update_webhook_if_changed() -> bool:
     return False
 
 
+def webhook_update_pending() -> bool:
+    """Есть валидный URL, отличный от установленного (например, прошлая попытка set_webhook не удалась)."""
+    url = get_webhook_url()
+    return validate_webhook_url(url) and url != _current_webhook_url
+
+
 async def monitor_webhook_url() -> None:
-    """Фоновая задача для мониторинга изменений webhook URL."""
-    while True:
-        await asyncio.sleep(5)  # Проверяем каждые 5 секунд
-        await update_webhook_if_changed()
+    """Фоновая задача: set_webhook на каждое устоявшееся изменение .webhook_url (inotify/stat, с debounce)."""
+    async for _ in watch_file(
+        WEBHOOK_URL_FILE,
+        debounce=WEBHOOK_WATCH_DEBOUNCE,
+        poll_interval=WEBHOOK_WATCH_POLL_INTERVAL,
+    ):
+        # Ошибка set_webhook — повтор с нарастающей паузой; файл перечитывается, так что ставим последний URL
+        delay = 1.0
+        while not await update_webhook_if_changed() and webhook_update_pending():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WEBHOOK_SET_RETRY_SECONDS)
 
 
 async def run_webhook() -> None:
+    global _current_webhook_url
     webhook_url = get_webhook_url()
     if not webhook_url:
         raise SystemExit("WEBHOOK_BASE_URL is required for webhook mode (set in env or .webhook_url file)")
@@ -202,12 +241,19 @@ async def run_webhook() -> None:
     # Сначала поднимаем HTTP-сервер на порту 8081, чтобы cloudflared/туннель могли
     # проксировать запросы (иначе 502 Bad Gateway при первом запросе от Telegram)
     app = web.Application()
-    SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot,
-        secret_token=WEBHOOK_SECRET or None,
-    ).register(app, path=WEBHOOK_PATH)
-    setup_application(app, dp, bot=bot)
+    cluster = None
+    if BOT_WEBHOOK_WORKERS > 1:
+        # Фронт только раскладывает апдейты по воркерам (по chat_id), обработка — в их процессах
+        cluster = WebhookCluster(BOT_WEBHOOK_WORKERS, secret=WEBHOOK_SECRET)
+        cluster.start()
+        app.router.add_post(WEBHOOK_PATH, cluster.handle)
+    else:
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=WEBHOOK_SECRET or None,
+        ).register(app, path=WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, host="0.0.0.0", port=8081)
@@ -231,11 +277,13 @@ async def run_webhook() -> None:
                 webhook_url,
                 secret_token=WEBHOOK_SECRET or None,
                 drop_pending_updates=True,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
             )
             logger.info(
                 "Bot started with webhook",
                 extra={"event": "webhook_set_ok", "webhook_url": webhook_url},
             )
+            _current_webhook_url = webhook_url
             break
         except Exception as e:
             msg = str(e)
@@ -251,15 +299,21 @@ async def run_webhook() -> None:
     
     # Запускаем мониторинг изменений URL в фоне
     monitor_task = asyncio.create_task(monitor_webhook_url())
+    # Уведомления — один экземпляр на бота: в кластерном режиме их шлёт фронт, а не воркеры
+    notify_task = start_notifications()
     
     try:
         await asyncio.Event().wait()
     finally:
+        if notify_task is not None:
+            notify_task.cancel()
         monitor_task.cancel()
         try:
             await monitor_task
         except asyncio.CancelledError:
             pass
+        if cluster is not None:
+            await cluster.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,369 @@
+"""
+Уведомления пользователям о событиях backend (депозит зачислен, предложение приняли, контракт
+рассчитан, вывод выполнен/отклонён).
+
+Источник — лента outbox GET {BACKEND_BASE_URL}/admin/events?after_id=N (нужен ADMIN_TOKEN).
+Отправка учитывает лимиты Telegram:
+- общий token bucket NOTIFY_GLOBAL_RATE сообщений в секунду (Telegram — около 30 в секунду на бота);
+- не чаще одного сообщения в чат за NOTIFY_PER_CHAT_INTERVAL секунд;
+- события одного пользователя копятся NOTIFY_COALESCE_SECONDS и уходят одним сообщением
+  (в день экспирации пользователь получает одну сводку, а не по сообщению на контракт);
+- 429 (TelegramRetryAfter) останавливает общий bucket на retry_after, сообщение возвращается в очередь.
+
+Курсор ленты хранится в NOTIFY_CURSOR_FILE и сдвигается только за события, которые уже отправлены
+(или отброшены: пользователь заблокировал бота) — после перезапуска неотправленное уйдёт повторно.
+События старше NOTIFY_MAX_AGE_SECONDS не отправляются (долгий простой, первый запуск без курсора).
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import aiohttp
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from .logging import get_logger
+
+
+logger = get_logger("bot.notifications")
+
+BACKEND_BASE_URL = (os.getenv("BACKEND_BASE_URL", "") or "").strip().rstrip("/")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+NOTIFY_CURSOR_FILE = os.getenv("NOTIFY_CURSOR_FILE", "") or str(Path(__file__).parent.parent / ".notify_cursor")
+NOTIFY_POLL_INTERVAL = float(os.getenv("NOTIFY_POLL_INTERVAL", "2"))
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "30"))
+NOTIFY_PER_CHAT_INTERVAL = float(os.getenv("NOTIFY_PER_CHAT_INTERVAL", "1"))
+NOTIFY_COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "2"))
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "30"))
+NOTIFY_MAX_AGE_SECONDS = float(os.getenv("NOTIFY_MAX_AGE_SECONDS", "3600"))
+
+FEED_LIMIT = 500
+# Сколько неотправленных событий держим в памяти, прежде чем перестать читать ленту
+MAX_BACKLOG = 50000
+MAX_SEND_ATTEMPTS = 3
+# Строк в одном сообщении; остальное сворачивается в «и ещё N»
+MAX_LINES = 20
+
+EVENT_TYPES = (
+    "deposit_credited", "offer_taken", "contract_settled", "withdrawal_completed", "withdrawal_failed",
+    "price_alerts_fired", "orders_executed", "offers_cancelled", "contracts_netted",
+)
+
+
+def render(event: dict, user_id: int) -> str | None:
+    """Строка уведомления о событии для конкретного получателя."""
+    p = event["payload"]
+    kind = event["type"]
+    if kind == "deposit_credited":
+        return f"💰 Депозит зачислен: {p['amount']} {p['currency']}"
+    if kind == "offer_taken":
+        remaining = p.get("remaining_qty")
+        if remaining and remaining != "0":
+            # Частичное принятие: остаток предложения по-прежнему открыт
+            offer_id = p.get("offer_id", p["contract_id"])
+            return f"🤝 Ваше предложение #{offer_id} приняли частично: {p['qty']} по {p['entry_price']} TON, осталось {remaining}"
+        return f"🤝 Ваше предложение #{p.get('offer_id', p['contract_id'])} приняли: {p['qty']} по {p['entry_price']} TON"
+    if kind == "contract_settled":
+        pnl = p["pnl_emitter"] if user_id == p.get("emitter_id") else p.get("pnl_buyer")
+        return f"📊 Контракт #{p['contract_id']} рассчитан по {p['close_price']} TON, PnL: {pnl} TON"
+    if kind == "withdrawal_completed":
+        return f"✅ Вывод {p['amount']} {p['currency']} выполнен"
+    if kind == "withdrawal_failed":
+        return f"⚠️ Вывод {p['amount']} {p['currency']} не выполнен, средства возвращены на баланс"
+    if kind == "price_alerts_fired":
+        # Одно событие на пуш цен: получателю — только его алерты
+        lines = [_render_alert(a) for a in p["alerts"] if a["user_id"] == user_id]
+        return "\n".join(lines) or None
+    if kind == "orders_executed":
+        lines = [_render_order(o) for o in p["orders"] if o["user_id"] == user_id]
+        return "\n".join(lines) or None
+    if kind == "offers_cancelled":
+        lines = [_render_cancelled_offer(o) for o in p["offers"] if o["user_id"] == user_id]
+        return "\n".join(lines) or None
+    if kind == "contracts_netted":
+        lines = [_render_netting(n, user_id) for n in p["pairs"] if user_id in n["users"]]
+        return "\n".join(lines) or None
+    return None
+
+
+def _render_alert(alert: dict) -> str:
+    market = f"{alert['gift']} {alert['expiry_days']}D" if alert.get("gift") else f"рынок #{alert['market_id']}"
+    sign = "≥" if alert["direction"] == "above" else "≤"
+    return f"🔔 {market}: цена {alert['price']} TON ({sign} {alert['threshold']})"
+
+
+ORDER_KINDS = {"limit_entry": "Лимитный ордер", "stop_loss": "Стоп-лосс", "take_profit": "Тейк-профит"}
+
+
+def _render_order(order: dict) -> str:
+    name = f"{ORDER_KINDS.get(order['kind'], 'Ордер')} #{order['order_id']}"
+    if order["status"] == "executed":
+        return f"⚡ {name} исполнен по {order['price']} TON (контракт #{order['contract_id']})"
+    return f"⚠️ {name} не исполнен: {order['error']}"
+
+
+CANCEL_REASONS = {
+    "user": "по вашему запросу",
+    "ttl": "истёк срок",
+    "market_inactive": "рынок закрыт",
+    "expiry_passed": "наступила экспирация",
+}
+
+
+def _render_cancelled_offer(offer: dict) -> str:
+    reason = CANCEL_REASONS.get(offer["reason"], offer["reason"])
+    return f"↩️ Предложение #{offer['contract_id']} снято ({reason}), маржа {offer['margin']} TON возвращена"
+
+
+def _render_netting(pair: dict, user_id: int) -> str:
+    released = pair["released"].get(str(user_id), "0")
+    head = f"🔄 Неттинг на рынке #{pair['market_id']}: {len(pair['netted'])} контрактов"
+    if pair["contract_id"] is None:
+        return f"{head} взаимно погашены, на баланс зачислено {released} TON"
+    return f"{head} → #{pair['contract_id']} ({pair['qty']} по {pair['entry_price']} TON), освобождено {released} TON"
+
+
+def compose(lines: list[str]) -> str:
+    if len(lines) <= MAX_LINES:
+        return "\n".join(lines)
+    return "\n".join(lines[:MAX_LINES - 1] + [f"…и ещё {len(lines) - MAX_LINES + 1} событий"])
+
+
+class TokenBucket:
+    """Асинхронный token bucket для одного event loop; pause() — пауза после 429 от Telegram."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._at = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.capacity, self._tokens + (now - self._at) * self.rate)
+            self._at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class PendingChat:
+    chat_id: int
+    lines: list[str] = field(default_factory=list)
+    event_ids: list[int] = field(default_factory=list)
+    attempts: int = 0
+
+
+class Notifier:
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        base_url: str,
+        admin_token: str,
+        cursor_path: str,
+        global_rate: float = NOTIFY_GLOBAL_RATE,
+        per_chat_interval: float = NOTIFY_PER_CHAT_INTERVAL,
+        coalesce_seconds: float = NOTIFY_COALESCE_SECONDS,
+        concurrency: int = NOTIFY_CONCURRENCY,
+    ) -> None:
+        self.bot = bot
+        self.base_url = base_url
+        self.admin_token = admin_token
+        self.cursor_path = Path(cursor_path)
+        self.per_chat_interval = per_chat_interval
+        self.coalesce_seconds = coalesce_seconds
+        self.bucket = TokenBucket(global_rate)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._pending: dict[int, PendingChat] = {}
+        self._ready: list[tuple[float, int]] = []  # (когда можно отправлять, chat_id)
+        self._next_allowed: dict[int, float] = {}
+        self._unsent: dict[int, int] = {}  # event id → сколько получателей ещё ждут
+        self._wakeup = asyncio.Event()
+        self.fetched_cursor = self._load_cursor()
+
+    # --- Курсор ---
+
+    def _load_cursor(self) -> int:
+        try:
+            return int(self.cursor_path.read_text(encoding="utf-8").strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def safe_cursor(self) -> int:
+        """Все события с id не больше этого уже отправлены или отброшены."""
+        return min(self._unsent) - 1 if self._unsent else self.fetched_cursor
+
+    def _save_cursor(self) -> None:
+        try:
+            self.cursor_path.write_text(str(self.safe_cursor()), encoding="utf-8")
+        except OSError:
+            logger.warning("Could not save notification cursor", exc_info=True, extra={"event": "notify_cursor_error"})
+
+    # --- Очередь ---
+
+    def add_event(self, event: dict) -> None:
+        for recipient in event.get("recipients", []):
+            line = render(event, recipient["user_id"])
+            if line is None:
+                continue
+            chat_id = int(recipient["telegram_user_id"])
+            pending = self._pending.get(chat_id)
+            if pending is None:
+                pending = self._pending[chat_id] = PendingChat(chat_id)
+                ready_at = max(time.monotonic() + self.coalesce_seconds, self._next_allowed.get(chat_id, 0.0))
+                heapq.heappush(self._ready, (ready_at, chat_id))
+            pending.lines.append(line)
+            pending.event_ids.append(event["id"])
+            self._unsent[event["id"]] = self._unsent.get(event["id"], 0) + 1
+        self._wakeup.set()
+
+    def _done(self, pending: PendingChat) -> None:
+        for event_id in pending.event_ids:
+            left = self._unsent.get(event_id, 0) - 1
+            if left > 0:
+                self._unsent[event_id] = left
+            else:
+                self._unsent.pop(event_id, None)
+
+    def _requeue(self, pending: PendingChat, delay: float) -> None:
+        """Вернуть неотправленное в начало очереди чата (новые события того же чата — следом)."""
+        newer = self._pending.get(pending.chat_id)
+        if newer is not None:
+            pending.lines += newer.lines
+            pending.event_ids += newer.event_ids
+        self._pending[pending.chat_id] = pending
+        ready_at = time.monotonic() + delay
+        self._next_allowed[pending.chat_id] = ready_at
+        heapq.heappush(self._ready, (ready_at, pending.chat_id))
+        self._wakeup.set()
+
+    # --- Отправка ---
+
+    async def run_sender(self) -> None:
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            ready_at, chat_id = self._ready[0]
+            delay = ready_at - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._ready)
+            pending = self._pending.get(chat_id)
+            if pending is None:
+                continue
+            if self._next_allowed.get(chat_id, 0.0) > time.monotonic():
+                # Запись в куче устарела (чат вернулся в очередь позже) — ждём своей очереди
+                heapq.heappush(self._ready, (self._next_allowed[chat_id], chat_id))
+                continue
+            del self._pending[chat_id]
+            await self._slots.acquire()
+            await self.bucket.acquire()
+            self._next_allowed[chat_id] = time.monotonic() + self.per_chat_interval
+            asyncio.create_task(self._send(pending))
+
+    async def _send(self, pending: PendingChat) -> None:
+        try:
+            await self.bot.send_message(pending.chat_id, compose(pending.lines))
+            self._done(pending)
+        except TelegramRetryAfter as e:
+            self.bucket.pause(e.retry_after)
+            self._requeue(pending, e.retry_after)
+            logger.warning(
+                "Telegram flood control, pausing notifications",
+                extra={"event": "notify_retry_after", "retry_after": e.retry_after},
+            )
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чата нет — повтор не поможет
+            self._done(pending)
+            logger.info(
+                "Notification dropped",
+                extra={"event": "notify_chat_dropped", "telegram_user_id": pending.chat_id, "reason": str(e)[:200]},
+            )
+        except Exception:
+            pending.attempts += 1
+            if pending.attempts < MAX_SEND_ATTEMPTS:
+                self._requeue(pending, 2 ** pending.attempts)
+            else:
+                self._done(pending)
+                logger.error(
+                    "Notification send failed",
+                    exc_info=True,
+                    extra={"event": "notify_send_error", "telegram_user_id": pending.chat_id},
+                )
+        finally:
+            self._slots.release()
+
+    # --- Лента событий ---
+
+    async def fetch(self, session: aiohttp.ClientSession) -> list[dict]:
+        params = {"after_id": self.fetched_cursor, "limit": FEED_LIMIT, "types": ",".join(EVENT_TYPES)}
+        async with session.get(
+            f"{self.base_url}/admin/events",
+            params=params,
+            headers={"Authorization": f"Bearer {self.admin_token}"},
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+        self.fetched_cursor = data["next_after_id"]
+        return data["events"]
+
+    async def run_feed(self) -> None:
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                if len(self._unsent) >= MAX_BACKLOG:
+                    await asyncio.sleep(NOTIFY_POLL_INTERVAL)
+                    continue
+                try:
+                    events = await self.fetch(session)
+                except Exception:
+                    logger.warning("Event feed request failed", exc_info=True, extra={"event": "notify_feed_error"})
+                    await asyncio.sleep(NOTIFY_POLL_INTERVAL)
+                    continue
+                cutoff = datetime.utcnow() - timedelta(seconds=NOTIFY_MAX_AGE_SECONDS)
+                for event in events:
+                    created = event.get("created_at")
+                    if created and datetime.fromisoformat(created) < cutoff:
+                        continue
+                    self.add_event(event)
+                self._save_cursor()
+                if len(events) < FEED_LIMIT:
+                    await asyncio.sleep(NOTIFY_POLL_INTERVAL)
+
+    async def run(self) -> None:
+        logger.info(
+            "Notifications started",
+            extra={"event": "notify_started", "after_id": self.fetched_cursor},
+        )
+        await asyncio.gather(self.run_feed(), self.run_sender())
+
+
+def notifier_from_env(bot: Bot) -> Notifier | None:
+    """Notifier по env; None, если не заданы BACKEND_BASE_URL и ADMIN_TOKEN (уведомления выключены)."""
+    if not BACKEND_BASE_URL or not ADMIN_TOKEN:
+        return None
+    return Notifier(bot, base_url=BACKEND_BASE_URL, admin_token=ADMIN_TOKEN, cursor_path=NOTIFY_CURSOR_FILE)
@@ -0,0 +1,188 @@
+"""
+Long polling со своим исполнителем апдейтов (BOT_MODE=polling).
+
+dp.start_polling обрабатывает апдейты без ограничений и настроек: медленный обработчик одного
+пользователя задерживал остальных. Здесь getUpdates в цикле, а каждый апдейт уходит в
+ChatSequencer: не больше BOT_POLL_CONCURRENCY обработчиков одновременно, апдейты одного чата —
+строго по порядку. Если принято больше BOT_POLL_MAX_PENDING необработанных апдейтов, следующий
+getUpdates ждёт — Telegram хранит апдейты у себя, память бота не растёт.
+
+Ошибки getUpdates polling не останавливают: при TelegramRetryAfter ждём retry_after секунд, при
+любой другой ошибке — паузу с удвоением до 30 секунд. Завершает работу только
+TelegramUnauthorizedError (токен отозван — повтор бесполезен).
+
+Метрики: событие polling_stats в логе раз в BOT_STATS_LOG_INTERVAL секунд и, если задан
+BOT_METRICS_PORT, GET /metrics в текстовом формате Prometheus.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from functools import partial
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import (
+    TelegramConflictError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+    TelegramUnauthorizedError,
+)
+from aiohttp import web
+
+from .logging import get_logger
+from .sequencer import ChatSequencer, update_chat_key
+
+
+logger = get_logger("bot.polling")
+
+BOT_POLL_CONCURRENCY = int(os.getenv("BOT_POLL_CONCURRENCY", "64"))
+BOT_POLL_MAX_PENDING = int(os.getenv("BOT_POLL_MAX_PENDING", "5000"))
+# Long poll: Telegram держит getUpdates до BOT_POLL_TIMEOUT секунд, пока нет апдейтов
+BOT_POLL_TIMEOUT = int(os.getenv("BOT_POLL_TIMEOUT", "30"))
+BOT_POLL_LIMIT = int(os.getenv("BOT_POLL_LIMIT", "100"))
+# Через запятую (message,callback_query); пусто — типы, на которые есть обработчики в dp
+BOT_ALLOWED_UPDATES = [t.strip() for t in os.getenv("BOT_ALLOWED_UPDATES", "").split(",") if t.strip()]
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0"))
+BOT_STATS_LOG_INTERVAL = float(os.getenv("BOT_STATS_LOG_INTERVAL", "60"))
+BOT_POLL_SHUTDOWN_TIMEOUT = float(os.getenv("BOT_POLL_SHUTDOWN_TIMEOUT", "10"))
+
+
+class PollingExecutor:
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        *,
+        concurrency: int = BOT_POLL_CONCURRENCY,
+        max_pending: int = BOT_POLL_MAX_PENDING,
+        poll_timeout: int = BOT_POLL_TIMEOUT,
+        limit: int = BOT_POLL_LIMIT,
+        allowed_updates: list[str] | None = None,
+    ) -> None:
+        self.bot = bot
+        self.dp = dp
+        self.sequencer = ChatSequencer(concurrency)
+        self.max_pending = max_pending
+        self.poll_timeout = poll_timeout
+        self.limit = limit
+        self.allowed_updates = allowed_updates or BOT_ALLOWED_UPDATES or dp.resolve_used_update_types()
+        self.offset: int | None = None
+        self.received = 0
+        self.poll_errors = 0
+
+    def stats(self) -> dict[str, int]:
+        s = self.sequencer
+        return {
+            "queued": s.queued,
+            "in_flight": s.in_flight,
+            "active_chats": s.active_chats,
+            "received": self.received,
+            "processed": s.processed,
+            "failed": s.failed,
+            "poll_errors": self.poll_errors,
+        }
+
+    async def _wait_capacity(self) -> None:
+        while self.sequencer.queued >= self.max_pending:
+            await asyncio.sleep(0.05)
+
+    async def poll_once(self) -> int:
+        """Один getUpdates; апдейты отдаются в sequencer, offset сдвигается сразу."""
+        await self._wait_capacity()
+        updates = await self.bot.get_updates(
+            offset=self.offset,
+            limit=self.limit,
+            timeout=self.poll_timeout,
+            allowed_updates=self.allowed_updates,
+            request_timeout=self.poll_timeout + 10,
+        )
+        for update in updates:
+            self.sequencer.submit(update_chat_key(update), partial(self.dp.feed_update, self.bot, update))
+            self.offset = update.update_id + 1
+        self.received += len(updates)
+        return len(updates)
+
+    async def run(self) -> None:
+        logger.info(
+            "Polling executor started",
+            extra={"event": "polling_executor_started", "allowed_updates": self.allowed_updates},
+        )
+        delay = 1.0
+        try:
+            while True:
+                try:
+                    await self.poll_once()
+                    delay = 1.0
+                except TelegramUnauthorizedError:
+                    raise
+                except TelegramRetryAfter as e:
+                    # Flood control: Telegram сам говорит, сколько ждать
+                    self.poll_errors += 1
+                    logger.warning(
+                        "getUpdates flood control, retrying",
+                        extra={"event": "polling_error", "error": str(e), "retry_in": e.retry_after},
+                    )
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    # Conflict — параллельно работает другой экземпляр бота или установлен webhook;
+                    # прочие (неожиданный ответ, ошибка разбора) — с трассировкой, но polling не падает
+                    self.poll_errors += 1
+                    logger.warning(
+                        "getUpdates failed, retrying",
+                        extra={"event": "polling_error", "error": str(e), "retry_in": delay},
+                        exc_info=not isinstance(e, (TelegramNetworkError, TelegramServerError, TelegramConflictError)),
+                    )
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self, timeout: float = BOT_POLL_SHUTDOWN_TIMEOUT) -> None:
+        """Дождаться уже принятых апдейтов (offset для них подтверждён, повторно Telegram их не пришлёт)."""
+        try:
+            await asyncio.wait_for(self.sequencer.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Polling shutdown timed out, unfinished updates dropped",
+                extra={"event": "polling_shutdown_timeout", **self.stats()},
+            )
+
+    async def log_stats(self, interval: float = BOT_STATS_LOG_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("Polling stats", extra={"event": "polling_stats", **self.stats()})
+
+    async def metrics_handler(self, request: web.Request) -> web.Response:
+        lines = []
+        for name, value in self.stats().items():
+            kind = "gauge" if name in ("queued", "in_flight", "active_chats") else "counter"
+            metric = f"bot_polling_{name}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {value}")
+        return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
+
+async def start_metrics_server(executor: PollingExecutor, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", executor.metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host="0.0.0.0", port=port).start()
+    logger.info("Bot metrics server started", extra={"event": "bot_metrics_started", "port": port})
+    return runner
+
+
+async def run_polling_executor(bot: Bot, dp: Dispatcher) -> None:
+    executor = PollingExecutor(bot, dp)
+    stats_task = asyncio.create_task(executor.log_stats()) if BOT_STATS_LOG_INTERVAL > 0 else None
+    runner = await start_metrics_server(executor, BOT_METRICS_PORT) if BOT_METRICS_PORT else None
+    await dp.emit_startup(bot=bot)
+    try:
+        await executor.run()
+    finally:
+        if stats_task is not None:
+            stats_task.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
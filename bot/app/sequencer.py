@@ -0,0 +1,102 @@
+"""
+Параллельная обработка апдейтов с сохранением порядка внутри чата.
+
+Апдейты разных чатов обрабатываются параллельно задачами asyncio (не больше concurrency
+одновременно), апдейты одного чата — строго по очереди: у активного чата своя очередь и одна
+задача-обработчик, которая завершается, когда очередь пуста.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable
+
+from .logging import get_logger
+
+
+logger = get_logger("bot.sequencer")
+
+Job = Callable[[], Awaitable[object]]
+
+
+def chat_key(update: dict) -> int | None:
+    """Ключ очереди для сырого апдейта Telegram: id чата, иначе id пользователя."""
+    for name, value in update.items():
+        if name == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+        user = value.get("from") or value.get("user")
+        if user and "id" in user:
+            return int(user["id"])
+    return None
+
+
+def update_chat_key(update) -> int | None:
+    """То же для объекта aiogram Update (режим polling)."""
+    event = update.event
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    return user.id if user is not None else None
+
+
+class ChatSequencer:
+    def __init__(self, concurrency: int = 64) -> None:
+        self._slots = asyncio.Semaphore(concurrency)
+        self._queues: dict[int | None, deque[Job]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.queued = 0  # принято, но ещё не начато
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._queues)
+
+    def submit(self, key: int | None, job: Job) -> None:
+        self.queued += 1
+        if key is None:
+            # Апдейт без чата (например, poll) — порядок не важен
+            self._spawn(self._run_one(job))
+            return
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(job)
+            return
+        self._queues[key] = deque([job])
+        self._spawn(self._drain(key))
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_one(self, job: Job) -> None:
+        async with self._slots:
+            self.queued -= 1
+            self.in_flight += 1
+            try:
+                await job()
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Update handling failed", extra={"event": "update_handle_error"})
+            finally:
+                self.in_flight -= 1
+
+    async def _drain(self, key: int) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                await self._run_one(queue.popleft())
+        finally:
+            del self._queues[key]
+
+    async def join(self) -> None:
+        """Дождаться обработки всего принятого."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -0,0 +1,216 @@
+"""
+Приём webhook Telegram несколькими процессами (BOT_WEBHOOK_WORKERS > 1).
+
+Фронт-процесс слушает порт 8081, проверяет секрет и кладёт апдейт в очередь воркера с номером
+chat_id % N. Все апдейты одного чата попадают в один процесс, внутри процесса ChatSequencer
+обрабатывает их по порядку, а разные чаты — параллельно.
+
+Telegram получает 200 только после подтверждения воркера: обработав апдейт, воркер пишет его
+update_id в общую очередь подтверждений. Нет подтверждения за BOT_WORKER_ACK_TIMEOUT (воркер
+упал с апдейтом в памяти или обработка слишком долгая) — фронт отвечает 503, и Telegram
+доставит апдейт повторно. Доставка «хотя бы один раз»: апдейт, обработанный дольше таймаута,
+может быть обработан дважды. Повтор апдейта, ещё ожидающего подтверждения, в очередь не кладётся.
+SO_REUSEPORT не подходит: ядро раздаёт соединения процессам без учёта чата, и порядок сообщений
+одного пользователя терялся бы.
+
+Очередь воркера ограничена BOT_WORKER_QUEUE_SIZE: при переполнении фронт отвечает 503, и
+Telegram повторит доставку позже. Упавший воркер перезапускается с той же очередью.
+Каждый воркер выполняет хуки dp.startup/dp.shutdown (как setup_application в одном процессе).
+Уведомления (notifications.py) шлёт один фронт-процесс: в воркерах они бы дублировались.
+FSM-состояние — в общем SQLite (fsm_storage.py), путь BOT_FSM_STORAGE_PATH.
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import multiprocessing
+import os
+import queue
+import time
+from functools import partial
+from pathlib import Path
+
+from aiogram.types import Update
+from aiohttp import web
+
+from .logging import get_logger
+from .sequencer import ChatSequencer, chat_key
+
+
+logger = get_logger("bot.webhook_cluster")
+
+BOT_WORKER_CONCURRENCY = int(os.getenv("BOT_WORKER_CONCURRENCY", "64"))
+BOT_WORKER_QUEUE_SIZE = int(os.getenv("BOT_WORKER_QUEUE_SIZE", "10000"))
+# Сколько апдейтов воркер держит в очередях чатов, прежде чем перестать забирать новые
+BOT_WORKER_MAX_PENDING = int(os.getenv("BOT_WORKER_MAX_PENDING", "5000"))
+# Сколько фронт ждёт подтверждения обработки, прежде чем ответить Telegram 503
+BOT_WORKER_ACK_TIMEOUT = float(os.getenv("BOT_WORKER_ACK_TIMEOUT", "30"))
+DEFAULT_FSM_STORAGE_PATH = str(Path(__file__).parent.parent / "fsm.sqlite3")
+
+
+def shard_for(update: dict, workers: int) -> int:
+    """Номер воркера для сырого апдейта: по чату, апдейты без чата — по update_id."""
+    key = chat_key(update)
+    return (key if key is not None else int(update.get("update_id", 0))) % workers
+
+
+def worker_main(index: int, updates: multiprocessing.Queue, acks: multiprocessing.Queue) -> None:
+    """Точка входа процесса-воркера."""
+    from .main import bot, dp
+
+    asyncio.run(_serve(index, updates, acks, bot, dp))
+
+
+async def _handle(dp, bot, update: Update, acks: multiprocessing.Queue) -> None:
+    try:
+        await dp.feed_update(bot, update)
+    finally:
+        # Ошибка обработчика повтором от Telegram не лечится — подтверждаем и её
+        acks.put(update.update_id)
+
+
+async def _serve(index: int, updates: multiprocessing.Queue, acks: multiprocessing.Queue, bot, dp) -> None:
+    loop = asyncio.get_running_loop()
+    sequencer = ChatSequencer(BOT_WORKER_CONCURRENCY)
+    await dp.emit_startup(bot=bot)
+    logger.info("Bot worker started", extra={"event": "bot_worker_started", "worker": index, "pid": os.getpid()})
+    try:
+        while True:
+            if sequencer.queued >= BOT_WORKER_MAX_PENDING:
+                await asyncio.sleep(0.01)
+                continue
+            raw = await loop.run_in_executor(None, updates.get)
+            if raw is None:
+                break
+            data = json.loads(raw)
+            update = Update.model_validate(data, context={"bot": bot})
+            sequencer.submit(chat_key(data), partial(_handle, dp, bot, update, acks))
+        await sequencer.join()
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await dp.storage.close()
+        await bot.session.close()
+
+
+class WebhookCluster:
+    def __init__(
+        self,
+        workers: int,
+        *,
+        secret: str = "",
+        queue_size: int = BOT_WORKER_QUEUE_SIZE,
+        ack_timeout: float = BOT_WORKER_ACK_TIMEOUT,
+    ) -> None:
+        self.workers = workers
+        self.secret = secret
+        self.ack_timeout = ack_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queues = [self._ctx.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._acks = self._ctx.Queue()
+        # update_id → ожидание подтверждения воркера (повторы того же апдейта ждут его же)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._processes: list[multiprocessing.Process | None] = [None] * workers
+        self._supervisor: asyncio.Task | None = None
+        self._ack_reader: asyncio.Task | None = None
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _spawn(self, index: int) -> None:
+        proc = self._ctx.Process(
+            target=worker_main,
+            args=(index, self._queues[index], self._acks),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        proc.start()
+        self._processes[index] = proc
+
+    def start(self) -> None:
+        # Воркеры наследуют окружение: включаем общее FSM-хранилище, если оно не задано явно
+        os.environ.setdefault("BOT_FSM_STORAGE_PATH", DEFAULT_FSM_STORAGE_PATH)
+        for index in range(self.workers):
+            self._spawn(index)
+        self._supervisor = asyncio.create_task(self._supervise())
+        self._ack_reader = asyncio.create_task(self._read_acks())
+        logger.info("Bot webhook cluster started", extra={"event": "bot_cluster_started", "workers": self.workers})
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(1)
+            for index, proc in enumerate(self._processes):
+                if proc is not None and not proc.is_alive():
+                    logger.error(
+                        "Bot worker died, restarting",
+                        extra={"event": "bot_worker_restarted", "worker": index, "exitcode": proc.exitcode},
+                    )
+                    self._spawn(index)
+
+    async def _read_acks(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            update_id = await loop.run_in_executor(None, self._acks.get)
+            if update_id is None:
+                return
+            waiter = self._pending.pop(update_id, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret:
+            token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(token, self.secret):
+                return web.Response(status=401)
+        raw = await request.read()
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return web.Response(status=400)
+        update_id = data.get("update_id") if isinstance(data, dict) else None
+        if not isinstance(update_id, int):
+            return web.Response(status=400)
+        waiter = self._pending.get(update_id)
+        if waiter is None:
+            shard = shard_for(data, self.workers)
+            try:
+                self._queues[shard].put_nowait(raw)
+            except queue.Full:
+                self.rejected += 1
+                logger.warning(
+                    "Bot worker queue full, asking Telegram to retry",
+                    extra={"event": "bot_worker_queue_full", "worker": shard},
+                )
+                return web.Response(status=503)
+            waiter = self._pending[update_id] = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.ack_timeout)
+        except asyncio.TimeoutError:
+            # Повтор от Telegram снова попадёт в очередь: апдейт мог пропасть с упавшим воркером
+            if self._pending.get(update_id) is waiter:
+                del self._pending[update_id]
+            self.timed_out += 1
+            logger.warning(
+                "Bot update not acknowledged, asking Telegram to retry",
+                extra={"event": "bot_update_ack_timeout", "update_id": update_id},
+            )
+            return web.Response(status=503)
+        return web.Response()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        for q in self._queues:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for proc in self._processes:
+            if proc is None:
+                continue
+            await asyncio.to_thread(proc.join, max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                proc.terminate()
+        self._acks.put(None)
+        if self._ack_reader is not None:
+            await self._ack_reader
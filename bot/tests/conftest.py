@@ -0,0 +1,10 @@
+"""
+Фикстуры для тестов бота. Тесты запускаются из каталога bot: python -m pytest -q
+"""
+from __future__ import annotations
+
+import os
+import sys
+
+# Добавляем bot в path (пакет app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
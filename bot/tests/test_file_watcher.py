@@ -0,0 +1,83 @@
+"""
+watch_file: серия записей на месте и замена через rename дают ровно одно изменение после debounce —
+через inotify и через опрос stat().
+"""
+import asyncio
+import os
+
+import pytest
+
+from app import file_watcher
+from app.file_watcher import watch_file
+
+
+DEBOUNCE = 0.15
+POLL = 0.02
+
+
+async def _write_in_place(path: str) -> None:
+    for n in range(5):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"https://tunnel-{n}.example")
+        await asyncio.sleep(0.01)
+
+
+async def _rename_over(path: str) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("https://renamed.example.with.a.longer.name")
+    os.replace(tmp, path)
+
+
+async def _touch_neighbour(path: str) -> None:
+    with open(os.path.join(os.path.dirname(path), "other.txt"), "w", encoding="utf-8") as f:
+        f.write("x")
+
+
+def _changes(path: str, action) -> int:
+    async def run() -> int:
+        changes = 0
+
+        async def consume() -> None:
+            nonlocal changes
+            async for _ in watch_file(path, debounce=DEBOUNCE, poll_interval=POLL):
+                changes += 1
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)  # наблюдение запущено
+        await action(path)
+        await asyncio.sleep(DEBOUNCE * 3 + POLL * 2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return changes
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def webhook_file(tmp_path) -> str:
+    path = tmp_path / ".webhook_url"
+    path.write_text("https://initial.example", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture(params=["inotify", "stat"])
+def mode(request, monkeypatch) -> str:
+    if request.param == "inotify":
+        if file_watcher._load_libc() is None:
+            pytest.skip("inotify недоступен на этой платформе")
+    else:
+        monkeypatch.setattr(file_watcher, "_load_libc", lambda: None)
+    return request.param
+
+
+def test_writes_in_place_yield_once(webhook_file: str, mode: str):
+    assert _changes(webhook_file, _write_in_place) == 1
+
+
+def test_rename_over_yields_once(webhook_file: str, mode: str):
+    assert _changes(webhook_file, _rename_over) == 1
+
+
+def test_other_files_ignored(webhook_file: str, mode: str):
+    assert _changes(webhook_file, _touch_neighbour) == 0
@@ -0,0 +1,65 @@
+"""
+SqliteStorage: состояние и данные FSM переживают переоткрытие файла (другой процесс, рестарт).
+"""
+import asyncio
+
+import pytest
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+from app.fsm_storage import SqliteStorage
+
+
+class Form(StatesGroup):
+    amount = State()
+
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=200)
+
+
+def test_round_trip_and_reopen(tmp_path):
+    path = str(tmp_path / "fsm.sqlite3")
+
+    async def write():
+        storage = SqliteStorage(path)
+        assert await storage.get_state(KEY) is None
+        assert await storage.get_data(KEY) == {}
+        await storage.set_state(KEY, Form.amount)
+        await storage.set_data(KEY, {"amount": "1.5", "note": "привет"})
+        assert await storage.get_state(KEY) == "Form:amount"
+        # Данные не затирают состояние и наоборот
+        await storage.set_data(KEY, {"amount": "2"})
+        assert await storage.get_state(KEY) == "Form:amount"
+        await storage.close()
+
+    async def read():
+        storage = SqliteStorage(path)
+        try:
+            other = StorageKey(bot_id=1, chat_id=100, user_id=201)
+            return (
+                await storage.get_state(KEY),
+                await storage.get_data(KEY),
+                await storage.get_state(other),
+            )
+        finally:
+            await storage.close()
+
+    asyncio.run(write())
+    assert asyncio.run(read()) == ("Form:amount", {"amount": "2"}, None)
+
+
+def test_clear_state_and_data(tmp_path):
+    async def run():
+        storage = SqliteStorage(str(tmp_path / "fsm.sqlite3"))
+        await storage.set_state(KEY, "raw:state")
+        await storage.update_data(KEY, {"a": 1})
+        assert await storage.update_data(KEY, {"b": 2}) == {"a": 1, "b": 2}
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        result = (await storage.get_state(KEY), await storage.get_data(KEY))
+        with pytest.raises(TypeError):
+            await storage.set_data(KEY, [1])
+        await storage.close()
+        return result
+
+    assert asyncio.run(run()) == (None, {})
@@ -0,0 +1,95 @@
+"""
+JSON-логирование бота: форматтер, лимиты шумных событий, неблокирующая очередь и совпадение
+общих частей с backend/app/core/logging.py.
+"""
+import ast
+import json
+import logging
+import queue
+from pathlib import Path
+
+import pytest
+
+from app import logging as bot_logging
+from app.logging import EventSamplingFilter, JsonFormatter, NonBlockingQueueHandler, _parse_event_map
+
+
+BACKEND_LOGGING = Path(__file__).resolve().parents[2] / "backend" / "app" / "core" / "logging.py"
+# Определения, которые обязаны совпадать с backend (без учёта докстрингов)
+SHARED = (
+    "_dumps", "_parse_event_map", "EventSamplingFilter", "NonBlockingQueueHandler",
+    "setup_logging", "_stop_listener", "get_logger",
+)
+
+
+def _record(event: str | None = None, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("bot", logging.WARNING, __file__, 1, "msg %s", ("x",), None)
+    if event is not None:
+        record.event = event
+    for k, v in extra.items():
+        setattr(record, k, v)
+    return record
+
+
+def test_formatter_outputs_extras_only():
+    log = json.loads(JsonFormatter().format(_record("notify_chat_dropped", telegram_user_id=7, reason="blocked")))
+    assert log["service"] == "bot"
+    assert log["event"] == "notify_chat_dropped"
+    assert log["message"] == "msg x"
+    assert (log["telegram_user_id"], log["reason"]) == (7, "blocked")
+    for attr in ("thread", "threadName", "lineno", "args", "msg"):
+        assert attr not in log
+
+
+def test_rate_limit_suppresses_and_reports():
+    f = EventSamplingFilter(rate_limits={"webhook_update_error": 3})
+    passed = [f.filter(_record("webhook_update_error")) for _ in range(10)]
+    assert passed.count(True) == 3
+    assert all(f.filter(_record("update_handled")) for _ in range(10))
+    assert f.filter(_record())
+    f._buckets["webhook_update_error"][0] = 1
+    record = _record("webhook_update_error")
+    assert f.filter(record)
+    assert record.suppressed == 7
+
+
+def test_sampling_ratio_zero_drops_all():
+    f = EventSamplingFilter(sampling={"update_handled": 0.0})
+    assert not any(f.filter(_record("update_handled")) for _ in range(5))
+
+
+def test_queue_handler_never_blocks():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+    for _ in range(5):
+        handler.handle(_record("update_handled"))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    record = handler.queue.get_nowait()
+    assert record.msg == "msg x" and record.args is None
+
+
+def test_default_rate_limits_parse():
+    limits = _parse_event_map(bot_logging.DEFAULT_RATE_LIMITS, float)
+    assert limits["bot_worker_queue_full"] == 5.0 and len(limits) == 5
+
+
+def _definitions(source: str) -> dict[str, str]:
+    """Имя → ast.dump определения верхнего уровня без докстрингов."""
+    result = {}
+    for node in ast.parse(source).body:
+        if not isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            continue
+        for owner in [node, *[n for n in ast.walk(node) if isinstance(n, (ast.FunctionDef, ast.ClassDef))]]:
+            body = owner.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+                owner.body = body[1:] or [ast.Pass()]
+        result[node.name] = ast.dump(node)
+    return result
+
+
+@pytest.mark.skipif(not BACKEND_LOGGING.exists(), reason="backend рядом нет (бот развёрнут отдельно)")
+def test_shared_parts_match_backend():
+    bot = _definitions(Path(bot_logging.__file__).read_text(encoding="utf-8"))
+    backend = _definitions(BACKEND_LOGGING.read_text(encoding="utf-8"))
+    drifted = [name for name in SHARED if bot.get(name) != backend.get(name)]
+    assert drifted == [], f"bot/app/logging.py расходится с backend: {drifted}"
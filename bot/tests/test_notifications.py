@@ -0,0 +1,144 @@
+"""
+Уведомления: token bucket, склейка событий чата в одно сообщение, пауза по retry_after,
+курсор ленты только за отправленные или отброшенные события.
+"""
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from app.notifications import Notifier, TokenBucket
+
+
+class FakeBot:
+    """send_message пишет в sent; errors[chat_id] — исключения для очередных попыток."""
+
+    def __init__(self) -> None:
+        self.sent: list[tuple[int, str, float]] = []
+        self.errors: dict[int, list[Exception]] = {}
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        errors = self.errors.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+
+
+def _notifier(bot: FakeBot, tmp_path, **kw) -> Notifier:
+    options = {"global_rate": 1000, "per_chat_interval": 0, "coalesce_seconds": 0.05, **kw}
+    return Notifier(bot, base_url="http://backend", admin_token="t", cursor_path=str(tmp_path / "cursor"), **options)
+
+
+def _deposit(event_id: int, *chats: int, amount: str = "1") -> dict:
+    return {
+        "id": event_id,
+        "type": "deposit_credited",
+        "payload": {"amount": amount, "currency": "TON"},
+        "recipients": [{"user_id": chat, "telegram_user_id": str(chat)} for chat in chats],
+    }
+
+
+async def _until(condition, timeout: float = 3.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def _method(chat_id: int) -> SendMessage:
+    return SendMessage(chat_id=chat_id, text="x")
+
+
+def test_token_bucket_rate_and_pause():
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=2)
+        started = time.monotonic()
+        for _ in range(2):
+            await bucket.acquire()
+        burst = time.monotonic() - started
+        await bucket.acquire()
+        refill = time.monotonic() - started
+        bucket.pause(0.2)
+        paused_at = time.monotonic()
+        await bucket.acquire()
+        return burst, refill, time.monotonic() - paused_at
+
+    burst, refill, paused = asyncio.run(run())
+    assert burst < 0.03
+    assert refill >= 0.04
+    assert paused >= 0.19
+
+
+def test_events_of_chat_coalesced(tmp_path):
+    bot = FakeBot()
+
+    async def run():
+        notifier = _notifier(bot, tmp_path)
+        sender = asyncio.create_task(notifier.run_sender())
+        notifier.add_event(_deposit(1, 100, amount="1"))
+        notifier.add_event(_deposit(2, 100, 200, amount="2"))
+        notifier.add_event(_deposit(3, 100, amount="3"))
+        await _until(lambda: len(bot.sent) == 2)
+        sender.cancel()
+        return notifier
+
+    notifier = asyncio.run(run())
+    texts = {chat: text for chat, text, _ in bot.sent}
+    assert texts[100].splitlines() == [
+        "💰 Депозит зачислен: 1 TON", "💰 Депозит зачислен: 2 TON", "💰 Депозит зачислен: 3 TON",
+    ]
+    assert texts[200] == "💰 Депозит зачислен: 2 TON"
+    assert notifier._unsent == {}
+
+
+def test_retry_after_pauses_and_resends(tmp_path):
+    bot = FakeBot()
+    bot.errors[100] = [TelegramRetryAfter(_method(100), "Flood control exceeded", retry_after=1)]
+
+    async def run():
+        notifier = _notifier(bot, tmp_path)
+        sender = asyncio.create_task(notifier.run_sender())
+        notifier.add_event(_deposit(1, 100))
+        await _until(lambda: not bot.errors[100])
+        failed_at = time.monotonic()
+        # Событие, пришедшее во время паузы, уходит тем же сообщением
+        notifier.add_event(_deposit(2, 100, amount="5"))
+        await _until(lambda: bot.sent)
+        sender.cancel()
+        return failed_at
+
+    failed_at = asyncio.run(run())
+    [(chat, text, sent_at)] = bot.sent
+    assert sent_at - failed_at >= 0.95
+    assert text.splitlines() == ["💰 Депозит зачислен: 1 TON", "💰 Депозит зачислен: 5 TON"]
+
+
+def test_cursor_advances_only_past_sent_or_dropped(tmp_path):
+    bot = FakeBot()
+    bot.errors[100] = [TelegramForbiddenError(_method(100), "bot was blocked by the user")]
+    bot.errors[200] = [TelegramRetryAfter(_method(200), "Flood control exceeded", retry_after=1)]
+
+    async def run():
+        notifier = _notifier(bot, tmp_path)
+        notifier.fetched_cursor = 3
+        notifier.add_event(_deposit(1, 100))
+        notifier.add_event(_deposit(2, 200))
+        notifier.add_event(_deposit(3, 300))
+        assert notifier.safe_cursor() == 0
+        sender = asyncio.create_task(notifier.run_sender())
+        # 1 отброшено (бот заблокирован), 3 отправлено, 2 ждёт конца паузы
+        await _until(lambda: [c for c, _, _ in bot.sent] == [300])
+        assert notifier.safe_cursor() == 1
+        notifier._save_cursor()
+        saved = _notifier(FakeBot(), tmp_path).fetched_cursor
+        await _until(lambda: len(bot.sent) == 2)
+        sender.cancel()
+        return notifier, saved
+
+    notifier, saved = asyncio.run(run())
+    # После перезапуска на паузе событие 2 пришло бы снова
+    assert saved == 1
+    assert notifier.safe_cursor() == 3
+    notifier._save_cursor()
+    assert _notifier(FakeBot(), tmp_path).fetched_cursor == 3
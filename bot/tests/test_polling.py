@@ -0,0 +1,152 @@
+"""
+PollingExecutor: offset getUpdates, ограничение необработанных апдейтов, пауза при ошибках сети.
+"""
+import asyncio
+
+import pytest
+from aiogram import Dispatcher
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramUnauthorizedError
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+
+from app import polling
+from app.polling import PollingExecutor
+
+
+def _update(update_id: int, chat_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": chat_id, "type": "private"},
+            "text": "hi",
+        },
+    })
+
+
+class FakeBot:
+    """get_updates отдаёт заготовленные пачки (или исключения), записывает offset каждого вызова."""
+
+    def __init__(self, batches: list) -> None:
+        self.batches = list(batches)
+        self.offsets: list[int | None] = []
+
+    async def get_updates(self, *, offset, limit, timeout, allowed_updates, request_timeout):
+        self.offsets.append(offset)
+        if not self.batches:
+            raise TelegramUnauthorizedError(GetUpdates(), "stop")
+        batch = self.batches.pop(0)
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+
+class FakeDispatcher(Dispatcher):
+    def __init__(self, release: asyncio.Event | None = None) -> None:
+        super().__init__()
+        self.release = release
+        self.handled: list[int] = []
+
+    async def feed_update(self, bot, update: Update, **kwargs) -> None:
+        if self.release is not None:
+            await self.release.wait()
+        self.handled.append(update.update_id)
+
+
+def test_offset_advances_past_each_batch():
+    bot = FakeBot([[_update(10, 1), _update(11, 2)], [], [_update(12, 1)]])
+
+    async def run():
+        dp = FakeDispatcher()
+        executor = PollingExecutor(bot, dp, allowed_updates=["message"])
+        with pytest.raises(TelegramUnauthorizedError):
+            await executor.run()
+        return executor, dp
+
+    executor, dp = asyncio.run(run())
+    assert bot.offsets == [None, 12, 12, 13]
+    assert sorted(dp.handled) == [10, 11, 12]
+    assert executor.stats()["received"] == 3
+
+
+def test_max_pending_holds_next_get_updates():
+    async def run():
+        release = asyncio.Event()
+        bot = FakeBot([[_update(n, n) for n in range(1, 4)], [_update(4, 4)]])
+        dp = FakeDispatcher(release)
+        executor = PollingExecutor(bot, dp, concurrency=1, max_pending=2, allowed_updates=["message"])
+        assert await executor.poll_once() == 3
+        second = asyncio.create_task(executor.poll_once())
+        await asyncio.sleep(0.2)
+        # Два апдейта ждут слота — больше из Telegram не забираем
+        assert executor.sequencer.queued == 2 and len(bot.offsets) == 1 and not second.done()
+        release.set()
+        assert await second == 1
+        await executor.shutdown(timeout=1)
+        return bot, dp
+
+    bot, dp = asyncio.run(run())
+    assert bot.offsets == [None, 4]
+    assert sorted(dp.handled) == [1, 2, 3, 4]
+
+
+def test_backoff_on_network_errors(monkeypatch):
+    delays: list[float] = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(seconds: float) -> None:
+        delays.append(seconds)
+        await real_sleep(0)
+
+    error = TelegramNetworkError(GetUpdates(), "connection reset")
+    bot = FakeBot([error, error, error, [_update(1, 1)], error])
+
+    async def run():
+        executor = PollingExecutor(bot, FakeDispatcher(), allowed_updates=["message"])
+        monkeypatch.setattr(polling.asyncio, "sleep", fake_sleep)
+        try:
+            with pytest.raises(TelegramUnauthorizedError):
+                await executor.run()
+        finally:
+            monkeypatch.undo()
+        return executor
+
+    executor = asyncio.run(run())
+    # Пауза растёт вдвое и сбрасывается после успешного getUpdates
+    assert [d for d in delays if d >= 1] == [1.0, 2.0, 4.0, 1.0]
+    assert executor.stats()["poll_errors"] == 4
+    assert bot.offsets == [None, None, None, None, 2, 2]
+
+
+def test_retry_after_and_unexpected_errors_keep_polling(monkeypatch):
+    delays: list[float] = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(seconds: float) -> None:
+        delays.append(seconds)
+        await real_sleep(0)
+
+    bot = FakeBot([
+        TelegramRetryAfter(GetUpdates(), "flood", retry_after=7),
+        ValueError("bad payload"),
+        TelegramNetworkError(GetUpdates(), "connection reset"),
+        [_update(1, 1)],
+    ])
+
+    async def run():
+        executor = PollingExecutor(bot, FakeDispatcher(), allowed_updates=["message"])
+        monkeypatch.setattr(polling.asyncio, "sleep", fake_sleep)
+        try:
+            # Остановить polling может только TelegramUnauthorizedError (FakeBot — когда пачки кончились)
+            with pytest.raises(TelegramUnauthorizedError):
+                await executor.run()
+        finally:
+            monkeypatch.undo()
+        return executor
+
+    executor = asyncio.run(run())
+    # retry_after — как велел Telegram, без влияния на удвоение паузы
+    assert [d for d in delays if d >= 1] == [7, 1.0, 2.0]
+    assert executor.stats()["poll_errors"] == 3
+    assert bot.offsets == [None, None, None, None, 2]
@@ -0,0 +1,97 @@
+"""
+ChatSequencer: порядок апдейтов внутри чата и параллельность между чатами.
+"""
+import asyncio
+import random
+
+from app.sequencer import ChatSequencer, chat_key
+
+
+def test_chat_order_kept_under_concurrency():
+    rng = random.Random(0)
+    seen: dict[int, list[int]] = {}
+
+    async def run():
+        sequencer = ChatSequencer(concurrency=8)
+
+        def job(chat: int, n: int):
+            async def handle():
+                # Разная длительность: без упорядочивания поздние апдейты обгоняли бы ранние
+                await asyncio.sleep(rng.random() / 1000)
+                seen.setdefault(chat, []).append(n)
+            return handle
+
+        for n in range(50):
+            for chat in (1, 2, 3):
+                sequencer.submit(chat, job(chat, n))
+        await sequencer.join()
+        return sequencer
+
+    sequencer = asyncio.run(run())
+    assert seen == {chat: list(range(50)) for chat in (1, 2, 3)}
+    assert (sequencer.processed, sequencer.queued, sequencer.active_chats) == (150, 0, 0)
+
+
+def test_different_chats_run_in_parallel():
+    async def run():
+        sequencer = ChatSequencer(concurrency=4)
+        started = asyncio.Event()
+        release = asyncio.Event()
+        running = 0
+        peak = 0
+
+        async def slow():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            if peak == 3:
+                started.set()
+            await release.wait()
+            running -= 1
+
+        for chat in (10, 20, 30):
+            sequencer.submit(chat, slow)
+        # Второй апдейт чата 10 ждёт первого, хотя свободные слоты есть
+        sequencer.submit(10, slow)
+        await asyncio.wait_for(started.wait(), timeout=1)
+        assert (sequencer.in_flight, sequencer.queued) == (3, 1)
+        release.set()
+        await sequencer.join()
+        return peak
+
+    assert asyncio.run(run()) == 3
+
+
+def test_concurrency_limit_and_failures():
+    async def run():
+        sequencer = ChatSequencer(concurrency=2)
+        running = 0
+        peak = 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.001)
+            running -= 1
+
+        async def broken():
+            raise RuntimeError("handler failed")
+
+        for chat in range(10):
+            sequencer.submit(chat, job)
+        sequencer.submit(None, broken)
+        sequencer.submit(3, job)
+        await sequencer.join()
+        return sequencer, peak
+
+    sequencer, peak = asyncio.run(run())
+    assert peak == 2
+    assert (sequencer.processed, sequencer.failed) == (11, 1)
+
+
+def test_chat_key():
+    assert chat_key({"update_id": 1, "message": {"chat": {"id": -100}, "from": {"id": 7}}}) == -100
+    assert chat_key({"update_id": 2, "callback_query": {"from": {"id": 7}, "message": {"chat": {"id": 5}}}}) == 5
+    assert chat_key({"update_id": 3, "inline_query": {"from": {"id": 7}}}) == 7
+    assert chat_key({"update_id": 4, "poll": {"id": "p"}}) is None
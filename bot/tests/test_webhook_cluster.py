@@ -0,0 +1,142 @@
+"""
+Кластер webhook: стабильное шардирование по чату, 200 только после подтверждения воркера,
+хуки startup/shutdown в воркере.
+"""
+import asyncio
+import json
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.webhook_cluster import WebhookCluster, _serve, shard_for
+
+
+def _message(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "T"},
+            "text": "hi",
+        },
+    }
+
+
+class FakeRequest:
+    def __init__(self, body: dict, headers: dict | None = None) -> None:
+        self._raw = json.dumps(body).encode()
+        self.headers = headers or {}
+
+    async def read(self) -> bytes:
+        return self._raw
+
+
+def test_shard_stable_per_chat():
+    for workers in (2, 3, 8):
+        for chat_id in (1, 42, -1001234567890, 987654321):
+            shards = {shard_for(_message(update_id, chat_id), workers) for update_id in range(20)}
+            assert shards == {chat_id % workers}
+    # Апдейты без чата раскладываются по update_id
+    assert {shard_for({"update_id": n, "poll": {"id": "p"}}, 4) for n in range(8)} == {0, 1, 2, 3}
+
+
+def _worker(cluster: WebhookCluster, shard: int, *, ack: bool = True) -> list[dict]:
+    """Забрать апдейт из очереди воркера (как процесс-воркер) и подтвердить его."""
+    data = json.loads(cluster._queues[shard].get(timeout=1))
+    if ack:
+        cluster._acks.put(data["update_id"])
+    return [data]
+
+
+def test_ack_only_after_worker_processed():
+    cluster = WebhookCluster(2, ack_timeout=2)
+
+    async def run():
+        cluster._ack_reader = asyncio.create_task(cluster._read_acks())
+        update = _message(1, 11)
+        pending = asyncio.create_task(cluster.handle(FakeRequest(update)))
+        await asyncio.sleep(0.05)
+        assert not pending.done()
+        # Повтор того же апдейта, пока ждём подтверждения, в очередь не кладётся
+        retry = asyncio.create_task(cluster.handle(FakeRequest(update)))
+        await asyncio.sleep(0.05)
+        taken = await asyncio.to_thread(_worker, cluster, 1)
+        # Второй копии в очереди нет
+        assert cluster._queues[1].empty()
+        responses = await asyncio.gather(pending, retry)
+        cluster._acks.put(None)
+        await cluster._ack_reader
+        return taken, responses
+
+    taken, responses = asyncio.run(run())
+    assert [u["update_id"] for u in taken] == [1]
+    assert [r.status for r in responses] == [200, 200]
+    assert cluster._pending == {}
+
+
+def test_no_ack_returns_503_and_retry_requeues():
+    cluster = WebhookCluster(1, ack_timeout=0.1)
+
+    async def run():
+        cluster._ack_reader = asyncio.create_task(cluster._read_acks())
+        update = _message(5, 3)
+        # Воркер забрал апдейт и упал, не подтвердив
+        first = await cluster.handle(FakeRequest(update))
+        lost = await asyncio.to_thread(_worker, cluster, 0, ack=False)
+        retry = asyncio.create_task(cluster.handle(FakeRequest(update)))
+        await asyncio.sleep(0.02)
+        redelivered = await asyncio.to_thread(_worker, cluster, 0)
+        second = await retry
+        cluster._acks.put(None)
+        await cluster._ack_reader
+        return first, lost, redelivered, second
+
+    first, lost, redelivered, second = asyncio.run(run())
+    assert first.status == 503 and cluster.timed_out == 1
+    assert [u["update_id"] for u in lost] == [5] and [u["update_id"] for u in redelivered] == [5]
+    assert second.status == 200
+
+
+def test_full_queue_and_bad_requests():
+    cluster = WebhookCluster(1, secret="s3cret", queue_size=1, ack_timeout=0.05)
+
+    async def run():
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+        assert (await cluster.handle(FakeRequest(_message(1, 1)))).status == 401
+        assert (await cluster.handle(FakeRequest({"message": {}}, headers))).status == 400
+        assert (await cluster.handle(FakeRequest(_message(1, 1), headers))).status == 503  # не подтверждён
+        return await cluster.handle(FakeRequest(_message(2, 1), headers))
+
+    assert asyncio.run(run()).status == 503
+    assert cluster.rejected == 1
+
+
+def test_worker_runs_hooks_and_acks(monkeypatch):
+    calls: list[str] = []
+    handled: list[int] = []
+    bot = Bot(token="42:TEST")
+    dp = Dispatcher(storage=MemoryStorage())
+
+    @dp.startup()
+    async def on_startup() -> None:
+        calls.append("startup")
+
+    @dp.shutdown()
+    async def on_shutdown() -> None:
+        calls.append("shutdown")
+
+    @dp.message()
+    async def on_message(message) -> None:
+        handled.append(message.message_id)
+
+    cluster = WebhookCluster(1)
+    updates, acks = cluster._queues[0], cluster._acks
+    for n in (1, 2, 3):
+        updates.put(json.dumps(_message(n, 9)))
+    updates.put(None)
+    asyncio.run(_serve(0, updates, acks, bot, dp))
+    assert calls == ["startup", "shutdown"]
+    assert handled == [1, 2, 3]
+    assert sorted(acks.get(timeout=1) for _ in range(3)) == [1, 2, 3]